@@ -76,7 +76,8 @@ class rhnpushConfigParser:
             'proxy':   '',
             'tolerant':   '0',
             'ca_chain':  self.get_ca_bundle_path(),
-            'timeout': None
+            'timeout': None,
+            'threads': '1'
         }
 
         # Used to parse the config file.
@@ -84,7 +84,7 @@ class ConfManager:
         if argoptions.verbose == 0:
             argoptions.verbose = None
 
-        # Orgid, count, cache_lifetime, and verbose all need to be integers, just like in argoptions.
+        # Orgid, count, cache_lifetime, verbose, timeout and threads all need to be integers, just like in argoptions.
         if self.defaultconfig.orgid:
             self.defaultconfig.orgid = int(self.defaultconfig.orgid)
 
@@ -100,6 +100,9 @@ class ConfManager:
         if self.defaultconfig.timeout:
             self.defaultconfig.timeout = int(self.defaultconfig.timeout)
 
+        if self.defaultconfig.threads:
+            self.defaultconfig.threads = int(self.defaultconfig.threads)
+
         # Copy the settings in argoptions into self.defaultconfig.
         self.defaultconfig, argoptions = utils.make_common_attr_equal(self.defaultconfig, argoptions)
 
@@ -31,7 +31,10 @@ This script performs various management operations on the Spacewalk Proxy:
 import os
 import random
 import sys
+import threading
 import time
+from multiprocessing import Pool, cpu_count
+from multiprocessing.pool import ThreadPool
 # pylint: disable=W0402
 from optparse import Option, OptionParser
 
@@ -56,6 +59,12 @@ BUFFER_SIZE = 65536
 HEADERS_PER_CALL = 10
 DEBUG = 0
 RPMTAG_NOSOURCE = 1051
+# Packages per existence check and per channel subscription call
+CHECKSUMS_PER_CALL = 500
+CHANNEL_PACKAGES_PER_CALL = 1000
+# Upload attempts per package, and the first wait between them in seconds
+UPLOAD_TRIES = 3
+UPLOAD_BACKOFF = 1
 
 
 def main():
@@ -111,7 +120,9 @@ def main():
                help='If rhnpush errors while uploading a package, continue uploading the rest of the packages.'),
         Option('--ca-chain', action='store', help='alternative SSL CA Cert'),
         Option('--timeout', action='store', type='int', metavar='SECONDS',
-               help='Change default connection timeout.')
+               help='Change default connection timeout.'),
+        Option('--threads', action='store', type='int', metavar='N',
+               help='Compute checksums and upload packages with N parallel workers')
     ]
 
     # Having to maintain a store_true list is ugly. I'm trying to get rid of this.
@@ -187,6 +198,12 @@ class UploadClass(uploadLib.UploadClass):
     def __init__(self, options, files=None):
         uploadLib.UploadClass.__init__(self, options, files)
         self.url_v2 = None
+        self._auth_lock = threading.Lock()
+        # incremented whenever the uploads re-authenticate
+        self._session_generation = 0
+
+    def _threads(self):
+        return max(getattr(self.options, 'threads', None) or 1, 1)
 
     def setURL(self):
         server = sstr(idn_ascii_to_puny(self.options.server))
@@ -357,10 +374,7 @@ class UploadClass(uploadLib.UploadClass):
         self.files = files1 + files2
 
         channel_packages = []
-
-        # a little fault tolarence is in order
-        random.seed()
-        tries = 3
+        uploads = []
 
         # satellites < 4.1.0 are no more supported
         if sys.version_info[0] == 3:
@@ -373,8 +387,6 @@ class UploadClass(uploadLib.UploadClass):
         (server_digest_hash, pkgs_info, digest_hash) = self.check_package_exists()
 
         for pkg in self.files:
-            ret = None  # pkilambi:errors off as not initialized.this fixes it.
-
             # temporary fix for picking pkgs instead of full paths
             pkg_key = (pkg.strip()).split('/')[-1]
 
@@ -412,63 +424,27 @@ class UploadClass(uploadLib.UploadClass):
                     self.warn(0, msg)
                     continue
 
-            for _t in range(0, tries):
-                try:
-                    ret = self.package(pkg, checksum_type, checksum)
-                    if ret is None:
-                        raise uploadLib.UploadError()
-
-                # TODO:  Revisit this.  We throw this error all over the place,
-                #        but doing so will cause us to skip the --tolerant logic
-                #        below.  I don't think we really want this behavior.
-                #        There are some cases where we don't want to retry 3
-                #        times, but not at the expense of disabling the tolerant
-                #        flag, IMHO.  This loop needs some lovin'.  -- pav
-
-                # FIX: it checks for tolerant flag and aborts only if the flag is
-                #not specified
-                except uploadLib.UploadError:
-                    ue = sys.exc_info()[1]
-                    if not self.options.tolerant:
-                        self.die(1, ue)
-                    self.warn(2, ue)
-                except AuthenticationRequired:
-                    # session expired so we re-authenticate for the process to complete
-                    # this uses the username and password from memory if available
-                    # else it prompts for one.
-                    self.authenticate()
-                except:
-                    self.warn(2, sys.exc_info()[1])
-                    wait = random.randint(1, 5)
-                    self.warn(0, "Waiting %d seconds and trying again..." % wait)
-                    time.sleep(wait)
-                # The else clause gets executed in the stuff in the try-except block *succeeds*.
-                else:
-                    break
+            uploads.append((pkg, checksum_type, checksum))
 
-            # if the preceeding for-loop exits without a call to break, then this else clause gets called.
-            # What's kind of weird is that if the preceeding for-loop doesn't call break then an error occurred
-            # and all of retry attempts failed. If the for-loop *does* call break then everything is hunky-dory.
-            # In short, this else clause only get's called if something is F.U.B.A.R and the retry attempts don't
-            # fix anything.
-            else:
-                if not self.options.tolerant:
-                    # pkilambi:bug#176358:this exits with a error code of 1
-                    self.die(1, "Giving up after %d attempts" % tries)
-                else:
-                    print("Giving up after %d attempts and continuing on..." % (tries,))
+        # the patch clusters are uploaded after all the other packages
+        uploads1 = [u for u in uploads if not u[0].startswith('patch-cluster-')]
+        uploads2 = [u for u in uploads if u[0].startswith('patch-cluster-')]
 
-            # 5/13/05 wregglej - 154248 ?? we still want to add the packages if they're source.
-            if ret and self.channels:  # and ret['arch'] != 'src':
-                # Don't bother to add the package if
-                # no channel was specified or a source rpm was passed
-                channel_packages.append(ret)
+        start = time.time()
+        for batch in (uploads1, uploads2):
+            for ret in self._upload_packages(batch):
+                # 5/13/05 wregglej - 154248 ?? we still want to add the packages if they're source.
+                if ret and self.channels:  # and ret['arch'] != 'src':
+                    # Don't bother to add the package if
+                    # no channel was specified or a source rpm was passed
+                    channel_packages.append(ret)
+        if uploads:
+            self._report_throughput([u[0] for u in uploads], time.time() - start)
 
         # self.channels is never None, it always has at least one entry with an empty string.
         if len(self.channels) == 1 and self.channels[0] == '':
             return
         info = {
-            'packages': channel_packages,
             'channels': self.channels
         }
         if self.orgId == '' or self.orgId > 0:
@@ -477,61 +453,171 @@ class UploadClass(uploadLib.UploadClass):
         # 2/3/06 wregglej 173287 Added check to see if we can use session tokens.
         if channel_packages:
             self.authenticate()
+        for i in range(0, len(channel_packages), CHANNEL_PACKAGES_PER_CALL):
+            info['packages'] = channel_packages[i:i + CHANNEL_PACKAGES_PER_CALL]
             uploadLib.call(self.server.packages.channelPackageSubscriptionBySession,
                            self.session.getSessionString(), info)
         return 0
 
+    def _upload_packages(self, uploads):
+        """
+        Uploads the (package, checksum type, checksum) tuples of uploads over
+        up to --threads parallel connections.
+        Returns the info of the uploaded packages (None for the packages
+        given up on), in the order of uploads.
+        """
+        threads = min(self._threads(), len(uploads))
+        if threads <= 1:
+            return [self._upload_package(*u) for u in uploads]
+
+        rets = []
+        pool = ThreadPool(threads)
+        try:
+            for ret, exc in pool.imap(self._upload_package_worker, uploads):
+                if exc is not None:
+                    # don't start the uploads still queued
+                    pool.terminate()
+                    raise exc
+                rets.append(ret)
+        finally:
+            pool.close()
+            pool.join()
+        return rets
+
+    def _upload_package_worker(self, upload):
+        try:
+            return self._upload_package(*upload), None
+        except SystemExit:
+            # die() was called; exit from the main thread
+            return None, sys.exc_info()[1]
+
+    def _reauthenticate(self, generation):
+        """
+        Re-authenticates after the session of generation was refused, unless
+        another upload thread has done it since.
+        """
+        with self._auth_lock:
+            if self._session_generation == generation:
+                self.authenticate()
+                self._session_generation += 1
+
+    def _upload_package(self, pkg, checksum_type, checksum):
+        ret = None  # pkilambi:errors off as not initialized.this fixes it.
+        for attempt in range(0, UPLOAD_TRIES):
+            generation = self._session_generation
+            try:
+                ret = self.package(pkg, checksum_type, checksum)
+                if ret is None:
+                    raise uploadLib.UploadError()
+
+            # TODO:  Revisit this.  We throw this error all over the place,
+            #        but doing so will cause us to skip the --tolerant logic
+            #        below.  I don't think we really want this behavior.
+            #        There are some cases where we don't want to retry 3
+            #        times, but not at the expense of disabling the tolerant
+            #        flag, IMHO.  This loop needs some lovin'.  -- pav
+
+            # FIX: it checks for tolerant flag and aborts only if the flag is
+            #not specified
+            except uploadLib.UploadError:
+                ue = sys.exc_info()[1]
+                if not self.options.tolerant:
+                    self.die(1, ue)
+                self.warn(2, ue)
+            except AuthenticationRequired:
+                # session expired so we re-authenticate for the process to complete
+                # this uses the username and password from memory if available
+                # else it prompts for one.
+                self._reauthenticate(generation)
+            except:
+                self.warn(2, sys.exc_info()[1])
+                if attempt + 1 < UPLOAD_TRIES:
+                    # back off exponentially, with some jitter so parallel
+                    # uploads don't retry all at the same time
+                    wait = UPLOAD_BACKOFF * 2 ** attempt * random.uniform(1, 2)
+                    self.warn(0, "Waiting %.1f seconds and trying again..." % wait)
+                    time.sleep(wait)
+            # The else clause gets executed in the stuff in the try-except block *succeeds*.
+            else:
+                return ret
+
+        # All the retry attempts failed
+        if not self.options.tolerant:
+            # pkilambi:bug#176358:this exits with a error code of 1
+            self.die(1, "Giving up after %d attempts" % UPLOAD_TRIES)
+        else:
+            print("Giving up after %d attempts and continuing on..." % (UPLOAD_TRIES,))
+        return ret
+
+    def _report_throughput(self, packages, elapsed):
+        size = 0
+        for pkg in packages:
+            try:
+                size += os.path.getsize(pkg)
+            except OSError:
+                pass
+        elapsed = max(elapsed, 0.001)
+        mib = size / 1048576.0
+        self.warn(0, "Uploaded %d packages (%.1f MiB) in %.1f seconds: %.1f packages/s, %.2f MiB/s"
+                  % (len(packages), mib, elapsed, len(packages) / elapsed, mib / elapsed))
+
     # does an existance check of the packages to be uploaded and returns their checksum and other info
     def check_package_exists(self):
         self.warn(2, "Computing checksum and package info. This may take some time ...")
         pkg_hash = {}
         digest_hash = {}
-
-        for pkg in self.files:
-            pkg_info = {}
-            pkg_key = (pkg.strip()).split('/')[-1]
-
-            if not os.access(pkg, os.R_OK):
+        checksum_data = {}
+        batch = {}
+
+        # the checksums are computed by --threads processes, and every
+        # CHECKSUMS_PER_CALL packages are looked up on the server meanwhile
+        for pkg, error, pkg_info in self._package_checksum_infos():
+            if error:
+                verbose, msg = error
                 if not self.options.tolerant:
-                    self.die(-1, "Could not read file %s" % pkg)
-                self.warn(-1, "Could not read file %s" % pkg)
-                continue
-            try:
-                a_pkg = package_from_filename(pkg)
-                a_pkg.read_header()
-                a_pkg.payload_checksum()
-            except InvalidPackageError:
-                if not self.options.tolerant:
-                    self.die(-1, "ERROR: %s: This file doesn't appear to be a package" % pkg)
-                self.warn(2, "ERROR: %s: This file doesn't appear to be a package" % pkg)
-                continue
-            except IOError:
-                if not self.options.tolerant:
-                    self.die(-1, "ERROR: %s: No such file or directory available" % pkg)
-                self.warn(2, "ERROR: %s: No such file or directory available" % pkg)
+                    self.die(-1, msg)
+                self.warn(verbose, msg)
                 continue
 
-            digest_hash[pkg_key] = (a_pkg.checksum_type, a_pkg.checksum)
-            a_pkg.input_stream.close()
-
-            for tag in ('name', 'version', 'release', 'epoch', 'arch'):
-                val = a_pkg.header[tag]
-                if val is None:
-                    val = ''
-                pkg_info[tag] = val
             # b195903:the arch for srpms should be obtained by is_source check
             # instead of checking arch in header
-            if a_pkg.header.is_source:
-                if not self.options.source:
-                    self.die(-1, "ERROR: Trying to Push src rpm, Please re-try with --source.")
-                if RPMTAG_NOSOURCE in a_pkg.header.keys():
-                    pkg_info['arch'] = 'nosrc'
-                else:
-                    pkg_info['arch'] = 'src'
-            pkg_info['checksum_type'] = a_pkg.checksum_type
-            pkg_info['checksum'] = a_pkg.checksum
-            pkg_hash[pkg_key] = pkg_info
+            if pkg_info['arch'] in ('src', 'nosrc') and not self.options.source:
+                self.die(-1, "ERROR: Trying to Push src rpm, Please re-try with --source.")
 
+            pkg_key = (pkg.strip()).split('/')[-1]
+            digest_hash[pkg_key] = (pkg_info['checksum_type'], pkg_info['checksum'])
+            pkg_hash[pkg_key] = batch[pkg_key] = pkg_info
+            if len(batch) >= CHECKSUMS_PER_CALL:
+                checksum_data.update(self._get_server_checksums(batch))
+                batch = {}
+        if batch or not pkg_hash:
+            checksum_data.update(self._get_server_checksums(batch))
+
+        return (checksum_data, pkg_hash, digest_hash)
+
+    def _package_checksum_infos(self):
+        """
+        Yields (package, error, package info) for every file, in order.
+        """
+        # checksumming is CPU bound, more processes than CPUs don't help
+        processes = min(self._threads(), len(self.files), cpu_count())
+        if processes <= 1:
+            for pkg in self.files:
+                yield (pkg, ) + _package_checksum_info(pkg)
+            return
+
+        pool = Pool(processes)
+        try:
+            for i, ret in enumerate(pool.imap(_package_checksum_info, self.files)):
+                yield (self.files[i], ) + ret
+        finally:
+            pool.terminate()
+            pool.join()
+
+    def _get_server_checksums(self, pkg_hash):
+        """
+        Returns the checksums of the packages in pkg_hash known to the server.
+        """
         if self.options.nullorg:
             # to satisfy xmlrpc from None values.
             orgid = 'null'
@@ -568,7 +654,7 @@ class UploadClass(uploadLib.UploadClass):
                 checksum_data = uploadLib.getSourcePackageMD5sumBySession(self.server,
                                                                           self.session.getSessionString(), info)
 
-        return (checksum_data, pkg_hash, digest_hash)
+        return checksum_data
 
     def package(self, package, fileChecksumType, fileChecksum):
         self.warn(1, "Uploading package %s" % package)
@@ -669,6 +755,41 @@ class UploadClass(uploadLib.UploadClass):
 class AuthenticationRequired(Exception):
     pass
 
+
+def _package_checksum_info(pkg):
+    """
+    Reads the header and computes the checksum of the package pkg; runs in
+    the worker processes of check_package_exists.
+    Returns (error, package info), error being (verbosity, message) if pkg
+    is not a readable package.
+    """
+    if not os.access(pkg, os.R_OK):
+        return (-1, "Could not read file %s" % pkg), None
+    try:
+        a_pkg = package_from_filename(pkg)
+        a_pkg.read_header()
+        a_pkg.payload_checksum()
+    except InvalidPackageError:
+        return (2, "ERROR: %s: This file doesn't appear to be a package" % pkg), None
+    except IOError:
+        return (2, "ERROR: %s: No such file or directory available" % pkg), None
+    a_pkg.input_stream.close()
+
+    pkg_info = {}
+    for tag in ('name', 'version', 'release', 'epoch', 'arch'):
+        val = a_pkg.header[tag]
+        if val is None:
+            val = ''
+        pkg_info[tag] = val
+    if a_pkg.header.is_source:
+        if RPMTAG_NOSOURCE in a_pkg.header.keys():
+            pkg_info['arch'] = 'nosrc'
+        else:
+            pkg_info['arch'] = 'src'
+    pkg_info['checksum_type'] = a_pkg.checksum_type
+    pkg_info['checksum'] = a_pkg.checksum
+    return None, pkg_info
+
 if __name__ == '__main__':
     # test code
     sys.exit(main() or 0)
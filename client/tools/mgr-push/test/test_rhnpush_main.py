@@ -0,0 +1,138 @@
+#
+# Copyright (c) 2026 SUSE LLC
+#
+# This software is licensed to you under the GNU General Public License,
+# version 2 (GPLv2). There is NO WARRANTY for this software, express or
+# implied, including the implied warranties of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. You should have received a copy of GPLv2
+# along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+#
+
+import threading
+import unittest
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+# test import
+import rhnpush_main
+
+# globals ----------------------------------------------------------------
+
+PACKAGES = ["pkg%d-1.0-1.x86_64.rpm" % i for i in range(5)]
+
+# test case --------------------------------------------------------------
+
+
+def _options(**kwargs):
+    options = dict(verbose=-2, threads=3, tolerant=0, force=0, source=0, nullorg=0, proxy=None)
+    options.update(kwargs)
+    return mock.Mock(**options)
+
+
+def _package_info(pkg):
+    return {'name': pkg.split('-')[0], 'version': '1.0', 'release': '1', 'epoch': '', 'arch': 'x86_64',
+            'checksum_type': 'sha256', 'checksum': 'sum-%s' % pkg}
+
+
+class UploadTest(unittest.TestCase):
+
+    def setUp(self):
+        self.upload = rhnpush_main.UploadClass(_options(), files=list(PACKAGES))
+        self.upload.authenticate = mock.Mock()
+
+    def testUploadsInOrder(self):
+        self.upload.package = mock.Mock(side_effect=lambda pkg, *args: {'name': pkg})
+
+        rets = self.upload._upload_packages([(p, 'sha256', 'sum') for p in PACKAGES])
+
+        self.assertEqual(rets, [{'name': p} for p in PACKAGES])
+        self.assertEqual(self.upload.package.call_count, len(PACKAGES))
+
+    def testDieInWorkerExits(self):
+        def package(pkg, *args):
+            if pkg == PACKAGES[1]:
+                raise rhnpush_main.uploadLib.UploadError("unsigned rpm")
+            return {'name': pkg}
+        self.upload.package = mock.Mock(side_effect=package)
+
+        with mock.patch.object(rhnpush_main.uploadLib, "ReportError"):
+            self.assertRaises(SystemExit, self.upload._upload_packages,
+                              [(p, 'sha256', 'sum') for p in PACKAGES])
+
+    def testRetryBacksOff(self):
+        self.upload.package = mock.Mock(side_effect=[IOError("reset"), IOError("reset"), {'name': 'pkg0'}])
+
+        with mock.patch.object(rhnpush_main.time, "sleep") as sleep, \
+                mock.patch.object(rhnpush_main.random, "uniform", return_value=1):
+            ret = self.upload._upload_package(PACKAGES[0], 'sha256', 'sum')
+
+        self.assertEqual(ret, {'name': 'pkg0'})
+        self.assertEqual([c[0][0] for c in sleep.call_args_list],
+                         [rhnpush_main.UPLOAD_BACKOFF, 2 * rhnpush_main.UPLOAD_BACKOFF])
+
+    def testReauthenticateOncePerSession(self):
+        # both uploads are refused with the same session before either re-authenticates
+        refused = threading.Barrier(2, timeout=10)
+
+        def package(pkg, *args):
+            if self.upload._session_generation == 0:
+                refused.wait()
+                raise rhnpush_main.AuthenticationRequired()
+            return {'name': pkg}
+        self.upload.package = mock.Mock(side_effect=package)
+        self.upload.options.threads = 2
+
+        rets = self.upload._upload_packages([(p, 'sha256', 'sum') for p in PACKAGES[:2]])
+
+        self.assertEqual(rets, [{'name': p} for p in PACKAGES[:2]])
+        self.assertEqual(self.upload.authenticate.call_count, 1)
+        self.assertEqual(self.upload._session_generation, 1)
+
+    def testExistenceChecksInBatches(self):
+        infos = [(p, None, _package_info(p)) for p in PACKAGES]
+        self.upload._package_checksum_infos = mock.Mock(return_value=iter(infos))
+        self.upload._get_server_checksums = mock.Mock(side_effect=lambda batch: dict((k, ()) for k in batch))
+
+        with mock.patch.object(rhnpush_main, "CHECKSUMS_PER_CALL", 2):
+            server_digests, pkg_hash, digest_hash = self.upload.check_package_exists()
+
+        self.assertEqual([sorted(c[0][0]) for c in self.upload._get_server_checksums.call_args_list],
+                         [PACKAGES[0:2], PACKAGES[2:4], PACKAGES[4:]])
+        self.assertEqual(server_digests, dict((p, ()) for p in PACKAGES))
+        self.assertEqual(sorted(pkg_hash), PACKAGES)
+        self.assertEqual(digest_hash[PACKAGES[0]], ('sha256', 'sum-%s' % PACKAGES[0]))
+
+    def testChannelSubscriptionInBatches(self):
+        for name in ('setForce', 'setOrg', 'setURL', 'setChannels', 'setServer'):
+            setattr(self.upload, name, mock.Mock())
+        self.upload.channels = ['channel']
+        self.upload.orgId = ''
+        self.upload.session = mock.Mock()
+        self.upload.server = mock.Mock()
+        # all the packages are already on the server
+        digests = dict((p, ('sha256', 'sum-%s' % p)) for p in PACKAGES)
+        self.upload.check_package_exists = mock.Mock(
+            return_value=(digests, dict((p, _package_info(p)) for p in PACKAGES), digests))
+
+        # the info of the call is reused for the next batch
+        batches = []
+
+        def call(method, session, info):
+            self.assertEqual(info['channels'], ['channel'])
+            batches.append([p['name'] for p in info['packages']])
+
+        with mock.patch.object(rhnpush_main.rhnpush_v2, "PingPackageUpload") as ping, \
+                mock.patch.object(rhnpush_main.uploadLib, "call", side_effect=call), \
+                mock.patch.object(rhnpush_main, "CHANNEL_PACKAGES_PER_CALL", 2):
+            ping.return_value.ping.return_value = (200, "OK", {'X-RHN-Check-Package-Exists': '1'})
+            self.assertEqual(self.upload.packages(), 0)
+
+        self.assertEqual(batches, [['pkg0', 'pkg1'], ['pkg2', 'pkg3'], ['pkg4']])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -625,8 +625,13 @@ class BrokerHandler(SharedHandler):
             params = ()
         try:
             ret = f(*params)
-        except rhnRepository.NotLocalError:
+        except rhnRepository.NotLocalError as e:
             # The package is not local
+            if funct == 'getPackage' and e.args:
+                # but belongs in the local repository: store it there while
+                # streaming it from the parent, if its checksum is known
+                self.teePath = "%s/%s" % (CFG.PKG_DIR, e.args[0])
+                self.teeChecksum = rhnRepository.checksumFromPackagePath(e.args[0])
             return None
 
         return ret
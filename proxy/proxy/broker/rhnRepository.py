@@ -51,6 +51,8 @@ from uyuni.common.usix import raise_with_tb
 
 PKG_LIST_DIR = os.path.join(CFG.PKG_DIR, 'list')
 PREFIX = "rhn"
+# Length of the hex digests of the checksum types the packages may have
+CHECKSUM_TYPES_BY_LENGTH = {32: 'md5', 40: 'sha1', 64: 'sha256', 96: 'sha384', 128: 'sha512'}
 
 
 class NotLocalError(Exception):
@@ -461,6 +463,23 @@ def computePackagePaths(nvrea, source=0, prepend="", checksum=None):
     return paths
 
 
+def checksumFromPackagePath(path):
+    """ Returns the (checksum type, checksum) of a package path computed by
+        computePackagePaths with a checksum, or None for other paths.
+    """
+    parts = path.split('/')
+    # [prefix, checksum[:3], name, version-release, arch, checksum, filename]
+    if len(parts) != 7 or not parts[5].startswith(parts[1]):
+        return None
+    checksum = parts[5].lower()
+    if checksum.strip('0123456789abcdef'):
+        return None
+    checksum_type = CHECKSUM_TYPES_BY_LENGTH.get(len(checksum))
+    if checksum_type is None:
+        return None
+    return checksum_type, checksum
+
+
 def cache(stringObject, directory, filename, version):
     """ Caches stringObject into a file and removes older files """
 
@@ -21,8 +21,10 @@ try:
 except ImportError:
     # python 2
     import urllib
+import os
 import socket
 import sys
+import tempfile
 
 # global imports
 from rhn import connections
@@ -38,6 +40,7 @@ from spacewalk.common.rhnLog import log_debug, log_error
 from spacewalk.common import rhnFlags, apache
 from spacewalk.common.rhnTranslate import _
 from uyuni.common import rhnLib
+from uyuni.common.checksum import getHashlibInstance
 from uyuni.common.usix import raise_with_tb, ListType, TupleType
 
 # local imports
@@ -69,6 +72,10 @@ class SharedHandler:
 
         self.responseContext = ResponseContext()
         self.uri = None   # ''
+        # Local file that streamed response bodies are also written to, and
+        # the (checksum type, checksum) the body must match to be stored there
+        self.teePath = None
+        self.teeChecksum = None
 
         # Common settings for both the proxy and the redirect
         # broker and redirect immediately alter these for their own purposes
@@ -466,6 +473,11 @@ class SharedHandler:
 
         # read content if there is some or the size is unknown
         if (size > 0 or size == -1) and (toRequest.method != 'HEAD'):
+            if CFG.STREAM_DOWNLOADS:
+                # Relay the body to the client while it arrives from the
+                # parent instead of storing it first
+                toRequest.output = self._streamHTTPBody(fromResponse, self._detachResponse(fromResponse), size)
+                return
             tfile = SmartIO(max_mem_size=CFG.MAX_MEM_FILE_SIZE)
             buf = fromResponse.read(CFG.BUFFER_SIZE)
             while buf:
@@ -479,3 +491,88 @@ class SharedHandler:
                 toRequest.output = toRequest.headers_in['wsgi.file_wrapper'](tfile, CFG.BUFFER_SIZE)
             else:
                 toRequest.output = iter(lambda: tfile.read(CFG.BUFFER_SIZE), '')
+
+    def _detachResponse(self, fromResponse):
+        """ Take the response and its connection out of the response context,
+            so they are not closed before the body is streamed to the client.
+            Returns the connection to close when done.
+        """
+        if self.responseContext.getBodyFd() is not fromResponse:
+            return None
+        connection = self.responseContext.getConnection()
+        self.responseContext.setBodyFd(None)
+        self.responseContext.setConnection(None)
+        return connection
+
+    def _openTee(self, fromResponse, size):
+        """ Returns (file object, temporary path) to write a copy of the
+            response body to, or (None, None).
+        """
+        if not self.teePath or getattr(fromResponse, 'status', None) != apache.HTTP_OK:
+            return None, None
+        if not self.teeChecksum or size == -1:
+            # the body could not be verified
+            log_debug(3, "Not storing %s locally: unknown checksum or size" % self.teePath)
+            return None, None
+        try:
+            dirname = os.path.dirname(self.teePath)
+            if not os.path.isdir(dirname):
+                os.makedirs(dirname)
+            fd, tmpPath = tempfile.mkstemp(prefix='.' + os.path.basename(self.teePath), dir=dirname)
+            return os.fdopen(fd, 'wb'), tmpPath
+        except (IOError, OSError) as e:
+            log_error("Cannot store %s locally: %s" % (self.teePath, e))
+            return None, None
+
+    def _streamHTTPBody(self, fromResponse, connection, size):
+        """ Generator relaying the response body in CFG.BUFFER_SIZE chunks,
+            writing it also to self.teePath if set. The local copy is kept only
+            if the body is complete and matches self.teeChecksum.
+
+            Errors reading the body are raised, so that the client gets a
+            failed transfer and not a truncated file.
+        """
+        tee, tmpPath = self._openTee(fromResponse, size)
+        digest = None
+        if tee is not None:
+            digest = getHashlibInstance(self.teeChecksum[0], False)
+        written = 0
+        stored = False
+        try:
+            while True:
+                try:
+                    buf = fromResponse.read(CFG.BUFFER_SIZE)
+                except IOError as e:
+                    log_error("Error reading the response body of %s: %s" % (self.uri, e))
+                    raise
+                if not buf:
+                    break
+                if tee is not None:
+                    try:
+                        tee.write(buf)
+                        digest.update(buf)
+                    except (IOError, OSError) as e:
+                        log_error("Cannot store %s locally: %s" % (self.teePath, e))
+                        tee.close()
+                        os.unlink(tmpPath)
+                        tee = None
+                written += len(buf)
+                yield buf
+            if size != -1 and written != size:
+                log_error("Response body of %s truncated: %s of %s bytes" % (self.uri, written, size))
+                raise IOError("Response body truncated")
+            if tee is not None:
+                tee.close()
+                if digest.hexdigest() == self.teeChecksum[1]:
+                    os.rename(tmpPath, self.teePath)
+                    stored = True
+                    log_debug(3, "Stored %s locally" % self.teePath)
+                else:
+                    log_error("Not storing %s locally: checksum mismatch" % self.teePath)
+        finally:
+            fromResponse.close()
+            if connection is not None:
+                connection.close()
+            if tee is not None and not stored:
+                tee.close()
+                os.unlink(tmpPath)
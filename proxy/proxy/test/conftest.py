@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2026 SUSE LLC
+#
+# This software is licensed to you under the GNU General Public License,
+# version 2 (GPLv2). There is NO WARRANTY for this software, express or
+# implied, including the implied warranties of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. You should have received a copy of GPLv2
+# along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+#
+import glob
+import os
+import shutil
+import tempfile
+
+import spacewalk
+
+PROXY_CONF_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'rhn-conf')
+
+
+def pytest_sessionstart(session):
+    # Skip if we already have done it
+    if 'RHN_CONFIG_PATH' in os.environ:
+        return
+
+    tmp_path = tempfile.mkdtemp()
+    # rhnConfig requires the /etc/rhn/rhn.conf even if empty at import time
+    with open(os.path.join(tmp_path, 'rhn.conf'), "w"):
+        pass
+
+    # rhnConfig requires the defaults config files at import time
+    defaults_path = os.path.join(tmp_path, 'defaults')
+    os.mkdir(defaults_path)
+    shutil.copy(os.path.join(os.path.dirname(spacewalk.__file__), 'rhn-conf', 'rhn.conf'), defaults_path)
+    for conf_file in glob.glob(os.path.join(PROXY_CONF_DIR, '*.conf')):
+        shutil.copy(conf_file, defaults_path)
+
+    os.environ['RHN_CONFIG_PATH'] = tmp_path
+    os.environ['RHN_CONFIG_DEFAULTS_PATH'] = defaults_path
+
+    # the broker modules read the proxy configuration at import time
+    from spacewalk.common.rhnConfig import initCFG
+    initCFG('proxy.broker')
+
+
+def pytest_sessionfinish(session, exitstatus):
+    if 'RHN_CONFIG_PATH' in os.environ:
+        shutil.rmtree(os.environ['RHN_CONFIG_PATH'])
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2026 SUSE LLC
+#
+# This software is licensed to you under the GNU General Public License,
+# version 2 (GPLv2). There is NO WARRANTY for this software, express or
+# implied, including the implied warranties of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. You should have received a copy of GPLv2
+# along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+#
+"""
+Tests for the streaming of response bodies from the parent to the client
+"""
+import hashlib
+import io
+import os
+from unittest.mock import Mock, patch
+
+import pytest
+
+from proxy import rhnShared
+from proxy.broker import rhnRepository
+
+BODY = b"package payload " * 100
+
+
+class FakeResponse:
+    """Response of the parent, optionally failing after some bytes"""
+
+    status = 200
+
+    def __init__(self, body, fail_after=None):
+        self._body = io.BytesIO(body)
+        self._fail_after = fail_after
+        self.closed = False
+
+    def read(self, size):
+        if self._fail_after is not None and self._body.tell() >= self._fail_after:
+            raise IOError("connection reset")
+        return self._body.read(size)
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def handler(tmp_path):
+    handler = rhnShared.SharedHandler(Mock(headers_in={}))
+    handler.uri = "/XMLRPC/GET-REQ/channel/getPackage/pkg-1.0-1.x86_64.rpm"
+    handler.teePath = str(tmp_path / "rhn" / "pkg-1.0-1.x86_64.rpm")
+    handler.teeChecksum = ('sha256', hashlib.sha256(BODY).hexdigest())
+    with patch.object(rhnShared.CFG, "BUFFER_SIZE", 256, create=True):
+        yield handler
+
+
+def _stored_files(handler):
+    dirname = os.path.dirname(handler.teePath)
+    return os.listdir(dirname) if os.path.isdir(dirname) else []
+
+
+def test_stream_stores_verified_body(handler):
+    response = FakeResponse(BODY)
+    connection = Mock()
+
+    chunks = list(handler._streamHTTPBody(response, connection, len(BODY)))
+
+    assert len(chunks) > 1
+    assert b"".join(chunks) == BODY
+    assert response.closed
+    connection.close.assert_called_once_with()
+    with open(handler.teePath, "rb") as f:
+        assert f.read() == BODY
+    assert _stored_files(handler) == [os.path.basename(handler.teePath)]
+
+
+def test_stream_checksum_mismatch_not_stored(handler):
+    handler.teeChecksum = ('sha256', hashlib.sha256(b"other").hexdigest())
+
+    assert b"".join(handler._streamHTTPBody(FakeResponse(BODY), None, len(BODY))) == BODY
+    assert _stored_files(handler) == []
+
+
+def test_stream_unknown_checksum_not_stored(handler):
+    handler.teeChecksum = None
+
+    assert b"".join(handler._streamHTTPBody(FakeResponse(BODY), None, len(BODY))) == BODY
+    assert _stored_files(handler) == []
+
+
+def test_stream_chunked_response_not_stored(handler):
+    assert b"".join(handler._streamHTTPBody(FakeResponse(BODY), None, -1)) == BODY
+    assert _stored_files(handler) == []
+
+
+def test_stream_read_error_raised(handler):
+    response = FakeResponse(BODY, fail_after=512)
+    connection = Mock()
+
+    with pytest.raises(IOError):
+        list(handler._streamHTTPBody(response, connection, len(BODY)))
+    assert response.closed
+    connection.close.assert_called_once_with()
+    assert _stored_files(handler) == []
+
+
+def test_stream_truncated_body_raised(handler):
+    with pytest.raises(IOError):
+        list(handler._streamHTTPBody(FakeResponse(BODY[:1000]), None, len(BODY)))
+    assert _stored_files(handler) == []
+
+
+def test_stream_client_disconnect_not_stored(handler):
+    response = FakeResponse(BODY)
+    stream = handler._streamHTTPBody(response, None, len(BODY))
+    next(stream)
+    stream.close()
+
+    assert response.closed
+    assert _stored_files(handler) == []
+
+
+def test_checksum_from_package_path():
+    checksum = hashlib.sha256(BODY).hexdigest()
+    paths = rhnRepository.computePackagePaths(["pkg", "1.0", "1", "", "x86_64"], prepend=rhnRepository.PREFIX,
+                                              checksum=checksum)
+
+    assert rhnRepository.checksumFromPackagePath(paths[0]) == ('sha256', checksum)
+    assert rhnRepository.checksumFromPackagePath(paths[1]) is None
+    md5 = hashlib.md5(BODY).hexdigest()
+    assert rhnRepository.checksumFromPackagePath(
+        rhnRepository.computePackagePaths(["pkg", "1.0", "1", "2", "x86_64"], prepend=rhnRepository.PREFIX,
+                                          checksum=md5)[0]) == ('md5', md5)
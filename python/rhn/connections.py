@@ -11,6 +11,8 @@
 import base64
 import encodings.idna
 import socket
+import threading
+import time
 from platform import python_version
 from rhn.stringutils import bstr, ustr, sstr
 from rhn import SSL
@@ -260,6 +262,55 @@ class HTTPSProxyConnection(HTTPProxyConnection):
         # Add a User-Agent header
         self.putheader("User-Agent", self._user_agent)
 
+class ConnectionPool:
+    """
+    Keeps the idle HTTP/1.1 connections of a transport open, so consecutive
+    requests to the same host do not pay for a new TCP and SSL handshake.
+    At most maxsize idle connections are kept per host, each for at most
+    timeout seconds.
+    """
+    def __init__(self, maxsize=4, timeout=15):
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Returns an idle connection to key, None if there is none"""
+        now = time.time()
+        with self._lock:
+            idle = self._idle.get(key, [])
+            while idle:
+                connection, released = idle.pop()
+                if now - released < self.timeout and connection.sock is not None:
+                    return connection
+                connection.close()
+        return None
+
+    def put(self, key, connection):
+        """Gives a connection with no pending response back to the pool"""
+        if connection.sock is None:
+            return
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.maxsize:
+                idle.append((connection, time.time()))
+                return
+        connection.close()
+
+    def clear(self):
+        """Closes all the idle connections"""
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for connections in idle.values():
+            for connection, _released in connections:
+                connection.close()
+
+    def __len__(self):
+        with self._lock:
+            return sum(len(connections) for connections in self._idle.values())
+
+
 def idn_puny_to_unicode(hostname):
     """ Convert Internationalized domain name from Punycode (RFC3492) to Unicode """
     if hostname is None:
@@ -237,7 +237,7 @@ class Server:
         self._bufferSize = bufferSize
         self._transport.set_buffer_size(bufferSize)
 
-    def set_progress_callback(self, progressCallback, bufferSize=16384):
+    def set_progress_callback(self, progressCallback, bufferSize=transports.BUFFER_SIZE):
         self._progressCallback = progressCallback
         self._transport.set_progress_callback(progressCallback, bufferSize)
 
@@ -398,7 +398,7 @@ class Server:
 
             self._redirected = None
             retry += 1
-            if save_response == 200:
+            if save_response in (200, 206):
                 # exit redirects loop and return response
                 break
             elif save_response not in (301, 302):
@@ -0,0 +1,99 @@
+#!/usr/bin/python
+#
+# Reuse of the HTTP/1.1 connections by the transports
+#
+
+import socket
+import threading
+import unittest
+
+try: # python2
+    from SimpleXMLRPCServer import SimpleXMLRPCServer, SimpleXMLRPCRequestHandler
+    from SocketServer import ThreadingMixIn
+except ImportError: # python3
+    from xmlrpc.server import SimpleXMLRPCServer, SimpleXMLRPCRequestHandler
+    from socketserver import ThreadingMixIn
+
+from rhn import transports
+from rhn.rpclib import Server
+
+
+class ThreadingXMLRPCServer(ThreadingMixIn, SimpleXMLRPCServer):
+    daemon_threads = True
+
+
+class KeepAliveHandler(SimpleXMLRPCRequestHandler):
+    protocol_version = "HTTP/1.1"
+    connections = []
+
+    def setup(self):
+        SimpleXMLRPCRequestHandler.setup(self)
+        self.connections.append(self.connection)
+
+    def log_message(self, *args):
+        pass
+
+
+class KeepAliveTest(unittest.TestCase):
+
+    def setUp(self):
+        KeepAliveHandler.connections = []
+        self.httpd = ThreadingXMLRPCServer(("127.0.0.1", 0), KeepAliveHandler,
+            logRequests=False)
+        self.httpd.register_function(lambda x: x, "echo")
+        thread = threading.Thread(target=self.httpd.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.url = "http://127.0.0.1:%s/RPC2" % self.httpd.server_address[1]
+
+    def tearDown(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def _calls(self, server, count):
+        for i in range(count):
+            self.assertEqual(server.echo(i), i)
+
+    def testConnectionReused(self):
+        server = Server(self.url)
+        self._calls(server, 20)
+        self.assertEqual(len(KeepAliveHandler.connections), 1)
+        server.close()
+
+    def testReconnectAfterReset(self):
+        server = Server(self.url)
+        self._calls(server, 2)
+        # the server drops the idle connection
+        KeepAliveHandler.connections[0].shutdown(socket.SHUT_RDWR)
+        self._calls(server, 2)
+        self.assertEqual(len(KeepAliveHandler.connections), 2)
+        server.close()
+
+    def testIdleTimeout(self):
+        server = Server(self.url)
+        server._transport._pool.timeout = 0
+        self._calls(server, 3)
+        self.assertEqual(len(KeepAliveHandler.connections), 3)
+        server.close()
+
+    def testConnectionPerCallWithoutPool(self):
+        """Without a pool every call opens a connection, with one it is reused"""
+        def calls(pool_size):
+            server = Server(self.url)
+            server._transport._pool.maxsize = pool_size
+            self._calls(server, 200)
+            server.close()
+
+        calls(0)
+        self.assertEqual(len(KeepAliveHandler.connections), 200)
+        calls(transports.KEEPALIVE_POOL_SIZE)
+        self.assertEqual(len(KeepAliveHandler.connections), 201)
+
+    def testBufferSize(self):
+        self.assertEqual(transports.Input().bufferSize, transports.BUFFER_SIZE)
+        self.assertEqual(Server(self.url)._transport.bufferSize,
+            transports.BUFFER_SIZE)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -10,7 +10,9 @@
 
 
 # Transport objects
+import errno
 import os
+import socket
 import sys
 import time
 from rhn import connections
@@ -19,9 +21,11 @@ from rhn.SmartIO import SmartIO
 from rhn.UserDictCase import UserDictCase
 
 try: # python2
+    import httplib
     import xmlrpclib
     from types import IntType, StringType, ListType
 except ImportError: # python3
+    import http.client as httplib
     import xmlrpc.client as xmlrpclib
     IntType = int
     StringType = bytes
@@ -32,12 +36,30 @@ __version__ = "$Revision$"
 # XXX
 COMPRESS_LEVEL = 6
 
+# Size of the chunks read from the network
+BUFFER_SIZE = 65536
+
+# Idle keep-alive connections kept per host, and for how many seconds
+KEEPALIVE_POOL_SIZE = 4
+KEEPALIVE_TIMEOUT = 15
+
 # Exceptions
 class NotProcessed(Exception):
     pass
 
+def _connection_reset(e):
+    """True if e means the server closed a kept-alive connection"""
+    if isinstance(e, httplib.BadStatusLine):
+        return True
+    if isinstance(e, socket.timeout):
+        return False
+    return isinstance(e, socket.error) and getattr(e, 'errno', None) in (
+        errno.EPIPE, errno.ECONNRESET, errno.ECONNABORTED)
+
 class Transport(xmlrpclib.Transport):
     user_agent = "rhn.rpclib.py/%s" % __version__
+    keepalive_pool_size = KEEPALIVE_POOL_SIZE
+    keepalive_timeout = KEEPALIVE_TIMEOUT
 
     def __init__(self, transfer=0, encoding=0, refreshCallback=None,
             progressCallback=None, use_datetime=None, timeout=None):
@@ -51,16 +73,18 @@ class Transport(xmlrpclib.Transport):
         self._lang = None
         self.refreshCallback = refreshCallback
         self.progressCallback = progressCallback
-        self.bufferSize = 16384
+        self.bufferSize = BUFFER_SIZE
         self.headers_in = None
         self.response_status = None
         self.response_reason = None
         self._redirected = None
         self._use_datetime = use_datetime
         self.timeout = timeout
+        self._pool = connections.ConnectionPool(self.keepalive_pool_size,
+            self.keepalive_timeout)
 
     # set the progress callback
-    def set_progress_callback(self, progressCallback, bufferSize=16384):
+    def set_progress_callback(self, progressCallback, bufferSize=BUFFER_SIZE):
         self.progressCallback = progressCallback
         self.bufferSize = bufferSize
 
@@ -73,8 +97,8 @@ class Transport(xmlrpclib.Transport):
     # progress callback called
     def set_buffer_size(self, bufferSize):
         if bufferSize is None:
-            # No buffer size specified; go with 16k
-            bufferSize = 16384
+            # No buffer size specified; go with the default
+            bufferSize = BUFFER_SIZE
 
         self.bufferSize = bufferSize
 
@@ -142,20 +166,61 @@ class Transport(xmlrpclib.Transport):
         # XXX: automatically compute how to send depending on how much data
         #      you want to send
 
-        # XXX Deal with HTTP/1.1 if necessary
         self.verbose = verbose
 
         # implement BASIC HTTP AUTHENTICATION
         host, extra_headers, x509 = self.get_host_info(host)
         if not extra_headers:
             extra_headers = []
-        # Establish the connection
+        # Reuse a kept-alive connection to the host if there is one; if the
+        # server closed it meanwhile, send the request once more over a
+        # new connection
+        connection = self._pool.get(host)
+        while 1:
+            reused = connection is not None
+            if not reused:
+                connection = self._new_connection(host)
+            req = self._prepare_request(connection, request_body, extra_headers)
+            try:
+                headers, fd = req.send_http(host, handler)
+            except Exception as e:
+                connection.close()
+                if reused and _connection_reset(e):
+                    connection = None
+                    continue
+                raise
+            break
+
+        if self.verbose:
+            print("Incoming headers:")
+            for header, value in headers.items():
+                print("\t%s : %s" % (header, value))
+
+        if fd.status in (301, 302):
+            self._redirected = headers["Location"]
+            self.response_status = fd.status
+            connection.close()
+            return None
+
+        # Save the headers
+        self.headers_in = headers
+        self.response_status = fd.status
+        self.response_reason = fd.reason
+
+        return self._process_response(fd, connection)
+
+    def _new_connection(self, host):
         connection = self.get_connection(host)
         # Setting the user agent. Only interesting for SSL tunnels, in any
         # other case the general headers are good enough.
         connection.set_user_agent(self.user_agent)
         if self.verbose:
             connection.set_debuglevel(self.verbose - 1)
+        # Remember the host to give the connection back to the pool
+        connection.pool_key = host
+        return connection
+
+    def _prepare_request(self, connection, request_body, extra_headers):
         # Get the output object to push data with
         req = Output(connection=connection, method=self.method)
         req.set_transport_flags(**self._transport_flags)
@@ -173,31 +238,28 @@ class Transport(xmlrpclib.Transport):
         # Host and Content-Length are set by HTTP*Connection
         for h in ['Content-Length', 'Host']:
             req.clear_header(h)
+        return req
+
+    def _release_connection(self, connection, response):
+        """
+        Keeps the connection open for the next request if the server allows
+        it and the response has been read completely, closes it otherwise.
+        """
+        if response.will_close or response.length != 0:
+            connection.close()
+        else:
+            self._pool.put(getattr(connection, 'pool_key', None), connection)
 
-        headers, fd = req.send_http(host, handler)
-
-        if self.verbose:
-            print("Incoming headers:")
-            for header, value in headers.items():
-                print("\t%s : %s" % (header, value))
-
-        if fd.status in (301, 302):
-            self._redirected = headers["Location"]
-            self.response_status = fd.status
-            return None
-
-        # Save the headers
-        self.headers_in = headers
-        self.response_status = fd.status
-        self.response_reason = fd.reason
-
-        return self._process_response(fd, connection)
+    def close(self):
+        """Closes the kept-alive connections"""
+        self._pool.clear()
 
     def _process_response(self, fd, connection):
         # Now use the Input class in case we get an enhanced response
         resp = Input(self.headers_in, progressCallback=self.progressCallback,
                 bufferSize=self.bufferSize)
 
+        response = fd
         fd = resp.decode(fd)
 
         if isinstance(fd, InputStream):
@@ -213,11 +275,11 @@ class Transport(xmlrpclib.Transport):
             f.close = connection.close
             return f
 
-        # We can safely close the connection now; if we had an
+        # The whole response has been read now; if we had an
         # application/octet/stream (for which Input.read passes the original
         # socket object), Input.decode would return an InputStream,
         # so we wouldn't reach this point
-        connection.close()
+        self._release_connection(connection, response)
 
         return self.parse_response(fd)
 
@@ -232,7 +294,7 @@ class Transport(xmlrpclib.Transport):
         p, u = self.getparser()
 
         while 1:
-            response = f.read(1024)
+            response = f.read(self.bufferSize)
             if not response:
                 break
             if self.refreshCallback:
@@ -357,7 +419,7 @@ class SafeProxyTransport(ProxyTransport):
 # Input class to automate reading the posting from the network
 # Having to work with environment variables blows, though
 class Input:
-    def __init__(self, headers=None, progressCallback=None, bufferSize=1024,
+    def __init__(self, headers=None, progressCallback=None, bufferSize=BUFFER_SIZE,
             max_mem_size=16384):
         self.transfer = None
         self.encoding = None
@@ -426,7 +488,8 @@ class Input:
                 max_mem_size=self.max_mem_size)
         else:
             # Oh well, no clue; read until EOF (hopefully)
-            self.io = _smart_total_read(fd)
+            self.io = _smart_total_read(fd, bufferSize=self.bufferSize,
+                max_mem_size=self.max_mem_size)
 
         if not self.transfer or self.transfer == "binary":
             return
@@ -492,7 +555,7 @@ class Input:
 
 # Utility functions
 
-def _smart_total_read(fd, bufferSize=1024, max_mem_size=16384):
+def _smart_total_read(fd, bufferSize=BUFFER_SIZE, max_mem_size=16384):
     """
     Tries to read data from the supplied stream, and puts the results into a
     StmartIO object. The data will be in memory or in a temporary file,
@@ -509,7 +572,7 @@ def _smart_total_read(fd, bufferSize=1024, max_mem_size=16384):
 
     return io
 
-def _smart_read(fd, amt, bufferSize=1024, progressCallback=None,
+def _smart_read(fd, amt, bufferSize=BUFFER_SIZE, progressCallback=None,
         max_mem_size=16384):
     # Reads amt bytes from fd, or until the end of file, whichever
     # occurs first
@@ -725,7 +788,9 @@ class BaseOutput:
 
         if self._connection is None:
             raise Exception("No connection object found")
-        self._connection.connect()
+        if self._connection.sock is None:
+            # not a kept-alive connection
+            self._connection.connect()
         # wrap self data into binary object, otherwise HTTPConnection.request
         # will encode it as ISO-8859-1 https://docs.python.org/3/library/http.client.html#httpconnection-objects
         self._connection.request(self.method, handler, body=bstr(self.data), headers=self.headers)
@@ -752,7 +817,7 @@ class BaseOutput:
         # If the flag is not set, it's unacceptable
         if not self.transport_flags.get('allow_partial_content'):
             return 0
-        if response.msg['Content-Type'] != 'application/octet-stream':
+        if response.msg['Content-Type'] not in ('application/octet-stream', 'application/x-rpm'):
             # Don't allow anything else to be requested as a range, it could
             # break the XML parser
             return 0
@@ -802,7 +867,7 @@ Output = BaseOutput
 # File object
 class File:
     def __init__(self, file_obj, length = 0, name = None,
-            progressCallback=None, bufferSize=16384):
+            progressCallback=None, bufferSize=BUFFER_SIZE):
         self.length = length
         self.file_obj = file_obj
         self.close = file_obj.close
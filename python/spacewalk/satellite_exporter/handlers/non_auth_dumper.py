@@ -28,6 +28,7 @@ import sys
 
 from rhn.UserDictCase import UserDictCase
 from uyuni.common.usix import raise_with_tb
+from spacewalk.common import apache, byterange
 from spacewalk.common.rhnLog import log_debug, log_error
 from spacewalk.common.rhnConfig import CFG
 from spacewalk.server import rhnSQL, rhnLib
@@ -581,21 +582,41 @@ class NonAuthenticatedDumper(rhnHandler, dumper.XML_Dumper):
 
         stream.seek(0, 2)
         file_size = stream.tell()
-        stream.seek(0, 0)
         log_debug(3, "Package size", file_size)
-        self.headers_out['Content-Length'] = file_size
+        range_start, range_end = 0, file_size
+        # Serve up the requested byte range, so that interrupted downloads
+        # can be resumed by the slave
+        if file_size and "Range" in self._raw_stream.headers_in:
+            try:
+                range_start, range_end = byterange.parse_byteranges(
+                    self._raw_stream.headers_in["Range"], file_size)
+            except (byterange.InvalidByteRangeException, byterange.UnsatisfyableByteRangeException):
+                # Send the whole file
+                pass
+            else:
+                self.headers_out['Content-Range'] = byterange.get_content_range(range_start, range_end, file_size)
+                self._raw_stream.status = apache.HTTP_PARTIAL_CONTENT
+        stream.seek(range_start, 0)
+        self.headers_out['Accept-Ranges'] = 'bytes'
+        self.headers_out['Content-Length'] = range_end - range_start
         self.compress_level = 0
         self._raw_stream.content_type = 'application/x-rpm'
         self._send_headers()
-        self.send_rpm(stream)
+        self.send_rpm(stream, range_end - range_start)
         return 0
 
-    def send_rpm(self, stream):
+    def send_rpm(self, stream, length=None):
         buffer_size = 65536
         while 1:
+            if length is not None:
+                if length <= 0:
+                    break
+                buffer_size = min(buffer_size, length)
             buf = stream.read(buffer_size)
             if not buf:
                 break
+            if length is not None:
+                length -= len(buf)
             try:
                 self._raw_stream.write(buf)
             except IOError:
@@ -339,9 +339,9 @@ class XML_Dumper:
         """ Caches the short package entries for channel_id """
         # Create a temporary file
         temp_stream = tempfile.TemporaryFile()
-        stream = StringIO()
         # Always compress the result
         compress_level = 5
+        stream = StringBuffer(temp_stream, compression='gzip', compress_level=compress_level)
         writer = xmlWriter.XMLWriter(stream=stream)
 
         # Fetch packages
@@ -355,8 +355,6 @@ class XML_Dumper:
                                  ShortPackagesDumper(writer, package_ids))
         dumper.dump()
         writer.flush()
-        stream.seek(0, 0)
-        temp_stream.write(gzip.compress(data=stream.read().encode(), compresslevel=compress_level))
         # We're done with the stream object
         stream.close()
         del stream
@@ -18,8 +18,12 @@ import os.path
 import sys
 import time
 import gzip
+import json
+import fcntl
 import shutil
 import gettext
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, as_completed
 try:
     #  python 2
     import cStringIO
@@ -27,6 +31,7 @@ except ImportError:
     #  python3
     import io as cStringIO
 from . import dumper
+from .string_buffer import StringBuffer
 from uyuni.common.usix import raise_with_tb
 from uyuni.common.checksum import getFileChecksum
 from spacewalk.common import rhnMail
@@ -50,6 +55,15 @@ except AttributeError:
 # bare-except and broad-except
 # pylint: disable=W0702,W0703
 
+# ioctl cloning a file on filesystems supporting reflinks (btrfs, xfs), from linux/fs.h
+FICLONE = 0x40049409
+
+# number of XML files generated by a worker process per task
+EXPORT_BATCH_SIZE = 50
+
+# gzip compression level of the exported files
+COMPRESS_LEVEL = 9
+
 class ISSError(Exception):
 
     def __init__(self, msg, tb):
@@ -75,6 +89,67 @@ class ISSChannelPackageShortDiskSource:
         return os.path.join(self.mp, self.pathkey % (self.channelid,))
 
 
+class ExportState:
+
+    """ last_modified of the objects exported to an output directory by the previous
+    runs. Incremental exports use it to skip the objects that did not change.
+    """
+
+    filename = '.export-state.json'
+
+    def __init__(self, mount_point):
+        self.path = os.path.join(mount_point, self.filename)
+        self.objects = {}
+        try:
+            with open(self.path, 'r') as f:
+                self.objects = json.load(f)
+        except (IOError, ValueError):
+            pass
+
+    def is_current(self, kind, object_id, last_modified, filename):
+        # the XML files get compressed once a step is done
+        return (self.objects.get(kind, {}).get(str(object_id)) == last_modified
+                and (os.path.exists(filename) or os.path.exists(filename + '.gz')))
+
+    def update(self, kind, object_id, last_modified):
+        self.objects.setdefault(kind, {})[str(object_id)] = last_modified
+
+    def save(self):
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.objects, f)
+        os.rename(tmp_path, self.path)
+
+
+def clone_file(src, dst):
+    """ Copy src to dst, sharing the data blocks of both files if the filesystem supports reflinks. """
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        try:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+            return
+        except (IOError, OSError):
+            pass
+    shutil.copyfile(src, dst)
+
+
+# Dumper of the exporter process, inherited by the forked export workers
+_export_dumper = None
+
+
+def _init_export_worker():
+    """Initialize an export worker process with its own DB connection"""
+    # do not close the connection inherited from the parent process, it is still in use there
+    rhnSQL.closeDB(committing=False, closing=False)
+    rhnSQL.initDB()
+
+
+def _dump_items_worker(args):
+    dump_func, batch = args
+    for filename, item in batch:
+        _export_dumper.dump_item(dump_func, filename, item)
+    return len(batch)
+
+
 class FileMapper:
 
     """ This class maps dumps to files. In other words, you give it
@@ -225,7 +300,7 @@ class Dumper(dumper.XML_Dumper):
     """
 
     def __init__(self, outputdir, channel_labels, org_ids, hardlinks,
-                 start_date, end_date, use_rhn_date, whole_errata):
+                 start_date, end_date, use_rhn_date, whole_errata, workers=1, incremental=False):
         dumper.XML_Dumper.__init__(self)
         self.fm = FileMapper(outputdir)
         self.mp = outputdir
@@ -236,11 +311,16 @@ class Dumper(dumper.XML_Dumper):
         self.hardlinks = hardlinks
         self.filename = None
         self.outstream = None
+        self.outbuffer = None
 
         self.start_date = start_date
         self.end_date = end_date
         self.use_rhn_date = use_rhn_date
         self.whole_errata = whole_errata
+        self.workers = workers
+        self.state = None
+        if incremental:
+            self.state = ExportState(outputdir)
 
         if self.start_date:
             dates = {'start_date': self.start_date,
@@ -337,7 +417,7 @@ class Dumper(dumper.XML_Dumper):
         ###BINARY RPM INFO###
         try:
             if self.whole_errata and self.start_date:
-                query = """ select rcp.package_id id, rp.path path
+                query = """ select rcp.package_id id, rp.path path, rp.checksum_id checksum_id
                    from rhnChannelPackage rcp, rhnPackage rp
                         left join rhnErrataPackage rep on rp.id = rep.package_id
                         left join rhnErrata re on rep.errata_id = re.id
@@ -346,7 +426,7 @@ class Dumper(dumper.XML_Dumper):
                 """
             else:
                 query = """
-                         select rcp.package_id id, rp.path path
+                         select rcp.package_id id, rp.path path, rp.checksum_id checksum_id
                            from rhnChannelPackage rcp, rhnPackage rp
                           where rcp.package_id = rp.id
                             and rcp.channel_id = :channel_id
@@ -386,7 +466,7 @@ class Dumper(dumper.XML_Dumper):
             brpm_data = rhnSQL.prepare(self.brpm_query)
 
             # self.brpms is a list of binary rpm info. It is a list of dictionaries, where each dictionary
-            # has 'id' and 'path' as the keys.
+            # has 'id', 'path' and 'checksum_id' as the keys.
             self.brpms = []
             log2stdout(1, "Gathering binary RPM info...")
             for ch in self.channel_ids:
@@ -665,7 +745,9 @@ class Dumper(dumper.XML_Dumper):
     # closes the self.outstream, which is an addition defined in this subclass.
     # set_filename and _get_xml_writer for more info.
     def close(self):
-        self.outstream.close()
+        if self.outbuffer is not None:
+            self.outbuffer.close()
+            self.outstream.close()
 
     # This is an addition that allows the caller to set the filename for the output stream.
     def set_filename(self, filename):
@@ -675,9 +757,62 @@ class Dumper(dumper.XML_Dumper):
     # be a file, which should have been set prior to this via the set_filename method.
     # TODO: Add error-checking. Either give self.outstream a sane default or have it throw an error if it hasn't
     #      been set yet.
+    # The file is compressed while it is written.
     def _get_xml_writer(self):
-        self.outstream = open(self.filename, "w")
-        return xmlWriter.XMLWriter(stream=self.outstream)
+        if os.path.exists(self.filename):
+            # left uncompressed by an interrupted export, it would replace the new file
+            os.unlink(self.filename)
+        self.outstream = open(self.filename + ".gz", "wb")
+        self.outbuffer = StringBuffer(self.outstream, compression='gzip', compress_level=COMPRESS_LEVEL)
+        return xmlWriter.XMLWriter(stream=self.outbuffer)
+
+    def dump_item(self, dump_func, filename, item):
+        self.set_filename(filename)
+        dump_func(self, [item])
+        self.close()
+
+    def _dump_items(self, kind, items, id_key, get_file, dump_func, pb):
+        """ Dump each of the items to its own file with dump_func.
+
+        Incremental exports skip the items not modified since the previous export. With more
+        than one worker, the files are generated by worker processes with their own DB connection.
+        """
+        global _export_dumper
+
+        todo = []
+        for item in items:
+            filename = get_file(item)
+            if self.state is not None and self.state.is_current(kind, item[id_key], item['last_modified'], filename):
+                log2email(5, "Skipping unchanged %s %s" % (kind, item[id_key]))
+                pb.addTo(1)
+                pb.printIncrement()
+                continue
+            todo.append((filename, item))
+
+        if self.workers > 1 and len(todo) > 1:
+            batches = [todo[i:i + EXPORT_BATCH_SIZE] for i in range(0, len(todo), EXPORT_BATCH_SIZE)]
+            _export_dumper = self
+            # the workers need the dumper state of this process, so they are forked
+            ctx = multiprocessing.get_context('fork')
+            try:
+                with ctx.Pool(processes=self.workers, initializer=_init_export_worker) as pool:
+                    for count in pool.imap_unordered(_dump_items_worker,
+                                                     [(dump_func, batch) for batch in batches]):
+                        pb.addTo(count)
+                        pb.printIncrement()
+            finally:
+                _export_dumper = None
+        else:
+            for filename, item in todo:
+                self.dump_item(dump_func, filename, item)
+                pb.addTo(1)
+                pb.printIncrement()
+
+        if self.state is not None:
+            for _filename, item in todo:
+                self.state.update(kind, item[id_key], item['last_modified'])
+            self.state.save()
+        return len(todo)
 
     # The dump_* methods aren't really overrides because they don't preserve the method
     # signature, but they are meant as replacements for the methods defined in the base
@@ -696,6 +831,7 @@ class Dumper(dumper.XML_Dumper):
             pb.printAll(1)
             self.set_filename(filename)
             dump_func(self)
+            self.close()
 
             pb.addTo(1)
             pb.printIncrement()
@@ -778,6 +914,7 @@ class Dumper(dumper.XML_Dumper):
                 dumper.XML_Dumper.dump_channels(self, [channel],
                                                 self.start_date, self.end_date,
                                                 self.use_rhn_date, self.whole_errata)
+                self.close()
 
                 log2email(4, "Channel: %s" % channel['label'])
                 log2email(5, "Channel exported to %s" % self.fm.getChannelsFile(channel['label']))
@@ -806,6 +943,7 @@ class Dumper(dumper.XML_Dumper):
                 filepath = self.fm.getChannelPackageShortFile(ch_id['channel_id'])
                 self.set_filename(filepath)
                 dumper.XML_Dumper.dump_channel_packages_short(self, ch_id, ch_id['last_modified'], filepath)
+                self.close()
 
         except Exception:
             e = sys.exc_info()[1]
@@ -824,18 +962,12 @@ class Dumper(dumper.XML_Dumper):
                                           self.pb_length,
                                           self.pb_char)
             pb.printAll(1)
-            for pkg_info in self.pkg_info:
-                package_name = "rhn-package-" + str(pkg_info['package_id'])
-                self.set_filename(self.fm.getPackagesFile(package_name))
-                dumper.XML_Dumper.dump_packages(self, [pkg_info])
-
-                log2email(4, "Package: %s" % package_name)
-                log2email(5, "Package exported to %s" % self.fm.getPackagesFile(package_name))
-
-                pb.addTo(1)
-                pb.printIncrement()
+            exported = self._dump_items('packages', self.pkg_info, 'package_id',
+                                        lambda pkg_info: self.fm.getPackagesFile(
+                                            "rhn-package-" + str(pkg_info['package_id'])),
+                                        dumper.XML_Dumper.dump_packages, pb)
             pb.printComplete()
-            log2stdout(3, "Number of packages exported: %s" % str(len(self.pkg_info)))
+            log2stdout(3, "Number of packages exported: %s" % str(exported))
 
         except Exception:
             e = sys.exc_info()[1]
@@ -854,17 +986,12 @@ class Dumper(dumper.XML_Dumper):
                                           self.pb_length,
                                           self.pb_char)
             pb.printAll(1)
-            for pkg_info in self.pkg_info:
-                package_name = "rhn-package-" + str(pkg_info['package_id'])
-                self.set_filename(self.fm.getShortPackagesFile(package_name))
-                dumper.XML_Dumper.dump_packages_short(self, [pkg_info])
-
-                log2email(4, "Short Package: %s" % package_name)
-                log2email(5, "Short Package exported to %s" % package_name)
-                pb.addTo(1)
-                pb.printIncrement()
+            exported = self._dump_items('packages_short', self.pkg_info, 'package_id',
+                                        lambda pkg_info: self.fm.getShortPackagesFile(
+                                            "rhn-package-" + str(pkg_info['package_id'])),
+                                        dumper.XML_Dumper.dump_packages_short, pb)
             pb.printComplete()
-            log2stdout(3, "Number of short packages exported: %s" % str(len(self.pkg_info)))
+            log2stdout(3, "Number of short packages exported: %s" % str(exported))
 
         except Exception:
             e = sys.exc_info()[1]
@@ -879,6 +1006,7 @@ class Dumper(dumper.XML_Dumper):
             for pkg_info in self.src_pkg_info:
                 self.set_filename(self.fm.getSourcePackagesFile("rhn-source-package-" + str(pkg_info['package_id'])))
                 dumper.XML_Dumper.dump_source_packages(self, [pkg_info])
+                self.close()
 
         except Exception:
             e = sys.exc_info()[1]
@@ -897,18 +1025,12 @@ class Dumper(dumper.XML_Dumper):
                                           self.pb_length,
                                           self.pb_char)
             pb.printAll(1)
-            for errata_info in self.errata_info:
-                erratum_name = "rhn-erratum-" + str(errata_info['errata_id'])
-                self.set_filename(self.fm.getErrataFile(erratum_name))
-                dumper.XML_Dumper.dump_errata(self, [errata_info])
-
-                log2email(4, "Erratum: %s" % str(errata_info['advisory-name']))
-                log2email(5, "Erratum exported to %s" % self.fm.getErrataFile(erratum_name))
-
-                pb.addTo(1)
-                pb.printIncrement()
+            exported = self._dump_items('errata', self.errata_info, 'errata_id',
+                                        lambda errata_info: self.fm.getErrataFile(
+                                            "rhn-erratum-" + str(errata_info['errata_id'])),
+                                        dumper.XML_Dumper.dump_errata, pb)
             pb.printComplete()
-            log2stdout(3, "Number of errata exported: %s" % str(len(self.errata_info)))
+            log2stdout(3, "Number of errata exported: %s" % str(exported))
 
         except Exception:
             e = sys.exc_info()[1]
@@ -930,6 +1052,7 @@ class Dumper(dumper.XML_Dumper):
             for kickstart_tree in self.kickstart_trees:
                 self.set_filename(self.fm.getKickstartTreeFile(kickstart_tree['kickstart_label']))  # , 'foo/bar'))
                 dumper.XML_Dumper.dump_kickstartable_trees(self, [kickstart_tree])
+                self.close()
 
                 log2email(5, "KS Data: %s" % str(kickstart_tree['kickstart_label']))
 
@@ -1015,6 +1138,38 @@ class Dumper(dumper.XML_Dumper):
                                    e.__class__.__name__, tbout.getvalue()), sys.exc_info()[2])
 
     # RPM and SRPM dumping code
+    def _export_rpm(self, satellite_path, path_to_rpm, exported_path=None):
+        """ Copy or hard link a rpm into the export directory, exported_path is an already
+        exported file with the same checksum.
+        """
+        try:
+            if exported_path is not None:
+                try:
+                    # identical files are stored only once in the export
+                    os.link(exported_path, path_to_rpm)
+                    return
+                except OSError:
+                    pass
+            # copy the file to the path under the mountpoint.
+            if self.hardlinks:
+                os.link(satellite_path, path_to_rpm)
+            else:
+                clone_file(satellite_path, path_to_rpm)
+        except IOError:
+            e = sys.exc_info()[1]
+            tbout = cStringIO.StringIO()
+            Traceback(mail=0, ostream=tbout, with_locals=1)
+            raise_with_tb(ISSError("Error: Error copying file %s: %s" %
+                                   (satellite_path, e.__class__.__name__),
+                                   tbout.getvalue()), sys.exc_info()[2])
+        except OSError:
+            e = sys.exc_info()[1]
+            tbout = cStringIO.StringIO()
+            Traceback(mail=0, ostream=tbout, with_locals=1)
+            raise_with_tb(ISSError("Error: Could not make hard link %s: %s (different filesystems?)" %
+                                   (satellite_path, e.__class__.__name__),
+                                   tbout.getvalue()), sys.exc_info()[2])
+
     def dump_rpms(self):
         try:
             print("\n")
@@ -1025,6 +1180,11 @@ class Dumper(dumper.XML_Dumper):
                                           self.pb_length,
                                           self.pb_char)
             pb.printAll(1)
+            # files to export, and files with the same checksum as one of them
+            copies = []
+            duplicates = []
+            exported_checksums = {}
+            exported_paths = set()
             for rpm in self.brpms:
                 # generate path to the rpms under the mount point
                 path_to_rpm = diskImportLib.rpmsPath("rhn-package-%s" % str(rpm['id']), self.mp)
@@ -1045,37 +1205,44 @@ class Dumper(dumper.XML_Dumper):
                 if not os.path.exists(dirs_to_rpm):
                     os.makedirs(dirs_to_rpm)
 
-                # check if the path to rpm hardlink already exists
-                if os.path.exists(path_to_rpm):
+                # check if the path to rpm hardlink already exists, the same package
+                # may also be in several of the exported channels
+                if path_to_rpm in exported_paths or os.path.exists(path_to_rpm):
+                    pb.addTo(1)
+                    pb.printIncrement()
                     continue
+                exported_paths.add(path_to_rpm)
 
-                try:
-                    # copy the file to the path under the mountpoint.
-                    if self.hardlinks:
-                        os.link(satellite_path, path_to_rpm)
-                    else:
-                        shutil.copyfile(satellite_path, path_to_rpm)
-                except IOError:
-                    e = sys.exc_info()[1]
-                    tbout = cStringIO.StringIO()
-                    Traceback(mail=0, ostream=tbout, with_locals=1)
-                    raise_with_tb(ISSError("Error: Error copying file %s: %s" %
-                                           (os.path.join(CFG.MOUNT_POINT, rpm['path']), e.__class__.__name__),
-                                           tbout.getvalue()), sys.exc_info()[2])
-                except OSError:
-                    e = sys.exc_info()[1]
-                    tbout = cStringIO.StringIO()
-                    Traceback(mail=0, ostream=tbout, with_locals=1)
-                    raise_with_tb(ISSError("Error: Could not make hard link %s: %s (different filesystems?)" %
-                                           (os.path.join(CFG.MOUNT_POINT, rpm['path']), e.__class__.__name__),
-                                           tbout.getvalue()), sys.exc_info()[2])
-
-                log2email(5, "RPM: %s" % rpm['path'])
-
+                if rpm['checksum_id'] in exported_checksums:
+                    duplicates.append((satellite_path, path_to_rpm, exported_checksums[rpm['checksum_id']]))
+                else:
+                    exported_checksums[rpm['checksum_id']] = path_to_rpm
+                    copies.append((satellite_path, path_to_rpm))
+
+            if self.workers > 1:
+                with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                    futures = dict((executor.submit(self._export_rpm, *copy), copy[0]) for copy in copies)
+                    for future in as_completed(futures):
+                        future.result()
+                        log2email(5, "RPM: %s" % futures[future])
+                        pb.addTo(1)
+                        pb.printIncrement()
+            else:
+                for satellite_path, path_to_rpm in copies:
+                    self._export_rpm(satellite_path, path_to_rpm)
+                    log2email(5, "RPM: %s" % satellite_path)
+                    pb.addTo(1)
+                    pb.printIncrement()
+
+            for satellite_path, path_to_rpm, exported_path in duplicates:
+                self._export_rpm(satellite_path, path_to_rpm, exported_path)
+                log2email(5, "RPM: %s (same as %s)" % (satellite_path, exported_path))
                 pb.addTo(1)
                 pb.printIncrement()
             pb.printComplete()
             log2stdout(3, "Number of RPMs exported: %s" % str(len(self.brpms)))
+            if duplicates:
+                log2stdout(3, "Number of identical RPMs linked: %s" % str(len(duplicates)))
         except ISSError:
             raise
 
@@ -1314,6 +1481,16 @@ class ExporterMain:
         if self.start_date and self.options.whole_errata:
             self.whole_errata = self.options.whole_errata
 
+        self.workers = 1
+        if self.options.parallel:
+            try:
+                self.workers = int(self.options.parallel)
+            except ValueError:
+                self.workers = 0
+            if self.workers < 1:
+                sys.stderr.write("--parallel must be a positive number.\n")
+                sys.exit(1)
+
         # verify mountpoint
         if os.access(self.outputdir, os.F_OK | os.R_OK | os.W_OK):
             if os.path.isdir(self.outputdir):
@@ -1324,7 +1501,9 @@ class ExporterMain:
                                      start_date=self.start_date,
                                      end_date=self.end_date,
                                      use_rhn_date=self.options.use_rhn_date,
-                                     whole_errata=self.options.whole_errata)
+                                     whole_errata=self.options.whole_errata,
+                                     workers=self.workers,
+                                     incremental=self.options.incremental)
                 self.actionmap = {
                     'arches':   {'dump': self.dumper.dump_arches},
                     'arches-extra':   {'dump': self.dumper.dump_server_group_type_server_arches},
@@ -1496,11 +1675,17 @@ class ExporterMain:
                 if not os.path.exists(os_data_dir):
                     continue
 
+                filepaths = []
                 for fpath, _dirs, files in os.walk(os_data_dir):
                     for f in files:
                         if f.endswith(".xml") or f.endswith(".yaml"):
-                            filepath = os.path.join(fpath, f)
-                            compress_file(filepath)
+                            filepaths.append(os.path.join(fpath, f))
+                if self.workers > 1 and len(filepaths) > 1:
+                    with multiprocessing.Pool(processes=self.workers) as pool:
+                        pool.map(compress_file, filepaths, chunksize=EXPORT_BATCH_SIZE)
+                else:
+                    for filepath in filepaths:
+                        compress_file(filepath)
 
             if self.options.make_isos:
                 #iso_output = os.path.join(self.isos_dir, self.dump_dir)
@@ -1565,7 +1750,7 @@ def compress_file(f):
     Gzip the given file and then remove the file.
     """
     datafile = open(f, 'rb')
-    gzipper = gzip.GzipFile(f + '.gz', 'w', 9)
+    gzipper = gzip.GzipFile(f + '.gz', 'w', COMPRESS_LEVEL)
     gzipper.write(datafile.read())
     gzipper.flush()
     # close opened streams
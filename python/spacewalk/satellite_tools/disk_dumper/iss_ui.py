@@ -82,6 +82,10 @@ class UI:
                    help="Include the org with this id in the export."),
             option("--list-orgs",        action="store_true",
                    help="List all orgs that can be exported"),
+            option("--parallel",        action="store",
+                   help="Number of worker processes generating the XML files and copying the RPMs. Default: 1."),
+            option("--incremental",        action="store_true",
+                   help="Skip packages and errata not modified since the previous export to the same directory."),
         ]
         self.optionparser = option_parser(option_list=self.optiontable)
         self.options, self.args = self.optionparser.parse_args()
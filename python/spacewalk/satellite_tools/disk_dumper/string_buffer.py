@@ -18,29 +18,74 @@
 
 import sys
 import time
+import zlib
+
+try:
+    import zstandard
+    HAS_ZSTD = True
+except ImportError:
+    HAS_ZSTD = False
+
+
+def get_compressor(compression, compress_level):
+    """ Return a compressor object for the compression ('gzip' or 'zstd'), None without compression """
+    if not compression:
+        return None
+    if compression == 'gzip':
+        # wbits 16 + MAX_WBITS writes the gzip header and trailer
+        return zlib.compressobj(compress_level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    if compression == 'zstd':
+        if not HAS_ZSTD:
+            raise ValueError("zstd compression requires the zstandard module")
+        return zstandard.ZstdCompressor(level=compress_level).compressobj()
+    raise ValueError("Unknown compression %s" % compression)
+
 
 class StringBuffer:
 
-    def __init__(self, stream):
+    """ Collects the small writes of the XML writers into chunks of buffer_size
+    characters before writing them to the stream.
+
+    With a compression, the data is encoded to UTF-8 and compressed on the fly,
+    the stream then receives bytes. close() writes the end of the compressed data.
+    """
+
+    def __init__(self, stream, buffer_size=65536, compression=None, compress_level=5):
         self.stream = stream
-        self.buffer_size = 65536
-        self.buffer = ""
+        self.buffer_size = buffer_size
+        self._chunks = []
+        self._size = 0
+        # set first, __del__ needs it if get_compressor raises
+        self._compressor = None
+        self._compressor = get_compressor(compression, compress_level)
 
     def write(self, data):
-        self.buffer = self.buffer + data
-        if len(self.buffer) < self.buffer_size:
+        self._chunks.append(data)
+        self._size += len(data)
+        if self._size < self.buffer_size:
             return
         # The buffer is full, send it
-        self.stream.write(self.buffer[:self.buffer_size])
-        self.buffer = self.buffer[self.buffer_size:]
+        self._send()
+
+    def _send(self):
+        data = "".join(self._chunks)
+        self._chunks = []
+        self._size = 0
+        if self._compressor is not None:
+            data = self._compressor.compress(data.encode('utf-8'))
+            if not data:
+                return
+        self.stream.write(data)
 
     def flush(self):
-        if self.buffer:
-            self.stream.write(self.buffer)
-            self.buffer = ""
+        if self._chunks:
+            self._send()
 
     def close(self):
         self.flush()
+        if self._compressor is not None:
+            self.stream.write(self._compressor.flush())
+            self._compressor = None
 
     def __del__(self):
         self.close()
@@ -146,10 +146,11 @@ class FailedDownloadError(Exception):
 
 
 class DownloadThread(Thread):
-    def __init__(self, parent, queue):
+    def __init__(self, parent, queue, download_slots=None):
         super().__init__()
         self.parent = parent
         self.queue = queue
+        self.download_slots = download_slots
         # pylint: disable=E1101
         self.curl = pycurl.Curl()
         self.mirror = 0
@@ -278,10 +279,17 @@ class DownloadThread(Thread):
             except Empty:
                 break
             self.mirror = 0
-            success = self.__fetch_url(params)
+            if self.download_slots is not None:
+                with self.download_slots:
+                    success = self.__fetch_url(params)
+            else:
+                success = self.__fetch_url(params)
             if self.parent.log_obj:
                 # log_obj must be thread-safe
                 self.parent.log_obj.log(success, os.path.basename(params['relative_path']))
+            if self.parent.done_callback:
+                # done_callback must be thread-safe
+                self.parent.done_callback(success, params)
             self.queue.task_done()
             if not success:
                 package = os.path.basename(params['target_file'])
@@ -318,6 +326,8 @@ class ThreadedDownloader:
 
         self.retries = retries
         self.log_obj = log_obj
+        self.done_callback = None
+        self.download_slots = None
         self.force = force
         self.lock = Lock()
         self.exception = None
@@ -329,6 +339,14 @@ class ThreadedDownloader:
     def set_log_obj(self, log_obj):
         self.log_obj = log_obj
 
+    def set_done_callback(self, done_callback):
+        """Set a function called with (success, params) as soon as a file is processed"""
+        self.done_callback = done_callback
+
+    def set_download_slots(self, download_slots):
+        """Limit the downloads running at the same time with a semaphore shared with other downloaders"""
+        self.download_slots = download_slots
+
     def set_force(self, force):
         self.force = force
 
@@ -364,7 +382,7 @@ class ThreadedDownloader:
             self.first_in_queue_done = False
             started_threads = []
             for _ in range(self.threads):
-                thread = DownloadThread(self, queue)
+                thread = DownloadThread(self, queue, self.download_slots)
                 thread.setDaemon(True)
                 thread.start()
                 started_threads.append(thread)
@@ -0,0 +1,288 @@
+#
+# Copyright (c) 2023 SUSE LLC
+#
+# This software is licensed to you under the GNU General Public License,
+# version 2 (GPLv2). There is NO WARRANTY for this software, express or
+# implied, including the implied warranties of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. You should have received a copy of GPLv2
+# along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+#
+#
+# Persisted index of the size, mtime and checksum of the files in the
+# package pool, shared by mgr-inter-sync, reposync and spacewalk-data-fsck.
+# A checksum stays valid as long as the size and the mtime of the file do
+# not change, so unchanged files are never hashed twice.
+#
+
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from spacewalk.common.rhnLog import log_debug
+from uyuni.common.checksum import getFileChecksum
+
+INDEX_PATH = '/var/cache/rhn/file-state.db'
+STAT_WORKERS = 16
+HASH_WORKERS = 4
+# max. number of parameters of one sqlite query
+QUERY_BATCH_SIZE = 500
+# entries of deleted files are pruned by the first process using the index after this many seconds
+PRUNE_INTERVAL = 24 * 3600
+
+
+def _stat(abs_path):
+    try:
+        return os.stat(abs_path)
+    except OSError:
+        return None
+
+
+def _checksum(args):
+    checksum_type, abs_path = args
+    try:
+        return getFileChecksum(checksum_type, filename=abs_path)
+    except (OSError, IOError):
+        return None
+
+
+def stat_files(abs_paths, workers=STAT_WORKERS):
+    """ Stat the files in parallel; returns {abs_path: stat result or None if missing} """
+    abs_paths = list(abs_paths)
+    if len(abs_paths) < 2 or workers < 2:
+        return dict((abs_path, _stat(abs_path)) for abs_path in abs_paths)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return dict(zip(abs_paths, executor.map(_stat, abs_paths)))
+
+
+class FileStateIndex:
+
+    """ (path, size, mtime, checksum type, checksum) of the files which have been hashed """
+
+    def __init__(self, path=INDEX_PATH, hash_workers=HASH_WORKERS, stat_workers=STAT_WORKERS):
+        self.path = path
+        self.hash_workers = hash_workers
+        self.stat_workers = stat_workers
+        self._conn = None
+        self._pid = None
+        self._disabled = False
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        if self._disabled:
+            return None
+        # sqlite connections must not be shared with forked workers
+        if self._conn is not None and self._pid == os.getpid():
+            return self._conn
+        try:
+            dirname = os.path.dirname(self.path)
+            if dirname and not os.path.isdir(dirname):
+                os.makedirs(dirname)
+            conn = sqlite3.connect(self.path, timeout=60, check_same_thread=False)
+            # several syncs may use the index concurrently
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""CREATE TABLE IF NOT EXISTS file_state (
+                                path TEXT PRIMARY KEY,
+                                size INTEGER NOT NULL,
+                                mtime_ns INTEGER NOT NULL,
+                                checksum_type TEXT NOT NULL,
+                                checksum TEXT NOT NULL)""")
+            conn.execute("""CREATE TABLE IF NOT EXISTS index_state (
+                                name TEXT PRIMARY KEY,
+                                value INTEGER NOT NULL)""")
+            conn.commit()
+        except (OSError, sqlite3.Error) as e:
+            log_debug(1, "File state index %s not available: %s" % (self.path, e))
+            self._disabled = True
+            return None
+        self._conn = conn
+        self._pid = os.getpid()
+        return conn
+
+    def close(self):
+        if self._conn is not None and self._pid == os.getpid():
+            self._conn.close()
+        self._conn = None
+
+    def get_many(self, abs_paths):
+        """ Returns {abs_path: (size, mtime_ns, checksum_type, checksum)} of the indexed files """
+        abs_paths = list(abs_paths)
+        result = {}
+        with self._lock:
+            conn = self._connect()
+            if conn is None:
+                return result
+            try:
+                for i in range(0, len(abs_paths), QUERY_BATCH_SIZE):
+                    batch = abs_paths[i:i + QUERY_BATCH_SIZE]
+                    cursor = conn.execute(
+                        "SELECT path, size, mtime_ns, checksum_type, checksum FROM file_state"
+                        " WHERE path IN (%s)" % ", ".join("?" * len(batch)), batch)
+                    for row in cursor:
+                        result[row[0]] = tuple(row[1:])
+            except sqlite3.Error as e:
+                log_debug(1, "Unable to read the file state index: %s" % e)
+        return result
+
+    def update_many(self, entries):
+        """ Stores entries of (abs_path, size, mtime_ns, checksum_type, checksum) """
+        entries = list(entries)
+        if not entries:
+            return
+        with self._lock:
+            conn = self._connect()
+            if conn is None:
+                return
+            try:
+                conn.executemany("INSERT OR REPLACE INTO file_state VALUES (?, ?, ?, ?, ?)", entries)
+                conn.commit()
+            except sqlite3.Error as e:
+                log_debug(1, "Unable to update the file state index: %s" % e)
+
+    def remove_many(self, abs_paths):
+        """ Removes the entries of the files, e.g. when they are deleted """
+        abs_paths = [(abs_path, ) for abs_path in abs_paths]
+        if not abs_paths:
+            return
+        with self._lock:
+            conn = self._connect()
+            if conn is None:
+                return
+            try:
+                conn.executemany("DELETE FROM file_state WHERE path = ?", abs_paths)
+                conn.commit()
+            except sqlite3.Error as e:
+                log_debug(1, "Unable to update the file state index: %s" % e)
+
+    def prune(self, interval=None):
+        """ Removes the entries of the files which do not exist anymore. With an interval,
+            nothing is done if the index has been pruned less than interval seconds ago. """
+        now = int(time.time())
+        with self._lock:
+            conn = self._connect()
+            if conn is None:
+                return
+            try:
+                if interval is not None:
+                    row = conn.execute("SELECT value FROM index_state WHERE name = 'pruned'").fetchone()
+                    if row and now - row[0] < interval:
+                        return
+                # record it first, concurrent processes do not need to prune too
+                conn.execute("INSERT OR REPLACE INTO index_state VALUES ('pruned', ?)", (now, ))
+                conn.commit()
+                abs_paths = [row[0] for row in conn.execute("SELECT path FROM file_state")]
+            except sqlite3.Error as e:
+                log_debug(1, "Unable to read the file state index: %s" % e)
+                return
+        stats = stat_files(abs_paths, self.stat_workers)
+        missing = [abs_path for abs_path in abs_paths if stats[abs_path] is None]
+        log_debug(3, "Pruning %d deleted files from the file state index" % len(missing))
+        self.remove_many(missing)
+
+    def get_checksums(self, files, stats=None, refresh=False):
+        """ Returns {abs_path: checksum or None if the file is missing} for files,
+            a list of (abs_path, checksum_type). Only files changed since they were
+            indexed are hashed (in parallel), and recorded in the index.
+            stats are the already known stat results of the files. With refresh,
+            all the files are hashed again, e.g. to detect silent corruption. """
+        files = list(files)
+        if stats is None:
+            stats = stat_files([abs_path for abs_path, _checksum_type in files], self.stat_workers)
+        if refresh:
+            indexed = {}
+        else:
+            indexed = self.get_many([abs_path for abs_path, _checksum_type in files if stats.get(abs_path)])
+
+        result = {}
+        to_hash = []
+        missing = []
+        for abs_path, checksum_type in files:
+            st = stats.get(abs_path)
+            if st is None:
+                result[abs_path] = None
+                missing.append(abs_path)
+                continue
+            entry = indexed.get(abs_path)
+            if entry and entry[:3] == (st.st_size, st.st_mtime_ns, checksum_type):
+                result[abs_path] = entry[3]
+            else:
+                to_hash.append((checksum_type, abs_path))
+
+        if len(to_hash) > 1 and self.hash_workers > 1:
+            with ThreadPoolExecutor(max_workers=self.hash_workers) as executor:
+                checksums = list(executor.map(_checksum, to_hash))
+        else:
+            checksums = [_checksum(args) for args in to_hash]
+
+        entries = []
+        for (checksum_type, abs_path), checksum in zip(to_hash, checksums):
+            result[abs_path] = checksum
+            if checksum is not None:
+                st = stats[abs_path]
+                entries.append((abs_path, st.st_size, st.st_mtime_ns, checksum_type, checksum))
+        self.update_many(entries)
+        self.remove_many(missing)
+        return result
+
+    def get_checksum(self, abs_path, checksum_type, refresh=False):
+        """ Returns the checksum of a file, None if it does not exist """
+        return self.get_checksums([(abs_path, checksum_type)], refresh=refresh).get(abs_path)
+
+    def verify_files(self, files):
+        """ Verifies the files, a list of (abs_path, mtime, size, checksum_type, checksum),
+            in bulk. Returns {abs_path: errcode}:
+                0   - file is ok, it has either the specified mtime and size
+                              or checksum matches (then its mtime is set)
+                1   - file does not exist at all
+                2   - file has a different checksum
+        """
+        files = list(files)
+        stats = stat_files([f[0] for f in files], self.stat_workers)
+
+        result = {}
+        to_check = []
+        missing = []
+        for abs_path, mtime, size, checksum_type, checksum in files:
+            st = stats[abs_path]
+            if st is None:
+                # File is missing completely
+                result[abs_path] = 1
+                missing.append(abs_path)
+            elif int(st.st_mtime) == mtime and st.st_size == size:
+                # Same mtime, and size, assume identity
+                result[abs_path] = 0
+            else:
+                to_check.append((abs_path, mtime, checksum_type, checksum))
+
+        self.remove_many(missing)
+        if not to_check:
+            return result
+
+        checksums = self.get_checksums([(f[0], f[2]) for f in to_check], stats)
+        entries = []
+        for abs_path, mtime, checksum_type, checksum in to_check:
+            if checksums[abs_path] != checksum:
+                result[abs_path] = 2
+                continue
+            # Set the mtime
+            os.utime(abs_path, (mtime, mtime))
+            st = os.stat(abs_path)
+            entries.append((abs_path, st.st_size, st.st_mtime_ns, checksum_type, checksum))
+            result[abs_path] = 0
+        self.update_many(entries)
+        return result
+
+
+_index = None
+
+
+def get_index():
+    """ Returns the file state index of this process """
+    global _index
+    if _index is None:
+        _index = FileStateIndex()
+        # files are also deleted by other components, e.g. taskomatic
+        _index.prune(PRUNE_INTERVAL)
+    return _index
@@ -15,6 +15,7 @@
 #
 
 import base64
+import hashlib
 import configparser
 import os
 import re
@@ -26,6 +27,7 @@ import tempfile
 import traceback
 import json
 from datetime import datetime
+from multiprocessing.managers import BaseManager
 from dateutil.parser import parse as parse_date
 from xml.dom import minidom
 import gzip
@@ -33,6 +35,10 @@ from dateutil.tz import tzutc
 import gettext
 import errno
 import multiprocessing
+import multiprocessing.connection
+import queue
+import threading
+import time
 
 from rhn.connections import idn_puny_to_unicode
 from rhn.stringutils import ustr
@@ -52,6 +58,7 @@ from spacewalk.server.importlib import importLib, mpmSource, packageImport, erra
 from spacewalk.server.importlib.packageImport import ChannelPackageSubscription
 from spacewalk.server.importlib.backendOracle import SQLBackend
 from spacewalk.server.importlib.errataImport import ErrataImport
+from spacewalk.satellite_tools import file_index
 from spacewalk.satellite_tools.download import ThreadedDownloader, ProgressBarLogger, TextLogger
 from spacewalk.satellite_tools.repo_plugins import CACHE_DIR
 from spacewalk.satellite_tools.repo_plugins import yum_src
@@ -71,7 +78,10 @@ relative_comps_dir = 'rhn/comps'
 relative_modules_dir = 'rhn/modules'
 relative_mediaproducts_dir = 'suse/media.1'
 checksum_cache_filename = 'reposync/checksum_cache'
-default_import_batch_size = 20
+snapshot_cache_dir = os.path.join(CACHE_DIR, 'snapshots')
+# seconds to wait for the packages claimed by the channels synced in parallel,
+# the channel downloads the packages still pending itself afterwards
+deferred_packages_timeout = 3600
 
 errata_typemap = {
     'security': 'Security Advisory',
@@ -255,6 +265,228 @@ class TreeInfoParser(object):
         with open(file_name, "w") as fd:
             self.parser.write(fd)
 
+
+def _init_import_worker(log_file, log_level):
+    """Initialize a package import worker process with its own log and DB connection
+
+    The workers are started by a fork server, they inherit neither the log nor the
+    DB connection of the sync process.
+    """
+    if log_file:
+        rhnLog.initLOG(log_file, log_level)
+    rhnSQL.initDB()
+
+
+class RepoSnapshot(object):
+    """
+    Package checksums and patch fingerprints of the last successful import of a
+    repository into a channel.
+
+    Used by incremental syncs to hand only the packages and patches that changed
+    since the previous run to import_packages and upload_updates.
+    """
+    version = 1
+
+    def __init__(self, channel_label, url, options):
+        key = hashlib.sha256(url.encode('utf-8', errors='replace')).hexdigest()
+        self.path = os.path.join(snapshot_cache_dir, channel_label, key + '.json')
+        # compare the options in their JSON form, the filters are tuples which are loaded back as lists
+        self.options = json.loads(json.dumps(options))
+        # state of the previous import, valid only if loaded is True
+        self.loaded = False
+        self.packages = set()
+        self.errata = {}
+        # state of the current import
+        self.new_packages = set()
+        self.new_errata = {}
+
+    def load(self, channel_package_count):
+        """Load the previous snapshot if it is still consistent with the channel"""
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+        except (IOError, OSError, ValueError):
+            return self
+        if (data.get('version') != self.version or data.get('options') != self.options or
+                data.get('channel_package_count') != channel_package_count):
+            # sync options changed or packages were linked/unlinked outside of reposync
+            log(1, "  Repository snapshot outdated, running a full sync.")
+            return self
+        self.packages = set(tuple(p) for p in data['packages'])
+        self.errata = data['errata']
+        self.loaded = True
+        return self
+
+    def save(self, channel_package_count):
+        fileutils.makedirs(os.path.dirname(self.path))
+        data = {'version': self.version,
+                'options': self.options,
+                'channel_package_count': channel_package_count,
+                'packages': sorted(self.new_packages),
+                'errata': self.new_errata}
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f)
+        os.rename(tmp_path, self.path)
+
+    def removed_packages(self):
+        return self.packages - self.new_packages
+
+    def removed_errata(self):
+        return set(self.errata) - set(self.new_errata)
+
+    @staticmethod
+    def erratum_fingerprint(notice):
+        packages = sorted([pkg.get(k) or '' for k in ('name', 'epoch', 'version', 'release', 'arch')]
+                          for c in notice['pkglist'] or [] for pkg in c['packages'])
+        fingerprint = json.dumps([notice['version'], notice['status'], notice['updated'] or notice['issued'],
+                                  packages], default=str)
+        return hashlib.sha256(fingerprint.encode('utf-8')).hexdigest()
+
+
+class SharedPackageClaims(object):
+    """
+    Packages being downloaded and imported by the channels synced in parallel.
+
+    Lives in the ChannelSyncManager process, channels claim the packages they are going
+    to download so that a package present in several channels is processed only once.
+    Keys are (org_id, checksum_type, checksum) tuples.
+    """
+
+    def __init__(self):
+        self._owners = {}
+        self._pids = {}
+        self._pending = set()
+        self._lock = threading.Lock()
+
+    def claim(self, keys, owner, pid=None):
+        """Claim keys for owner running in process pid, returns the keys which were
+        already claimed by someone else"""
+        taken = []
+        with self._lock:
+            for key in keys:
+                key = tuple(key)
+                if key in self._owners:
+                    if self._owners[key] != owner:
+                        taken.append(key)
+                else:
+                    self._owners[key] = owner
+                    self._pending.add(key)
+                    if pid is not None:
+                        self._pids[key] = pid
+        return taken
+
+    def release_process(self, pid):
+        """Release the keys still pending of the process pid, e.g. after it died,
+        returns the number of released keys"""
+        with self._lock:
+            keys = [key for key in self._pending if self._pids.get(key) == pid]
+            self._pending.difference_update(keys)
+        return len(keys)
+
+    def release(self, keys):
+        """Mark claimed keys as processed (either imported or failed)"""
+        with self._lock:
+            self._pending.difference_update(tuple(key) for key in keys)
+
+    def pending(self, keys):
+        """Return the number of keys still being processed"""
+        with self._lock:
+            return len([key for key in keys if tuple(key) in self._pending])
+
+
+class ChannelSyncManager(BaseManager):
+    pass
+
+
+ChannelSyncManager.register('SharedPackageClaims', SharedPackageClaims)
+
+
+def _sync_channel_process(conn, shared_claims, download_slots, channel_label, sync_args, batch_size):
+    """Sync a single channel in a process started by ChannelSyncScheduler, sends the return code to conn"""
+    ret_code = 1
+    try:
+        # do not close the connection inherited from the parent process, it is still in use there
+        rhnSQL.closeDB(committing=False, closing=False)
+        sync = RepoSync(channel_label=channel_label, **sync_args)
+        sync.set_shared_state(shared_claims, download_slots)
+        if batch_size:
+            sync.set_import_batch_size(batch_size)
+        _, ret_code = sync.sync()
+    except SystemExit as e:
+        ret_code = e.code or 0
+    except BaseException:  # pylint: disable=W0703
+        log2(0, 0, "Sync of channel %s failed: %s" % (channel_label, traceback.format_exc()), stream=sys.stderr)
+    finally:
+        conn.send(ret_code)
+        conn.close()
+
+
+class ChannelSyncScheduler(object):
+    """
+    Sync several channels at the same time, every channel in its own process.
+
+    The channels share the download slots, i.e. at most reposync_download_threads packages
+    are downloaded at once in total, and packages present in several channels are downloaded
+    and imported only once.
+    """
+
+    def __init__(self, parallel, batch_size=None):
+        self.parallel = parallel
+        self.batch_size = batch_size
+
+    def run(self, channels):
+        """
+        Sync the channels, a list of (channel_label, RepoSync keyword arguments) tuples.
+
+        Returns the elapsed time and the first non-zero return code of the channel syncs.
+        """
+        with cfg_component('server.satellite') as CFG:
+            download_threads = int(CFG.REPOSYNC_DOWNLOAD_THREADS)
+        start_time = datetime.now()
+        ret_code = 0
+        pending = list(channels)
+        running = {}
+        with ChannelSyncManager() as manager:
+            shared_claims = manager.SharedPackageClaims()
+            download_slots = multiprocessing.BoundedSemaphore(download_threads)
+            try:
+                while pending or running:
+                    while pending and len(running) < self.parallel:
+                        channel_label, sync_args = pending.pop(0)
+                        parent_conn, child_conn = multiprocessing.Pipe(duplex=False)
+                        process = multiprocessing.Process(
+                            target=_sync_channel_process, name="reposync-%s" % channel_label,
+                            args=(child_conn, shared_claims, download_slots, channel_label, sync_args,
+                                  self.batch_size))
+                        process.start()
+                        child_conn.close()
+                        running[process.sentinel] = (channel_label, process, parent_conn)
+                        log(0, "Sync of channel %s started." % channel_label)
+
+                    for sentinel in multiprocessing.connection.wait(list(running.keys())):
+                        channel_label, process, conn = running.pop(sentinel)
+                        process.join()
+                        if conn.poll():
+                            channel_ret_code = conn.recv()
+                        else:
+                            # the process died without a result
+                            channel_ret_code = process.exitcode or 1
+                        conn.close()
+                        # the claims are left pending if the process was killed
+                        released = shared_claims.release_process(process.pid)
+                        if released:
+                            log(0, "Released %d packages claimed by channel %s." % (released, channel_label))
+                        log(0, "Sync of channel %s completed with exit code %s." % (channel_label, channel_ret_code))
+                        if channel_ret_code != 0 and ret_code == 0:
+                            ret_code = channel_ret_code
+            finally:
+                for channel_label, process, conn in running.values():
+                    process.terminate()
+                    process.join()
+        return datetime.now() - start_time, ret_code
+
+
 def set_filter_opt(option, opt_str, value, parser):
     # pylint: disable=W0613
     if opt_str in ['--include', '-i']:
@@ -415,7 +647,7 @@ class RepoSync(object):
                  metadata_only=False, strict=0, excluded_urls=None, no_packages=False,
                  log_dir="reposync", log_level=None, force_kickstart=False, force_all_errata=False,
                  check_ssl_dates=True, force_null_org_content=False, show_packages_only=False,
-                 noninteractive=False, deep_verify=False):
+                 noninteractive=False, deep_verify=False, incremental=False):
         self.regen = False
         self.fail = fail
         self.filters = filters or []
@@ -429,6 +661,9 @@ class RepoSync(object):
         self.ks_tree_type = 'externally-managed'
         self.interactive = not noninteractive
         self.deep_verify = deep_verify
+        # snapshots are not trusted when all packages or errata have to be verified
+        self.incremental = incremental and not deep_verify and not force_all_errata
+        self.snapshot = None
         self.error_messages = []
         self.available_packages = {}
         self.ks_install_type = None
@@ -511,11 +746,50 @@ class RepoSync(object):
         #    self.checksum_cache = {}
         self.arches = self.get_compatible_arches(int(self.channel['id']))
         self.channel_arch = self.get_channel_arch(int(self.channel['id']))
-        self.import_batch_size = default_import_batch_size
+        # set by load_import_settings unless overridden
+        self.import_batch_size = None
+        self.import_workers = None
+        # set by set_shared_state when syncing several channels in parallel
+        self.shared_claims = None
+        self.download_slots = None
 
     def set_import_batch_size(self, batch_size):
         self.import_batch_size = int(batch_size)
 
+    def set_shared_state(self, shared_claims, download_slots):
+        """Share packages and downloads with the channels synced in parallel by ChannelSyncScheduler"""
+        self.shared_claims = shared_claims
+        self.download_slots = download_slots
+
+    def __getstate__(self):
+        # the import workers get a copy of this object with every batch; they do not share the
+        # state of the parallel channel syncs, and the download slots semaphore can not be pickled
+        state = self.__dict__.copy()
+        state['shared_claims'] = None
+        state['download_slots'] = None
+        return state
+
+    def load_import_settings(self):
+        """Read the number of package import workers and the import batch size from the configuration"""
+        with cfg_component('server.satellite') as CFG:
+            if self.import_batch_size is None:
+                try:
+                    self.import_batch_size = int(CFG.REPOSYNC_IMPORT_BATCH_SIZE)
+                except ValueError:
+                    raise ValueError(
+                        "Number of packages expected, found: '%s'" % CFG.REPOSYNC_IMPORT_BATCH_SIZE
+                    )
+            try:
+                self.import_workers = int(CFG.REPOSYNC_IMPORT_WORKERS)
+            except ValueError:
+                raise ValueError(
+                    "Number of processes expected, found: '%s'" % CFG.REPOSYNC_IMPORT_WORKERS
+                )
+        if self.import_batch_size < 1:
+            raise ValueError("Invalid import batch size: %d" % self.import_batch_size)
+        if self.import_workers < 1:
+            self.import_workers = min(os.cpu_count() * 2, 32)
+
     def set_urls_prefix(self, prefix):
         """If there are relative urls in DB, set their real location in runtime"""
         for index, url in enumerate(self.urls):
@@ -533,6 +807,9 @@ class RepoSync(object):
         start_time = datetime.now()
         with cfg_component('server.susemanager') as CFG:
             mount_point = CFG.MOUNT_POINT
+        snapshots = []
+        if self.incremental:
+            channel_package_count = self.count_channel_packages()
         for data in self.urls:
             data['source_url_auth'] = self.set_repo_credentials(data)
             data['source_url'] = [u["url"] for u in data['source_url_auth']]
@@ -612,6 +889,14 @@ class RepoSync(object):
                         log(0, "Unhandled error occurred: {}".format(exc))
                         raise
 
+                    if self.incremental and not self.show_packages_only:
+                        self.snapshot = RepoSnapshot(self.channel_label, url,
+                                                     [self.filters, self.latest, self.metadata_only, self.no_packages,
+                                                      self.no_errata]).load(channel_package_count)
+                        snapshots.append(self.snapshot)
+                        if self.snapshot.loaded:
+                            log(0, "  Incremental sync based on the snapshot of the previous sync.")
+
                     if self.show_packages_only:
                         self.show_packages(plugin, repo_id)
                     elif plugin is not None:
@@ -672,8 +957,26 @@ class RepoSync(object):
                     self.sendErrorMail(fetchTraceback())
                     sync_error = -1
 
+        # when the channel content was left untouched since the last sync of all its repositories,
+        # only the packages and errata removed from the repositories need to be unlinked
+        incremental_strict = bool(snapshots) and len(snapshots) == len(self.urls) and \
+            all(snapshot.loaded for snapshot in snapshots)
         # In strict mode unlink all packages from channel which are not synced from current repositories
-        if self.strict and sync_error == 0:
+        if self.strict and sync_error == 0 and incremental_strict:
+            removed_packages = set()
+            removed_errata = set()
+            for snapshot in snapshots:
+                removed_packages.update(snapshot.removed_packages())
+                removed_errata.update(snapshot.removed_errata())
+            if not self.no_packages:
+                for (checksum_type, checksum) in removed_packages - self.all_packages:
+                    self.disassociate_package(checksum_type, checksum)
+                    self.regen = True
+            if not self.no_errata and self.channel['org_id']:
+                for erratum in removed_errata - self.all_errata:
+                    self.disassociate_erratum(erratum)
+                    self.regen = True
+        elif self.strict and sync_error == 0:
             if not self.no_packages:
                 channel_packages = rhnSQL.fetchall_dict("""
                     select p.id, ct.label as checksum_type, c.checksum
@@ -709,6 +1012,10 @@ class RepoSync(object):
             taskomatic.add_to_erratacache_queue(self.channel_label)
         self.update_date()
         rhnSQL.commit()
+        if snapshots and sync_error == 0 and failed_packages == 0 and not self.error_messages:
+            channel_package_count = self.count_channel_packages()
+            for snapshot in snapshots:
+                snapshot.save(channel_package_count)
         with cfg_component('server.susemanager') as CFG:
             if CFG.AUTO_GENERATE_BOOTSTRAP_REPO and self.regenerate_bootstrap_repo:
                 log(0, '  Regenerating bootstrap repositories.')
@@ -753,6 +1060,15 @@ class RepoSync(object):
                 taskomatic.add_to_system_overview_update_queue(row["id"])
             rhnSQL.commit()
 
+    def count_channel_packages(self):
+        h = rhnSQL.prepare("""
+            select count(*) as count
+              from rhnChannelPackage
+             where channel_id = :channel_id
+        """)
+        h.execute(channel_id=int(self.channel['id']))
+        return h.fetchone_dict()['count']
+
     def set_ks_tree_type(self, tree_type='externally-managed'):
         self.ks_tree_type = tree_type
 
@@ -996,12 +1312,23 @@ class RepoSync(object):
         processed_updates = 0
         backend = SQLBackend()
         channel_advisory_names = self.list_errata()
+        fingerprints = {}
+        unchanged = 0
         for notice in notices:
             notice = self.fix_notice(notice)
 
             # Save advisory names from all repositories
             self.all_errata.add(notice['update_id'])
 
+            if self.snapshot:
+                fingerprint = RepoSnapshot.erratum_fingerprint(notice)
+                if self.snapshot.loaded and self.snapshot.errata.get(notice['update_id']) == fingerprint:
+                    # not changed since the last sync
+                    self.snapshot.new_errata[notice['update_id']] = fingerprint
+                    unchanged += 1
+                    continue
+                fingerprints[self._patch_naming(notice)] = (notice['update_id'], fingerprint)
+
             # pylint: disable=W0703
             try:
                 erratum = self._populate_erratum(notice)
@@ -1021,6 +1348,8 @@ class RepoSync(object):
                 if self.fail:
                     raise
 
+        if unchanged:
+            log(0, "    Patches unchanged since last sync: %s." % unchanged)
         if batch:
             log(0, "    Syncing %s new patch(es) to channel." % len(batch))
             importer = ErrataImport(batch, backend)
@@ -1028,6 +1357,14 @@ class RepoSync(object):
             self.regen = True
         elif notices:
             log(0, "    No new patch to sync.")
+
+        if fingerprints:
+            # remember only patches which made it into the channel, the others
+            # (e.g. referencing packages not synced yet) have to be retried next time
+            for advisory_name in self.list_errata():
+                if advisory_name in fingerprints:
+                    update_id, fingerprint = fingerprints[advisory_name]
+                    self.snapshot.new_errata[update_id] = fingerprint
         return processed_updates
 
     def import_packages(self, plug, source_id, url, is_non_local_repo):
@@ -1065,20 +1402,33 @@ class RepoSync(object):
 
         with cfg_component('server.susemanager') as CFG:
             mount_point = CFG.MOUNT_POINT
-        for pack in packages:
-            if pack.arch not in self.arches:
-                # skip packages with incompatible architecture
-                skipped += 1
-                continue
-            epoch = ''
-            if pack.epoch and pack.epoch != '0':
-                epoch = "%s:" % pack.epoch
-            ident = "%s-%s%s-%s.%s" % (pack.name, epoch, pack.version, pack.release, pack.arch)
-            self.available_packages[ident] = 1
-
-            packs = rhnPackage.get_info_for_package(
-                [pack.name, pack.version, pack.release, pack.epoch, pack.arch],
-                channel_id, self.org_id)
+
+        compatible_packages = [pack for pack in packages if pack.arch in self.arches]
+        # skip packages with incompatible architecture
+        skipped += num_passed - len(compatible_packages)
+
+        if self.snapshot:
+            self.snapshot.new_packages = set((pack.checksum_type, pack.checksum) for pack in compatible_packages)
+        if self.snapshot and self.snapshot.loaded:
+            # packages imported by the previous sync are already in the DB and linked to the channel
+            changed_packages = []
+            for pack in compatible_packages:
+                if (pack.checksum_type, pack.checksum) in self.snapshot.packages:
+                    self.available_packages[self._available_package_ident(pack)] = 1
+                    self.all_packages.add((pack.checksum_type, pack.checksum))
+                else:
+                    changed_packages.append(pack)
+            log(0, "    Packages unchanged since last sync: %5d" % (len(compatible_packages) - len(changed_packages)))
+            compatible_packages = changed_packages
+        db_packages = rhnPackage.get_info_for_packages(
+            [[pack.name, pack.version, pack.release, pack.epoch, pack.arch] for pack in compatible_packages],
+            channel_id, self.org_id)
+
+        for pack in compatible_packages:
+            self.available_packages[self._available_package_ident(pack)] = 1
+
+            packs = db_packages.get(rhnPackage.nevra_key(
+                [pack.name, pack.version, pack.release, pack.epoch, pack.arch]), [])
             db_pack = None
             for p in packs:
                 if p['checksum'] == pack.checksum:
@@ -1131,53 +1481,33 @@ class RepoSync(object):
             log(0, "    Packages already synced:      %5d" % (num_passed - num_to_process))
             log(0, "    Packages to sync:             %5d" % num_to_process)
 
-        downloader = ThreadedDownloader()
-        to_download_count = 0
-        for what in to_process:
-            pack, to_download, to_link = what
-            if to_download:
-                target_file = os.path.join(plug.repo.pkgdir, pack.checksum, os.path.basename(pack.unique_id.relativepath))
-                pack.path = target_file
-                params = {}
-                checksum_type = pack.checksum_type
-                checksum = pack.checksum
-                plug.set_download_parameters(params, pack.unique_id.relativepath, target_file,
-                                             checksum_type=checksum_type, checksum_value=checksum)
-                downloader.add(params)
-                to_download_count += 1
-        if num_to_process != 0:
-            log(0, "    New packages to download:     %5d" % to_download_count)
-            log2(0, 0, "  Downloading packages:")
-        logger = TextLogger(None, to_download_count)
-        downloader.set_log_obj(logger)
-        downloader.run()
+        self.load_import_settings()
+        deferred = []
+        claimed = []
+        if self.shared_claims is not None:
+            deferred, claimed = self._claim_packages(to_process)
+        try:
+            failed_packages_import, failed_downloads = self._download_packages(
+                plug, to_process, to_disassociate, is_non_local_repo, log_summary=num_to_process != 0)
+        finally:
+            if claimed:
+                self.shared_claims.release(claimed)
+        failed_packages += failed_packages_import
+        if deferred:
+            to_download_again = self._resolve_deferred_packages(to_process, deferred, channel_id, mount_point)
+            if to_download_again:
+                # channels synced in parallel failed to import them
+                failed_packages_import, failed_downloads_again = self._download_packages(
+                    plug, to_process, to_disassociate, is_non_local_repo, indexes=to_download_again)
+                failed_packages += failed_packages_import
+                failed_downloads.update(failed_downloads_again)
 
         log(0, 'Filtering packages that failed to download')
-        to_process = [i for i in to_process if os.path.basename(i[0].path) not in downloader.failed_pkgs]
-
-        log2background(0, "Importing packages started.")
-        log(0, '')
-        log(0, '  Importing packages to DB:')
-
-        twisted_batch_indexes = self.twisted_batch_indexes(len(to_process), self.import_batch_size)
-        to_process_batches = [[to_process[twisted_index] for twisted_index in twisted_batch] for twisted_batch in twisted_batch_indexes]
-
-        affected_channels = []
-        with multiprocessing.Pool(processes=min(os.cpu_count() * 2, 32), maxtasksperchild=1) as pool:
-            results = [pool.apply_async(self.import_package_batch, args=[to_process_batch, to_disassociate, is_non_local_repo, i, len(to_process_batches)])
-                       for i, to_process_batch in enumerate(to_process_batches)]
-
-            for i, result in enumerate(results):
-                affected_channels_batch, failed_packages_batch, all_packages, processed_batch = result.get()
-                affected_channels += affected_channels_batch
-                failed_packages += failed_packages_batch
-                self.all_packages.update(all_packages)
-                for j, processed in enumerate(processed_batch):
-                    to_process[twisted_batch_indexes[i][j]] = processed
-
-        if affected_channels:
-            errataCache.schedule_errata_cache_update(affected_channels)
-        log2background(0, "Importing packages finished.")
+        if self.snapshot:
+            self.snapshot.new_packages.difference_update(
+                (i[0].checksum_type, i[0].checksum) for i in to_process
+                if os.path.basename(i[0].path) in failed_downloads)
+        to_process = [i for i in to_process if os.path.basename(i[0].path) not in failed_downloads]
 
         # Disassociate packages
         for (checksum_type, checksum) in to_disassociate:
@@ -1207,6 +1537,216 @@ class RepoSync(object):
         self._normalize_orphan_vendor_packages()
         return failed_packages
 
+    def _download_packages(self, plug, to_process, to_disassociate, is_non_local_repo, log_summary=True,
+                           indexes=None):
+        """Download and import the entries of to_process marked for download
+
+        If indexes is given, only the entries at these indexes are considered.
+        Entries of to_process are updated in place.
+        Returns the number of packages failed to import and the names of the files failed to download.
+        """
+        downloader = ThreadedDownloader()
+        if self.download_slots is not None:
+            downloader.set_download_slots(self.download_slots)
+        to_download_count = 0
+        if indexes is None:
+            indexes = range(len(to_process))
+        download_indexes = [index for index in indexes if to_process[index][1]]
+        # packages are imported in the order they get downloaded, spread them so that
+        # every import batch gets a sample of the whole repository (see twisted_batch_indexes)
+        download_order = [download_indexes[i] for batch in
+                          self.twisted_batch_indexes(len(download_indexes), self.import_batch_size) for i in batch]
+        for index in download_order:
+            pack, to_download, to_link = to_process[index]
+            if to_download:
+                target_file = os.path.join(plug.repo.pkgdir, pack.checksum, os.path.basename(pack.unique_id.relativepath))
+                pack.path = target_file
+                params = {}
+                checksum_type = pack.checksum_type
+                checksum = pack.checksum
+                plug.set_download_parameters(params, pack.unique_id.relativepath, target_file,
+                                             checksum_type=checksum_type, checksum_value=checksum)
+                downloader.add(params)
+                to_download_count += 1
+        if log_summary:
+            log(0, "    New packages to download:     %5d" % to_download_count)
+            log2(0, 0, "  Downloading packages:")
+        logger = TextLogger(None, to_download_count)
+        downloader.set_log_obj(logger)
+
+        log2background(0, "Importing packages started.")
+        affected_channels, failed_packages = self.download_and_import_packages(
+            downloader, to_process, to_disassociate, is_non_local_repo, download_indexes)
+        if affected_channels:
+            errataCache.schedule_errata_cache_update(affected_channels)
+        log2background(0, "Importing packages finished.")
+        return failed_packages, set(downloader.failed_pkgs)
+
+    @staticmethod
+    def _claim_key(pack, org_id):
+        return (str(org_id or ''), pack.checksum_type, pack.checksum)
+
+    def _claim_packages(self, to_process):
+        """Claim the packages to download for this channel among the channels synced in parallel
+
+        Packages already claimed by another channel are not downloaded, their entries in
+        to_process are disabled until _resolve_deferred_packages is called.
+        Returns the indexes of the deferred entries and the keys claimed by this channel.
+        """
+        keys = [self._claim_key(pack, self.org_id) for (pack, to_download, to_link) in to_process if to_download]
+        if not keys:
+            return [], []
+        taken = set(tuple(key) for key in self.shared_claims.claim(keys, self.channel_label, os.getpid()))
+        deferred = []
+        for index, (pack, to_download, to_link) in enumerate(to_process):
+            if to_download and self._claim_key(pack, self.org_id) in taken:
+                deferred.append(index)
+                to_process[index] = (pack, False, False)
+        if deferred:
+            log(0, "    Packages synced by other channels: %5d" % len(deferred))
+        return deferred, [key for key in keys if key not in taken]
+
+    def _resolve_deferred_packages(self, to_process, deferred, channel_id, mount_point):
+        """Wait for the channels synced in parallel to import the deferred packages and link them
+
+        Returns the indexes of the entries which still have to be downloaded.
+        """
+        keys = [self._claim_key(to_process[index][0], self.org_id) for index in deferred]
+        deadline = time.time() + deferred_packages_timeout
+        while self.shared_claims.pending(keys):
+            if time.time() >= deadline:
+                # the packages not imported meanwhile are downloaded by this channel
+                log(0, "    Timed out waiting for packages synced by other channels.")
+                break
+            log(1, "    Waiting for packages synced by other channels.")
+            time.sleep(5)
+
+        packs = [to_process[index][0] for index in deferred]
+        db_packages = rhnPackage.get_info_for_packages(
+            [[pack.name, pack.version, pack.release, pack.epoch, pack.arch] for pack in packs],
+            channel_id, self.org_id)
+        to_download_again = []
+        for index in deferred:
+            pack = to_process[index][0]
+            to_link = pack.arch not in ['src', 'nosrc']
+            db_pack = None
+            for p in db_packages.get(rhnPackage.nevra_key(
+                    [pack.name, pack.version, pack.release, pack.epoch, pack.arch]), []):
+                if p['checksum'] == pack.checksum:
+                    db_pack = p
+                    break
+            if db_pack and db_pack['path']:
+                pack.path = os.path.join(mount_point, db_pack['path'])
+            if db_pack and self.match_package_checksum(pack, db_pack):
+                pack.set_checksum(db_pack['checksum_type'], db_pack['checksum'])
+                pack.epoch = db_pack['epoch']
+                self.all_packages.add((pack.checksum_type, pack.checksum))
+                to_process[index] = (pack, False, to_link and db_pack['channel_id'] != channel_id)
+            else:
+                to_process[index] = (pack, True, to_link)
+                to_download_again.append(index)
+        return to_download_again
+
+    def download_and_import_packages(self, downloader, to_process, to_disassociate, is_non_local_repo,
+                                     download_indexes=None):
+        """Run the downloader and import the downloaded packages to the DB while the download goes on
+
+        Every successfully downloaded package is queued for import as soon as it is complete.
+        Full batches are handed to a pool of import_package_batch workers. The number of
+        pending batches and queued packages is bounded, so the download is throttled when
+        the import cannot keep up. Only the entries at download_indexes are downloaded if given,
+        entries of to_process are updated in place.
+
+        Returns the list of affected channels and the number of packages failed to import.
+        """
+        workers = self.import_workers
+        if download_indexes is None:
+            download_indexes = [index for index, (pack, to_download, to_link) in enumerate(to_process)
+                                if to_download]
+        index_by_path = {to_process[index][0].path: index for index in download_indexes}
+        batch_count = (len(index_by_path) + self.import_batch_size - 1) // self.import_batch_size
+        downloaded = queue.Queue(maxsize=self.import_batch_size * workers)
+        pending_batches = threading.BoundedSemaphore(workers * 2)
+        download_errors = []
+
+        def download():
+            try:
+                downloader.run()
+            except BaseException as e:  # pylint: disable=W0703
+                download_errors.append(e)
+            finally:
+                # no more packages will come
+                downloaded.put(None)
+
+        # called from the download threads
+        downloader.set_done_callback(lambda success, params: downloaded.put((success, params['target_file'])))
+
+        affected_channels = []
+        failed_packages = 0
+        results = []
+        log(0, '')
+        log(0, '  Downloading and importing packages to DB:')
+        # the workers are kept for the whole import and reuse their DB connection for every batch.
+        # They are not forked from this process: the download threads started below (and the ones
+        # of previous imports) may hold the locks of logging, curl or the DB driver at fork time.
+        log_file, log_level = (rhnLog.LOG.file, rhnLog.LOG.level) if rhnLog.LOG else (None, 0)
+        with multiprocessing.get_context('forkserver').Pool(
+                processes=workers, initializer=_init_import_worker, initargs=(log_file, log_level)) as pool:
+            def submit(batch_indexes):
+                pending_batches.acquire()
+                results.append((batch_indexes, pool.apply_async(
+                    self.import_package_batch,
+                    args=[[to_process[i] for i in batch_indexes], to_disassociate, is_non_local_repo,
+                          len(results), batch_count],
+                    callback=lambda _: pending_batches.release(),
+                    error_callback=lambda _: pending_batches.release())))
+
+            download_thread = threading.Thread(target=download, name="reposync-download")
+            download_thread.start()
+            finished = False
+            try:
+                batch_indexes = []
+                while True:
+                    item = downloaded.get()
+                    if item is None:
+                        finished = True
+                        break
+                    success, target_file = item
+                    if not success or target_file not in index_by_path:
+                        continue
+                    batch_indexes.append(index_by_path[target_file])
+                    if len(batch_indexes) >= self.import_batch_size:
+                        submit(batch_indexes)
+                        batch_indexes = []
+                if batch_indexes:
+                    submit(batch_indexes)
+
+                for batch_indexes, result in results:
+                    affected_channels_batch, failed_packages_batch, all_packages, processed_batch = result.get()
+                    affected_channels += affected_channels_batch
+                    failed_packages += failed_packages_batch
+                    self.all_packages.update(all_packages)
+                    for index, processed in zip(batch_indexes, processed_batch):
+                        to_process[index] = processed
+            finally:
+                if not finished:
+                    # stop the download and unblock the download threads waiting for the import
+                    downloader.fail_download(sys.exc_info()[1])
+                    while downloaded.get() is not None:
+                        pass
+                download_thread.join()
+
+        if download_errors:
+            raise download_errors[0]
+        return affected_channels, failed_packages
+
+    @staticmethod
+    def _available_package_ident(pack):
+        epoch = ''
+        if pack.epoch and pack.epoch != '0':
+            epoch = "%s:" % pack.epoch
+        return "%s-%s%s-%s.%s" % (pack.name, epoch, pack.version, pack.release, pack.arch)
+
     def twisted_batch_indexes(self, total_size, batch_size):
         """Assume a list of total_size elements, and consider the following two possible divisions of its elements: per "batch" or per "chunk".
         Batches are contiguous sub-lists of the original list with batch_size elements each (and there's batch_count=total_size/batch_size of them).
@@ -1247,9 +1787,8 @@ class RepoSync(object):
         return batch_count * element_index + batch_index
 
     def import_package_batch(self, to_process, to_disassociate, is_non_local_repo, batch_index, batch_count):
-        # Prepare SQL statements
-        rhnSQL.closeDB(committing=False, closing=False)
-        rhnSQL.initDB()
+        """Import a batch of downloaded packages, runs in a worker process set up by _init_import_worker"""
+        # Prepare SQL statements, cursors are cached per connection so this is done once per worker
         h_delete_package_queue = rhnSQL.prepare("""delete from rhnPackageFileDeleteQueue where path = :path""")
         backend = SQLBackend()
         mpm_bin_batch = importLib.Collection()
@@ -1389,7 +1928,7 @@ class RepoSync(object):
                                     raise exc
             pack.clear_header()
 
-        rhnSQL.closeDB()
+        rhnSQL.commit()
         log(0, "  Package batch #{} of {} completed...".format(batch_index + 1, batch_count))
         return affected_channels, failed_packages, all_packages, to_process
 
@@ -1423,11 +1962,14 @@ class RepoSync(object):
         with cfg_component('server.susemanager') as CFG:
             mount_point = CFG.MOUNT_POINT
 
+        db_packages = rhnPackage.get_info_for_packages(
+            [[pack.name, pack.version, pack.release, pack.epoch, pack.arch] for pack in packages],
+            channel_id, self.org_id)
+
         for pack in packages:
 
-            packs = rhnPackage.get_info_for_package(
-                [pack.name, pack.version, pack.release, pack.epoch, pack.arch],
-                channel_id, self.org_id)
+            packs = db_packages.get(rhnPackage.nevra_key(
+                [pack.name, pack.version, pack.release, pack.epoch, pack.arch]), [])
             db_pack = None
             for p in packs:
                 if p['checksum'] == pack.checksum:
@@ -1489,8 +2031,11 @@ class RepoSync(object):
             md_pack.checksum_type != db_pack['checksum_type'] or
             md_pack.checksum != db_pack['checksum']):
 
+            # the file state index only hashes files which changed since the last sync,
+            # unless all of them are verified to detect silent corruption
             if (os.path.exists(abspath) and
-                getFileChecksum(md_pack.checksum_type, filename=abspath) == md_pack.checksum):
+                file_index.get_index().get_checksum(abspath, md_pack.checksum_type,
+                                                    refresh=self.deep_verify) == md_pack.checksum):
 
                 return True
             else:
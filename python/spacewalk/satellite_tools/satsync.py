@@ -21,7 +21,6 @@
 import datetime
 import os
 import sys
-import stat
 import time
 import fnmatch
 try:
@@ -52,6 +51,7 @@ from spacewalk.server.rhnLib import get_package_path
 from uyuni.common import fileutils
 
 # __rhn sync/import imports__
+from spacewalk.satellite_tools import file_index
 from spacewalk.satellite_tools import xmlWireSource
 from spacewalk.satellite_tools import xmlDiskSource
 from spacewalk.satellite_tools.progress_bar import ProgressBar
@@ -83,6 +83,7 @@ initLOG(CFG.LOG_FILE, CFG.DEBUG)
 
 _DEFAULT_SYSTEMID_PATH = '/etc/sysconfig/rhn/systemid'
 DEFAULT_ORG = 1
+DEFAULT_DOWNLOAD_THREADS = 4
 
 # the option object is used everywhere in this module... make it a
 # global so we don't have to pass it to everyone.
@@ -473,6 +474,7 @@ class Syncer:
         self.xml_dump_version = OPTIONS.dump_version or str(constants.PROTOCOL_VERSION)
         self.check_rpms = check_rpms
         self.keep_rpms = OPTIONS.keep_rpms
+        self._download_threads = OPTIONS.download_threads
 
         # Object to help with channel math
         self._channel_req = None
@@ -946,6 +948,7 @@ class Syncer:
 
         package_type = self._get_package_type_for_channel(channel_label)
         h = rhnSQL.prepare(self._query_compare_packages)
+        packages = []
         for pid in chunk:
             package = package_collection.get_package(pid)
             assert package is not None
@@ -965,11 +968,22 @@ class Syncer:
                         and package['checksums'][r['checksum_type']] == r['checksum']):
                     row = r
                     break
-
+            packages.append((pid, package, l_timestamp, row))
+
+        # Check the files of the whole chunk at once
+        errcodes = None
+        if self.check_rpms:
+            errcodes = self._verify_files(
+                [(row['path'], l_timestamp, package['package_size'], row['checksum_type'],
+                  package['checksums'][row['checksum_type']])
+                 for pid, package, l_timestamp, row in packages
+                 if row and row['path'] and row['checksum_type'] in package['checksums']])
+
+        for pid, package, l_timestamp, row in packages:
             self._process_package(pid, package, l_timestamp, row,
                                   self._missing_channel_packages[channel_label],
                                   self._missing_fs_packages[channel_label],
-                                  check_rpms=self.check_rpms)
+                                  check_rpms=self.check_rpms, errcodes=errcodes)
 
     # XXX the "is null" condition will have to change in multiorg satellites
     def _diff_packages(self):
@@ -1012,7 +1026,8 @@ class Syncer:
     def _verify_file(path, mtime, size, checksum_type, checksum):
         """
         Verifies if the file is on the filesystem and matches the mtime and checksum.
-        Computing the checksum is costly, that's why we rely on mtime comparisons.
+        Computing the checksum is costly, that's why we rely on mtime comparisons
+        and on the checksums of the file state index.
         Returns errcode:
             0   - file is ok, it has either the specified mtime and size
                           or checksum matches (then function sets mtime)
@@ -1021,30 +1036,22 @@ class Syncer:
         """
         if not path:
             return 1
-        abs_path = os.path.join(CFG.MOUNT_POINT, path)
-        try:
-            stat_info = os.stat(abs_path)
-        except OSError:
-            # File is missing completely
-            return 1
+        return Syncer._verify_files([(path, mtime, size, checksum_type, checksum)])[path]
 
-        l_mtime = stat_info[stat.ST_MTIME]
-        l_size = stat_info[stat.ST_SIZE]
-        if l_mtime == mtime and l_size == size:
-            # Same mtime, and size, assume identity
-            return 0
-
-        # Have to check checksum
-        l_checksum = getFileChecksum(checksum_type, filename=abs_path)
-        if l_checksum != checksum:
-            return 2
-
-        # Set the mtime
-        os.utime(abs_path, (mtime, mtime))
-        return 0
+    @staticmethod
+    def _verify_files(files):
+        """
+        Bulk version of _verify_file: the files, a list of
+        (path, mtime, size, checksum_type, checksum), are stat'ed (and hashed
+        if need be) in parallel. Returns {path: errcode}
+        """
+        abs_files = [(os.path.join(CFG.MOUNT_POINT, path), mtime, size, checksum_type, checksum)
+                     for path, mtime, size, checksum_type, checksum in files]
+        errcodes = file_index.get_index().verify_files(abs_files)
+        return dict((f[0], errcodes[abs_f[0]]) for f, abs_f in zip(files, abs_files))
 
     def _process_package(self, package_id, package, l_timestamp, row,
-                         m_channel_packages, m_fs_packages, check_rpms=1):
+                         m_channel_packages, m_fs_packages, check_rpms=1, errcodes=None):
         path = None
         channel_package = None
         fs_package = None
@@ -1069,8 +1076,11 @@ class Syncer:
                 if check_rpms:
                     if db_path:
                         # check the filesystem
-                        errcode = self._verify_file(db_path, l_timestamp,
-                                                    package_size, checksum_type, checksum)
+                        if errcodes is not None and db_path in errcodes:
+                            errcode = errcodes[db_path]
+                        else:
+                            errcode = self._verify_file(db_path, l_timestamp,
+                                                        package_size, checksum_type, checksum)
                         if errcode:
                             # file doesn't match
                             fs_package = package_id
@@ -1831,20 +1841,21 @@ class Syncer:
         real_total_size = total_size
         start_time = round(time.time())
 
-        all_threads = []
-        for _thread in range(4):
+        running = min(self._download_threads, pkgs_total)
+        for _thread in range(running):
             t = ThreadDownload(lock, queue, out_queue, short_package_collection, package_collection,
                                self, self._failed_fs_packages, self._extinct_packages, sources, channel)
-            t.setDaemon(True)
+            t.daemon = True
             t.start()
-            all_threads.append(t)
 
-        while ([x for x in all_threads if x.isAlive()]
-               and pkg_current < pkgs_total):
-            try:
-                (rpmManip, package, is_done) = out_queue.get(False, 0.1)
-            except Queue.Empty:
+        # Every worker reports each of its packages and finally None once it
+        # runs out of packages, so we just wait for the next event
+        while running and pkg_current < pkgs_total:
+            result = out_queue.get()
+            if result is None:
+                running -= 1
                 continue
+            (rpmManip, package, is_done) = result
             pkg_current = pkg_current + 1
 
             if not is_done:  # package failed to download or already exist on disk
@@ -1906,9 +1917,20 @@ class Syncer:
         # pylint: disable=W0631
         return "%*.*f %s" % (int_len, fract_len, fuzzy, unit)
 
-    def _get_package_stream(self, channel, package_id, nvrea, sources, checksum):
-        """ returns (filepath, stream), so in the case of a "wire source",
-            the return value is, of course, (None, stream)
+    def _get_rpm_wire_source(self):
+        """Returns a wire source for the exclusive use of one download thread,
+        or None if the packages are not fetched from an ISS parent"""
+        if self.mountpoint or not CFG.ISS_PARENT:
+            return None
+        return xmlWireSource.RpmWireSource(self.systemid, True, self.xml_dump_version,
+                                           self.xmlDataServer.server_handler)
+
+    def _get_package_stream(self, channel, package_id, nvrea, sources, checksum,
+                            offset=0, wire_source=None):
+        """ returns (filepath, stream, offset), so in the case of a "wire source",
+            the return value is, of course, (None, stream, offset)
+            offset is where the stream starts in the package: the requested
+            offset if the wire source resumed the download, 0 otherwise
         """
 
         # Returns a package stream from disk
@@ -1920,11 +1942,14 @@ class Syncer:
                 e = sys.exc_info()[1]
                 if e.errno != 2:  # No such file or directory
                     raise
-                return (rpmFile, None)
+                return (rpmFile, None, 0)
 
-            return (rpmFile, stream)
+            return (rpmFile, stream, 0)
 
         # Wire stream
+        if wire_source is not None:
+            stream, offset = wire_source.getRpmStream(nvrea, channel, checksum, offset)
+            return (None, stream, offset)
         if CFG.ISS_PARENT:
             stream = self.xmlDataServer.getRpm(nvrea, channel, checksum)
         else:
@@ -1932,7 +1957,7 @@ class Syncer:
                                                        self.xml_dump_version)
             stream = rpmServer.getPackageStream(channel, nvrea, checksum)
 
-        return (None, stream)
+        return (None, stream, 0)
 
     def import_supportinfo(self):
         """Imports the support-related information"""
@@ -1985,111 +2010,124 @@ class ThreadDownload(threading.Thread):
         self.sources = sources
         self.channel = channel
         self.lock = lock
+        # Connection of this thread; the shared one needs the lock
+        self.wire_source = syncer._get_rpm_wire_source()
 
     def run(self):
-        while not self.queue.empty():
-            # grabs host from queue
-            (package_id, path) = self.queue.get()
-            package = self.package_collection.get_package(package_id)
-            last_modified = package['last_modified']
-            checksum_type = package['checksum_type']
-            checksum = package['checksum']
-            package_size = package['package_size']
-            if not path:
-                nevra = get_nevra(package)
-                orgid = None
-                if package['org_id']:
-                    orgid = OPTIONS.orgid or DEFAULT_ORG
-                path = self.syncer._get_rel_package_path(nevra, orgid, self.sources,
-                                                         checksum_type, checksum)
-
-            # update package path
-            package['path'] = path
-            self.package_collection.add_item(package)
-
-            errcode = self.syncer._verify_file(path, rhnLib.timestamp(last_modified),
-                                               package_size, checksum_type, checksum)
-            if errcode == 0:
-                # file is already there
-                # do not count this size to time estimate
-                try:
-                    self.queue.task_done()
-                except AttributeError:
-                    pass
-                self.out_queue.put((None, package, False))
-                continue
-
-            cfg = config.initUp2dateConfig()
-            rpmManip = RpmManip(package, path)
-            nvrea = rpmManip.nvrea()
-
-            # Retry a number of times, we may have network errors
-            for _try in range(cfg['networkRetries']):
-                self.lock.acquire()
+        try:
+            while 1:
+                # grabs host from queue
                 try:
-                    rpmFile, stream = self.syncer._get_package_stream(self.channel,
-                                                                      package_id, nvrea, self.sources, checksum)
-                except:
-                    self.lock.release()
-                    raise
-                self.lock.release()
-                if stream is None:
-                    # Mark the package as extinct
-                    self.extinct_packages.put(package_id)
-                    log(1, messages.package_fetch_extinct %
-                        (os.path.basename(path)))
-                    break  # inner for
-
+                    (package_id, path) = self.queue.get_nowait()
+                except Queue.Empty:
+                    break
                 try:
-                    rpmManip.write_file(stream)
-                    break  # inner for
-                except FileCreationError:
+                    rpmManip, package, is_done = self._fetch_package(package_id, path)
+                except Exception:  # pylint: disable=W0703
                     e = sys.exc_info()[1]
-                    msg = e.args[0]
-                    log2disk(-1, _("Unable to save file %s: %s") % (
-                        rpmManip.full_path, msg))
-                    # Try again
-                    continue  # inner for
-
-            else:  # for
-                # Ran out of iterations
-                # Mark the package as failed and move on
-                self.failed_fs_packages.put(package_id)
-                log(1, messages.package_fetch_failed %
-                    (os.path.basename(path)))
-                # Move to the next package
+                    log(-1, _("Unable to fetch package %s: %s") % (package_id, e), stream=sys.stderr)
+                    self.failed_fs_packages.put(package_id)
+                    rpmManip, package, is_done = None, self.package_collection.get_package(package_id), False
+                # signals to queue job is done
                 try:
                     self.queue.task_done()
                 except AttributeError:
                     pass
-                self.out_queue.put((rpmManip, package, False))
-                continue
+                self.out_queue.put((rpmManip, package, is_done))
+        finally:
+            # No more packages from this thread
+            self.out_queue.put(None)
+
+    def _get_package_stream(self, package_id, nvrea, checksum, offset):
+        if self.wire_source is not None:
+            return self.syncer._get_package_stream(self.channel, package_id, nvrea, self.sources,
+                                                   checksum, offset, self.wire_source)
+        with self.lock:
+            return self.syncer._get_package_stream(self.channel, package_id, nvrea, self.sources,
+                                                   checksum)
+
+    def _fetch_package(self, package_id, path):
+        """Fetches a package; returns (rpmManip, package, is_done)"""
+        package = self.package_collection.get_package(package_id)
+        last_modified = package['last_modified']
+        checksum_type = package['checksum_type']
+        checksum = package['checksum']
+        package_size = package['package_size']
+        if not path:
+            nevra = get_nevra(package)
+            orgid = None
+            if package['org_id']:
+                orgid = OPTIONS.orgid or DEFAULT_ORG
+            path = self.syncer._get_rel_package_path(nevra, orgid, self.sources,
+                                                     checksum_type, checksum)
+
+        # update package path
+        package['path'] = path
+        self.package_collection.add_item(package)
+
+        errcode = self.syncer._verify_file(path, rhnLib.timestamp(last_modified),
+                                           package_size, checksum_type, checksum)
+        if errcode == 0:
+            # file is already there
+            # do not count this size to time estimate
+            return (None, package, False)
+
+        cfg = config.initUp2dateConfig()
+        rpmManip = RpmManip(package, path)
+        nvrea = rpmManip.nvrea()
 
+        # Retry a number of times, we may have network errors
+        for _try in range(cfg['networkRetries']):
+            # Resume what an interrupted attempt (or run) left behind
+            offset = 0
+            if self.wire_source is not None:
+                offset = rpmManip.partial_size()
+            rpmFile, stream, offset = self._get_package_stream(package_id, nvrea, checksum, offset)
             if stream is None:
-                # Package is extinct. Move on
-                try:
-                    self.queue.task_done()
-                except AttributeError:
-                    pass
-                self.out_queue.put((rpmManip, package, False))
-                continue
+                # Mark the package as extinct
+                self.extinct_packages.put(package_id)
+                log(1, messages.package_fetch_extinct %
+                    (os.path.basename(path)))
+                return (rpmManip, package, False)
 
-            if self.syncer.mountpoint and not self.syncer.keep_rpms:
-                # Channel dumps import; try to unlink to preserve disk space
-                # rpmFile is always returned by _get_package_stream for
-                # disk-based imports
-                assert(rpmFile is not None)
-                try:
-                    os.unlink(rpmFile)
-                except (OSError, IOError):
-                    pass
+            try:
+                rpmManip.write_file(stream, offset)
+            except FileCreationError:
+                e = sys.exc_info()[1]
+                msg = e.args[0]
+                log2disk(-1, _("Unable to save file %s: %s") % (
+                    rpmManip.full_path, msg))
+                # Try again
+                continue  # inner for
+            finally:
+                stream.close()
 
-            # signals to queue job is done
+            if offset and getFileChecksum(checksum_type, filename=rpmManip.full_path) != checksum:
+                # The partial file did not belong to this package; start over
+                log2disk(-1, _("Resumed file %s has a wrong checksum") % rpmManip.full_path)
+                os.unlink(rpmManip.full_path)
+                continue  # inner for
+            break  # inner for
+
+        else:  # for
+            # Ran out of iterations
+            # Mark the package as failed and move on
+            self.failed_fs_packages.put(package_id)
+            log(1, messages.package_fetch_failed %
+                (os.path.basename(path)))
+            return (rpmManip, package, False)
+
+        if self.syncer.mountpoint and not self.syncer.keep_rpms:
+            # Channel dumps import; try to unlink to preserve disk space
+            # rpmFile is always returned by _get_package_stream for
+            # disk-based imports
+            assert(rpmFile is not None)
             try:
-                self.queue.task_done()
-            except AttributeError:
+                os.unlink(rpmFile)
+            except (OSError, IOError):
                 pass
-            self.out_queue.put((rpmManip, package, True))
+
+        return (rpmManip, package, True)
 
 
 class StreamProducer:
@@ -2234,6 +2272,9 @@ def processCommandline():
                help=_('existing custom channels will also be synced (unless -c is used)')),
         Option('--debug-level',         action='store',
                help=_('override debug level set in /etc/rhn/rhn.conf (which is currently set at %s).') % CFG.DEBUG),
+        Option('--download-threads',    action='store',
+               help=_('number of packages downloaded in parallel (default: %s)')
+               % (CFG.SYNC_DOWNLOAD_THREADS or DEFAULT_DOWNLOAD_THREADS)),
         Option('--dump-version',        action='store',
                help=_("requested version of XML dump (default: %s)") % constants.PROTOCOL_VERSION),
         Option('--email',               action='store_true',
@@ -2478,6 +2519,15 @@ def processCommandline():
             usix.raise_with_tb(ValueError(_("ERROR: --batch-size must have a value within the range: 1..50")),
                                sys.exc_info()[2])
 
+    try:
+        OPTIONS.download_threads = int(OPTIONS.download_threads or CFG.SYNC_DOWNLOAD_THREADS
+                                       or DEFAULT_DOWNLOAD_THREADS)
+        if OPTIONS.download_threads < 1:
+            raise ValueError
+    except (ValueError, TypeError):
+        usix.raise_with_tb(ValueError(_("ERROR: --download-threads must be a positive integer")),
+                           sys.exc_info()[2])
+
     OPTIONS.mount_point = fileutils.cleanupAbsPath(OPTIONS.mount_point)
     OPTIONS.systemid = fileutils.cleanupAbsPath(OPTIONS.systemid)
 
@@ -199,8 +199,27 @@ class FileManip:
             self.full_path = os.path.join(CFG.MOUNT_POINT, self.relative_path)
             self.buffer_size = CFG.BUFFER_SIZE
 
-    def write_file(self, stream_in):
+    @property
+    def partial_path(self):
+        """Path the file is downloaded to before it is complete"""
+        return self.full_path + '.part'
+
+    def partial_size(self):
+        """Returns the number of bytes of a previous, interrupted download
+        which can be resumed"""
+        try:
+            size = os.path.getsize(self.partial_path)
+        except OSError:
+            return 0
+        if self.file_size is not None and size >= self.file_size:
+            # Nothing sensible left to resume
+            return 0
+        return size
+
+    def write_file(self, stream_in, offset=0):
         """Writes the contents of stream_in to the filesystem
+        If offset is set, stream_in holds the contents of the file starting
+        at that offset, and they are appended to the partial download.
         Returns the file size(success) or raises FileCreationError"""
         dirname = os.path.dirname(self.full_path)
         createPath(dirname)
@@ -214,7 +233,7 @@ class FileManip:
         # df
         f_bavail = stat[4]  # free blocks
         freespace = f_bsize * float(f_bavail)
-        if self.file_size is not None and self.file_size > freespace:
+        if self.file_size is not None and self.file_size - offset > freespace:
             msg = messages.not_enough_diskspace % (freespace / 1024)
             log(-1, msg, stream=sys.stderr)
             # pkilambi: As the metadata download does'nt check for unfetched rpms
@@ -229,29 +248,29 @@ class FileManip:
             sys.exit(-1)
             #raise FileCreationError(msg)
 
-        fout = open(self.full_path, 'wb')
+        # The file is only moved in place once it is complete; an interrupted
+        # download is kept in partial_path, to be resumed by the next attempt
+        if offset:
+            fout = open(self.partial_path, 'r+b')
+            fout.seek(offset)
+            fout.truncate()
+        else:
+            fout = open(self.partial_path, 'wb')
         # setting file permissions; NOTE: rhnpush uses apache to write to disk,
         # hence the 6 setting.
         with cfg_component(component=None) as CFG:
-            setPermsPath(self.full_path, user=CFG.httpd_user, group=CFG.httpd_group, chmod=int('0644', 8))
-        size = 0
+            setPermsPath(self.partial_path, user=CFG.httpd_user, group=CFG.httpd_group, chmod=int('0644', 8))
         try:
             while 1:
                 buf = stream_in.read(self.buffer_size)
                 if not buf:
                     break
-                buf_len = len(buf)
                 fout.write(buf)
-                size = size + buf_len
         except IOError:
             e = sys.exc_info()[1]
             msg = "IOError: %s" % e
             log(-1, msg, stream=sys.stderr)
-            # Try not to leave garbage around
-            try:
-                os.unlink(self.full_path)
-            except (OSError, IOError):
-                pass
+            fout.close()
             raise_with_tb(FileCreationError(msg), sys.exc_info()[2])
         l_file_size = fout.tell()
         fout.close()
@@ -261,13 +280,15 @@ class FileManip:
             msg = "Error: file %s has wrong size. Expected %s bytes, got %s bytes" % (
                 self.full_path, self.file_size, l_file_size)
             log(-1, msg, stream=sys.stderr)
-            # Try not to leave garbage around
-            try:
-                os.unlink(self.full_path)
-            except (OSError, IOError):
-                pass
+            if l_file_size > self.file_size:
+                # Try not to leave garbage around
+                try:
+                    os.unlink(self.partial_path)
+                except (OSError, IOError):
+                    pass
             raise FileCreationError(msg)
 
+        os.rename(self.partial_path, self.full_path)
         os.utime(self.full_path, (self.timestamp, self.timestamp))
         return l_file_size
 
@@ -347,6 +347,50 @@ class MetadataWireSource(BaseWireSource):
         self._prepare()
         return self._openSocketStream("dump.cloned_channels", (self.systemid,))
 
+class RpmWireSource(MetadataWireSource):
+
+    """Retrieves packages over a server object of its own, so that every
+    download thread can reuse its connection settings without sharing (and
+    locking) the class-wide server object; also resumes partial downloads
+    through HTTP ranges."""
+
+    def __init__(self, systemid, sslYN=0, xml_dump_version=None, server_handler=None):
+        MetadataWireSource.__init__(self, systemid, sslYN, xml_dump_version)
+        self.server_handler = server_handler
+        self.rpmServerObj = None
+        self.offset = 0
+
+    def _prepare(self):
+        # The connection is set up by getServer()
+        pass
+
+    def getServer(self, forcedYN=0):
+        if forcedYN or self.rpmServerObj is None:
+            url = '%s%s' % (self.schemeAndUrl(None), self.server_handler)
+            proxy, puser, ppass = get_proxy(url)
+            self.rpmServerObj = connection.StreamConnection(url, proxy=proxy,
+                                                            username=puser, password=ppass,
+                                                            xml_dump_version=self.xml_dump_version,
+                                                            timeout=CFG.timeout)
+            self._set_ssl_trusted_certs(self.rpmServerObj)
+            self.rpmServerObj.set_transport_flags(allow_partial_content=1)
+        # Parents that do not support ranges ignore the header and send the
+        # whole package
+        self.rpmServerObj.set_header('Range', 'bytes=%d-' % self.offset)
+        return self.rpmServerObj
+
+    def getRpmStream(self, nvrea, channel, checksum, offset=0):
+        """Returns (stream, offset): the stream starts at the requested
+        offset if the parent honoured the range, at the beginning of the
+        package otherwise"""
+        self.offset = offset
+        stream = self.getRpm(nvrea, channel, checksum)
+        content_range = self.rpmServerObj.get_content_range()
+        if content_range is None:
+            return stream, 0
+        return stream, content_range['first_byte_pos']
+
+
 class XMLRPCWireSource(BaseWireSource):
 
     "Base class for all the XMLRPC calls"
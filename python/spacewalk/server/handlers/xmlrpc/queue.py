@@ -282,6 +282,21 @@ class Queue(rhnHandler):
                       order by a.earliest_action, a.prerequisite nulls first, a.id
     """)
 
+    # Index only check whether the server has any action at all, so the
+    # queue of the clients polling without pending actions is not searched
+    _query_queue_pending = rhnSQL.Statement("""
+                    select 1
+                      from rhnServerAction sa
+                     where sa.server_id = :server_id
+                       and sa.status in (0, 1) -- Queued or picked up
+                     limit 1
+    """)
+
+    def _has_pending_actions(self):
+        h = rhnSQL.prepare(self._query_queue_pending)
+        h.execute(server_id=self.server_id)
+        return h.fetchone_dict() is not None
+
     # Probably we need to figure out if we really need to split these two.
     def get(self, system_id, version=1, status={}):
         # Authenticate the system certificate
@@ -298,6 +313,11 @@ class Queue(rhnHandler):
         # Update the capabilities list
         rhnCapability.update_client_capabilities(self.server_id)
 
+        if not self._has_pending_actions():
+            log_debug(3, "No pending actions", self.server_id)
+            rhnSQL.commit()
+            return ""
+
         # Invalidate failed actions
         self._invalidate_failed_prereq_actions()
 
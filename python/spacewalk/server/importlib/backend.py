@@ -69,6 +69,9 @@ class Backend:
     # This object is initialized by the specific subclasses (e.g.
     # OracleBackend)
     tables = TableCollection()
+    # Number of already uploaded objects whose child tables are fetched at
+    # once when verifying an object collection
+    childLookupBatchSize = 100
     # TODO: Some reason why we're passing a module in here? Seems to
     # always be rhnSQL anyhow...
 
@@ -2133,14 +2136,6 @@ class Backend:
             # saving id
             hash[k] = h.fetchone_dict().popitem()[1]
 
-    def __buildQueries(self, childTables):
-        childTableLookups = {}
-        queryTempl = "select * from %s where %s = :id"
-        for childTableName in childTables:
-            childTableLookups[childTableName] = self.dbmodule.prepare(
-                queryTempl % (childTableName, childTables[childTableName]))
-        return childTableLookups
-
     def __processObjectCollection(self, objColl, parentTable, childTables=[],
                                   colname=None, **kwargs):
         # Returns the DML object that was processed
@@ -2215,8 +2210,6 @@ class Backend:
 
         # Lookup object
         lookup = TableLookup(parentTableObj, self.dbmodule)
-        # XXX
-        childTableLookups = self.__buildQueries(childTables)
         # For each valid object in the collection, look it up
         #   if it doesn't exist, insert all the associated information
         #   if it already exists:
@@ -2230,12 +2223,9 @@ class Backend:
         #       one if not explicitly specified). The "global" severity is the
         #       max of all severities.
         #   New objects will have a diff level of -1
-        for object in objColl:
-            if object.ignored:
-                # Skip it
-                continue
-            h = lookup.query(object)
-            row = h.fetchone_dict()
+        objects = [object for object in objColl if not object.ignored]
+        # Look the whole collection up at once
+        for object, row in zip(objects, lookup.query_many(objects)):
             if not row:
                 # Object does not exist
                 id = self.sequences[parentTable].next()
@@ -2283,6 +2273,7 @@ class Backend:
             uploadedObjects[row['id']] = [object, row]
 
         # Deal with already-uploaded objects
+        toVerify = []
         for objid, (object, row) in list(uploadedObjects.items()):
             # Build the external value
             extObject = {'id': row['id']}
@@ -2299,9 +2290,18 @@ class Backend:
                     # Same object, or not different enough
                     # not enough karma either
                     continue
+            toVerify.append((objid, object, extObject, diffval))
+
+        # The child tables of the objects to verify are fetched in chunks,
+        # for all the objects of a chunk at once
+        childTablesInfo = {}
+        for i, (objid, object, extObject, diffval) in enumerate(toVerify):
+            if objid not in childTablesInfo:
+                chunk = [v[0] for v in toVerify[i:i + self.childLookupBatchSize]]
+                childTablesInfo = self.__getChildTablesInfo(chunk, childTables)
 
             localDML = self.__processUploaded(objid, object, childTables,
-                                              childTableLookups)
+                                              childTablesInfo[objid])
 
             if uploadForce < object.diff.level:
                 # Not enough karma
@@ -2328,7 +2328,7 @@ class Backend:
             raise TransactionError("Error uploading package source batch")
         return self.__doDML(dml)
 
-    def __processUploaded(self, objid, object, childTables, childTableLookups):
+    def __processUploaded(self, objid, object, childTables, childTablesInfo):
         # Store the DML operations locally
         localDML = {
             'insert': {},
@@ -2336,10 +2336,6 @@ class Backend:
             'delete': {},
         }
 
-        # Grab the rest of the information
-        childTablesInfo = self.__getChildTablesInfo(objid, list(childTables.keys()),
-                                                    childTableLookups)
-
         # Start computing deltas
         for childTableName in childTables:
             # Init the local hashes
@@ -2498,12 +2494,8 @@ class Backend:
     def __lookupObjectCollection(self, objColl, tableName, ignore_missing=0):
         # Looks the object up in tableName, and fills in its id
         lookup = TableLookup(self.tables[tableName], self.dbmodule)
-        for object in objColl:
-            if object.ignored:
-                # Skip it
-                continue
-            h = lookup.query(object)
-            row = h.fetchone_dict()
+        objects = [object for object in objColl if not object.ignored]
+        for object, row in zip(objects, lookup.query_many(objects)):
             if not row:
                 if ignore_missing:
                     # Ignore the missing objects
@@ -2513,34 +2505,31 @@ class Backend:
                 raise InvalidPackageError(object, "Could not find object %s in table %s" % (object, tableName))
             object.id = row['id']
 
-    def __getChildTablesInfo(self, id, tables, queries):
-        # Returns a hash with the information about package id from tables
-        result = {}
-        for tname in tables:
+    def __getChildTablesInfo(self, ids, childTables):
+        # Returns a hash keyed on the object ids with the information about
+        # each object from the child tables, keyed on the table name
+        result = dict((id, dict((tname, {}) for tname in childTables)) for id in ids)
+        for tname, colname in list(childTables.items()):
             tableobj = self.tables[tname]
             fields = tableobj.getFields()
-            q = queries[tname]
-            q.execute(id=id)
-            hash = {}
-            while 1:
-                row = q.fetchone_dict()
-                if not row:
-                    break
-                pks = tableobj.getPK()
+            pks = tableobj.getPK()
+            sql = "select %s.* from %s join (values %%s) as parent_ids (id) on %s.%s = parent_ids.id" % (
+                tname, tname, tname, colname)
+            h = self.dbmodule.prepare(sql)
+            rows = h.execute_values(sql, [(id,) for id in ids], template="(%s::numeric)",
+                                    page_size=10_000) or []
+            if not rows:
+                continue
+            names = [d[0].lower() for d in h.description]
+            for row in rows:
+                row = dict(zip(names, row))
                 key = []
                 for f in pks:
-                    value = row[f]
-                    datatype = fields[f]
-                    value = sanitizeValue(value, datatype)
-                    key.append(value)
+                    key.append(sanitizeValue(row[f], fields[f]))
                 val = {}
                 for f, datatype in list(fields.items()):
-                    value = row[f]
-                    value = sanitizeValue(value, datatype)
-                    val[f] = value
-                hash[tuple(key)] = val
-
-            result[tname] = hash
+                    val[f] = sanitizeValue(row[f], datatype)
+                result[row[colname]][tname][tuple(key)] = val
         return result
 
     def __populateTable(self, table_name, data, delete_extra=1):
@@ -69,6 +69,20 @@ class DBdate(DBtype):
 class DBdateTime(DBtype):
     pass
 
+
+def sqlTypeCast(datatype):
+    # Cast for the values sent in a VALUES list, so they compare and assign
+    # like the table columns
+    if isinstance(datatype, DBint):
+        return "::numeric"
+    if isinstance(datatype, DBstring):
+        return "::varchar"
+    if isinstance(datatype, DBdateTime):
+        return "::timestamptz"
+    if isinstance(datatype, DBdate):
+        return "::date"
+    return ""
+
 # Database objects
 
 
@@ -234,6 +248,32 @@ class BaseTableLookup:
         # Stub
         return None
 
+    def _valuesColumns(self, key):
+        # The non-null primary keys, the ones sent in a VALUES list
+        return [self.pks[i] for i in range(len(key)) if not key[i]]
+
+    def _valuesJoinClause(self, key):
+        # Joins the table with a VALUES list aliased new_values on the
+        # primary keys
+        clauses = []
+        for i in range(len(key)):
+            pk = self.pks[i]
+            if key[i]:
+                clauses.append("%s.%s is null" % (self.table.name, pk))
+            else:
+                clauses.append("%s.%s = new_values.%s" % (self.table.name, pk, pk))
+        return ' and '.join(clauses)
+
+    def _valuesTemplate(self, columns):
+        return "(%s)" % ", ".join(["%%s%s" % sqlTypeCast(self.table.fields[c]) for c in columns])
+
+    @staticmethod
+    def _valuesRows(values, columns, npks):
+        rows = zip(*[values[c] for c in columns])
+        # Later values for the same primary key win, like they did when the
+        # rows were processed one statement at a time
+        return list(dict([(row[:npks], row) for row in rows]).values())
+
     def _getCachedQuery(self, key, blob_map=None):
         if key in self.queries:
             # Serve it from the pool
@@ -256,16 +296,48 @@ class TableLookup(BaseTableLookup):
     def __init__(self, table, dbmodule):
         BaseTableLookup.__init__(self, table, dbmodule)
         self.queryTemplate = "select * from %s where %s"
+        self.manyQueryTemplate = "select %s.*, new_values.ordering from %s " \
+            "join (values %%s) as new_values (%s) on %s"
 
     def _buildQuery(self, key):
         return self.queryTemplate % (self.table.name, self.whereclauses[key])
 
+    def _buildManyQuery(self, key):
+        return self.manyQueryTemplate % (self.table.name, self.table.name,
+                                         ', '.join(['ordering'] + self._valuesColumns(key)),
+                                         self._valuesJoinClause(key))
+
+    def query_many(self, values):
+        """ Looks up all the values with one statement per combination of
+            null primary keys. Returns the rows as dictionaries, None for
+            the values not found, in the order of values """
+        result = [None] * len(values)
+        valuesHash = {}
+        for i, value in enumerate(values):
+            key, hash = self._selectQueryKey(value)
+            columns = self._valuesColumns(key)
+            valuesHash.setdefault(key, []).append(tuple([i] + [hash[c] for c in columns]))
+
+        for key, rows in list(valuesHash.items()):
+            columns = self._valuesColumns(key)
+            query = self._buildManyQuery(key)
+            statement = self.dbmodule.prepare(query)
+            # The position of the value goes first, uncast
+            template = "(%s)" % ", ".join(["%s"] + ["%%s%s" % sqlTypeCast(self.table.fields[c])
+                                                   for c in columns])
+            found = statement.execute_values(query, rows, template=template, page_size=10_000) or []
+            names = [d[0].lower() for d in statement.description[:-1]] if found else []
+            for row in found:
+                if result[row[-1]] is None:
+                    result[row[-1]] = dict(zip(names, row[:-1]))
+        return result
+
 
 class TableUpdate(BaseTableLookup):
 
     def __init__(self, table, dbmodule):
         BaseTableLookup.__init__(self, table, dbmodule)
-        self.queryTemplate = "update %s set %s where %s"
+        self.queryTemplate = "update %s set %s from (values %%s) as new_values (%s) where %s"
         self.fields = list(self.table.getFields().keys())
         # Fields minus pks
         self.otherfields = []
@@ -279,7 +351,7 @@ class TableUpdate(BaseTableLookup):
                 self.blob_fields.append(field)
             else:
                 self.otherfields.append(field)
-        self.updateclause = ', '.join(["%s = :%s" % (x, x) for x in self.otherfields])
+        self.updateclause = ', '.join(["%s = new_values.%s" % (x, x) for x in self.otherfields])
         # key
         self.firstkey = None
         for pk in self.pks:
@@ -289,8 +361,9 @@ class TableUpdate(BaseTableLookup):
                 break
 
     def _buildQuery(self, key):
+        columns = self._valuesColumns(key) + self.otherfields
         return self.queryTemplate % (self.table.name, self.updateclause,
-                                     self.whereclauses[key])
+                                     ', '.join(columns), self._valuesJoinClause(key))
 
     def _split_blob_values(self, values, blob_only=0):
         # Splits values that have to be inserted
@@ -346,8 +419,13 @@ class TableUpdate(BaseTableLookup):
                 if not val[self.firstkey]:
                     # Nothing to do
                     continue
+                # Update all the rows at once
+                pks = self._valuesColumns(key)
+                columns = pks + self.otherfields
                 statement = self._getCachedQuery(key)
-                statement.executemany(**val)
+                statement.execute_values(self._buildQuery(key), self._valuesRows(val, columns, len(pks)),
+                                         template=self._valuesTemplate(columns), fetch=False,
+                                         page_size=10_000)
 
         if not self.blob_fields:
             return
@@ -392,7 +470,11 @@ class TableDelete(TableLookup):
 
     def __init__(self, table, dbmodule):
         TableLookup.__init__(self, table, dbmodule)
-        self.queryTemplate = "delete from %s where %s"
+        self.queryTemplate = "delete from %s using (values %%s) as new_values (%s) where %s"
+
+    def _buildQuery(self, key):
+        return self.queryTemplate % (self.table.name, ', '.join(self._valuesColumns(key)),
+                                     self._valuesJoinClause(key))
 
     def query(self, values):
         # Build the values hash
@@ -422,11 +504,17 @@ class TableDelete(TableLookup):
             if not val[firstkey]:
                 # Nothing to do
                 continue
+            # Delete all the rows at once
+            pks = self._valuesColumns(key)
             statement = self._getCachedQuery(key)
-            statement.executemany(**val)
+            statement.execute_values(self._buildQuery(key), self._valuesRows(val, pks, len(pks)),
+                                     template=self._valuesTemplate(pks), fetch=False,
+                                     page_size=10_000)
 
 
 class TableInsert(TableUpdate):
+    # Row count from which COPY is used instead of INSERT statements
+    copyThreshold = 10_000
 
     def __init__(self, table, dbmodule):
         TableUpdate.__init__(self, table, dbmodule)
@@ -448,8 +536,11 @@ class TableInsert(TableUpdate):
 
         # Do the insert
         statement = self._getCachedQuery(None, blob_map=blob_map)
-        l = len(values[self.insert_fields[0]])
-        value_list = [[values[f][i] for f in self.insert_fields] for i in range(l)]
+        value_list = list(zip(*[values[f] for f in self.insert_fields]))
+        if not self.blob_fields and len(value_list) >= self.copyThreshold:
+            # Bulk load big imports, like capabilities and changelogs
+            statement.copy_from(self.table.name, self.insert_fields, value_list)
+            return
         statement.execute_values(self._buildQuery(None), value_list, fetch=False, page_size=10_000)
 
 def sanitizeValue(value, datatype):
@@ -326,7 +326,8 @@ class rpmSourcePackage(SourcePackage, rpmPackage):
         self['sigchecksum'] = ''.join(["%02x" % ord(x) for x in self['sigchecksum']])
 
 
-class rpmFile(File, ChangeLog):
+class rpmFile(File):
+    __slots__ = ()
     # Mapping from the attribute's names to rpm tags
     tagMap = {
         'name': 'filenames',
@@ -347,7 +348,7 @@ class rpmFile(File, ChangeLog):
     }
 
     def populate(self, hash):
-        ChangeLog.populate(self, hash)
+        File.populate(self, hash)
         # Fix the time
         tm = self['mtime']
         if isinstance(tm, int):
@@ -359,6 +360,7 @@ class rpmFile(File, ChangeLog):
 
 
 class rpmProvides(Dependency):
+    __slots__ = ()
     # More mappings
     tagMap = {
         'name': 'provides',
@@ -368,6 +370,7 @@ class rpmProvides(Dependency):
 
 
 class rpmRequires(Dependency):
+    __slots__ = ()
     # More mappings
     tagMap = {
         'name': 'requirename',
@@ -376,6 +379,7 @@ class rpmRequires(Dependency):
     }
 
 class rpmOldSuggests(Dependency):
+    __slots__ = ()
     # More mappings
     tagMap = {
         'name': 1156,  # 'suggestsname',
@@ -384,6 +388,7 @@ class rpmOldSuggests(Dependency):
     }
 
 class rpmSuggests(Dependency):
+    __slots__ = ()
     # More mappings
     tagMap = {
         'name'      : 5049, #'suggestsname',
@@ -392,6 +397,7 @@ class rpmSuggests(Dependency):
     }
 
 class rpmOldRecommends(Dependency):
+    __slots__ = ()
     # More mappings
     tagMap = {
         'name'      : 1156, #'recommendsname',
@@ -400,6 +406,7 @@ class rpmOldRecommends(Dependency):
     }
 
 class rpmRecommends(Dependency):
+    __slots__ = ()
     # More mappings
     tagMap = {
         'name'      : 5046, #'recommendsname',
@@ -408,6 +415,7 @@ class rpmRecommends(Dependency):
     }
 
 class rpmOldSupplements(Dependency):
+    __slots__ = ()
     # More mappings
     tagMap = {
         'name'      : 1159, #'supplementsname',
@@ -416,6 +424,7 @@ class rpmOldSupplements(Dependency):
     }
 
 class rpmSupplements(Dependency):
+    __slots__ = ()
     # More mappings
     tagMap = {
         'name'      : 5052, #'supplementsname',
@@ -424,6 +433,7 @@ class rpmSupplements(Dependency):
     }
 
 class rpmOldEnhances(Dependency):
+    __slots__ = ()
     # More mappings
     tagMap = {
         'name'      : 1159, #'enhancesname',
@@ -432,6 +442,7 @@ class rpmOldEnhances(Dependency):
     }
 
 class rpmEnhances(Dependency):
+    __slots__ = ()
     # More mappings
     tagMap = {
         'name'      : 5055, #'enhancesname',
@@ -440,6 +451,7 @@ class rpmEnhances(Dependency):
     }
 
 class rpmConflicts(Dependency):
+    __slots__ = ()
     # More mappings
     tagMap = {
         'name': 'conflictname',
@@ -449,6 +461,7 @@ class rpmConflicts(Dependency):
 
 
 class rpmObsoletes(Dependency):
+    __slots__ = ()
     # More mappings
     tagMap = {
         'name': 'obsoletename',
@@ -458,6 +471,7 @@ class rpmObsoletes(Dependency):
 
 
 class rpmBreaks(Dependency):
+    __slots__ = ()
     # More mappings
     tagMap = {
         'name':  1159,  # 'enhancesname'
@@ -467,6 +481,7 @@ class rpmBreaks(Dependency):
 
 
 class rpmPredepends(Dependency):
+    __slots__ = ()
     # More mappings
     tagMap = {
         'name':  1159,  # 'enhancesname'
@@ -476,6 +491,7 @@ class rpmPredepends(Dependency):
 
 
 class rpmChangeLog(ChangeLog):
+    __slots__ = ()
     tagMap = {
         'name': 'changelogname',
         'text': 'changelogtext',
@@ -18,6 +18,7 @@
 
 import os
 import shutil
+import sys
 from uyuni.common.usix import IntType, StringType, InstanceType
 try:
     #  python 2
@@ -56,6 +57,139 @@ class Item(dict):
         return "[<%s instance; attributes=%s]" % (str(self.__class__),
                                                   dict.__repr__(self))
 
+# Marks the keys of a Record which are not set
+_unset = object()
+
+
+class Record(object):
+
+    """
+    Compact, dictionary-like package child record (files, dependencies,
+    changelog entries, checksums). A big package carries tens of thousands
+    of them, so the values are kept in slots instead of one hash per record
+    and the often repeated strings are interned. Keys which are neither
+    attributes nor extra fields are kept in a hash created on demand.
+    """
+    __slots__ = ('_extra',)
+    attributeTypes = {}
+    # Keys set while importing the record, besides its attributes
+    extraFields = ()
+    # Keys with values repeated in many records
+    internedFields = ()
+    # All the slotted keys, in order
+    _fields = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        fields = {}
+        for klass in reversed(cls.__mro__):
+            for f in klass.__dict__.get('__slots__', ()):
+                if f != '_extra':
+                    fields[f] = None
+        cls._fields = fields
+
+    def __init__(self):
+        self._extra = None
+        for k in self._fields:
+            setattr(self, k, _unset)
+        # Same initial values as an Item
+        for k, v in list(self.attributeTypes.items()):
+            self[k] = v
+
+    def __getitem__(self, key):
+        if key in self._fields:
+            value = getattr(self, key)
+            if value is not _unset:
+                return value
+        elif self._extra is not None and key in self._extra:
+            return self._extra[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key in self._fields:
+            if key in self.internedFields and isinstance(value, str):
+                value = sys.intern(value)
+            setattr(self, key, value)
+            return
+        if self._extra is None:
+            self._extra = {}
+        self._extra[key] = value
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        if key in self._fields:
+            setattr(self, key, _unset)
+        else:
+            del self._extra[key]
+
+    def __contains__(self, key):
+        if key in self._fields:
+            return getattr(self, key) is not _unset
+        return self._extra is not None and key in self._extra
+
+    has_key = __contains__
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def __eq__(self, other):
+        if isinstance(other, (Record, dict)):
+            return dict(self.items()) == dict(other.items())
+        return NotImplemented
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+
+    __hash__ = None
+
+    def keys(self):
+        keys = [k for k in self._fields if getattr(self, k) is not _unset]
+        if self._extra:
+            keys.extend(self._extra)
+        return keys
+
+    def values(self):
+        return [self[k] for k in self.keys()]
+
+    def items(self):
+        return [(k, self[k]) for k in self.keys()]
+
+    def get(self, key, default=None):
+        if key in self:
+            return self[key]
+        return default
+
+    def update(self, hash):
+        for k, v in list(hash.items()):
+            self[k] = v
+
+    def populate(self, hash):
+        self.update(hash)
+        return self
+
+    def copy(self):
+        return dict(self.items())
+
+    def __getstate__(self):
+        return dict(self.items())
+
+    def __setstate__(self, state):
+        self._extra = None
+        for k in self._fields:
+            setattr(self, k, _unset)
+        self.update(state)
+
+    def __repr__(self):
+        return "[<%s instance; attributes=%s]" % (str(self.__class__),
+                                                  repr(dict(self.items())))
+
 # BaseInformation is an Item with a couple of other features (an id, an ignored
 # flag, diff information)
 
@@ -366,7 +500,7 @@ class Org(Information):
     }
 
 
-class File(Item):
+class File(Record):
     attributeTypes = {
         'name': StringType,
         'device': IntType,
@@ -384,41 +518,40 @@ class File(Item):
         'checksum': StringType,
         'checksum_type': StringType,
     }
+    extraFields = ('capability', 'capability_id', 'checksum_id')
+    internedFields = ('username', 'groupname', 'lang', 'checksum_type')
+    __slots__ = tuple(attributeTypes) + extraFields
 
-    def __init__(self):
-        Item.__init__(self, self.attributeTypes)
 
-
-class Dependency(Item):
+class Dependency(Record):
     attributeTypes = {
         'name': StringType,
         'version': StringType,
         'flags': IntType,
     }
-
-    def __init__(self):
-        Item.__init__(self, self.attributeTypes)
+    extraFields = ('capability', 'capability_id')
+    internedFields = ('name', 'version')
+    __slots__ = tuple(attributeTypes) + extraFields
 
 
-class ChangeLog(Item):
+class ChangeLog(Record):
     attributeTypes = {
         'name': StringType,
         'text': StringType,
         'time': DateType,
     }
-
-    def __init__(self):
-        Item.__init__(self, self.attributeTypes)
+    extraFields = ('id', 'changelog_data_id')
+    internedFields = ('name',)
+    __slots__ = tuple(attributeTypes) + extraFields
 
 
-class Checksum(Item):
+class Checksum(Record):
     attributeTypes = {
         'type': StringType,
         'value': StringType,
     }
-
-    def __init__(self):
-        Item.__init__(self, self.attributeTypes)
+    internedFields = ('type',)
+    __slots__ = tuple(attributeTypes)
 
 class ProductFile(Information):
     attributeTypes = {
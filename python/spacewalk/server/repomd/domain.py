@@ -29,6 +29,7 @@ class Channel:
         self.checksum_type = None
 
         self.num_packages = 0
+        self.package_ids = []
         self.packages = []
         self.errata = []
         self.updateinfo = None
@@ -76,6 +77,8 @@ class Package:
         self.enhances = []
         self.suggests = []
         self.recommends = []
+        self.breaks = []
+        self.predepends = []
 
         self.changelog = []
 
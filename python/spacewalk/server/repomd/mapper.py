@@ -132,6 +132,7 @@ class ChannelMapper:
         package_ids = self.channel_sql.fetchall()
 
         channel.num_packages = len(package_ids)
+        channel.package_ids = [package_id[0] for package_id in package_ids]
         channel.packages = self._package_generator(package_ids)
 
         channel.errata = self._erratum_generator(channel_id)
@@ -156,9 +157,7 @@ class ChannelMapper:
         return channel
 
     def _package_generator(self, package_ids):
-        for package_id in package_ids:
-            pkg = self.pkg_mapper.get_package(package_id[0])
-            yield pkg
+        return self.pkg_mapper.get_packages([package_id[0] for package_id in package_ids])
 
     def _erratum_generator(self, channel_id):
         self.errata_id_sql.execute(channel_id=channel_id)
@@ -206,11 +205,63 @@ class CachedPackageMapper:
 
         return package
 
+    def last_modified_many(self, package_ids):
+        return self.mapper.last_modified_many(package_ids)
+
+    def __get_batch_size(self):
+        return self.mapper.batch_size
+
+    batch_size = property(__get_batch_size)
+
+    def get_packages(self, package_ids):
+        """
+        Load the packages with ids package_ids, in the same order.
+
+        Packages not in the cache, or not new enough, are loaded from the
+        provided mapper in batches.
+        """
+        for chunk in chunks(package_ids, self.mapper.batch_size):
+            last_modified = self.mapper.last_modified_many(chunk)
+            packages = {}
+            missing = []
+            for package_id in chunk:
+                cache_key = "repomd-packages/" + str(package_id)
+                if package_id in last_modified and self.cache.has_key(cache_key, last_modified[package_id]):
+                    packages[package_id] = self.cache.get(cache_key)
+                else:
+                    missing.append(package_id)
+
+            for package in self.mapper.get_packages(missing):
+                if package.id in last_modified:
+                    self.cache.set("repomd-packages/" + str(package.id), package, last_modified[package.id])
+                packages[package.id] = package
+
+            for package_id in chunk:
+                if package_id in packages:
+                    yield packages[package_id]
+
 
 class SqlPackageMapper:
 
     """ Data Mapper for Packages to the RHN db. """
 
+    # Number of packages loaded at once by get_packages
+    batch_size = 500
+
+    # Dependency type, table
+    prco_tables = [
+        ('provides', 'rhnPackageProvides'),
+        ('requires', 'rhnPackageRequires'),
+        ('recommends', 'rhnPackageRecommends'),
+        ('supplements', 'rhnPackageSupplements'),
+        ('enhances', 'rhnPackageEnhances'),
+        ('suggests', 'rhnPackageSuggests'),
+        ('conflicts', 'rhnPackageConflicts'),
+        ('obsoletes', 'rhnPackageObsoletes'),
+        ('breaks', 'rhnPackageBreaks'),
+        ('predepends', 'rhnPackagePredepends'),
+    ]
+
     def __init__(self):
         self.details_sql = rhnSQL.prepare("""
         select
@@ -405,11 +456,117 @@ class SqlPackageMapper:
         where package_id = :package_id
         """)
 
+        # Queries loading a batch of packages at once. The package ids go in
+        # the "wanted" VALUES list; the package id is the last column.
+        self.batch_details_query = """
+        with wanted (package_id) as (values %s)
+        select
+            pn.name,
+            pevr.version,
+            pevr.release,
+            pevr.epoch,
+            pa.label arch,
+            c.checksum checksum,
+            p.summary,
+            p.description,
+            p.vendor,
+            p.build_time,
+            p.package_size,
+            p.payload_size,
+            p.installed_size,
+            p.header_start,
+            p.header_end,
+            pg.name package_group,
+            p.build_host,
+            p.copyright,
+            p.path,
+            sr.name source_rpm,
+            p.last_modified,
+            c.checksum_type,
+            p.id
+        from
+            wanted,
+            rhnPackage p,
+            rhnPackageName pn,
+            rhnPackageEVR pevr,
+            rhnPackageArch pa,
+            rhnPackageGroup pg,
+            rhnSourceRPM sr,
+            rhnChecksumView c
+        where
+            p.id = wanted.package_id
+        and p.name_id = pn.id
+        and p.evr_id = pevr.id
+        and p.package_arch_id = pa.id
+        and p.package_group = pg.id
+        and p.source_rpm_id = sr.id
+        and p.checksum_id = c.id
+        """
+
+        self.batch_prco_query = "with wanted (package_id) as (values %s)" + " union all ".join(["""
+        select
+           '%s',
+           dep.sense,
+           pc.name,
+           pc.version,
+           dep.package_id
+        from
+           wanted,
+           rhnPackageCapability pc,
+           %s dep
+        where
+           dep.package_id = wanted.package_id
+           and dep.capability_id = pc.id
+        """ % prco_table for prco_table in self.prco_tables])
+
+        self.batch_filelist_query = """
+        with wanted (package_id) as (values %s)
+        select
+            pc.name,
+            pf.package_id
+        from
+            wanted,
+            rhnPackageCapability pc,
+            rhnPackageFile pf
+        where
+            pf.package_id = wanted.package_id
+        and pf.capability_id = pc.id
+        """
+
+        self.batch_other_query = """
+        with wanted (package_id) as (values %s)
+        select
+            cl.name,
+            cl.text,
+            cl.time,
+            cl.package_id
+        from
+            wanted,
+            rhnPackageChangelog cl
+        where cl.package_id = wanted.package_id
+        """
+
+        self.batch_last_modified_query = """
+        with wanted (package_id) as (values %s)
+        select
+            p.id,
+            to_char(p.last_modified, 'YYYYMMDDHH24MISS') as last_modified
+        from
+            wanted,
+            rhnPackage p
+        where p.id = wanted.package_id
+        """
+
     def last_modified(self, package_id):
         """ Get the last_modified date on the package with id package_id. """
         self.last_modified_sql.execute(package_id=package_id)
         return self.last_modified_sql.fetchone()[0]
 
+    def last_modified_many(self, package_ids):
+        """ Get the last_modified dates of the packages with ids package_ids, keyed on package id. """
+        ids = dict([(int(package_id), package_id) for package_id in package_ids])
+        return dict([(ids[int(row[0])], row[1]) for row in self._batch_query(self.batch_last_modified_query, ids)])
+
     def get_package(self, package_id):
         """ Get the package with id package_id from the RHN db. """
         package = domain.Package(package_id)
@@ -419,6 +576,44 @@ class SqlPackageMapper:
         self._fill_package_other(package)
         return package
 
+    def get_packages(self, package_ids):
+        """
+        Get the packages with ids package_ids from the RHN db, in the same
+        order.
+
+        The packages are loaded in batches of batch_size, with one query per
+        kind of data for the whole batch. Packages missing from the db are
+        skipped.
+        """
+        for chunk in chunks(package_ids, self.batch_size):
+            packages = {}
+            for package_id in chunk:
+                packages[int(package_id)] = domain.Package(package_id)
+
+            found = set()
+            for row in self._batch_query(self.batch_details_query, packages):
+                package_id = int(row[22])
+                self._set_package_details(packages[package_id], row)
+                found.add(package_id)
+            for row in self._batch_query(self.batch_prco_query, packages):
+                self._add_package_dep(packages[int(row[4])], row)
+            for row in self._batch_query(self.batch_filelist_query, packages):
+                packages[int(row[1])].files.append(string_to_unicode(row[0]))
+            for row in self._batch_query(self.batch_other_query, packages):
+                self._add_package_changelog(packages[int(row[3])], row)
+
+            for package_id in chunk:
+                if int(package_id) in found:
+                    yield packages[int(package_id)]
+
+    @staticmethod
+    def _batch_query(query, package_ids):
+        if not package_ids:
+            return []
+        h = rhnSQL.prepare(query)
+        return h.execute_values(query, [(package_id,) for package_id in package_ids],
+                                template="(%s::numeric)") or []
+
     def _get_package_filename(self, pkg):
         if pkg[18]:
             path = pkg[18]
@@ -434,8 +629,9 @@ class SqlPackageMapper:
     def _fill_package_details(self, package):
         """ Load the packages basic details (summary, description, etc). """
         self.details_sql.execute(package_id=package.id)
-        pkg = self.details_sql.fetchone()
+        self._set_package_details(package, self.details_sql.fetchone())
 
+    def _set_package_details(self, package, pkg):
         package.name = pkg[0]
         package.version = pkg[1]
         package.release = pkg[2]
@@ -468,49 +664,53 @@ class SqlPackageMapper:
         deps = self.prco_sql.fetchall() or []
 
         for item in deps:
-            version = item[3] or ""
-            relation = ""
-            release = None
-            epoch = 0
-            if version:
-                sense = item[1] or 0
-                relation = SqlPackageMapper.__get_relation(sense)
-
-                vertup = version.split('-')
-                if len(vertup) > 1:
-                    version = vertup[0]
-                    release = vertup[1]
-
-                vertup = version.split(':')
-                if len(vertup) > 1:
-                    epoch = vertup[0]
-                    version = vertup[1]
-
-            dep = {'name': string_to_unicode(item[2]), 'flag': relation,
-                   'version': version, 'release': release, 'epoch': epoch}
-
-            if item[0] == "provides":
-                package.provides.append(dep)
-            elif item[0] == "requires":
-                package.requires.append(dep)
-            elif item[0] == "conflicts":
-                package.conflicts.append(dep)
-            elif item[0] == "obsoletes":
-                package.obsoletes.append(dep)
-            elif item[0] == "recommends":
-                package.recommends.append(dep)
-            elif item[0] == "supplements":
-                package.supplements.append(dep)
-            elif item[0] == "enhances":
-                package.enhances.append(dep)
-            elif item[0] == "suggests":
-                package.suggests.append(dep)
-            elif item[0] == "breaks":
-                package.breaks.append(dep)
-            elif item[0] == "predepends":
-                package.predepends.append(dep)
-            else:
-                assert False, "Unknown PRCO type: %s" % item[0]
+            self._add_package_dep(package, item)
+
+    def _add_package_dep(self, package, item):
+        """ Add the (type, sense, name, version) dependency item to the package. """
+        version = item[3] or ""
+        relation = ""
+        release = None
+        epoch = 0
+        if version:
+            sense = item[1] or 0
+            relation = SqlPackageMapper.__get_relation(sense)
+
+            vertup = version.split('-')
+            if len(vertup) > 1:
+                version = vertup[0]
+                release = vertup[1]
+
+            vertup = version.split(':')
+            if len(vertup) > 1:
+                epoch = vertup[0]
+                version = vertup[1]
+
+        dep = {'name': string_to_unicode(item[2]), 'flag': relation,
+               'version': version, 'release': release, 'epoch': epoch}
+
+        if item[0] == "provides":
+            package.provides.append(dep)
+        elif item[0] == "requires":
+            package.requires.append(dep)
+        elif item[0] == "conflicts":
+            package.conflicts.append(dep)
+        elif item[0] == "obsoletes":
+            package.obsoletes.append(dep)
+        elif item[0] == "recommends":
+            package.recommends.append(dep)
+        elif item[0] == "supplements":
+            package.supplements.append(dep)
+        elif item[0] == "enhances":
+            package.enhances.append(dep)
+        elif item[0] == "suggests":
+            package.suggests.append(dep)
+        elif item[0] == "breaks":
+            package.breaks.append(dep)
+        elif item[0] == "predepends":
+            package.predepends.append(dep)
+        else:
+            assert False, "Unknown PRCO type: %s" % item[0]
 
 #    @staticmethod
     def __get_relation(sense):
@@ -551,12 +751,16 @@ class SqlPackageMapper:
         log_data = self.other_sql.fetchall() or []
 
         for data in log_data:
+            self._add_package_changelog(package, data)
 
-            date = oratimestamp_to_sinceepoch(data[2])
+    @staticmethod
+    def _add_package_changelog(package, data):
+        """ Add the (name, text, time) changelog entry to the package. """
+        date = oratimestamp_to_sinceepoch(data[2])
 
-            chglog = {'author': string_to_unicode(data[0]), 'date': date,
-                      'text': string_to_unicode(data[1])}
-            package.changelog.append(chglog)
+        chglog = {'author': string_to_unicode(data[0]), 'date': date,
+                  'text': string_to_unicode(data[1])}
+        package.changelog.append(chglog)
 
 
 class CachedErratumMapper:
@@ -588,9 +792,7 @@ class CachedErratumMapper:
         cache_key = "repomd-errata/" + erratum_id
         if self.cache.has_key(cache_key, last_modified):
             erratum = self.cache.get(cache_key)
-            for package_id in erratum.package_ids:
-                package = self.package_mapper.get_package(package_id)
-                erratum.packages.append(package)
+            erratum.packages.extend(self.package_mapper.get_packages(erratum.package_ids))
         else:
             erratum = self.mapper.get_erratum(erratum_id)
 
@@ -720,10 +922,9 @@ class SqlErratumMapper:
         self.erratum_packages_sql.execute(erratum_id=erratum.id)
         pkgs = self.erratum_packages_sql.fetchall()
 
-        for pkg in pkgs:
-            package = self.package_mapper.get_package(pkg[0])
+        for package in self.package_mapper.get_packages([pkg[0] for pkg in pkgs]):
             erratum.packages.append(package)
-            erratum.package_ids.append(pkg[0])
+            erratum.package_ids.append(package.id)
 
 
 class SqlRepoMDMapper:
@@ -771,6 +972,12 @@ def get_erratum_mapper(package_mapper):
     return erratum_mapper
 
 
+def chunks(items, size):
+    """ Split the items list in lists of at most size items. """
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
 def oratimestamp_to_sinceepoch(ts):
     return time.mktime((ts.year, ts.month, ts.day, ts.hour, ts.minute,
                         ts.second, 0, 0, -1))
@@ -25,6 +25,8 @@ except ImportError:
     import io as StringIO
 import shutil
 import os.path
+import threading
+from collections import OrderedDict
 
 from gzip import GzipFile
 from gzip import write32u
@@ -43,6 +45,9 @@ from spacewalk.server import rhnChannel
 # One meg
 CHUNK_SIZE = 1048576
 
+# Memory used at most by the cached package fragments
+FRAGMENT_CACHE_SIZE = 128 * CHUNK_SIZE
+
 comps_mapping = {
     'rhel-x86_64-client-5': 'rhn/kickstart/ks-rhel-x86_64-client-5/Client/repodata/comps-rhel5-client-core.xml',
     'rhel-x86_64-client-vt-5': 'rhn/kickstart/ks-rhel-x86_64-client-5/VT/repodata/comps-rhel5-vt.xml',
@@ -57,6 +62,62 @@ for k in list(comps_mapping.keys()):
         comps_mapping[k.replace('x86_64', arch)] = comps_mapping[k].replace('x86_64', arch)
 
 
+class FragmentCache:
+
+    """
+    Size-bounded LRU cache of the rendered primary/filelists/other XML of
+    packages.
+
+    A package has the same metadata in all the channels it is in, so the
+    fragments rendered for a channel are reused for its clones and for the
+    other channels sharing the package. The key includes the package's
+    last_modified date, so changed packages are rendered again.
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._fragments = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, fragment_type, package_id, last_modified):
+        key = (fragment_type, package_id, last_modified)
+        with self._lock:
+            fragment = self._fragments.get(key)
+            if fragment is None:
+                self.misses += 1
+                return None
+            self._fragments.move_to_end(key)
+            self.hits += 1
+            return fragment
+
+    def set(self, fragment_type, package_id, last_modified, fragment):
+        if len(fragment) > self.max_size:
+            return
+        key = (fragment_type, package_id, last_modified)
+        with self._lock:
+            old = self._fragments.pop(key, None)
+            if old is not None:
+                self.size -= len(old)
+            self._fragments[key] = fragment
+            self.size += len(fragment)
+            while self.size > self.max_size:
+                _key, evicted = self._fragments.popitem(last=False)
+                self.size -= len(evicted)
+                self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            return {'fragments': len(self._fragments), 'size': self.size, 'hits': self.hits,
+                    'misses': self.misses, 'evictions': self.evictions}
+
+
+fragment_cache = FragmentCache(FRAGMENT_CACHE_SIZE)
+
+
 class Repository(object):
 
     """
@@ -190,9 +251,41 @@ class Repository(object):
         for view in views:
             view.write_start()
 
-        for package in self.channel.packages:
-            for view in views:
-                view.write_package(package)
+        # Write the cached fragments of the packages and load from the db
+        # only the packages with fragments not in the cache
+        package_mapper = mapper.get_package_mapper()
+        for chunk in mapper.chunks(self.channel.package_ids, package_mapper.batch_size):
+            last_modified = package_mapper.last_modified_many(chunk)
+            fragments = {}
+            missing = []
+            for package_id in chunk:
+                if package_id not in last_modified:
+                    # Removed in the meantime
+                    continue
+                fragments[package_id] = [fragment_cache.get(view.fragment_type, package_id,
+                                                            last_modified[package_id])
+                                          for view in views]
+                if None in fragments[package_id]:
+                    missing.append(package_id)
+
+            packages = {}
+            if missing:
+                for package in package_mapper.get_packages(missing):
+                    packages[package.id] = package
+
+            for package_id in chunk:
+                if package_id not in fragments:
+                    continue
+                if package_id in missing and package_id not in packages:
+                    continue
+                for view, fragment in zip(views, fragments[package_id]):
+                    if fragment is None:
+                        fragment = view.render_package(packages[package_id])
+                        fragment_cache.set(view.fragment_type, package_id,
+                                           last_modified[package_id], fragment)
+                    view.write_fragment(fragment)
+
+        log_debug(3, "Package fragment cache", fragment_cache.stats())
 
         for view in views:
             view.write_end()
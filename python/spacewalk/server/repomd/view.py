@@ -89,6 +89,9 @@ class RepoView:
 
 class PrimaryView(object):
 
+    # Name of the package fragments this view renders
+    fragment_type = "primary"
+
     def __init__(self, channel, fileobj):
         self.channel = channel
         self.fileobj = fileobj
@@ -202,8 +205,14 @@ class PrimaryView(object):
 
         self.fileobj.write(output)
 
+    def render_package(self, package):
+        return '\n'.join(self._get_package(package))
+
+    def write_fragment(self, fragment):
+        self.fileobj.write(fragment)
+
     def write_package(self, package):
-        self.fileobj.write('\n'.join(self._get_package(package)))
+        self.write_fragment(self.render_package(package))
 
     def write_end(self):
         self.fileobj.write("</metadata>")
@@ -211,6 +220,9 @@ class PrimaryView(object):
 
 class FilelistsView(object):
 
+    # Name of the package fragments this view renders
+    fragment_type = "filelists"
+
     def __init__(self, channel, fileobj):
         self.channel = channel
         self.fileobj = fileobj
@@ -234,8 +246,14 @@ class FilelistsView(object):
 
         self.fileobj.write(output)
 
+    def render_package(self, package):
+        return '\n'.join(self._get_package(package))
+
+    def write_fragment(self, fragment):
+        self.fileobj.write(fragment)
+
     def write_package(self, package):
-        self.fileobj.write('\n'.join(self._get_package(package)))
+        self.write_fragment(self.render_package(package))
 
     def write_end(self):
         self.fileobj.write("</filelists>")
@@ -243,6 +261,9 @@ class FilelistsView(object):
 
 class OtherView(object):
 
+    # Name of the package fragments this view renders
+    fragment_type = "other"
+
     def __init__(self, channel, fileobj):
         self.channel = channel
         self.fileobj = fileobj
@@ -270,8 +291,14 @@ class OtherView(object):
 
         self.fileobj.write(output)
 
+    def render_package(self, package):
+        return '\n'.join(self._get_package(package))
+
+    def write_fragment(self, fragment):
+        self.fileobj.write(fragment)
+
     def write_package(self, package):
-        self.fileobj.write('\n'.join(self._get_package(package)))
+        self.write_fragment(self.render_package(package))
 
     def write_end(self):
         self.fileobj.write("</otherdata>")
@@ -14,16 +14,22 @@
 #
 #
 
+import hashlib
 import re
 import sys
+import time
 
 # common module
-from spacewalk.common import rhnFlags
+from spacewalk.common import rhnCache, rhnFlags
 from spacewalk.common.rhnLog import log_debug
 
 # local module
 from . import rhnSQL
 
+# The stored capabilities are checked against the database at least once per
+# this many seconds, even if the client keeps sending the same ones
+CAPABILITIES_CACHE_TTL = 3600
+
 # Globally store the parsed capabilities in rhnFlags
 
 
@@ -58,12 +64,27 @@ def get_client_capabilities():
     return rhnFlags.get('client-capabilities')
 
 
+def _capabilities_digest(caps):
+    names = sorted(caps.keys())
+    data = "\n".join("%s(%s)" % (name, caps[name]['version']) for name in names)
+    return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+
 def update_client_capabilities(server_id):
     caps = get_client_capabilities()
 
     if caps is None:
         caps = {}
 
+    # Clients send the same capabilities on every check-in, don't compare
+    # them with the database again if they did not change
+    cache_key = "client-capabilities/%s" % server_id
+    cache_period = int(time.time()) // CAPABILITIES_CACHE_TTL * CAPABILITIES_CACHE_TTL
+    digest = _capabilities_digest(caps)
+    if rhnCache.get(cache_key, modified=cache_period) == digest:
+        log_debug(4, "Client capabilities unchanged", server_id)
+        return
+
     caps = caps.copy()
 
     h = rhnSQL.prepare("""
@@ -142,6 +163,8 @@ def update_client_capabilities(server_id):
     # work
     rhnSQL.commit()
 
+    rhnCache.set(cache_key, digest, modified=cache_period)
+
 
 def set_server_capabilities():
     try:
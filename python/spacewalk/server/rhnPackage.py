@@ -260,6 +260,83 @@ def get_info_for_package(pkg, channel_id, org_id):
     return ret
 
 
+def nevra_key(pkg):
+    """Returns the key used by get_info_for_packages for a [name, version, release, epoch, arch] list"""
+    name, version, release, epoch, arch = [None if i is None else str(i) for i in pkg]
+    # yum repo has epoch="0" not only when epoch is "0" but also if it's NULL
+    if epoch in ('0', '', None):
+        epoch = None
+    return (name, version, release, epoch, arch)
+
+
+def get_info_for_packages(pkgs, channel_id, org_id, page_size=1000):
+    """
+    Set-based variant of get_info_for_package.
+
+    Looks up all the [name, version, release, epoch, arch] lists in pkgs with
+    as few queries as possible and returns a dictionary mapping nevra_key(pkg)
+    to the list of rows get_info_for_package would have returned for it.
+    Packages not found in the database are not present in the dictionary.
+    """
+    log_debug(3, len(pkgs), channel_id, org_id)
+    wanted = sorted(set(nevra_key(pkg) for pkg in pkgs),
+                    key=lambda k: tuple('' if i is None else i for i in k))
+    if not wanted:
+        return {}
+
+    if org_id:
+        orgStatement = "p.org_id = %d" % int(org_id)
+    else:
+        orgStatement = "p.org_id is null"
+
+    statement = """
+    with wanted (ordering, name, version, release, epoch, arch) as (
+      values %%s
+    )
+    select wanted.ordering, p.path, cp.channel_id,
+           cv.checksum_type, cv.checksum, p.org_id, pe.epoch
+      from wanted
+      join rhnPackageName pn
+        on pn.name = wanted.name
+      join rhnPackageArch pa
+        on pa.label = wanted.arch
+      join rhnPackageEVR pe
+        on pe.version = wanted.version
+       and pe.release = wanted.release
+       and (pe.epoch = wanted.epoch
+            or (wanted.epoch is null and (pe.epoch is null or pe.epoch = '0')))
+      join rhnPackage p
+        on p.name_id = pn.id
+       and p.evr_id = pe.id
+       and p.package_arch_id = pa.id
+      left join rhnChannelPackage cp
+        on p.id = cp.package_id
+       and cp.channel_id = %d
+      join rhnChecksumView cv
+        on p.checksum_id = cv.id
+     where %s
+     order by wanted.ordering,
+              cp.channel_id nulls last,
+              p.id desc
+    """ % (int(channel_id), orgStatement)
+
+    h = rhnSQL.prepare(statement)
+    rows = h.execute_values(statement, [(i,) + key for i, key in enumerate(wanted)],
+                            page_size=page_size) or []
+
+    ret = {}
+    for ordering, path, channel, checksum_type, checksum, pkg_org_id, epoch in rows:
+        ret.setdefault(wanted[ordering], []).append({
+            'path': path,
+            'channel_id': channel,
+            'checksum_type': checksum_type,
+            'checksum': checksum,
+            'org_id': '' if pkg_org_id is None else str(pkg_org_id),
+            'epoch': epoch,
+        })
+    return ret
+
+
 def _none2emptyString(foo):
     if foo is None:
         return ""
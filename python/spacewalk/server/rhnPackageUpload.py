@@ -32,6 +32,10 @@ from spacewalk.server.rhnLib import get_package_path, \
     get_package_path_without_package_name
 from spacewalk.server.rhnServer import server_packages
 
+# Checksum types a client may verify an upload with, besides the checksum
+# type of the package itself
+UPLOAD_CHECKSUM_TYPES = ('sha256', 'sha384', 'sha512')
+
 
 def authenticate(username, password, channels=[], null_org=None, force=None):
     log_debug(4, username, force)
@@ -274,20 +278,27 @@ def save_uploaded_package(stream, nevra, org_id, packaging,
     a_pkg = rhn_pkg.package_from_stream(stream, packaging=packaging)
     a_pkg.read_header()
 
+    if checksum_type and checksum and checksum_type != a_pkg.checksum_type \
+            and checksum_type not in UPLOAD_CHECKSUM_TYPES:
+        log_debug(1, "Unsupported checksum type %s" % checksum_type)
+        raise rhnFault(104, "Mismatching information")
+
     temp_dir = os.path.join(CFG.MOUNT_POINT, CFG.PREPENDED_DIR, org_id, 'stage')
     if not os.path.isdir(temp_dir):
         os.makedirs(temp_dir)
     temp_stream = tempfile.NamedTemporaryFile(dir=temp_dir,
                                               prefix='-'.join((nevra[0], nevra[2], nevra[3], nevra[4])))
+    if checksum_type and checksum and checksum_type != a_pkg.checksum_type:
+        # the checksum to verify is computed while the package is stored
+        a_pkg.extra_checksum_types = (checksum_type, )
     a_pkg.save_payload(temp_stream)
 
     if checksum_type and checksum:
         # verify checksum
-        if not (checksum_type == a_pkg.checksum_type
-                and checksum == a_pkg.checksum):
+        if checksum != a_pkg.checksums.get(checksum_type):
             log_debug(1, "Mismatching checksums: expected %s:%s got %s:%s" %
                       (checksum_type, checksum,
-                       a_pkg.checksum_type, a_pkg.checksum))
+                       checksum_type, a_pkg.checksums.get(checksum_type)))
             raise rhnFault(104, "Mismatching information")
 
     temp_stream.file.close()
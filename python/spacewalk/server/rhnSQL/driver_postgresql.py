@@ -17,9 +17,11 @@
 # Database driver for PostgreSQL
 #
 
+import io
 import sys
 import string
 import re
+import functools
 import psycopg2
 import psycopg2.extras
 
@@ -33,6 +35,7 @@ from rhn.UserDictCase import UserDictCase
 from spacewalk.server import rhnSQL
 
 from uyuni.common.usix import BufferType, raise_with_tb
+from spacewalk.common import rhnLog
 from spacewalk.common.rhnLog import log_debug, log_error
 from spacewalk.common.rhnException import rhnException
 from .const import POSTGRESQL
@@ -47,14 +50,70 @@ def convert_named_query_params(query):
     existing queries intact we'll convert them when provided to the
     postgresql driver.
 
+    The same statements are prepared over and over again, so the rewritten
+    queries are kept in a bounded LRU cache.
+
     RETURNS: the new query with parameters replaced
     """
+    return _convert_named_query_params(query)
+
+
+@functools.lru_cache(maxsize=1024)
+def _convert_named_query_params(query):
     log_debug(6, "Converting query for PostgreSQL: %s" % query)
     new_query = re.sub(r'(\W):(\w+)', r'\1%(\2)s', query.replace('%', '%%'))
     log_debug(6, "New query: %s" % new_query)
     return new_query
 
 
+_INSERT_VALUES_RE = re.compile(r'^(\s*insert\s+into\s+[\w.]+\s*\([^)]*\)\s*values)\s*(\(.*\))\s*$',
+                               re.IGNORECASE | re.DOTALL)
+
+
+@functools.lru_cache(maxsize=256)
+def convert_to_positional_params(query):
+    """
+    Convert a query with %(name)s parameters into one using positional %s
+    parameters, so rows can be passed as tuples instead of dicts.
+
+    RETURNS: (new query, list of the parameter names in order)
+    """
+    names = []
+
+    def _replace(match):
+        if match.group(1):
+            return match.group(1)
+        names.append(match.group(2))
+        return '%s'
+    new_query = re.sub(r'(%%)|%\((\w+)\)s', _replace, query)
+    return new_query, names
+
+
+@functools.lru_cache(maxsize=256)
+def split_insert_values(query):
+    """
+    Split a single row "INSERT INTO t (...) VALUES (...)" statement into the
+    statement with a %s placeholder for execute_values and the row template.
+
+    RETURNS: (statement, template) or None if the query is not a plain insert
+    """
+    m = _INSERT_VALUES_RE.match(query)
+    if not m:
+        return None
+    return m.group(1) + ' %s', m.group(2)
+
+
+def _copy_value(value):
+    if value is None:
+        return '\\N'
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        value = '\\x' + bytes(value).hex()
+    else:
+        value = str(value)
+    return (value.replace('\\', '\\\\').replace('\t', '\\t')
+            .replace('\n', '\\n').replace('\r', '\\r'))
+
+
 class Function(sql_base.Procedure):
 
     """
@@ -282,10 +341,12 @@ class Cursor(sql_base.Cursor):
         return cursor
 
     def _execute_wrapper(self, function, *p, **kw):
-        params = ','.join(["%s: %s" % (key, value) for key, value
-                           in list(kw.items())])
-        log_debug(5, "Executing SQL: \"%s\" with bind params: {%s}"
-                  % (self.sql, params))
+        # Formatting all the bind params is expensive, do it only when logged
+        if rhnLog.LOG and rhnLog.LOG.level >= 5:
+            params = ','.join(["%s: %s" % (key, value) for key, value
+                               in list(kw.items())])
+            log_debug(5, "Executing SQL: \"%s\" with bind params: {%s}"
+                      % (self.sql, params))
         if self.sql is None:
             raise rhnException("Cannot execute empty cursor")
         if self.blob_map:
@@ -332,28 +393,47 @@ class Cursor(sql_base.Cursor):
             return 0
 
         params = UserDictCase(kwargs)
+        lengths = set(len(v) for v in params.values())
+        if len(lengths) > 1:
+            raise sql_base.SQLError("Unable to bound the following variable(s): %s: lists of different lengths"
+                                    % " ".join(params.keys()))
+        count = lengths.pop()
+        if not count:
+            return 0
 
-        # First break all the incoming keyword arg lists into individual
-        # hashes:
-        all_kwargs = []
-        for key in list(params.keys()):
-            if len(all_kwargs) < len(params[key]):
-                for i in range(len(params[key])):
-                    all_kwargs.append({})
-
-            i = 0
-            for val in params[key]:
-                all_kwargs[i][key] = val
-                i = i + 1
-
-        psycopg2.extras.execute_batch(self._real_cursor, self.sql, all_kwargs)
+        # Send the rows as tuples of positional parameters instead of
+        # building one hash per row
+        sql, names = convert_to_positional_params(self.sql)
+        if names:
+            rows = list(zip(*[params[name] for name in names]))
+        else:
+            rows = [()] * count
+
+        insert = split_insert_values(sql)
+        if insert:
+            # Plain inserts go to the server as multi-row statements
+            statement, template = insert
+            psycopg2.extras.execute_values(self._real_cursor, statement, rows, template=template,
+                                           page_size=1000)
+        else:
+            psycopg2.extras.execute_batch(self._real_cursor, sql, rows)
         self.description = self._real_cursor.description
+        return len(rows)
 
     def _execute_values(self, sql, argslist, template=None, page_size=1000, fetch=True):
         results = psycopg2.extras.execute_values(self._real_cursor, sql, argslist, template=template, page_size=page_size, fetch=fetch)
         self.description = self._real_cursor.description
         return results
 
+    def _copy_from(self, table, columns, rows):
+        data = io.StringIO()
+        for row in rows:
+            data.write('\t'.join([_copy_value(v) for v in row]))
+            data.write('\n')
+        data.seek(0)
+        self._real_cursor.copy_expert("COPY %s (%s) FROM STDIN" % (table, ', '.join(columns)), data)
+        return self._real_cursor.rowcount
+
     def update_blob(self, table_name, column_name, where_clause, data,
                     **kwargs):
         """
@@ -165,6 +165,13 @@ class Cursor:
         """
         return self._execute_wrapper(self._execute_values, sql, argslist, template, page_size, fetch)
 
+    def copy_from(self, table, columns, rows):
+        """
+        Bulk load rows, a sequence of tuples ordered like columns, into table.
+        Much faster than inserting the rows with separate statements.
+        """
+        return self._execute_wrapper(self._copy_from, table, columns, rows)
+
     def _execute_wrapper(self, function, *p, **kw):
         """
         Database specific execute wrapper. Mostly used just to catch DB
@@ -187,6 +194,9 @@ class Cursor:
     def _execute_values(self, *args, **kwargs):
         raise NotImplementedError()
 
+    def _copy_from(self, *args, **kwargs):
+        raise NotImplementedError()
+
     def _execute_(self, args, kwargs):
         """ Database specific execution of the query. """
         raise NotImplementedError()
@@ -17,9 +17,8 @@
 # profiles.
 #
 
-import sys
 import time
-from uyuni.common.usix import DictType, raise_with_tb
+from uyuni.common.usix import DictType
 from uyuni.common import rhn_rpm
 from spacewalk.common.rhnLog import log_debug
 from spacewalk.common.rhnException import rhnFault
@@ -39,6 +38,10 @@ class dbPackage:
         entry in the database for it.
     """
 
+    # profiles have thousands of packages, keep the instances small
+    __slots__ = ('n', 'v', 'r', 'e', 'a', 't', 'installtime', 'nvrea', 'real',
+                 'name_id', 'evr_id', 'package_arch_id', 'status')
+
     def __init__(self, pdict, real=0, name_id=None, evr_id=None,
                  package_arch_id=None):
         if type(pdict) != DictType:
@@ -113,20 +116,60 @@ class dbPackage:
         }
     __repr__ = __str__
 
-    _query_get_package_type_by_arch = rhnSQL.Statement("""
-        select at.label
-          from rhnArchType at
-          join rhnPackageArch pa ON pa.arch_type_id = at.id
-         where pa.id = lookup_package_arch(:arch)
-    """)
-
     def get_package_type_by_arch(self, arch):
-        h = rhnSQL.prepare(self._query_get_package_type_by_arch)
-        h.execute(arch=arch)
-        row = h.fetchone_dict()
-        if not row:
+        arch = get_package_arches().get(arch)
+        if not arch:
             return None
-        return row['label']
+        return arch[1]
+
+
+_query_get_package_arches = rhnSQL.Statement("""
+    select pa.label, pa.id, at.label type
+      from rhnPackageArch pa
+      join rhnArchType at ON pa.arch_type_id = at.id
+""")
+
+# {label: (id, type)} of the package arches, they never change at runtime
+_package_arches = None
+
+
+def get_package_arches():
+    """ Returns {label: (id, type)} of all package arches """
+    global _package_arches
+    if _package_arches is None:
+        h = rhnSQL.prepare(_query_get_package_arches)
+        h.execute()
+        _package_arches = dict((row['label'], (row['id'], row['type']))
+                               for row in h.fetchall_dict() or [])
+    return _package_arches
+
+
+def _lookup_package_name_ids(names):
+    """ Returns {name: id} of names, unknown names are created """
+    if not names:
+        return {}
+    statement = """
+        select name, lookup_package_name(name)
+          from (values %s) as wanted (name)
+    """
+    h = rhnSQL.prepare(statement)
+    rows = h.execute_values(statement, [(name,) for name in names],
+                            template="(%s::varchar)") or []
+    return dict(rows)
+
+
+def _lookup_evr_ids(evrs):
+    """ Returns {(epoch, version, release, type): id} of evrs, unknown ones are created """
+    if not evrs:
+        return {}
+    statement = """
+        select epoch, version, release, type, lookup_evr(epoch, version, release, type)
+          from (values %s) as wanted (epoch, version, release, type)
+    """
+    h = rhnSQL.prepare(statement)
+    rows = h.execute_values(statement, list(evrs),
+                            template="(%s::varchar, %s::varchar, %s::varchar, %s::varchar)") or []
+    return dict((tuple(row[:4]), row[4]) for row in rows)
 
 
 
@@ -230,39 +273,37 @@ class Packages:
         alist = [a for a in list(self.__p.values()) if a.status in (ADDED, UPDATED)]
         if alist:
             log_debug(4, sysid, len(alist), "added packages")
+            # Resolve the ids of all names, evrs and arches up front instead
+            # of calling the lookup functions for every row of the insert
+            package_arches = get_package_arches()
+            for a in alist:
+                if a.a not in package_arches:
+                    log_debug(2, "Unknown package arch found", a.a)
+                    raise rhnFault(45, "Unknown package arch found")
+
+            # some fields are not allowed to contain empty string (varchar)
+            def evr(a):
+                return (a.e or None, a.v, a.r, a.t)
+            name_ids = _lookup_package_name_ids(sorted(set(a.n for a in alist)))
+            evr_ids = _lookup_evr_ids(sorted(set(evr(a) for a in alist),
+                                             key=lambda k: tuple('' if i is None else i for i in k)))
+
             h = rhnSQL.prepare("""
             insert into rhnServerPackage
             (server_id, name_id, evr_id, package_arch_id, installtime)
-            values (:sysid, LOOKUP_PACKAGE_NAME(:n), LOOKUP_EVR(:e, :v, :r, :t),
-                LOOKUP_PACKAGE_ARCH(:a), TO_TIMESTAMP(:instime, 'YYYY-MM-DD HH24:MI:SS')
+            values (:sysid, :name_id, :evr_id, :package_arch_id,
+                TO_TIMESTAMP(:instime, 'YYYY-MM-DD HH24:MI:SS')
             )
             """)
-            # some fields are not allowed to contain empty string (varchar)
-
-            def lambdaae(a):
-                if a.e == '':
-                    return None
-                else:
-                    return a.e
             package_data = {
                 'sysid': [sysid] * len(alist),
-                'n': [a.n for a in alist],
-                'v': [a.v for a in alist],
-                'r': [a.r for a in alist],
-                'e': list(map(lambdaae, alist)),
-                'a': [a.a for a in alist],
-                't': [a.t for a in alist],
+                'name_id': [name_ids[a.n] for a in alist],
+                'evr_id': [evr_ids[evr(a)] for a in alist],
+                'package_arch_id': [package_arches[a.a][0] for a in alist],
                 'instime': [self.__expand_installtime(a.installtime) for a in alist],
             }
-            try:
-                h.executemany(**package_data)
-                rhnSQL.commit()
-            except rhnSQL.SQLSchemaError:
-                e = sys.exc_info()[1]
-                # LOOKUP_PACKAGE_ARCH failed
-                if e.errno == 20243:
-                    log_debug(2, "Unknown package arch found", e)
-                    raise_with_tb(rhnFault(45, "Unknown package arch found"), sys.exc_info()[2])
+            h.executemany(**package_data)
+            rhnSQL.commit()
 
             commits = commits + len(alist)
             del alist
@@ -281,28 +322,14 @@ class Packages:
         self.__changed = 0
         return 0
 
-    _query_get_package_arches = rhnSQL.Statement("""
-        select id, label
-          from rhnPackageArch
-    """)
-
-    def get_package_arches(self):
-        # None gets automatically converted to empty string
-        package_arches_hash = {None: ''}
-        h = rhnSQL.prepare(self._query_get_package_arches)
-        h.execute()
-        while 1:
-            row = h.fetchone_dict()
-            if not row:
-                break
-            package_arches_hash[row['id']] = row['label']
-        return package_arches_hash
-
     def reload_packages_byid(self, sysid):
         """ reload the packages list from the database """
         log_debug(3, sysid)
         # First, get the package arches
-        package_arches_hash = self.get_package_arches()
+        # None gets automatically converted to empty string
+        package_arches_hash = {None: ''}
+        for label, (package_arch_id, _type) in get_package_arches().items():
+            package_arches_hash[package_arch_id] = label
         # XXX we could achieve the same thing with an outer join but that's
         # more expensive
         # Now load packages
@@ -523,35 +550,28 @@ def package_delta(list1, list2):
         (install, remove)
         XXX upgrades and downgrades are simulated by a removal and an install
     """
+    list1 = [tuple(e) for e in list1]
+    list2 = [tuple(e) for e in list2]
+    # Packages present in both lists cancel out; only the names with a
+    # difference have to go through rpm's version comparison, which still
+    # matches e.g. version 51 with version 0051
+    changed = set(e[0] for e in set(list1).symmetric_difference(list2))
+    if not changed:
+        return [], []
+
     # Package registry - canonical versions for all packages
     package_registry = {}
-    hash1 = _package_list_to_hash(list1, package_registry)
-    hash2 = _package_list_to_hash(list2, package_registry)
+    hash1 = _package_list_to_hash([e for e in list1 if e[0] in changed], package_registry)
+    hash2 = _package_list_to_hash([e for e in list2 if e[0] in changed], package_registry)
     del package_registry
 
     installs = []
     removes = []
-    for pn, ph1 in list(hash1.items()):
-        if pn not in hash2:
-            removes.extend(list(ph1.keys()))
-            continue
-
-        ph2 = hash2[pn]
-        del hash2[pn]
-
-        # Now, compute the differences between ph1 and ph2
-        for p in list(ph1.keys()):
-            if p not in ph2:
-                # We have to remove it
-                removes.append(p)
-            else:
-                del ph2[p]
-        # Everything else left in ph2 has to be installed
-        installs.extend(list(ph2.keys()))
-
-    # Whatever else is left in hash2 should be installed
-    for ph2 in list(hash2.values()):
-        installs.extend(list(ph2.keys()))
+    for pn in changed:
+        ph1 = hash1.get(pn, {})
+        ph2 = hash2.get(pn, {})
+        removes.extend([p for p in ph1 if p not in ph2])
+        installs.extend([p for p in ph2 if p not in ph1])
 
     installs.sort()
     removes.sort()
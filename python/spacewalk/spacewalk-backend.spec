@@ -690,6 +690,7 @@ fi
 %{python3rhnroot}/satellite_tools/reposync.py*
 %{python3rhnroot}/satellite_tools/constants.py*
 %{python3rhnroot}/satellite_tools/download.py*
+%{python3rhnroot}/satellite_tools/file_index.py*
 %{python3rhnroot}/satellite_tools/ulnauth.py*
 %dir %{python3rhnroot}/satellite_tools/disk_dumper
 %{python3rhnroot}/satellite_tools/disk_dumper/__init__.py*
@@ -128,6 +128,28 @@ def test_execute_bulk(temp_table):
     assert rows[0][1] == "Somebody"
     assert rows[1][1] == "Else"
 
+def test_executemany_update(temp_table):
+    query = "UPDATE %s SET name = :name WHERE id = :id" % temp_table
+    cursor = rhnSQL.prepare(query)
+    cursor.executemany(id=TEST_IDS[:2], name=["Bob", "Sue"])
+
+    query = rhnSQL.prepare("SELECT name FROM %s ORDER BY id" % temp_table)
+    query.execute()
+    assert [row[0] for row in query.fetchall()] == ["Bob", "Sue", TEST_NAMES[2]]
+
+def test_copy_from(temp_table):
+    cursor = rhnSQL.prepare("SELECT 1")
+    cursor.copy_from(temp_table, ["id", "name", "num"],
+                     [(1000, "Tab\there", 1.5), (1001, "Back\\slash\nnewline", None)])
+
+    query = rhnSQL.prepare("SELECT * FROM %s WHERE id >= 1000 ORDER BY id" % temp_table)
+    query.execute()
+    rows = query.fetchall()
+    assert len(rows) == 2
+    assert rows[0][1] == "Tab\there"
+    assert rows[1][1] == "Back\\slash\nnewline"
+    assert rows[1][2] is None
+
 def test_numeric_columns(temp_table):
     h = rhnSQL.prepare("SELECT num FROM %s WHERE id = %s" % (temp_table, TEST_IDS[0]))
     h.execute()
@@ -0,0 +1,121 @@
+#!/usr/bin/python3
+#
+# Copyright (c) 2023 SUSE LLC
+#
+# This software is licensed to you under the GNU General Public License,
+# version 2 (GPLv2). There is NO WARRANTY for this software, express or
+# implied, including the implied warranties of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. You should have received a copy of GPLv2
+# along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+
+import hashlib
+import os
+
+from mock import patch
+
+from spacewalk.satellite_tools import file_index
+
+MTIME = 1672531200
+
+
+def _pool(tmp_path, count):
+    files = []
+    for i in range(count):
+        path = str(tmp_path / ("pkg%d.rpm" % i))
+        content = b"package %d" % i
+        with open(path, "wb") as f:
+            f.write(content)
+        os.utime(path, (MTIME, MTIME))
+        files.append((path, MTIME, len(content), "sha256", hashlib.sha256(content).hexdigest()))
+    return files
+
+
+def test_verify_files(tmp_path):
+    index = file_index.FileStateIndex(str(tmp_path / "index" / "file-state.db"))
+    files = _pool(tmp_path, 4)
+    os.utime(files[1][0], (MTIME + 10, MTIME + 10))
+    with open(files[2][0], "ab") as f:
+        f.write(b"corrupted")
+    os.unlink(files[3][0])
+
+    with patch("spacewalk.satellite_tools.file_index.getFileChecksum",
+               wraps=file_index.getFileChecksum) as checksum:
+        assert index.verify_files(files) == {files[0][0]: 0, files[1][0]: 0, files[2][0]: 2, files[3][0]: 1}
+        assert checksum.call_count == 2
+        # the mtime of the good file has been fixed
+        assert os.stat(files[1][0]).st_mtime == MTIME
+
+        # the corrupted file is known and not hashed again
+        checksum.reset_mock()
+        assert index.verify_files(files[:3]) == {files[0][0]: 0, files[1][0]: 0, files[2][0]: 2}
+        checksum.assert_not_called()
+
+
+def test_get_checksums_rehashes_changed_files(tmp_path):
+    index = file_index.FileStateIndex(str(tmp_path / "file-state.db"))
+    path = _pool(tmp_path, 1)[0][0]
+    assert index.get_checksum(path, "sha256") == hashlib.sha256(b"package 0").hexdigest()
+
+    with open(path, "wb") as f:
+        f.write(b"package 1")
+    os.utime(path, (MTIME + 1, MTIME + 1))
+    # a new index instance reads the persisted state
+    index = file_index.FileStateIndex(str(tmp_path / "file-state.db"))
+    assert index.get_checksum(path, "sha256") == hashlib.sha256(b"package 1").hexdigest()
+    assert index.get_checksum(path, "md5") == hashlib.md5(b"package 1").hexdigest()
+    assert index.get_checksum(str(tmp_path / "missing.rpm"), "sha256") is None
+
+
+def test_unusable_index(tmp_path):
+    (tmp_path / "file").write_text("")
+    index = file_index.FileStateIndex(str(tmp_path / "file" / "file-state.db"))
+    files = _pool(tmp_path, 1)
+    os.utime(files[0][0], (MTIME + 1, MTIME + 1))
+    assert index.verify_files(files) == {files[0][0]: 0}
+
+
+def test_get_checksums_of_unchanged_files(tmp_path):
+    """Unchanged files are hashed once, unless a refresh is requested to detect silent corruption"""
+    files = [(f[0], f[3]) for f in _pool(tmp_path, 4)]
+    index = file_index.FileStateIndex(str(tmp_path / "file-state.db"))
+
+    with patch("spacewalk.satellite_tools.file_index.getFileChecksum",
+               wraps=file_index.getFileChecksum) as checksum:
+        checksums = index.get_checksums(files)
+        assert checksum.call_count == 4
+        checksum.reset_mock()
+        assert index.get_checksums(files) == checksums
+        checksum.assert_not_called()
+
+    # flip a byte without changing the size or the mtime of the file
+    path = files[0][0]
+    with open(path, "r+b") as f:
+        f.write(b"P")
+    os.utime(path, (MTIME, MTIME))
+    assert index.get_checksum(path, "sha256") == checksums[path]
+    assert index.get_checksum(path, "sha256", refresh=True) == hashlib.sha256(b"Package 0").hexdigest()
+    # the refreshed checksum is stored
+    assert index.get_checksum(path, "sha256") == hashlib.sha256(b"Package 0").hexdigest()
+
+
+def test_deleted_files_removed(tmp_path):
+    index = file_index.FileStateIndex(str(tmp_path / "file-state.db"))
+    files = _pool(tmp_path, 3)
+    index.get_checksums([(f[0], f[3]) for f in files])
+
+    os.unlink(files[0][0])
+    assert index.get_checksum(files[0][0], "sha256") is None
+    assert sorted(index.get_many([f[0] for f in files])) == [files[1][0], files[2][0]]
+
+    # deleted by someone else
+    os.unlink(files[1][0])
+    index.prune()
+    assert sorted(index.get_many([f[0] for f in files])) == [files[2][0]]
+
+    # pruned at most once per interval
+    os.unlink(files[2][0])
+    index.prune(3600)
+    assert sorted(index.get_many([f[0] for f in files])) == [files[2][0]]
+    index.prune(0)
+    assert index.get_many([f[0] for f in files]) == {}
@@ -0,0 +1,97 @@
+#!/usr/bin/python3
+#
+# Copyright (c) 2023 SUSE LLC
+#
+# This software is licensed to you under the GNU General Public License,
+# version 2 (GPLv2). There is NO WARRANTY for this software, express or
+# implied, including the implied warranties of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. You should have received a copy of GPLv2
+# along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+
+import gzip
+import os
+
+from mock import Mock, patch
+
+from spacewalk.satellite_tools.disk_dumper import iss
+
+
+def _dumper(outputdir, workers=1, incremental=False):
+    # skip the DB queries of the constructor
+    dumper = iss.Dumper.__new__(iss.Dumper)
+    dumper.mp = str(outputdir)
+    dumper.fm = iss.FileMapper(str(outputdir))
+    dumper.outbuffer = None
+    dumper.hardlinks = False
+    dumper.workers = workers
+    dumper.state = iss.ExportState(str(outputdir)) if incremental else None
+    dumper.pb_label, dumper.pb_complete, dumper.pb_length, dumper.pb_char = "", "", 20, "#"
+    return dumper
+
+
+def test_export_state(tmp_path):
+    state = iss.ExportState(str(tmp_path))
+    filename = str(tmp_path / "rhn-package-1.xml")
+    state.update("packages", 1, "20230101000000")
+    state.save()
+
+    state = iss.ExportState(str(tmp_path))
+    # the previously exported file is gone
+    assert not state.is_current("packages", 1, "20230101000000", filename)
+    open(filename + ".gz", "w").close()
+    assert state.is_current("packages", 1, "20230101000000", filename)
+    assert not state.is_current("packages", 1, "20230202000000", filename)
+    assert not state.is_current("errata", 1, "20230101000000", filename)
+
+
+@patch("spacewalk.satellite_tools.disk_dumper.iss.log2email", Mock())
+@patch("spacewalk.satellite_tools.disk_dumper.iss.log2stdout", Mock())
+def test_dump_items_incremental(tmp_path):
+    def dump_func(dumper, items):
+        dumper._get_xml_writer().data(items[0]["package_id"])
+
+    items = [{"package_id": 1, "last_modified": "20230101000000"},
+             {"package_id": 2, "last_modified": "20230101000000"}]
+
+    def get_file(item):
+        return str(tmp_path / ("rhn-package-%d.xml" % item["package_id"]))
+
+    dumper = _dumper(tmp_path, incremental=True)
+    assert dumper._dump_items("packages", items, "package_id", get_file, dump_func, Mock()) == 2
+    with gzip.open(get_file(items[1]) + ".gz", "rt") as f:
+        assert f.read() == '<?xml version="1.0" encoding="UTF-8"?>2'
+
+    items[1]["last_modified"] = "20230202000000"
+    dumper = _dumper(tmp_path, incremental=True)
+    dump = Mock(side_effect=dump_func)
+    assert dumper._dump_items("packages", items, "package_id", get_file, dump, Mock()) == 1
+    dump.assert_called_once_with(dumper, [items[1]])
+
+
+@patch("spacewalk.satellite_tools.disk_dumper.iss.log2email", Mock())
+@patch("spacewalk.satellite_tools.disk_dumper.iss.log2stdout", Mock())
+def test_dump_rpms_links_identical_files(tmp_path):
+    mount_point = tmp_path / "mount"
+    mount_point.mkdir()
+    for name in ("a.rpm", "b.rpm", "c.rpm"):
+        (mount_point / name).write_text(name[0] * 100)
+
+    dumper = _dumper(tmp_path / "export", workers=2)
+    dumper.brpms = [
+        {"id": 1, "path": "a.rpm", "checksum_id": 10},
+        {"id": 2, "path": "b.rpm", "checksum_id": 10},
+        {"id": 3, "path": "c.rpm", "checksum_id": 30},
+        # the same package in another channel
+        {"id": 1, "path": "a.rpm", "checksum_id": 10},
+    ]
+    CFG = Mock()
+    CFG.MOUNT_POINT = str(mount_point)
+    with patch("spacewalk.satellite_tools.disk_dumper.iss.CFG", CFG):
+        dumper.dump_rpms()
+
+    exported = [iss.diskImportLib.rpmsPath("rhn-package-%d" % i, dumper.mp) for i in (1, 2, 3)]
+    assert open(exported[0]).read() == "a" * 100
+    assert open(exported[2]).read() == "c" * 100
+    assert os.path.samefile(exported[0], exported[1])
+    assert not os.path.samefile(exported[0], os.path.join(str(mount_point), "a.rpm"))
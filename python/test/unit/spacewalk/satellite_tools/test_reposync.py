@@ -19,6 +19,7 @@ import imp
 import sys
 import unittest
 import json
+import multiprocessing
 import os
 import time
 try:
@@ -218,6 +219,8 @@ class RepoSyncTest(unittest.TestCase):
         CFG.MOUNT_POINT = '/tmp'
         CFG.PREPENDED_DIR = ''
         CFG.AUTO_GENERATE_BOOTSTRAP_REPO = 1
+        CFG.REPOSYNC_IMPORT_WORKERS = 1
+        CFG.REPOSYNC_IMPORT_BATCH_SIZE = 20
         return CFG
     
     def _mock_repo_plugin(self, pkg_list) -> Mock:
@@ -243,9 +246,10 @@ class RepoSyncTest(unittest.TestCase):
     @patch("spacewalk.satellite_tools.reposync.os", os)
     @patch("spacewalk.satellite_tools.reposync.log", Mock())
     @patch("spacewalk.satellite_tools.reposync.RepoSync._normalize_orphan_vendor_packages", Mock())
+    @patch("spacewalk.satellite_tools.reposync.rhnPackage.get_info_for_packages", Mock(return_value={}))
     @patch("spacewalk.satellite_tools.reposync.ThreadedDownloader")
-    @patch("spacewalk.satellite_tools.reposync.multiprocessing.Pool")
-    def test_import_packages_excludes_failed_pkgs(self, pool, downloader):
+    @patch("spacewalk.satellite_tools.reposync.multiprocessing.get_context")
+    def test_import_packages_excludes_failed_pkgs(self, get_context, downloader):
         """
         When downloader fails to download a subset of packages
         Then the RepoSync.import_packages function should not process the failed packages
@@ -264,9 +268,120 @@ class RepoSyncTest(unittest.TestCase):
 
         # repository plugin returned 1 package that failed to download
         # multiprocessing.Pool.apply_async shouldn't be called
-        apply_async_mock = pool.return_value.__enter__.return_value.apply_async
+        apply_async_mock = get_context.return_value.Pool.return_value.__enter__.return_value.apply_async
         self.assertFalse(apply_async_mock.called)
 
+    @patch("uyuni.common.context_managers.initCFG", Mock())
+    @patch("spacewalk.satellite_tools.reposync.os", os)
+    def test_load_import_settings(self):
+        rs = _init_reposync(self.reposync)
+        CFG = self._mock_cfg()
+        CFG.REPOSYNC_IMPORT_WORKERS = 0
+        with patch("uyuni.common.context_managers.CFG", CFG):
+            rs.load_import_settings()
+        self.assertEqual(rs.import_batch_size, 20)
+        self.assertEqual(rs.import_workers, min(os.cpu_count() * 2, 32))
+
+        rs = _init_reposync(self.reposync)
+        rs.set_import_batch_size("5")
+        CFG.REPOSYNC_IMPORT_WORKERS = 3
+        with patch("uyuni.common.context_managers.CFG", CFG):
+            rs.load_import_settings()
+        self.assertEqual(rs.import_batch_size, 5)
+        self.assertEqual(rs.import_workers, 3)
+
+    @patch("spacewalk.satellite_tools.reposync.log", Mock())
+    @patch("spacewalk.satellite_tools.reposync.os", os)
+    @patch("spacewalk.satellite_tools.reposync.multiprocessing.get_context")
+    def test_download_and_import_packages_imports_while_downloading(self, get_context):
+        """
+        When packages get downloaded
+        Then they are handed to the import workers right away, except the failed ones
+        """
+        class SyncResult:
+            def __init__(self, value):
+                self.value = value
+
+            def get(self):
+                return self.value
+
+        def apply_async(func, args, callback, error_callback):
+            result = func(*args)
+            callback(result)
+            return SyncResult(result)
+
+        pool = get_context.return_value.Pool
+        pool.return_value.__enter__.return_value.apply_async = apply_async
+        rs = _init_reposync(self.reposync)
+        rs.import_batch_size = 1
+        rs.import_workers = 1
+
+        packs = self._mock_packages_list(["pkg1.rpm", "pkg2.rpm", "pkg3.rpm", "pkg4.rpm"])
+        for pack in packs:
+            pack.path = "/tmp/" + pack.unique_id.relativepath
+        to_process = [(packs[0], True, True), (packs[1], True, True), (packs[2], True, True), (packs[3], False, True)]
+
+        downloader = Mock()
+        def run():
+            callback = downloader.set_done_callback.call_args[0][0]
+            callback(True, {'target_file': "/tmp/pkg1.rpm"})
+            callback(False, {'target_file': "/tmp/pkg2.rpm"})
+            callback(True, {'target_file': "/tmp/pkg3.rpm"})
+        downloader.run = run
+
+        imported = []
+        def import_package_batch(batch, to_disassociate, is_non_local_repo, batch_index, batch_count):
+            imported.extend(pack for pack, _, _ in batch)
+            return ["channel"], 0, set(), [(pack, True, False) for pack, _, _ in batch]
+        rs.import_package_batch = import_package_batch
+
+        affected_channels, failed_packages = rs.download_and_import_packages(downloader, to_process, {}, True)
+
+        self.assertEqual(imported, [packs[0], packs[2]])
+        self.assertEqual(affected_channels, ["channel", "channel"])
+        self.assertEqual(failed_packages, 0)
+        self.assertEqual(to_process, [(packs[0], True, False), (packs[1], True, True),
+                                      (packs[2], True, False), (packs[3], False, True)])
+        # the workers are not forked from the process running the download threads
+        get_context.assert_called_once_with('forkserver')
+        self.assertEqual(pool.call_args[1]['initializer'], self.reposync._init_import_worker)
+
+    @patch("uyuni.common.context_managers.initCFG", Mock())
+    @patch("spacewalk.satellite_tools.reposync.log2", Mock())
+    @patch("spacewalk.satellite_tools.reposync.os", os)
+    @patch("spacewalk.satellite_tools.reposync.log", Mock())
+    @patch("spacewalk.satellite_tools.reposync.RepoSync._normalize_orphan_vendor_packages", Mock())
+    @patch("spacewalk.satellite_tools.reposync.RepoSync.match_package_checksum", Mock(return_value=True))
+    @patch("spacewalk.satellite_tools.reposync.rhnPackage.get_info_for_package")
+    @patch("spacewalk.satellite_tools.reposync.rhnPackage.get_info_for_packages")
+    @patch("spacewalk.satellite_tools.reposync.ThreadedDownloader")
+    def test_import_packages_looks_up_packages_in_bulk(self, downloader, get_info_bulk, get_info):
+        """
+        When the repository packages are already in the channel
+        Then the RepoSync.import_packages function should look them up with a single bulk query
+        """
+        rs = _init_reposync(self.reposync)
+        packs = self._mock_packages_list(["pkg1.rpm", "pkg2.rpm"])
+        for i, pack in enumerate(packs):
+            pack.name = "pkg%d" % (i + 1)
+            pack.version = "1.0"
+            pack.release = "1"
+            pack.epoch = "0"
+            pack.checksum = "checksum%d" % (i + 1)
+        get_info_bulk.return_value = {
+            (pack.name, "1.0", "1", None, "arch1"): [{'path': 'path/%s' % pack.name, 'channel_id': 1,
+                                                       'checksum_type': 'sha256', 'checksum': pack.checksum,
+                                                       'org_id': '1', 'epoch': None}]
+            for pack in packs}
+        plugin = self._mock_repo_plugin(packs)
+
+        with patch("uyuni.common.context_managers.CFG", self._mock_cfg()):
+            rs.import_packages(plugin, None, "unused-url-string", None)
+
+        self.assertEqual(get_info_bulk.call_count, 1)
+        self.assertFalse(get_info.called)
+        self.assertFalse(downloader.return_value.add.called)
+
     @patch("uyuni.common.context_managers.initCFG", Mock())
     def test_sync_raises_channel_timeout(self):
         rs = self._create_mocked_reposync()
@@ -940,7 +1055,8 @@ class RunScriptTest(unittest.TestCase):
                             config="example.conf",
                             channel_label=[],
                             parent_label=None,
-                            batch_size=None
+                            batch_size=None,
+                            parallel='1'
                         ),
                         []
                     ]
@@ -1022,6 +1138,195 @@ def test_channel_exceptions():
             assert ret == -1
         assert rs.sendErrorMail.call_args == (("%s: %s" % (exc_name, "error msg"), ), {})
 
+def test_repo_snapshot_roundtrip(tmp_path):
+    """Test that a saved repository snapshot is loaded by the next sync"""
+    reposync = spacewalk.satellite_tools.reposync
+    with patch.object(reposync, "snapshot_cache_dir", str(tmp_path)), \
+            patch.object(reposync, "os", os):
+        snapshot = reposync.RepoSnapshot("label", "http://url.one", [[], False])
+        snapshot.load(10)
+        assert not snapshot.loaded
+        snapshot.new_packages = {("sha256", "checksum1"), ("sha256", "checksum2")}
+        snapshot.new_errata = {"update1": "fingerprint1"}
+        snapshot.save(10)
+
+        snapshot = reposync.RepoSnapshot("label", "http://url.one", [[], False]).load(10)
+        assert snapshot.loaded
+        assert snapshot.packages == {("sha256", "checksum1"), ("sha256", "checksum2")}
+        assert snapshot.errata == {"update1": "fingerprint1"}
+
+        snapshot.new_packages = {("sha256", "checksum1")}
+        assert snapshot.removed_packages() == {("sha256", "checksum2")}
+        assert snapshot.removed_errata() == {"update1"}
+
+
+def test_repo_snapshot_outdated(tmp_path):
+    """Test that a snapshot is ignored when the channel or the sync options changed"""
+    reposync = spacewalk.satellite_tools.reposync
+    with patch.object(reposync, "snapshot_cache_dir", str(tmp_path)), \
+            patch.object(reposync, "os", os), \
+            patch.object(reposync, "log", Mock()):
+        snapshot = reposync.RepoSnapshot("label", "http://url.one", [[], False])
+        snapshot.new_packages = {("sha256", "checksum1")}
+        snapshot.save(10)
+
+        assert not reposync.RepoSnapshot("label", "http://url.one", [[], False]).load(11).loaded
+        assert not reposync.RepoSnapshot("label", "http://url.one", [[], True]).load(10).loaded
+        assert not reposync.RepoSnapshot("label", "http://url.two", [[], False]).load(10).loaded
+
+
+def test_repo_snapshot_filters(tmp_path):
+    """Test that a snapshot saved with --include/--exclude filters is reused with the same filters"""
+    reposync = spacewalk.satellite_tools.reposync
+    filters = [("+", ["pkg1", "pkg2*"]), ("-", ["pkg2-devel"])]
+    with patch.object(reposync, "snapshot_cache_dir", str(tmp_path)), \
+            patch.object(reposync, "os", os), \
+            patch.object(reposync, "log", Mock()):
+        snapshot = reposync.RepoSnapshot("label", "http://url.one", [filters, False])
+        snapshot.new_packages = {("sha256", "checksum1")}
+        snapshot.save(10)
+
+        assert reposync.RepoSnapshot("label", "http://url.one", [list(filters), False]).load(10).loaded
+        assert not reposync.RepoSnapshot("label", "http://url.one", [filters[:1], False]).load(10).loaded
+
+
+def test_shared_package_claims():
+    """Test that a package is claimed by the first channel only"""
+    claims = spacewalk.satellite_tools.reposync.SharedPackageClaims()
+    key1 = ("", "sha256", "checksum1")
+    key2 = ("", "sha256", "checksum2")
+
+    assert claims.claim([key1], "channel1") == []
+    assert claims.claim([key1, key2], "channel2") == [key1]
+    assert claims.pending([key1, key2]) == 2
+
+    claims.release([key1])
+    assert claims.pending([key1]) == 0
+    assert claims.claim([key1], "channel3") == [key1]
+
+
+def test_shared_package_claims_released_with_process():
+    """Test that the claims of a killed channel process are not left pending"""
+    claims = spacewalk.satellite_tools.reposync.SharedPackageClaims()
+    key1 = ("", "sha256", "checksum1")
+    key2 = ("", "sha256", "checksum2")
+    claims.claim([key1], "channel1", 100)
+    claims.claim([key2], "channel2", 200)
+
+    assert claims.release_process(100) == 1
+    assert claims.pending([key1, key2]) == 1
+    assert claims.release_process(100) == 0
+
+
+@patch("spacewalk.satellite_tools.reposync.log", Mock())
+@patch("spacewalk.satellite_tools.reposync.rhnSQL", Mock())
+@patch("spacewalk.satellite_tools.reposync.rhnLog", Mock())
+@patch("spacewalk.satellite_tools.reposync.rhnPackage.get_info_for_packages", Mock(return_value={}))
+@patch("spacewalk.satellite_tools.reposync.time")
+@patch("uyuni.common.context_managers.initCFG", Mock())
+def test_resolve_deferred_packages_timeout(mock_time):
+    """Test that the deferred packages are downloaded again if the claiming channel never releases them"""
+    reposync = spacewalk.satellite_tools.reposync
+    rs = _init_reposync(reposync, url="http://url.one")
+    claims = reposync.SharedPackageClaims()
+    rs.set_shared_state(claims, None)
+    mock_time.time.side_effect = [0, 10, reposync.deferred_packages_timeout]
+
+    pack = Mock()
+    pack.checksum_type = "sha256"
+    pack.checksum = "checksum1"
+    pack.arch = "x86_64"
+    claims.claim([rs._claim_key(pack, rs.org_id)], "other-channel", 100)
+    to_process = [(pack, False, False)]
+
+    assert rs._resolve_deferred_packages(to_process, [0], 1, "/tmp") == [0]
+    assert to_process == [(pack, True, True)]
+    assert mock_time.sleep.call_count == 1
+
+
+@patch("spacewalk.satellite_tools.reposync.log", Mock())
+@patch("spacewalk.satellite_tools.reposync.rhnSQL", Mock())
+@patch("spacewalk.satellite_tools.reposync.rhnLog", Mock())
+@patch("uyuni.common.context_managers.initCFG", Mock())
+def test_claim_packages_defers_packages_of_other_channels():
+    """Test that packages claimed by another channel are not downloaded"""
+    reposync = spacewalk.satellite_tools.reposync
+    rs = _init_reposync(reposync, url="http://url.one")
+    claims = reposync.SharedPackageClaims()
+    rs.set_shared_state(claims, None)
+
+    packs = []
+    for i in range(3):
+        pack = Mock()
+        pack.checksum_type = "sha256"
+        pack.checksum = "checksum%d" % i
+        packs.append(pack)
+    claims.claim([rs._claim_key(packs[1], rs.org_id)], "other-channel")
+    to_process = [(packs[0], True, True), (packs[1], True, True), (packs[2], False, True)]
+
+    deferred, claimed = rs._claim_packages(to_process)
+
+    assert deferred == [1]
+    assert claimed == [rs._claim_key(packs[0], rs.org_id)]
+    assert to_process == [(packs[0], True, True), (packs[1], False, False), (packs[2], False, True)]
+
+
+
+@patch("spacewalk.satellite_tools.reposync.log", Mock())
+@patch("spacewalk.satellite_tools.reposync.log2", Mock())
+@patch("spacewalk.satellite_tools.reposync.log2background", Mock())
+@patch("spacewalk.satellite_tools.reposync.os", os)
+@patch("spacewalk.satellite_tools.reposync.rhnSQL", Mock())
+@patch("spacewalk.satellite_tools.reposync.rhnLog", Mock())
+@patch("spacewalk.satellite_tools.reposync.ThreadedDownloader")
+@patch("uyuni.common.context_managers.initCFG", Mock())
+def test_download_packages_at_indexes(downloader):
+    """Test that the packages downloaded again after being deferred are updated in to_process"""
+    reposync = spacewalk.satellite_tools.reposync
+    rs = _init_reposync(reposync, url="http://url.one")
+    rs.import_batch_size = 2
+    downloader.return_value.failed_pkgs = []
+    plug = Mock()
+    plug.repo.pkgdir = "/tmp/pkgdir"
+
+    packs = []
+    for i in range(4):
+        pack = Mock()
+        pack.checksum = "checksum%d" % i
+        pack.unique_id.relativepath = "pkg%d.rpm" % i
+        packs.append(pack)
+    # the first package was imported by the first pass, the other ones were deferred
+    to_process = [(packs[0], True, False), (packs[1], True, True), (packs[2], True, True), (packs[3], False, True)]
+
+    def download_and_import_packages(downloader, to_process, to_disassociate, is_non_local_repo, download_indexes):
+        for index in download_indexes:
+            to_process[index] = (to_process[index][0], True, False)
+        return [], 0
+
+    rs.download_and_import_packages = Mock(side_effect=download_and_import_packages)
+    rs._download_packages(plug, to_process, {}, True, indexes=[1, 2, 3])
+
+    assert sorted(rs.download_and_import_packages.call_args[0][4]) == [1, 2]
+    assert downloader.return_value.add.call_count == 2
+    assert to_process == [(packs[0], True, False), (packs[1], True, False), (packs[2], True, False),
+                          (packs[3], False, True)]
+
+
+@patch("spacewalk.satellite_tools.reposync.rhnSQL", Mock())
+@patch("spacewalk.satellite_tools.reposync.rhnLog", Mock())
+@patch("uyuni.common.context_managers.initCFG", Mock())
+def test_import_worker_copy_without_shared_state():
+    """Test that the state shared by the parallel channel syncs is not handed to the import workers"""
+    reposync = spacewalk.satellite_tools.reposync
+    rs = _init_reposync(reposync, url="http://url.one")
+    rs.set_shared_state(Mock(), multiprocessing.BoundedSemaphore(2))
+
+    state = rs.__getstate__()
+
+    assert state['shared_claims'] is None
+    assert state['download_slots'] is None
+    assert rs.download_slots is not None
+
 def _init_reposync(reposync, label="Label", repo_type=RTYPE, **kwargs):
     """Initialize the RepoSync object with some mocked attrs"""
     reposync.RepoSync.get_compatible_arches = Mock(
@@ -0,0 +1,114 @@
+#!/usr/bin/python3
+#
+# Copyright (c) 2023 SUSE LLC
+#
+# This software is licensed to you under the GNU General Public License,
+# version 2 (GPLv2). There is NO WARRANTY for this software, express or
+# implied, including the implied warranties of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. You should have received a copy of GPLv2
+# along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+
+import gzip
+import io
+
+import pytest
+
+from spacewalk.satellite_tools.disk_dumper import string_buffer
+from spacewalk.satellite_tools.disk_dumper.string_buffer import StringBuffer
+from spacewalk.satellite_tools.exporter import xmlWriter
+
+CHANNEL_PACKAGES = 2000
+
+
+class RecordingStream(io.StringIO):
+    """Stream recording the size of every write"""
+
+    def __init__(self):
+        io.StringIO.__init__(self)
+        self.writes = []
+
+    def write(self, data):
+        self.writes.append(len(data))
+        return io.StringIO.write(self, data)
+
+
+def _dump_channel(stream, packages):
+    """Write a synthetic channel with the given number of packages"""
+    writer = xmlWriter.XMLWriter(stream=stream)
+    writer.open_tag("rhn-satellite", attributes={"version": "3.0"})
+    writer.open_tag("rhn-packages")
+    for i in range(packages):
+        writer.open_tag("rhn-package", attributes={
+            "id": "rhn-package-%d" % i, "org_id": "", "name": "package%d" % (i % 5000),
+            "version": "1.%d" % i, "release": "1.1", "epoch": "", "package-arch": "x86_64",
+            "checksum-type": "sha256", "checksum": "%064x" % i, "package-size": 12345,
+            "last-modified": "1672531200",
+        })
+        writer.open_tag("rhn-package-summary")
+        writer.data("Synthetic package %d <for> the tests" % i)
+        writer.close_tag("rhn-package-summary")
+        writer.empty_tag("rhn-package-provides-entry", attributes={"name": "package%d" % i, "sense": 8})
+        writer.close_tag("rhn-package")
+    writer.close_tag("rhn-packages")
+    writer.close_tag("rhn-satellite")
+    writer.flush()
+
+
+def test_string_buffer_chunks_writes():
+    stream = io.StringIO()
+    sb = StringBuffer(stream, buffer_size=10)
+    sb.write("abcd")
+    sb.write("efgh")
+    assert stream.getvalue() == ""
+    sb.write("ijkl")
+    assert stream.getvalue() == "abcdefghijkl"
+    sb.write("m")
+    sb.flush()
+    assert stream.getvalue() == "abcdefghijklm"
+
+
+def test_string_buffer_gzip():
+    stream = io.BytesIO()
+    sb = StringBuffer(stream, buffer_size=16, compression="gzip", compress_level=9)
+    for _ in range(1000):
+        sb.write("<tag>é</tag>")
+    sb.close()
+    # closing again does not write anything
+    size = len(stream.getvalue())
+    sb.close()
+    assert len(stream.getvalue()) == size
+    assert gzip.decompress(stream.getvalue()).decode("utf-8") == "<tag>é</tag>" * 1000
+
+
+def test_string_buffer_unknown_compression():
+    with pytest.raises(ValueError):
+        StringBuffer(io.BytesIO(), compression="lzma")
+
+
+@pytest.mark.skipif(not string_buffer.HAS_ZSTD, reason="zstandard is not installed")
+def test_string_buffer_zstd():
+    stream = io.BytesIO()
+    sb = StringBuffer(stream, compression="zstd", compress_level=3)
+    sb.write("<tag/>" * 100)
+    sb.close()
+    assert string_buffer.zstandard.ZstdDecompressor().decompressobj().decompress(
+        stream.getvalue()) == b"<tag/>" * 100
+
+
+def test_dump_channel():
+    """Dump a synthetic channel through the buffer: the stream gets full chunks only"""
+    expected = io.StringIO()
+    _dump_channel(expected, CHANNEL_PACKAGES)
+
+    stream = RecordingStream()
+    _dump_channel(StringBuffer(stream, buffer_size=4096), CHANNEL_PACKAGES)
+    assert stream.getvalue() == expected.getvalue()
+    assert len(stream.writes) > 1
+    assert min(stream.writes[:-1]) >= 4096
+
+    compressed = io.BytesIO()
+    sb = StringBuffer(compressed, compression="gzip", compress_level=5)
+    _dump_channel(sb, CHANNEL_PACKAGES)
+    sb.close()
+    assert gzip.decompress(compressed.getvalue()).decode("utf-8") == expected.getvalue()
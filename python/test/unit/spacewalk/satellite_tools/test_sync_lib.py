@@ -0,0 +1,74 @@
+#!/usr/bin/python3
+#
+# Copyright (c) 2023 SUSE LLC
+#
+# This software is licensed to you under the GNU General Public License,
+# version 2 (GPLv2). There is NO WARRANTY for this software, express or
+# implied, including the implied warranties of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. You should have received a copy of GPLv2
+# along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+
+import contextlib
+import io
+import os
+
+import pytest
+from mock import Mock, patch
+
+from spacewalk.satellite_tools import syncLib
+
+CONTENT = b"0123456789" * 10
+
+
+class _BrokenStream(io.BytesIO):
+    """Stream whose connection drops after a number of bytes"""
+
+    def __init__(self, data, fail_after):
+        io.BytesIO.__init__(self, data)
+        self.fail_after = fail_after
+
+    def read(self, size=-1):
+        if self.tell() >= self.fail_after:
+            raise IOError("connection reset")
+        return io.BytesIO.read(self, min(size, self.fail_after - self.tell()))
+
+
+@pytest.fixture
+def file_manip(tmp_path):
+    cfg = Mock(MOUNT_POINT=str(tmp_path), BUFFER_SIZE=16)
+    with patch("spacewalk.satellite_tools.syncLib.cfg_component",
+               lambda component: contextlib.nullcontext(cfg)), \
+            patch("spacewalk.satellite_tools.syncLib.createPath", lambda path: os.makedirs(path, exist_ok=True)), \
+            patch("spacewalk.satellite_tools.syncLib.setPermsPath", Mock()), \
+            patch("spacewalk.satellite_tools.syncLib.log", Mock()):
+        yield syncLib.FileManip("packages/foo.rpm", "20230101000000", len(CONTENT))
+
+
+def test_write_file(file_manip):
+    assert file_manip.write_file(io.BytesIO(CONTENT)) == len(CONTENT)
+    with open(file_manip.full_path, "rb") as f:
+        assert f.read() == CONTENT
+    assert not os.path.exists(file_manip.partial_path)
+    assert file_manip.partial_size() == 0
+
+
+def test_write_file_resumes_partial_download(file_manip):
+    with pytest.raises(syncLib.FileCreationError):
+        file_manip.write_file(_BrokenStream(CONTENT, 42))
+    # the interrupted download is kept, but not published
+    assert not os.path.exists(file_manip.full_path)
+    assert file_manip.partial_size() == 42
+
+    offset = file_manip.partial_size()
+    assert file_manip.write_file(io.BytesIO(CONTENT[offset:]), offset) == len(CONTENT)
+    with open(file_manip.full_path, "rb") as f:
+        assert f.read() == CONTENT
+    assert not os.path.exists(file_manip.partial_path)
+
+
+def test_write_file_discards_oversized_download(file_manip):
+    with pytest.raises(syncLib.FileCreationError):
+        file_manip.write_file(io.BytesIO(CONTENT + b"garbage"))
+    assert not os.path.exists(file_manip.partial_path)
+    assert file_manip.partial_size() == 0
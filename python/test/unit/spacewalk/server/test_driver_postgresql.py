@@ -0,0 +1,115 @@
+#!/usr/bin/python3
+from unittest.mock import MagicMock, patch
+
+from spacewalk.server.rhnSQL import driver_postgresql
+
+QUERY = """
+    SELECT c.id, c.label, c.name, ca.label AS arch
+      FROM rhnChannel c
+      JOIN rhnChannelArch ca ON ca.id = c.channel_arch_id
+      JOIN rhnServerChannel sc ON sc.channel_id = c.id
+     WHERE sc.server_id = :server_id
+       AND c.org_id = :org_id
+       AND c.label LIKE 'sles%'
+"""
+
+
+class _Unprintable:
+    def __str__(self):
+        raise AssertionError("bind params must not be formatted")
+
+
+def _cursor(sql=QUERY):
+    return driver_postgresql.Cursor(dbh=MagicMock(), sql=sql)
+
+
+def test_convert_named_query_params():
+    assert driver_postgresql.convert_named_query_params(QUERY) == (
+        QUERY.replace("%", "%%")
+        .replace(":server_id", "%(server_id)s")
+        .replace(":org_id", "%(org_id)s")
+    )
+    assert driver_postgresql.convert_named_query_params("SELECT 1") == "SELECT 1"
+
+
+def test_convert_named_query_params_is_cached():
+    driver_postgresql._convert_named_query_params.cache_clear()
+    with patch("spacewalk.server.rhnSQL.driver_postgresql.re.sub", wraps=driver_postgresql.re.sub) as sub:
+        first = driver_postgresql.convert_named_query_params(QUERY)
+        second = driver_postgresql.convert_named_query_params(QUERY)
+    assert first == second
+    assert sub.call_count == 1
+    info = driver_postgresql._convert_named_query_params.cache_info()
+    assert info.hits == 1
+    assert info.maxsize is not None
+
+
+@patch("spacewalk.common.rhnLog.LOG", MagicMock(level=1))
+def test_execute_wrapper_skips_params_formatting():
+    function = MagicMock(return_value=1)
+    assert _cursor()._execute_wrapper(function, server_id=_Unprintable()) == 1
+    function.assert_called_once()
+
+
+@patch("spacewalk.common.rhnLog.LOG", MagicMock(level=5))
+def test_execute_wrapper_formats_params_when_debugging():
+    with patch("spacewalk.server.rhnSQL.driver_postgresql.log_debug") as log_debug:
+        _cursor()._execute_wrapper(MagicMock(), server_id=1000010000)
+    assert "server_id: 1000010000" in log_debug.call_args[0][1]
+
+
+@patch("spacewalk.common.rhnLog.LOG", MagicMock(level=1))
+def test_repeated_executes_overhead():
+    """Repeated executes at normal log levels neither rewrite the statement nor format the params again"""
+    driver_postgresql._convert_named_query_params.cache_clear()
+    function = MagicMock()
+    params = dict(("param%d" % i, _Unprintable()) for i in range(20))
+    with patch("spacewalk.server.rhnSQL.driver_postgresql.re.sub", wraps=driver_postgresql.re.sub) as sub, \
+            patch("spacewalk.server.rhnSQL.driver_postgresql.log_debug") as log_debug:
+        for _i in range(100):
+            _cursor()._execute_wrapper(function, **params)
+    assert sub.call_count == 1
+    assert driver_postgresql._convert_named_query_params.cache_info().hits == 99
+    assert function.call_count == 100
+    assert all("param" not in str(c) for c in log_debug.call_args_list)
+
+
+def test_convert_to_positional_params():
+    sql = driver_postgresql.convert_named_query_params(
+        "UPDATE t SET name = :name WHERE id = :id AND label LIKE 'a%' AND other = :id")
+    assert driver_postgresql.convert_to_positional_params(sql) == (
+        "UPDATE t SET name = %s WHERE id = %s AND label LIKE 'a%%' AND other = %s",
+        ["name", "id", "id"])
+
+
+def test_split_insert_values():
+    assert driver_postgresql.split_insert_values("INSERT INTO t (id, name) VALUES (%s, lookup(%s))") == (
+        "INSERT INTO t (id, name) VALUES %s", "(%s, lookup(%s))")
+    assert driver_postgresql.split_insert_values("INSERT INTO t (id) SELECT %s") is None
+    assert driver_postgresql.split_insert_values("INSERT INTO t (id) VALUES (%s) RETURNING id") is None
+
+
+def test_executemany_inserts_with_execute_values():
+    cursor = _cursor("INSERT INTO t (id, name) VALUES (:id, :name)")
+    with patch("spacewalk.server.rhnSQL.driver_postgresql.psycopg2.extras") as extras:
+        cursor.executemany(name=["a", "b"], ID=[1, 2])
+    extras.execute_values.assert_called_once_with(
+        cursor._real_cursor, "INSERT INTO t (id, name) VALUES %s", [(1, "a"), (2, "b")],
+        template="(%s, %s)", page_size=1000)
+    extras.execute_batch.assert_not_called()
+
+
+def test_executemany_updates_with_positional_rows():
+    cursor = _cursor("UPDATE t SET name = :name WHERE id = :id")
+    with patch("spacewalk.server.rhnSQL.driver_postgresql.psycopg2.extras") as extras:
+        cursor.executemany(id=[1, 2], name=["a", "b"])
+    extras.execute_batch.assert_called_once_with(
+        cursor._real_cursor, "UPDATE t SET name = %s WHERE id = %s", [("a", 1), ("b", 2)])
+
+
+def test_copy_from():
+    cursor = _cursor("SELECT 1")
+    cursor.copy_from("t", ["id", "name", "data"], [(1, "a\tb\\c\nd", None), (2, "", b"\x01\xff")])
+    sql, data = cursor._real_cursor.copy_expert.call_args[0]
+    assert sql == "COPY t (id, name, data) FROM STDIN"
+    assert data.read() == "1\ta\\tb\\\\c\\nd\t\\N\n2\t\t\\\\x01ff\n"
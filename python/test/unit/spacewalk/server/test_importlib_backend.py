@@ -0,0 +1,75 @@
+#!/usr/bin/python3
+from unittest.mock import MagicMock
+
+from spacewalk.server.importlib.backend import Backend
+from spacewalk.server.importlib.backendLib import Table, TableCollection, DBint, DBstring
+from spacewalk.server.importlib.importLib import Information, Item
+
+
+class Parent(Information):
+    attributeTypes = {"label": DBstring(64), "name": DBstring(64), "children": [Item]}
+
+
+class SampleBackend(Backend):
+    tables = TableCollection(
+        Table("rhnParent", fields={"id": DBint(), "label": DBstring(64), "name": DBstring(64)},
+              pk=["label"]),
+        Table("rhnChild", fields={"parent_id": DBint(), "name": DBstring(64), "value": DBstring(64)},
+              pk=["parent_id", "name"], attribute="children"),
+    )
+
+
+def _parent(label, children):
+    parent = Parent()
+    parent["label"] = label
+    parent["name"] = label
+    parent["children"] = [Item({"name": name, "value": value}) for name, value in children]
+    return parent
+
+
+def _execute_values(parents, children):
+    """Mocked execute_values answering the parent and child table queries"""
+    statement = MagicMock()
+
+    def execute_values(sql, values, template=None, page_size=None, fetch=True):
+        if not fetch:
+            return None
+        if "rhnParent.*" in sql:
+            statement.description = [("id",), ("label",), ("name",), ("ordering",)]
+            return [parents[v[1]] + (v[0],) for v in values if v[1] in parents]
+        statement.description = [("parent_id",), ("name",), ("value",)]
+        ids = set(v[0] for v in values)
+        return [row for row in children if row[0] in ids]
+
+    statement.execute_values.side_effect = execute_values
+    return statement
+
+
+def test_process_object_collection_batches_lookups():
+    parents = dict(("p%d" % i, (i, "p%d" % i, "p%d" % i)) for i in range(250))
+    children = [(i, "a", "1") for i in range(250)] + [(i, "b", "old") for i in range(250)]
+    statement = _execute_values(parents, children)
+    dbmodule = MagicMock()
+    dbmodule.prepare.return_value = statement
+
+    backend = SampleBackend(dbmodule)
+    backend.sequences["rhnParent"] = MagicMock()
+    backend.sequences["rhnParent"].next.return_value = 1000
+    backend.childLookupBatchSize = 100
+    objects = [_parent("p%d" % i, [("a", "1"), ("b", "new")]) for i in range(250)]
+    objects.append(_parent("new", [("a", "1")]))
+
+    dml = backend.__processObjectCollection__(
+        objects, "rhnParent", {"rhnChild": "parent_id"}, uploadForce=4, ignoreUploaded=1, forceVerify=1)
+
+    # one lookup for the whole collection, one child table query per 100 objects
+    sqls = [c[0][0] for c in statement.execute_values.call_args_list]
+    assert len([s for s in sqls if s.startswith("select rhnParent.*")]) == 1
+    assert len([s for s in sqls if s.startswith("select rhnChild.*")]) == 3
+    assert [o.id for o in objects[:2]] == [0, 1]
+    assert objects[-1].id == 1000
+    assert objects[-1].diff_result.level == -1
+    assert len(dml.update["rhnChild"]["value"]) == 250
+    assert dml.insert["rhnParent"]["label"] == ["new"]
+    assert dml.insert["rhnChild"]["parent_id"] == [1000]
+    assert not dml.delete["rhnChild"]["name"]
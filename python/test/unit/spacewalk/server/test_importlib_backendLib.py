@@ -0,0 +1,89 @@
+#!/usr/bin/python3
+from unittest.mock import MagicMock
+
+from spacewalk.server.importlib.backendLib import Table, DBint, DBstring, DBdateTime, \
+    TableInsert, TableUpdate, TableDelete, TableLookup
+
+TABLE = Table(
+    "rhnTest",
+    fields={
+        "id": DBint(),
+        "label": DBstring(64),
+        "name": DBstring(128),
+        "modified": DBdateTime(),
+    },
+    pk=["id", "label"],
+    nullable=["label"],
+)
+
+
+def test_table_update_uses_values_list():
+    dbmodule = MagicMock()
+    TableUpdate(TABLE, dbmodule).query({
+        "id": [1, 2, 1],
+        "label": ["a", None, "a"],
+        "name": ["n1", "n2", "n3"],
+        "modified": [None, None, "2024-01-01 00:00:00"],
+    })
+    calls = dict((c[0][0], c) for c in dbmodule.prepare.return_value.execute_values.call_args_list)
+    c = calls["update rhnTest set name = new_values.name, modified = new_values.modified "
+              "from (values %s) as new_values (id, label, name, modified) "
+              "where rhnTest.id = new_values.id and rhnTest.label = new_values.label"]
+    # the last update of a row wins
+    assert c[0][1] == [(1, "a", "n3", "2024-01-01 00:00:00")]
+    assert c[1]["template"] == "(%s::numeric, %s::varchar, %s::varchar, %s::timestamptz)"
+    c = calls["update rhnTest set name = new_values.name, modified = new_values.modified "
+              "from (values %s) as new_values (id, name, modified) "
+              "where rhnTest.id = new_values.id and rhnTest.label is null"]
+    assert c[0][1] == [(2, "n2", None)]
+    assert c[1]["template"] == "(%s::numeric, %s::varchar, %s::timestamptz)"
+
+
+def test_table_delete_uses_values_list():
+    dbmodule = MagicMock()
+    TableDelete(TABLE, dbmodule).query({"id": [1, 2], "label": ["a", "b"]})
+    dbmodule.prepare.return_value.execute_values.assert_called_once_with(
+        "delete from rhnTest using (values %s) as new_values (id, label) "
+        "where rhnTest.id = new_values.id and rhnTest.label = new_values.label",
+        [(1, "a"), (2, "b")], template="(%s::numeric, %s::varchar)", fetch=False, page_size=10_000)
+
+
+def test_table_insert_copies_big_imports():
+    dbmodule = MagicMock()
+    insert = TableInsert(TABLE, dbmodule)
+    values = {"id": [1, 2], "label": ["a", "b"], "name": ["n1", "n2"], "modified": [None, None]}
+    statement = dbmodule.prepare.return_value
+
+    insert.query(values)
+    statement.execute_values.assert_called_once()
+    statement.copy_from.assert_not_called()
+
+    insert.copyThreshold = 2
+    insert.query(values)
+    statement.copy_from.assert_called_once_with(
+        "rhnTest", insert.insert_fields, list(zip(*[values[f] for f in insert.insert_fields])))
+
+
+def test_table_lookup_query_many():
+    dbmodule = MagicMock()
+    statement = dbmodule.prepare.return_value
+    statement.description = [("ID",), ("LABEL",), ("NAME",), ("MODIFIED",), ("ORDERING",)]
+    statement.execute_values.side_effect = [[(3, "c", "n3", None, 2), (1, "a", "n1", None, 0)], []]
+
+    rows = TableLookup(TABLE, dbmodule).query_many([
+        {"id": 1, "label": "a"}, {"id": 2, "label": "b"}, {"id": 3, "label": "c"}, {"id": 4, "label": None}])
+
+    assert rows == [{"id": 1, "label": "a", "name": "n1", "modified": None}, None,
+                    {"id": 3, "label": "c", "name": "n3", "modified": None}, None]
+    calls = statement.execute_values.call_args_list
+    assert calls[0][0] == (
+        "select rhnTest.*, new_values.ordering from rhnTest "
+        "join (values %s) as new_values (ordering, id, label) "
+        "on rhnTest.id = new_values.id and rhnTest.label = new_values.label",
+        [(0, 1, "a"), (1, 2, "b"), (2, 3, "c")])
+    assert calls[0][1]["template"] == "(%s, %s::numeric, %s::varchar)"
+    assert calls[1][0] == (
+        "select rhnTest.*, new_values.ordering from rhnTest "
+        "join (values %s) as new_values (ordering, id) "
+        "on rhnTest.id = new_values.id and rhnTest.label is null",
+        [(3, 4)])
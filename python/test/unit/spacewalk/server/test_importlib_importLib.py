@@ -0,0 +1,86 @@
+#!/usr/bin/python3
+import pickle
+import tracemalloc
+
+import pytest
+
+from spacewalk.server.importlib import headerSource
+from spacewalk.server.importlib.importLib import Item, File, Dependency
+
+
+def _file_hash(i):
+    return {
+        "name": "/usr/share/texmf-dist/tex/latex/package%d/file%d.sty" % (i // 50, i),
+        "device": 1, "inode": 1000 + i, "file_mode": 33188,
+        "username": "root", "groupname": "root", "rdev": 0, "file_size": 4096,
+        "mtime": 1600000000, "filedigest": "%064x" % i, "linkto": "", "flags": 0,
+        "verifyflags": -1, "lang": "", "checksum_type": "sha256",
+    }
+
+
+def test_record_dict_api():
+    dep = headerSource.rpmProvides()
+    assert not hasattr(dep, "__dict__")
+    assert list(dep.keys()) == ["name", "version", "flags"]
+    dep.populate({"name": "libfoo.so.1()(64bit)", "version": "", "flags": 0})
+    assert dep["name"] == "libfoo.so.1()(64bit)"
+    assert dep.get("missing", 1) == 1
+
+    # packageImport replaces name and version with the capability
+    del dep["name"]
+    del dep["version"]
+    dep["capability"] = ("libfoo.so.1()(64bit)", "")
+    dep["capability_id"] = 42
+    assert "name" not in dep
+    with pytest.raises(KeyError):
+        dep["name"]
+    assert dict(dep) == {"flags": 0, "capability": ("libfoo.so.1()(64bit)", ""), "capability_id": 42}
+
+    # keys beyond the slots still work
+    dep["sense"] = 8
+    assert dep["sense"] == 8
+    assert dep == {"flags": 0, "capability": ("libfoo.so.1()(64bit)", ""), "capability_id": 42, "sense": 8}
+
+    copy = pickle.loads(pickle.dumps(dep))
+    assert isinstance(copy, headerSource.rpmProvides)
+    assert copy == dep
+    assert "name" not in copy
+
+
+def test_rpm_file_populate():
+    f = headerSource.rpmFile()
+    assert not hasattr(f, "__dict__")
+    f.populate(_file_hash(1))
+    assert f["checksum"] == "%064x" % 1
+    assert "filedigest" not in f
+    assert f["mtime"] == headerSource.localtime(1600000000)
+
+
+def test_file_records_memory():
+    """Import big packages: slotted, interned records need far less memory than Items"""
+    hashes = [_file_hash(i) for i in range(20000)]
+    for h in hashes:
+        # every header gives its own copy of the repeated strings
+        for k in ("username", "groupname", "checksum_type"):
+            h[k] = "".join(list(h[k]))
+        h["checksum"] = h.pop("filedigest")
+
+    def measure(build):
+        tracemalloc.start()
+        try:
+            records = [build(h) for h in hashes]
+            return tracemalloc.get_traced_memory()[0], records
+        finally:
+            tracemalloc.stop()
+
+    class OldFile(Item):
+        def __init__(self):
+            Item.__init__(self, File.attributeTypes)
+
+    old_size, old_records = measure(lambda h: OldFile().populate(h))
+    new_size, new_records = measure(lambda h: File().populate(h))
+
+    assert [dict(r) for r in new_records] == [dict(r) for r in old_records]
+    assert new_records[0]["username"] is new_records[1]["username"]
+    assert new_size < old_size / 2
+    assert Dependency().populate({"name": "a", "version": "1", "flags": 0})["name"] == "a"
@@ -0,0 +1,42 @@
+#!/usr/bin/python3
+from unittest.mock import MagicMock, patch
+
+from spacewalk.server.handlers.xmlrpc import queue
+
+
+def _queue(pending):
+    with patch("spacewalk.server.rhnHandler.CFG", MagicMock()):
+        q = queue.Queue()
+    q.auth_system = MagicMock()
+    q.server_id = 1000010000
+    q.server = MagicMock()
+    q._invalidate_failed_prereq_actions = MagicMock()
+    cursor = MagicMock()
+    cursor.fetchone_dict.side_effect = [{"?column?": 1} if pending else None, None, None]
+    return q, cursor
+
+
+@patch("spacewalk.server.handlers.xmlrpc.queue.rhnCapability", MagicMock())
+@patch("spacewalk.server.handlers.xmlrpc.queue.CFG", MagicMock(DISABLE_CHECKINS=0))
+def test_get_without_pending_actions_skips_pickup():
+    q, cursor = _queue(pending=False)
+    with patch("spacewalk.server.handlers.xmlrpc.queue.rhnSQL") as rhnSQL:
+        rhnSQL.prepare.return_value = cursor
+        assert q.get("systemid") == ""
+
+    rhnSQL.prepare.assert_called_once_with(queue.Queue._query_queue_pending)
+    rhnSQL.commit.assert_called_once_with()
+    q._invalidate_failed_prereq_actions.assert_not_called()
+    q.server.server_locked.assert_not_called()
+
+
+@patch("spacewalk.server.handlers.xmlrpc.queue.rhnCapability", MagicMock())
+@patch("spacewalk.server.handlers.xmlrpc.queue.CFG", MagicMock(DISABLE_CHECKINS=0))
+def test_get_with_pending_actions_searches_queue():
+    q, cursor = _queue(pending=True)
+    with patch("spacewalk.server.handlers.xmlrpc.queue.rhnSQL") as rhnSQL:
+        rhnSQL.prepare.return_value = cursor
+        assert q.get("systemid") == ""
+
+    assert q._invalidate_failed_prereq_actions.called
+    assert rhnSQL.prepare.call_args[0][0] == queue.Queue._query_queue_get
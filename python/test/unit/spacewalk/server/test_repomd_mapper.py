@@ -0,0 +1,76 @@
+#!/usr/bin/python3
+import datetime
+from unittest.mock import MagicMock, patch
+
+from spacewalk.server.repomd import mapper
+
+BUILD_TIME = datetime.datetime(2023, 1, 2, 3, 4, 5)
+
+
+def _details(package_id, name):
+    return (name, "1.0", "1", None, "x86_64", "abc", "summary", "description", "vendor",
+            BUILD_TIME, 100, 90, 200, 10, 20, "group", "host", "GPL", None, "%s.src.rpm" % name,
+            BUILD_TIME, "sha256", package_id)
+
+
+def _mock_prepare(results):
+    """Return a mocked rhnSQL.prepare whose execute_values returns rows from results keyed on the query"""
+    queries = []
+
+    def execute_values(query, values, template=None):
+        queries.append((query, values))
+        ids = set(v[0] for v in values)
+        for key, rows in results.items():
+            if key in query:
+                return [row for row in rows if row[-1] in ids]
+        return []
+
+    cursor = MagicMock()
+    cursor.execute_values.side_effect = execute_values
+    return MagicMock(return_value=cursor), queries
+
+
+@patch("spacewalk.server.repomd.mapper.string_to_unicode", lambda text: text)
+def test_get_packages_loads_batches():
+    prepare, queries = _mock_prepare({
+        "p.build_time": [_details(1, "foo"), _details(2, "bar"), _details(3, "baz")],
+        "dep.sense": [("requires", 12, "libfoo", "1.0-1", 1), ("provides", 8, "bar", "1:2.0", 2)],
+        "pf.package_id": [("/usr/bin/foo", 1), ("/usr/bin/bar", 2)],
+        "cl.text": [("author", "text", BUILD_TIME, 3)],
+    })
+    with patch("spacewalk.server.repomd.mapper.rhnSQL.prepare", prepare):
+        package_mapper = mapper.SqlPackageMapper()
+        package_mapper.batch_size = 2
+        packages = list(package_mapper.get_packages([3, 1, 4, 2]))
+
+    # package 4 does not exist anymore
+    assert [p.id for p in packages] == [3, 1, 2]
+    assert [p.name for p in packages] == ["baz", "foo", "bar"]
+    assert packages[1].requires == [
+        {"name": "libfoo", "flag": "GE", "version": "1.0", "release": "1", "epoch": 0}]
+    assert packages[2].provides == [
+        {"name": "bar", "flag": "EQ", "version": "2.0", "release": None, "epoch": "1"}]
+    assert packages[1].files == ["/usr/bin/foo"]
+    assert packages[0].changelog[0]["author"] == "author"
+    assert packages[0].filename == "baz-1.0-1.x86_64.rpm"
+    # 2 batches of 4 queries each
+    assert len(queries) == 8
+    assert [q[1] for q in queries[::4]] == [[(3,), (1,)], [(4,), (2,)]]
+
+
+def test_cached_package_mapper_loads_missing_packages_in_batches():
+    sql_mapper = MagicMock()
+    sql_mapper.batch_size = 500
+    sql_mapper.last_modified_many.return_value = {1: "20230102030405", 2: "20230102030405"}
+    sql_mapper.get_packages.side_effect = lambda ids: [MagicMock(id=i) for i in ids]
+
+    cached_mapper = mapper.CachedPackageMapper(sql_mapper)
+    cached_mapper.cache = MagicMock()
+    cached_mapper.cache.has_key.side_effect = lambda key, modified: key == "repomd-packages/1"
+    cached_mapper.cache.get.return_value = MagicMock(id=1)
+    packages = list(cached_mapper.get_packages([2, 1]))
+
+    assert [p.id for p in packages] == [2, 1]
+    sql_mapper.get_packages.assert_called_once_with([2])
+    cached_mapper.cache.set.assert_called_once_with("repomd-packages/2", packages[0], "20230102030405")
+    sql_mapper.get_package.assert_not_called()
@@ -0,0 +1,67 @@
+#!/usr/bin/python3
+import io
+from unittest.mock import MagicMock, patch
+
+from spacewalk.server.repomd import repository, view
+from spacewalk.server.repomd.domain import Channel, Package
+
+
+def _package(package_id):
+    package = Package(package_id)
+    package.name = "pkg%d" % package_id
+    package.version = "1.0"
+    package.release = "1"
+    package.arch = "x86_64"
+    package.checksum = "checksum%d" % package_id
+    return package
+
+
+def _generate(channel, package_mapper):
+    views = [view.FilelistsView(channel, MagicMock()), view.OtherView(channel, MagicMock())]
+    output = [io.StringIO(), io.StringIO()]
+    for v, out in zip(views, output):
+        v.fileobj.write.side_effect = out.write
+    repo = repository.Repository({"id": channel.id, "last_modified": "20230101000000"})
+    repo._channel = channel
+    with patch("spacewalk.server.repomd.repository.mapper.get_package_mapper",
+               MagicMock(return_value=package_mapper)):
+        repo.generate_files(views)
+    return [out.getvalue() for out in output]
+
+
+def test_fragment_cache_evicts_least_recently_used():
+    cache = repository.FragmentCache(10)
+    cache.set("primary", 1, "1", "aaaa")
+    cache.set("primary", 2, "1", "bbbb")
+    assert cache.get("primary", 1, "1") == "aaaa"
+    cache.set("primary", 3, "1", "cccc")
+
+    assert cache.get("primary", 2, "1") is None
+    assert cache.get("primary", 1, "1") == "aaaa"
+    assert cache.get("primary", 3, "1") == "cccc"
+    assert cache.get("primary", 3, "2") is None
+    assert cache.stats() == {"fragments": 2, "size": 8, "hits": 3, "misses": 2, "evictions": 1}
+
+
+@patch("spacewalk.server.repomd.repository.fragment_cache", repository.FragmentCache(1024 * 1024))
+def test_generate_files_splices_cached_fragments():
+    package_mapper = MagicMock()
+    package_mapper.batch_size = 500
+    package_mapper.last_modified_many.side_effect = lambda ids: dict((i, "20230101000000") for i in ids)
+    package_mapper.get_packages.side_effect = lambda ids: [_package(i) for i in ids]
+
+    channel = Channel(1)
+    channel.num_packages = 2
+    channel.package_ids = [1, 2]
+    first = _generate(channel, package_mapper)
+    package_mapper.get_packages.assert_called_once_with([1, 2])
+    assert '<package pkgid="checksum2" name="pkg2" arch="x86_64">' in first[0]
+
+    # A clone sharing package 2 loads only its other package from the db
+    clone = Channel(2)
+    clone.num_packages = 2
+    clone.package_ids = [2, 3]
+    cloned = _generate(clone, package_mapper)
+    package_mapper.get_packages.assert_called_with([3])
+    assert first[1].split("  <package")[2].replace("</otherdata>", "") == cloned[1].split("  <package")[1]
+    assert repository.fragment_cache.stats()["hits"] == 2
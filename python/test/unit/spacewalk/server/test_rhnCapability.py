@@ -0,0 +1,74 @@
+#!/usr/bin/python3
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from spacewalk.common import rhnCache, rhnFlags
+from spacewalk.server import rhnCapability
+
+CAPABILITIES = ["caneatCheese(1)=1", "packages.runTransaction(1)=1", "packages.update(1-2)=2"]
+
+
+@pytest.fixture
+def cache():
+    """In-memory rhnCache: an entry is only returned for the same modified time"""
+    entries = {}
+
+    def cache_get(name, modified=None, **kwargs):
+        value, entry_modified = entries.get(name, (None, None))
+        if modified is not None and entry_modified != modified:
+            return None
+        return value
+
+    def cache_set(name, value, modified=None, **kwargs):
+        entries[name] = (value, modified)
+
+    with patch.object(rhnCache, "get", cache_get), patch.object(rhnCache, "set", cache_set):
+        yield entries
+
+
+@pytest.fixture
+def prepare():
+    cursor = MagicMock()
+    cursor.fetchone_dict.return_value = None
+    with patch("spacewalk.server.rhnCapability.rhnSQL") as rhnSQL:
+        rhnSQL.prepare.return_value = cursor
+        yield rhnSQL
+
+
+def test_update_client_capabilities_skips_unchanged(cache, prepare):
+    rhnFlags.reset()
+    rhnCapability.set_client_capabilities(CAPABILITIES)
+
+    rhnCapability.update_client_capabilities(1000010000)
+    cursor = prepare.prepare.return_value
+    assert cursor.execute.call_count == 1
+    assert cursor.executemany.call_args[1]["capability"] == [
+        "caneatCheese", "packages.runTransaction", "packages.update"]
+
+    # the next check-in with the same capabilities does not query the db
+    prepare.prepare.reset_mock()
+    rhnCapability.update_client_capabilities(1000010000)
+    prepare.prepare.assert_not_called()
+
+    # neither does another server
+    rhnCapability.update_client_capabilities(1000010001)
+    assert prepare.prepare.called
+
+    # changed capabilities are written again
+    prepare.prepare.reset_mock()
+    rhnCapability.set_client_capabilities(CAPABILITIES[:2] + ["packages.update(1-3)=2"])
+    rhnCapability.update_client_capabilities(1000010000)
+    assert prepare.prepare.called
+
+
+def test_update_client_capabilities_cache_expires(cache, prepare):
+    rhnFlags.reset()
+    rhnCapability.set_client_capabilities(CAPABILITIES)
+
+    with patch("spacewalk.server.rhnCapability.time.time", MagicMock(return_value=7200)):
+        rhnCapability.update_client_capabilities(1000010000)
+    prepare.prepare.reset_mock()
+    with patch("spacewalk.server.rhnCapability.time.time", MagicMock(return_value=7200 + 3600)):
+        rhnCapability.update_client_capabilities(1000010000)
+    assert prepare.prepare.called
@@ -0,0 +1,69 @@
+#!/usr/bin/python3
+import hashlib
+import io
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from spacewalk.common.rhnException import rhnFault
+from spacewalk.server import rhnPackageUpload
+
+PAYLOAD = b"package payload " * 1000
+NEVRA = ("foo", None, "1.0", "1", "x86_64")
+
+
+class FakePackage(object):
+    """Package whose payload is hashed like A_Package does"""
+
+    def __init__(self, checksum_type):
+        self.checksum_type = checksum_type
+        self.extra_checksum_types = ()
+        self.checksums = {}
+        self.checksum = None
+
+    def read_header(self):
+        pass
+
+    def save_payload(self, output_stream):
+        for hashtype in (self.checksum_type, ) + tuple(self.extra_checksum_types):
+            self.checksums[hashtype] = hashlib.new(hashtype, PAYLOAD).hexdigest()
+        self.checksum = self.checksums[self.checksum_type]
+        output_stream.write(PAYLOAD)
+
+
+@pytest.fixture
+def package():
+    pkg = FakePackage("sha256")
+    with patch.object(rhnPackageUpload.rhn_pkg, "package_from_stream", MagicMock(return_value=pkg)), \
+            patch.object(rhnPackageUpload.CFG, "MOUNT_POINT", "/pub", create=True), \
+            patch.object(rhnPackageUpload.CFG, "PREPENDED_DIR", "", create=True), \
+            patch("spacewalk.server.rhnPackageUpload.os.path.isdir", MagicMock(return_value=True)), \
+            patch("spacewalk.server.rhnPackageUpload.tempfile.NamedTemporaryFile", MagicMock()):
+        yield pkg
+
+
+def _save(checksum_type, checksum):
+    return rhnPackageUpload.save_uploaded_package(io.BytesIO(PAYLOAD), NEVRA, "1", "rpm",
+                                                  checksum_type, checksum)
+
+
+@pytest.mark.parametrize("checksum_type", ["sha256", "sha512"])
+def test_save_uploaded_package_verifies_checksum(package, checksum_type):
+    assert _save(checksum_type, hashlib.new(checksum_type, PAYLOAD).hexdigest()) is package
+    assert package.checksum == hashlib.sha256(PAYLOAD).hexdigest()
+
+
+@pytest.mark.parametrize("checksum_type", ["sha256", "sha384"])
+def test_save_uploaded_package_mismatch(package, checksum_type):
+    with pytest.raises(rhnFault) as e:
+        _save(checksum_type, hashlib.new(checksum_type, b"other").hexdigest())
+    assert e.value.code == 104
+
+
+@pytest.mark.parametrize("checksum_type", ["md5", "sha1", "unknown"])
+def test_save_uploaded_package_unsupported_checksum_type(package, checksum_type):
+    package.save_payload = MagicMock()
+    with pytest.raises(rhnFault) as e:
+        _save(checksum_type, "0123456789abcdef")
+    assert e.value.code == 104
+    package.save_payload.assert_not_called()
@@ -0,0 +1,100 @@
+#!/usr/bin/python3
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from spacewalk.common.rhnException import rhnFault
+from spacewalk.server.rhnServer import server_packages
+
+ARCHES = {"x86_64": (120, "rpm"), "noarch": (100, "rpm"), "amd64-deb": (200, "deb")}
+
+
+def _nvre_compare(t1, t2):
+    """Compare numeric versions like rpm does, 51 and 0051 are identical"""
+    assert t1[0] == t2[0]
+    v1, v2 = int(t1[1]), int(t2[1])
+    return (v1 > v2) - (v1 < v2)
+
+
+@pytest.fixture
+def nvre_compare():
+    with patch("spacewalk.server.rhnServer.server_packages.rhn_rpm.nvre_compare",
+               MagicMock(side_effect=_nvre_compare)) as compare:
+        yield compare
+
+
+@pytest.fixture
+def rhnSQL():
+    cursor = MagicMock()
+
+    def execute_values(statement, values, template=None):
+        if "lookup_package_name" in statement:
+            return [(v[0], 1000 + i) for i, v in enumerate(values)]
+        return [tuple(v) + (2000 + i,) for i, v in enumerate(values)]
+
+    cursor.execute_values.side_effect = execute_values
+    with patch("spacewalk.server.rhnServer.server_packages.rhnSQL") as sql, \
+            patch("spacewalk.server.rhnServer.server_packages._package_arches", ARCHES):
+        sql.prepare.return_value = cursor
+        yield sql
+
+
+def _package(name, version, arch="x86_64"):
+    return {"name": name, "version": version, "release": "1", "epoch": "", "arch": arch}
+
+
+def test_package_delta(nvre_compare):
+    list1 = [("foo", "51", "1", ""), ("bar", "1", "1", ""), ("baz", "1", "1", "")]
+    list2 = [("foo", "0051", "1", ""), ("bar", "2", "1", ""), ("baz", "1", "1", ""),
+             ("new", "1", "1", "")]
+
+    installs, removes = server_packages.package_delta(list1, list2)
+
+    assert installs == [("bar", "2", "1", ""), ("new", "1", "1", "")]
+    assert removes == [("bar", "1", "1", "")]
+    # baz is identical in both lists and not compared
+    assert all(c[0][0][0] != "baz" for c in nvre_compare.call_args_list)
+
+
+def test_package_delta_large_profile(nvre_compare):
+    profile = [("package%d" % i, str(v), "1", "") for i in range(5000) for v in (1, 2)]
+    updated = profile[:-1] + [("package4999", "3", "1", "")]
+
+    installs, removes = server_packages.package_delta(profile, updated)
+
+    assert installs == [("package4999", "3", "1", "")]
+    assert removes == [("package4999", "2", "1", "")]
+    # only the versions of the changed package are compared
+    assert nvre_compare.call_count == 4
+
+
+def test_save_packages_byid_resolves_ids_in_bulk(rhnSQL):
+    packages = server_packages.Packages()
+    packages._Packages__loaded = 1
+    for p in [_package("foo", "1"), _package("bar", "1", "noarch"), _package("foo", "1", "noarch")]:
+        packages.add_package(1000010000, p)
+
+    with patch("spacewalk.server.rhnServer.server_packages.check_entitlement", MagicMock(return_value={})):
+        packages.save_packages_byid(1000010000, schedule=0)
+
+    cursor = rhnSQL.prepare.return_value
+    assert [c[0][1] for c in cursor.execute_values.call_args_list] == [
+        [("bar",), ("foo",)],
+        [(None, "1", "1", "rpm")],
+    ]
+    cursor.executemany.assert_called_once()
+    data = cursor.executemany.call_args[1]
+    assert data["name_id"] == [1001, 1000, 1001]
+    assert data["evr_id"] == [2000] * 3
+    assert data["package_arch_id"] == [120, 100, 100]
+
+
+def test_save_packages_byid_unknown_arch(rhnSQL):
+    packages = server_packages.Packages()
+    packages._Packages__loaded = 1
+    packages.add_package(1000010000, dict(_package("foo", "1", "unknown"), type="rpm"))
+
+    with pytest.raises(rhnFault) as e:
+        packages.save_packages_byid(1000010000, schedule=0)
+    assert e.value.code == 45
+    rhnSQL.prepare.return_value.executemany.assert_not_called()
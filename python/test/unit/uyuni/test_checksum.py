@@ -0,0 +1,142 @@
+#!/usr/bin/python3
+import hashlib
+import io
+import os
+from unittest.mock import patch
+
+import pytest
+
+from uyuni.common import checksum
+from uyuni.common.rhn_pkg import A_Package
+
+TYPES = ['md5', 'sha1', 'sha256']
+
+
+@pytest.fixture
+def data_file(tmp_path):
+    data = os.urandom(3 * 1048576 + 12345)
+    path = tmp_path / "package.rpm"
+    path.write_bytes(data)
+    return str(path), data
+
+
+class CountingFile(io.BufferedReader):
+    """File counting the bytes read from it"""
+
+    bytes_read = 0
+
+    def read(self, size=-1):
+        data = io.BufferedReader.read(self, size)
+        self.bytes_read += len(data)
+        return data
+
+    def readinto(self, b):
+        n = io.BufferedReader.readinto(self, b)
+        self.bytes_read += n or 0
+        return n
+
+
+class ReadOnlyFile(object):
+    """File object without readinto() or fileno()"""
+
+    def __init__(self, data):
+        self._f = io.BytesIO(data)
+        self.read = self._f.read
+        self.seek = self._f.seek
+
+
+def test_checksums(data_file):
+    path, data = data_file
+    expected = dict((t, hashlib.new(t, data).hexdigest()) for t in TYPES)
+
+    assert checksum.getFileChecksums(TYPES, filename=path) == expected
+    assert checksum.getFileChecksums(TYPES, filename=path, use_mmap=True) == expected
+    with open(path, 'rb') as f:
+        assert checksum.getFileChecksums(TYPES, fd=f.fileno()) == expected
+        assert checksum.getFileChecksums(TYPES, fd=f.fileno(), use_mmap=True) == expected
+        assert checksum.getFileChecksums(TYPES, file_obj=f, buffer_size=65536) == expected
+        assert f.tell() == 0
+    assert checksum.getFileChecksums(TYPES, file_obj=ReadOnlyFile(data)) == expected
+    assert checksum.getFileChecksums(['sha', 'sha1'], filename=path) == {
+        'sha': expected['sha1'], 'sha1': expected['sha1']}
+    assert checksum.getFileChecksum('sha256', filename=path) == expected['sha256']
+
+
+def test_checksums_max_size(data_file):
+    path, data = data_file
+    head = hashlib.sha256(data[:1000000]).hexdigest()
+
+    assert checksum.getFileChecksums(['sha256'], filename=path, max_size=1000000)['sha256'] == head
+    assert checksum.getFileChecksums(['sha256'], filename=path, max_size=1000000,
+                                     use_mmap=True)['sha256'] == head
+    assert checksum.getFileChecksums(['sha256'], file_obj=ReadOnlyFile(data),
+                                     buffer_size=65536, max_size=1000000)['sha256'] == head
+    # a cap beyond the end of the file hashes all of it
+    assert checksum.getFileChecksums(['sha256'], filename=path, max_size=len(data) * 2)['sha256'] == \
+        hashlib.sha256(data).hexdigest()
+
+
+def test_checksums_empty_file(tmp_path):
+    path = tmp_path / "empty"
+    path.write_bytes(b"")
+    assert checksum.getFileChecksums(['md5'], filename=str(path)) == {'md5': hashlib.md5().hexdigest()}
+    assert checksum.getFileChecksums(['md5'], filename=str(path), use_mmap=True) == \
+        {'md5': hashlib.md5().hexdigest()}
+
+
+def test_checksums_mapped_on_request(data_file):
+    path, data = data_file
+    with patch.object(checksum.mmap, "mmap", side_effect=checksum.mmap.mmap) as mapped:
+        checksum.getFileChecksums(['sha256'], filename=path)
+        mapped.assert_not_called()
+        checksum.getFileChecksums(['sha256'], filename=path, use_mmap=True)
+        mapped.assert_called_once()
+
+
+def test_multi_hash():
+    m = checksum.MultiHash(['md5', 'sha256'])
+    m.update(b"foo")
+    m.update(memoryview(b"bar"))
+    assert m.hexdigests() == {'md5': hashlib.md5(b"foobar").hexdigest(),
+                              'sha256': hashlib.sha256(b"foobar").hexdigest()}
+
+
+def test_checksums_single_pass(tmp_path):
+    """Several digests of a big file: one pass instead of one per digest"""
+    path = str(tmp_path / "big.rpm")
+    with open(path, 'wb') as f:
+        chunk = os.urandom(1048576)
+        for _i in range(16):
+            f.write(chunk)
+
+    def read_counted(hash_all):
+        with CountingFile(io.FileIO(path)) as f:
+            digests = hash_all(f)
+            return f.bytes_read, digests
+
+    def separately(f):
+        return dict((t, checksum.getFileChecksum(t, file_obj=f)) for t in TYPES)
+
+    def together(f):
+        return checksum.getFileChecksums(TYPES, file_obj=f)
+
+    separate_read, separate_digests = read_counted(separately)
+    single_read, single_digests = read_counted(together)
+
+    assert single_read == 16 * 1048576
+    assert separate_read == 3 * single_read
+    assert single_digests == separate_digests
+    assert checksum.getFileChecksums(TYPES, filename=path, use_mmap=True) == single_digests
+
+
+def test_package_extra_checksums():
+    """The payload is hashed once for the package checksum and the extra types"""
+    data = os.urandom(100000)
+    a_pkg = A_Package(io.BytesIO(data))
+    a_pkg.extra_checksum_types = ('sha256', )
+    out = io.BytesIO()
+    a_pkg.save_payload(out)
+
+    assert out.getvalue() == data
+    assert a_pkg.checksum == hashlib.md5(data).hexdigest()
+    assert a_pkg.checksums == {'md5': a_pkg.checksum, 'sha256': hashlib.sha256(data).hexdigest()}
@@ -13,7 +13,9 @@
 # in this software or its documentation.
 #
 
+import mmap
 import os
+import stat
 
 try:
     import hashlib
@@ -42,6 +44,10 @@ except ImportError:
             else:
                 raise ValueError("Incompatible checksum type")
 
+# Size of the chunks hashed at once
+BUFFER_SIZE = 1048576
+
+
 def getHashlibInstance(hash_type, used_for_security):
     """Get an instance of a hashlib object.
     """
@@ -51,18 +57,49 @@ def getHashlibInstance(hash_type, used_for_security):
         return hashlib.new(hash_type)
 
 
+class MultiHash(object):
+    """ Computes the checksums of several types over the same data
+    """
+
+    def __init__(self, hashtypes, used_for_security=False):
+        self._types = list(hashtypes)
+        self._hashes = {}
+        for hashtype in self._types:
+            name = _hashlib_name(hashtype)
+            if name not in self._hashes:
+                self._hashes[name] = getHashlibInstance(name, used_for_security)
+        self._updates = [m.update for m in self._hashes.values()]
+
+    def update(self, data):
+        for update in self._updates:
+            update(data)
+
+    def hexdigests(self):
+        """ Returns {hashtype: hexdigest} """
+        return dict((hashtype, self._hashes[_hashlib_name(hashtype)].hexdigest())
+                    for hashtype in self._types)
+
+
 def getFileChecksum(hashtype, filename=None, fd=None, file_obj=None, buffer_size=None, used_for_security=False):
     """ Compute a file's checksum
         Used by rotateFile()
     """
+    return getFileChecksums([hashtype], filename=filename, fd=fd, file_obj=file_obj,
+                            buffer_size=buffer_size, used_for_security=used_for_security)[hashtype]
 
-    # python's md5 lib sucks
-    # there's no way to directly import a file.
-    if buffer_size is None:
-        buffer_size = 65536
 
-    if hashtype == 'sha':
-        hashtype = 'sha1'
+def getFileChecksums(hashtypes, filename=None, fd=None, file_obj=None, buffer_size=None,
+                     used_for_security=False, max_size=None, use_mmap=False):
+    """ Compute several checksums of a file reading it only once
+        The file is read into a reused buffer. With use_mmap, a regular
+        file given by filename or fd is mapped in memory instead; only use
+        it for local files that are not modified meanwhile, as a file
+        truncated while it is mapped kills the process with SIGBUS.
+        Only the first max_size bytes are hashed if max_size is set.
+        Returns {hashtype: hexdigest}
+    """
+    if buffer_size is None:
+        buffer_size = BUFFER_SIZE
 
     if filename is None and fd is None and file_obj is None:
         raise ValueError("no file specified")
@@ -72,26 +109,87 @@ def getFileChecksum(hashtype, filename=None, fd=None, file_obj=None, buffer_size
         f = os.fdopen(os.dup(fd), "rb")
     else:
         f = open(filename, "rb")
-    # Rewind it
-    f.seek(0, 0)
-    m = getHashlibInstance(hashtype, used_for_security)
-    while 1:
+
+    m = MultiHash(hashtypes, used_for_security)
+    try:
+        # Rewind it
+        f.seek(0, 0)
+        if not use_mmap or file_obj is not None or not _hash_mapped(f, m, buffer_size, max_size):
+            _hash_read(f, m, buffer_size, max_size)
+    finally:
+        # cleanup time
+        if file_obj is not None:
+            file_obj.seek(0, 0)
+        else:
+            f.close()
+    return m.hexdigests()
+
+
+def _hashlib_name(hashtype):
+    if hashtype == 'sha':
+        return 'sha1'
+    return hashtype
+
+
+def _hash_mapped(f, m, buffer_size, max_size):
+    """ Hash the regular file f mapped in memory; False if it can't be mapped """
+    try:
+        st = os.fstat(f.fileno())
+    except (AttributeError, OSError, ValueError):
+        return False
+    size = st.st_size
+    if max_size is not None:
+        size = min(size, max_size)
+    if not stat.S_ISREG(st.st_mode) or size == 0:
+        return False
+    try:
+        mapped = mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ)
+    except (EnvironmentError, ValueError):
+        return False
+    try:
+        view = memoryview(mapped)
+    except TypeError:
+        # python 2 maps don't support the buffer protocol
+        mapped.close()
+        return False
+    try:
+        # hash chunk by chunk, so every chunk is still cached for the
+        # next digest
+        for offset in range(0, size, buffer_size):
+            m.update(view[offset:offset + buffer_size])
+    finally:
+        # the map can't be closed while it is referenced
+        del view
+        mapped.close()
+    return True
+
+
+def _hash_read(f, m, buffer_size, max_size):
+    """ Hash f read into a reused buffer, or with read() if it has no readinto() """
+    remaining = max_size
+    readinto = getattr(f, 'readinto', None)
+    if readinto is not None:
+        view = memoryview(bytearray(buffer_size))
+    while remaining is None or remaining > 0:
+        size = buffer_size
+        if remaining is not None:
+            size = min(size, remaining)
         try:
-            buf = f.read(buffer_size)
+            if readinto is not None:
+                n = readinto(view[:size]) or 0
+                chunk = view[:n]
+            else:
+                chunk = f.read(size)
+                n = len(chunk)
         except:  # pylint: disable=W0702,W0703
             # No need to know exact root cause of the exception.
             # Will produce checksum other than expected for such case.
             break
-        if not buf:
+        if not n:
             break
-        m.update(buf)
-
-    # cleanup time
-    if file_obj is not None:
-        file_obj.seek(0, 0)
-    else:
-        f.close()
-    return m.hexdigest()
+        m.update(chunk)
+        if remaining is not None:
+            remaining -= n
 
 
 def getStringChecksum(hashtype, s):
@@ -24,7 +24,6 @@ from debian import debfile
 from debian.deb822 import Deb822
 
 from uyuni.common.usix import raise_with_tb
-from uyuni.common import checksum
 from uyuni.common.rhn_pkg import A_Package, InvalidPackageError
 
 # bare-except and broad-except
@@ -160,11 +159,11 @@ class DEB_Package(A_Package):
             raise_with_tb(InvalidPackageError(e), sys.exc_info()[2])
 
     def save_payload(self, output_stream):
-        c_hash = checksum.getHashlibInstance(self.checksum_type, False)
+        c_hash = self._payload_hash()
         if output_stream:
             output_start = output_stream.tell()
         self._stream_copy(self.header_data, output_stream, c_hash)
-        self.checksum = c_hash.hexdigest()
+        self._set_checksums(c_hash)
         if output_stream:
             self.payload_stream = output_stream
             self.payload_size = output_stream.tell() - output_start
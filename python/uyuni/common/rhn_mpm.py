@@ -35,7 +35,6 @@ from uyuni.common import fileutils
 from uyuni.common.usix import ListType, TupleType
 
 from uyuni.common.usix import raise_with_tb
-from uyuni.common import checksum
 from uyuni.common.rhn_pkg import A_Package, InvalidPackageError
 
 # bare-except and broad-except
@@ -288,9 +287,9 @@ class MPM_Package(A_Package):
 
     def save_payload(self, output_stream):
         self.payload_stream = self.input_stream
-        c_hash = checksum.getHashlibInstance(self.header.checksum_type(), False)
+        c_hash = self._payload_hash(self.header.checksum_type())
         self._encode_payload(output_stream, c_hash)
-        self.checksum = c_hash.hexdigest()
+        self._set_checksums(c_hash, self.header.checksum_type())
         if output_stream:
             self.payload_stream = output_stream
 
@@ -83,6 +83,9 @@ class A_Package:
         self.input_stream = input_stream
         self.checksum_type = DEFAULT_CHECKSUM_TYPE
         self.checksum = None
+        # checksums of other types computed along with checksum
+        self.extra_checksum_types = ()
+        self.checksums = {}
         self.payload_stream = None
         self.payload_size = None
 
@@ -92,11 +95,11 @@ class A_Package:
 
     def save_payload(self, output_stream):
         """saves payload to output_stream"""
-        c_hash = checksum.getHashlibInstance(self.checksum_type, False)
+        c_hash = self._payload_hash()
         if output_stream:
             output_start = output_stream.tell()
         self._stream_copy(self.input_stream, output_stream, c_hash)
-        self.checksum = c_hash.hexdigest()
+        self._set_checksums(c_hash)
         if output_stream:
             self.payload_stream = output_stream
             self.payload_size = output_stream.tell() - output_start
@@ -119,6 +122,15 @@ class A_Package:
             self.checksum_type = ctype
             self.payload_checksum()
 
+    def _payload_hash(self, checksum_type=None):
+        """hash of checksum_type and of the extra_checksum_types"""
+        checksum_type = checksum_type or self.checksum_type
+        return checksum.MultiHash((checksum_type, ) + tuple(self.extra_checksum_types))
+
+    def _set_checksums(self, c_hash, checksum_type=None):
+        self.checksums = c_hash.hexdigests()
+        self.checksum = self.checksums[checksum_type or self.checksum_type]
+
     @staticmethod
     def _stream_copy(source, dest, c_hash=None):
         """copies data from the source stream to the destination stream"""
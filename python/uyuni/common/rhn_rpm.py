@@ -23,7 +23,6 @@ import rpm
 
 from uyuni.common.usix import raise_with_tb
 from uyuni.common.usix import next as usix_next
-from uyuni.common import checksum
 from uyuni.common.rhn_pkg import A_Package, InvalidPackageError
 from rhn.stringutils import sstr
 
@@ -286,13 +285,13 @@ class RPM_Package(A_Package):
         return header_size
 
     def save_payload(self, output_stream):
-        c_hash = checksum.getHashlibInstance(self.checksum_type, False)
+        c_hash = self._payload_hash()
         if output_stream:
             output_start = output_stream.tell()
         self.header_data.seek(0, 0)
         self._stream_copy(self.header_data, output_stream, c_hash)
         self._stream_copy(self.input_stream, output_stream, c_hash)
-        self.checksum = c_hash.hexdigest()
+        self._set_checksums(c_hash)
         self.header_data.close()
         if output_stream:
             self.payload_stream = output_stream
@@ -0,0 +1,27 @@
+CREATE OR REPLACE FUNCTION suse_salt_pillar_notify_trig_fun() RETURNS TRIGGER AS $$
+DECLARE
+  target RECORD;
+BEGIN
+  IF TG_OP = 'DELETE' THEN
+    target := OLD;
+  ELSE
+    target := NEW;
+  END IF;
+  -- let the salt master drop its cached pillar of the changed target
+  PERFORM pg_notify('suse_salt_pillar', CASE
+    WHEN target.server_id IS NOT NULL THEN 'server:' || target.server_id
+    WHEN target.group_id IS NOT NULL THEN 'group:' || target.group_id
+    WHEN target.org_id IS NOT NULL THEN 'org:' || target.org_id
+    ELSE 'global'
+  END);
+  IF TG_OP = 'UPDATE' AND (OLD.server_id, OLD.group_id, OLD.org_id) IS DISTINCT FROM (NEW.server_id, NEW.group_id, NEW.org_id) THEN
+    PERFORM pg_notify('suse_salt_pillar', 'all');
+  END IF;
+  RETURN NULL;
+END $$ LANGUAGE PLPGSQL;
+
+DROP TRIGGER IF EXISTS suse_salt_pillar_notify_trig ON suseSaltPillar;
+
+CREATE TRIGGER suse_salt_pillar_notify_trig
+AFTER INSERT OR UPDATE OR DELETE ON suseSaltPillar
+FOR EACH ROW EXECUTE PROCEDURE suse_salt_pillar_notify_trig_fun();
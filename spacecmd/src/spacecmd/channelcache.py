@@ -0,0 +1,181 @@
+#
+# Licensed under the GNU General Public License Version 3
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright (c) 2023 SUSE LLC
+#
+
+"""
+On-disk cache of the packages and errata of the software channels.
+
+Every channel is stored together with its last_modified date, so only
+the channels which changed on the server have to be fetched again.
+"""
+
+import logging
+import sqlite3
+from datetime import datetime
+
+from spacecmd.i18n import _N
+
+PACKAGES = 'packages'
+ERRATA = 'errata'
+
+ERRATA_FIELDS = ('id', 'advisory_name', 'advisory_type', 'advisory_status',
+                 'date', 'advisory_synopsis')
+
+_DATE_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS expire (
+    kind TEXT PRIMARY KEY,
+    expire TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS channels (
+    kind TEXT NOT NULL,
+    label TEXT NOT NULL,
+    last_modified TEXT NOT NULL,
+    PRIMARY KEY (kind, label)
+);
+CREATE TABLE IF NOT EXISTS packages (
+    channel TEXT NOT NULL,
+    id INTEGER,
+    name TEXT,
+    longname TEXT
+);
+CREATE INDEX IF NOT EXISTS packages_channel_idx ON packages (channel);
+CREATE TABLE IF NOT EXISTS errata (
+    channel TEXT NOT NULL,
+    id INTEGER,
+    advisory_name TEXT,
+    advisory_type TEXT,
+    advisory_status TEXT,
+    date TEXT,
+    advisory_synopsis TEXT
+);
+CREATE INDEX IF NOT EXISTS errata_channel_idx ON errata (channel);
+"""
+
+
+class ChannelCache(object):
+    """
+    sqlite backed cache of the packages and errata of each channel
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = None
+
+    def _connect(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path)
+            self._conn.executescript(_SCHEMA)
+        return self._conn
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def get_expire(self, kind):
+        """
+        Returns the expiration date of the cache of kind,
+        now if it has never been generated.
+        """
+        try:
+            row = self._connect().execute(
+                'SELECT expire FROM expire WHERE kind = ?', (kind, )).fetchone()
+            if row:
+                return datetime.strptime(row[0], _DATE_FORMAT)
+        except (sqlite3.Error, ValueError) as exc:
+            logging.warning(_N("Couldn't load cache from %s"), self.path)
+            logging.debug(str(exc))
+
+        return datetime.now()
+
+    def set_expire(self, kind, expire):
+        try:
+            conn = self._connect()
+            conn.execute('INSERT OR REPLACE INTO expire VALUES (?, ?)',
+                         (kind, expire.strftime(_DATE_FORMAT)))
+            conn.commit()
+        except sqlite3.Error as exc:
+            logging.error(_N("Couldn't write to %s"), self.path)
+            logging.debug(str(exc))
+
+    def get_last_modified(self, kind):
+        """
+        Returns {label: last_modified} of the cached channels.
+        """
+        try:
+            return dict(self._connect().execute(
+                'SELECT label, last_modified FROM channels WHERE kind = ?', (kind, )))
+        except sqlite3.Error as exc:
+            logging.warning(_N("Couldn't load cache from %s"), self.path)
+            logging.debug(str(exc))
+            return {}
+
+    def store(self, kind, label, last_modified, rows):
+        """
+        Replaces the cached rows of the channel label: (id, name, longname)
+        tuples for packages, tuples of ERRATA_FIELDS for errata.
+        """
+        placeholders = ', '.join('?' * (len(ERRATA_FIELDS) + 1 if kind == ERRATA else 4))
+        try:
+            conn = self._connect()
+            with conn:
+                conn.execute('DELETE FROM %s WHERE channel = ?' % kind, (label, ))
+                conn.executemany('INSERT INTO %s VALUES (%s)' % (kind, placeholders),
+                                 [(label, ) + tuple(row) for row in rows])
+                conn.execute('INSERT OR REPLACE INTO channels VALUES (?, ?, ?)',
+                             (kind, label, last_modified))
+        except sqlite3.Error as exc:
+            logging.error(_N("Couldn't write to %s"), self.path)
+            logging.debug(str(exc))
+
+    def remove(self, kind, labels):
+        """
+        Removes the channels which are not visible anymore.
+        """
+        try:
+            conn = self._connect()
+            with conn:
+                for label in labels:
+                    conn.execute('DELETE FROM %s WHERE channel = ?' % kind, (label, ))
+                    conn.execute('DELETE FROM channels WHERE kind = ? AND label = ?',
+                                 (kind, label))
+        except sqlite3.Error as exc:
+            logging.error(_N("Couldn't write to %s"), self.path)
+            logging.debug(str(exc))
+
+    def clear(self, kind):
+        self.remove(kind, list(self.get_last_modified(kind)))
+
+    def get_rows(self, kind, labels):
+        """
+        Yields the cached rows of the channels, in the order of labels
+        and in the order they were returned by the server.
+        """
+        try:
+            conn = self._connect()
+            for label in labels:
+                for row in conn.execute('SELECT * FROM %s WHERE channel = ? ORDER BY rowid' % kind,
+                                        (label, )):
+                    yield row[1:]
+        except sqlite3.Error as exc:
+            logging.warning(_N("Couldn't load cache from %s"), self.path)
+            logging.debug(str(exc))
+
@@ -0,0 +1,105 @@
+#
+# Licensed under the GNU General Public License Version 3
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright (c) 2023 SUSE LLC
+#
+
+"""
+Concurrent execution of the API calls of a command, e.g. one or more calls
+for every selected system.
+
+An xmlrpclib.ServerProxy must not be shared between threads, so every
+thread of the pool calls the API over its own connection.
+"""
+
+import threading
+from multiprocessing.pool import ThreadPool
+
+try: # python 3
+    from xmlrpc import client as xmlrpclib
+except ImportError: # python2
+    import xmlrpclib
+
+
+class CallResult(object):
+    """
+    Result of a call for one item: either value or error is set.
+    """
+    __slots__ = ('item', 'value', 'error')
+
+    def __init__(self, item, value=None, error=None):
+        self.item = item
+        self.value = value
+        self.error = error
+
+
+def execute(connect, func, items, threads):
+    """
+    Call func(client, item) for every item with up to threads threads,
+    each with its own client created by connect().  Exceptions are
+    collected instead of being raised.
+
+    :return: list of CallResult in the order of items
+    """
+    items = list(items)
+    local = threading.local()
+
+    def call(item):
+        try:
+            if not hasattr(local, 'client'):
+                local.client = connect()
+            return CallResult(item, value=func(local.client, item))
+        except Exception as exc: # pylint: disable=broad-except
+            return CallResult(item, error=exc)
+
+    threads = min(threads, len(items))
+    if threads <= 1:
+        return [call(item) for item in items]
+
+    pool = ThreadPool(threads)
+    try:
+        return pool.map(call, items)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def map_concurrently(shell, func, items):
+    """
+    Call func(client, item) for every item over up to shell.threads
+    connections to the server of the shell.  With a single thread the
+    calls are done serially with shell.client.
+
+    :return: list of CallResult in the order of items
+    """
+    items = list(items)
+    if shell.threads > 1 and len(items) > 1:
+        connect = lambda: xmlrpclib.Server(shell.server_url)
+    else:
+        connect = lambda: shell.client
+
+    return execute(connect, func, items, shell.threads)
+
+
+def format_error(error):
+    """
+    Message of an exception collected by execute().
+    """
+    if isinstance(error, xmlrpclib.Fault):
+        return error.faultString
+
+    return str(error)
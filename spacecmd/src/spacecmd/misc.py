@@ -47,6 +47,8 @@ except ImportError: # python2
     import xmlrpclib
 from spacecmd.i18n import _N
 from spacecmd.utils import *
+from spacecmd.channelcache import ChannelCache, PACKAGES, ERRATA, ERRATA_FIELDS
+from spacecmd.executor import map_concurrently
 
 translation = gettext.translation('spacecmd', fallback=True)
 try:
@@ -89,6 +91,9 @@ SYSTEM_CACHE_TTL = 3600
 PACKAGE_CACHE_TTL = 86400
 ERRATA_CACHE_TTL = 86400
 
+# number of concurrent connections used by commands
+DEFAULT_THREADS = 4
+
 MINIMUM_API_VERSION = 10.8
 
 SEPARATOR = '\n' + '#' * 30 + '\n'
@@ -288,6 +293,7 @@ def do_login(self, args):
     # connect to the server
     logging.debug('Connecting to %s', server_url)
     self.client = xmlrpclib.Server(server_url, verbose=verbose_xmlrpc)
+    self.server_url = server_url
 
     # check the API to verify connectivity
     # pylint: disable=W0702
@@ -516,6 +522,7 @@ def remove_last_history_item(self):
 def clear_errata_cache(self):
     self.all_errata = {}
     self.errata_cache_expire = datetime.now()
+    self.channel_cache.clear(ERRATA)
     self.save_errata_cache()
 
 
@@ -538,35 +545,95 @@ def get_erratum_name(self, erratum_id):
     return None
 
 
+def _fetch_channel_data(self, method, channels):
+    """
+    Call channel.software.<method> for the channels concurrently.
+
+    :return: {label: result or the xmlrpclib.Fault}
+    """
+    result = {}
+    for r in map_concurrently(self, lambda client, c: getattr(client.channel.software, method)(self.session, c),
+                              channels):
+        if r.error is not None and not isinstance(r.error, xmlrpclib.Fault):
+            raise r.error
+        result[r.item] = r.error if r.error is not None else r.value
+    return result
+
+
+def _refresh_channel_cache(self, kind, method, to_rows, force=False):
+    """
+    Fetch the channels which changed since they were cached, all of them
+    if forced, and store their rows built by to_rows() in the channel cache.
+
+    :return: labels of the accessible channels
+    """
+    channels = self.client.channel.listSoftwareChannels(self.session)
+    channels = [c.get('label') for c in channels]
+
+    cached = self.channel_cache.get_last_modified(kind)
+    details = _fetch_channel_data(self, 'getDetails', channels)
+
+    accessible = []
+    stale = {}
+    for c in channels:
+        if isinstance(details[c], xmlrpclib.Fault):
+            logging.debug('No access to %s (%s): %s', c, details[c].faultCode, details[c].faultString)
+            continue
+
+        accessible.append(c)
+        last_modified = str(details[c].get('last_modified'))
+        if force or cached.get(c) != last_modified:
+            stale[c] = last_modified
+
+    data = _fetch_channel_data(self, method, [c for c in accessible if c in stale])
+    for c in list(accessible):
+        if c not in stale:
+            continue
+        if isinstance(data[c], xmlrpclib.Fault):
+            logging.debug('No access to %s (%s): %s', c, data[c].faultCode, data[c].faultString)
+            accessible.remove(c)
+            continue
+        self.channel_cache.store(kind, c, stale[c], to_rows(data[c]))
+
+    self.channel_cache.remove(kind, [c for c in cached if c not in accessible])
+
+    return accessible
+
+
+def _errata_rows(errata):
+    return [tuple(e.get(f) for f in ERRATA_FIELDS) for e in errata]
+
+
+def _load_errata_cache(self, channels=None):
+    """
+    Load self.all_errata from the channel cache.
+
+    :param channels: labels of the channels, all cached channels if None
+    """
+    if channels is None:
+        channels = sorted(self.channel_cache.get_last_modified(ERRATA))
+
+    self.all_errata = {}
+    for row in self.channel_cache.get_rows(ERRATA, channels):
+        if row[1] not in self.all_errata:
+            self.all_errata[row[1]] = dict(zip(ERRATA_FIELDS, row))
+    self.errata_cache_loaded = True
+
+
 def generate_errata_cache(self, force=False):
     if not force and datetime.now() < self.errata_cache_expire:
+        if not self.errata_cache_loaded:
+            _load_errata_cache(self)
         return
 
     if not self.options.quiet:
         # tell the user what's going on
         self.replace_line_buffer(_('** Generating errata cache **'))
 
-    channels = self.client.channel.listSoftwareChannels(self.session)
-    channels = [c.get('label') for c in channels]
-
-    for c in channels:
-        try:
-            errata = self.client.channel.software.listErrata(self.session, c)
-        except xmlrpclib.Fault as exc:
-            logging.debug('No access to %s (%s): %s', c, exc.faultCode, exc.faultString)
-            continue
+    channels = _refresh_channel_cache(self, ERRATA, 'listErrata', _errata_rows, force)
+    _load_errata_cache(self, channels)
 
-        for erratum in errata:
-            if erratum.get('advisory_name') not in self.all_errata:
-                self.all_errata[erratum.get('advisory_name')] = \
-                    {'id': erratum.get('id'),
-                     'advisory_name': erratum.get('advisory_name'),
-                     'advisory_type': erratum.get('advisory_type'),
-                     'advisory_status': erratum.get('advisory_status'),
-                     'date': erratum.get('date'),
-                     'advisory_synopsis': erratum.get('advisory_synopsis')}
-
-    self.errata_cache_expire = datetime.now() + timedelta(self.ERRATA_CACHE_TTL)
+    self.errata_cache_expire = datetime.now() + timedelta(seconds=self.ERRATA_CACHE_TTL)
     self.save_errata_cache()
 
     if not self.options.quiet:
@@ -575,9 +642,8 @@ def generate_errata_cache(self, force=False):
 
 
 def save_errata_cache(self):
-    save_cache(self.errata_cache_file,
-               self.all_errata,
-               self.errata_cache_expire)
+    # the errata themselves are stored as the channels are refreshed
+    self.channel_cache.set_expire(ERRATA, self.errata_cache_expire)
 
 
 def clear_package_cache(self):
@@ -585,37 +651,34 @@ def clear_package_cache(self):
     self.all_packages = {}
     self.all_packages_by_id = {}
     self.package_cache_expire = datetime.now()
+    self.channel_cache.clear(PACKAGES)
     self.save_package_caches()
 
 
-def generate_package_cache(self, force=False):
-    if not force and datetime.now() < self.package_cache_expire:
-        return
-
-    if not self.options.quiet:
-        # tell the user what's going on
-        self.replace_line_buffer(_('** Generating package cache **'))
+def _package_rows(packages):
+    return [(p.get('id'), p.get('name'), build_package_names(p)) for p in packages]
 
-    channels = self.client.channel.listSoftwareChannels(self.session)
-    channels = [c.get('label') for c in channels]
 
-    for c in channels:
-        try:
-            packages = self.client.channel.software.listAllPackages(self.session, c)
-        except xmlrpclib.Fault:
-            logging.debug('No access to %s', c)
-            continue
+def _load_package_caches(self, channels=None):
+    """
+    Load self.all_packages, self.all_packages_short and self.all_packages_by_id
+    from the channel cache.
 
-        for p in packages:
-            if not p.get('name') in self.all_packages_short:
-                self.all_packages_short[p.get('name')] = ''
+    :param channels: labels of the channels, all cached channels if None
+    """
+    if channels is None:
+        channels = sorted(self.channel_cache.get_last_modified(PACKAGES))
 
-            longname = build_package_names(p)
+    self.all_packages_short = {}
+    self.all_packages = {}
+    for package_id, name, longname in self.channel_cache.get_rows(PACKAGES, channels):
+        if not name in self.all_packages_short:
+            self.all_packages_short[name] = ''
 
-            if longname not in self.all_packages:
-                self.all_packages[longname] = [p.get('id')]
-            else:
-                self.all_packages[longname].append(p.get('id'))
+        if longname not in self.all_packages:
+            self.all_packages[longname] = [package_id]
+        else:
+            self.all_packages[longname].append(package_id)
 
     # keep a reverse dictionary so we can lookup package names by ID
     # We assume that package IDs are unique, so one ID is only
@@ -630,6 +693,21 @@ def generate_package_cache(self, force=False):
                     'instead of "%s"' % (i, k, self.all_packages_by_id[i]))
 
             self.all_packages_by_id[i] = k
+    self.package_cache_loaded = True
+
+
+def generate_package_cache(self, force=False):
+    if not force and datetime.now() < self.package_cache_expire:
+        if not self.package_cache_loaded:
+            _load_package_caches(self)
+        return
+
+    if not self.options.quiet:
+        # tell the user what's going on
+        self.replace_line_buffer(_('** Generating package cache **'))
+
+    channels = _refresh_channel_cache(self, PACKAGES, 'listAllPackages', _package_rows, force)
+    _load_package_caches(self, channels)
 
     self.package_cache_expire = datetime.now() + timedelta(seconds=self.PACKAGE_CACHE_TTL)
     self.save_package_caches()
@@ -640,18 +718,8 @@ def generate_package_cache(self, force=False):
 
 
 def save_package_caches(self):
-    # store the cache to disk to speed things up
-    save_cache(self.packages_short_cache_file,
-               self.all_packages_short,
-               self.package_cache_expire)
-
-    save_cache(self.packages_long_cache_file,
-               self.all_packages,
-               self.package_cache_expire)
-
-    save_cache(self.packages_by_id_cache_file,
-               self.all_packages_by_id,
-               self.package_cache_expire)
+    # the packages themselves are stored as the channels are refreshed
+    self.channel_cache.set_expire(PACKAGES, self.package_cache_expire)
 
 
 # create a global list of all available package names
@@ -743,12 +811,6 @@ def load_caches(self, server, username):
 
     self.ssm_cache_file = os.path.join(conf_dir, 'ssm')
     self.system_cache_file = os.path.join(conf_dir, 'systems')
-    self.errata_cache_file = os.path.join(conf_dir, 'errata')
-    self.packages_long_cache_file = os.path.join(conf_dir, 'packages_long')
-    self.packages_by_id_cache_file = \
-        os.path.join(conf_dir, 'packages_by_id')
-    self.packages_short_cache_file = \
-        os.path.join(conf_dir, 'packages_short')
 
     # load self.ssm from disk
     (self.ssm, _ignore) = load_cache(self.ssm_cache_file)
@@ -760,21 +822,25 @@ def load_caches(self, server, username):
     (self.all_systems, self.system_cache_expire) = \
         load_cache(self.system_cache_file)
 
-    # load self.all_errata from disk
-    (self.all_errata, self.errata_cache_expire) = \
-        load_cache(self.errata_cache_file)
-
-    # load self.all_packages_short from disk
-    (self.all_packages_short, self.package_cache_expire) = \
-        load_cache(self.packages_short_cache_file)
-
-    # load self.all_packages from disk
-    (self.all_packages, self.package_cache_expire) = \
-        load_cache(self.packages_long_cache_file)
+    # the package and errata caches are only read from disk when used
+    self.channel_cache = ChannelCache(os.path.join(conf_dir, 'channels.db'))
+    self.all_errata = {}
+    self.errata_cache_expire = self.channel_cache.get_expire(ERRATA)
+    self.errata_cache_loaded = False
+    self.all_packages_short = {}
+    self.all_packages = {}
+    self.all_packages_by_id = {}
+    self.package_cache_expire = self.channel_cache.get_expire(PACKAGES)
+    self.package_cache_loaded = False
 
-    # load self.all_packages_by_id from disk
-    (self.all_packages_by_id, self.package_cache_expire) = \
-        load_cache(self.packages_by_id_cache_file)
+    # remove the caches of older spacecmd versions
+    for cache_file in ['errata', 'packages_long', 'packages_by_id', 'packages_short']:
+        cache_file = os.path.join(conf_dir, cache_file)
+        if os.path.isfile(cache_file):
+            try:
+                os.remove(cache_file)
+            except OSError:
+                logging.debug('Could not remove %s', cache_file)
 
 
 def get_system_names(self):
@@ -1031,7 +1097,7 @@ def replace_line_buffer(self, msg=None):
 
 
 def load_config_section(self, section):
-    config_opts = ['server', 'username', 'password', 'nossl']
+    config_opts = ['server', 'username', 'password', 'nossl', 'threads']
 
     if not self.config_parser.has_section(section):
         logging.debug('Configuration section [%s] does not exist', section)
@@ -1061,6 +1127,12 @@ def load_config_section(self, section):
     if 'nossl' in self.config and isinstance(self.config['nossl'], str):
         self.config['nossl'] = re.match('^1|y|true$', self.config['nossl'], re.I)
 
+    if 'threads' in self.config:
+        try:
+            self.threads = max(1, int(self.config['threads']))
+        except ValueError:
+            logging.warning(_N('Invalid number of threads: %s'), self.config['threads'])
+
     # Obfuscate the password with asterisks
     config_debug = self.config.copy()
     if 'password' in config_debug:
@@ -88,6 +88,9 @@ class SpacewalkShell(Cmd):
         self.ssm = {}
         self.config = {}
 
+        # number of concurrent connections used by commands
+        self.threads = self.DEFAULT_THREADS
+
         self.postcmd(False, '')
 
         # make the options available everywhere
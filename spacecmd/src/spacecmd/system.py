@@ -42,6 +42,7 @@ from operator import itemgetter
 from xml.parsers.expat import ExpatError
 from spacecmd.i18n import _N
 from spacecmd.utils import *
+from spacecmd.executor import map_concurrently, format_error
 
 translation = gettext.translation('spacecmd', fallback=True)
 try:
@@ -56,6 +57,60 @@ __PKG_COMPARISONS = {0: _('Same'),
                      4: _('Newer there')}
 
 
+def _system_ids(self, systems):
+    """
+    :return: list of (system, system_id) of the systems with an ID
+    """
+    system_ids = []
+    for system in systems:
+        system_id = self.get_system_id(system)
+        if system_id:
+            system_ids.append((system, system_id))
+
+    return system_ids
+
+
+def _call_systems(self, func, system_ids):
+    """
+    Call func(client, system_id) for the (system, system_id) pairs
+    concurrently.  Failed calls are logged.
+
+    :return: tuple of the list of (system, system_id, result) of the
+             successful calls in the order of system_ids and the number
+             of failed calls
+    """
+    results = []
+    failed = 0
+    for r in map_concurrently(self, lambda client, item: func(client, item[1]), system_ids):
+        if r.error is not None:
+            logging.error(_N('%s: %s'), r.item[0], format_error(r.error))
+            failed += 1
+            continue
+        results.append((r.item[0], r.item[1], r.value))
+
+    return results, failed
+
+
+def _map_systems(self, func, systems):
+    """
+    Call func(client, system_id) for the systems concurrently.
+
+    :return: list of (system, system_id, result) in the order of systems;
+             systems without an ID or whose calls failed are skipped
+    """
+    return _call_systems(self, func, _system_ids(self, systems))[0]
+
+
+def _apply_to_systems(self, func, systems):
+    """
+    Call func(client, system_id) for the systems concurrently, for the
+    commands changing the systems.
+
+    :return: number of systems the call failed for
+    """
+    return _call_systems(self, func, _system_ids(self, systems))[1]
+
+
 def print_package_comparison(self, results):
     max_name = max_length(map(itemgetter('package_name'), results), minimum=7)
 
@@ -135,14 +190,10 @@ def manipulate_child_channels(self, args, remove=False):
     if not self.user_confirm():
         return
 
-    for system in systems:
-        system_id = self.get_system_id(system)
-        if not system_id:
-            continue
-
+    def set_child_channels(client, system_id):
         child_channels = \
-            self.client.system.listSubscribedChildChannels(self.session,
-                                                           system_id)
+            client.system.listSubscribedChildChannels(self.session,
+                                                      system_id)
 
         child_channels = [c.get('label') for c in child_channels]
 
@@ -155,11 +206,14 @@ def manipulate_child_channels(self, args, remove=False):
                 if channel not in child_channels:
                     child_channels.append(channel)
 
-        self.client.system.setChildChannels(self.session,
-                                            system_id,
-                                            child_channels)
+        client.system.setChildChannels(self.session,
+                                       system_id,
+                                       child_channels)
 
-    return
+    if _apply_to_systems(self, set_child_channels, systems):
+        return 1
+
+    return 0
 
 ####################
 
@@ -241,14 +295,13 @@ def do_system_reboot(self, args):
     if not self.user_confirm(_('Reboot these systems [y/N]:')):
         return 1
 
-    for system in systems:
-        system_id = self.get_system_id(system)
-        if not system_id:
-            continue
-
-        self.client.system.scheduleReboot(self.session, system_id, options.start_time)
+    failed = _apply_to_systems(self,
+                               lambda client, system_id: client.system.scheduleReboot(self.session,
+                                                                                      system_id,
+                                                                                      options.start_time),
+                               systems)
 
-    return 0
+    return 1 if failed else 0
 
 ####################
 
@@ -584,27 +637,28 @@ def do_system_listhardware(self, args):
         logging.warning(_N('No systems selected'))
         return 1
 
-    for system in sorted(systems):
-        system_id = self.get_system_id(system)
-        if not system_id:
-            continue
+    def get_hardware(client, system_id):
+        cpu = client.system.getCpu(self.session, system_id)
+        memory = client.system.getMemory(self.session, system_id)
+        devices = client.system.getDevices(self.session, system_id)
+        network = client.system.getNetworkDevices(self.session,
+                                                  system_id)
 
-        cpu = self.client.system.getCpu(self.session, system_id)
-        memory = self.client.system.getMemory(self.session, system_id)
-        devices = self.client.system.getDevices(self.session, system_id)
-        network = self.client.system.getNetworkDevices(self.session,
-                                                       system_id)
+        try:
+            dmi = client.system.getDmi(self.session, system_id)
+        except ExpatError:
+            dmi = None
+
+        return cpu, memory, devices, network, dmi
+
+    for system, _system_id, hardware in _map_systems(self, get_hardware, sorted(systems)):
+        (cpu, memory, devices, network, dmi) = hardware
 
         # Solaris systems don't have these value s
         for v in ('cache', 'vendor', 'family', 'stepping'):
             if not cpu.get(v):
                 cpu[v] = ''
 
-        try:
-            dmi = self.client.system.getDmi(self.session, system_id)
-        except ExpatError:
-            dmi = None
-
         if add_separator:
             print(self.SEPARATOR)
         add_separator = True
@@ -752,12 +806,7 @@ def do_system_installpackage(self, args):
     packages_to_install = args
 
     # get the ID for each system
-    system_ids = []
-    for system in sorted(systems):
-        system_id = self.get_system_id(system)
-        if not system_id:
-            continue
-        system_ids.append(system_id)
+    system_ids = _system_ids(self, sorted(systems))
 
     jobs = {}
 
@@ -767,7 +816,7 @@ def do_system_installpackage(self, args):
 
             avail_packages = \
                 self.client.system.listLatestAvailablePackage(self.session,
-                                                              system_ids,
+                                                              [i for (_s, i) in system_ids],
                                                               package)
 
             for system in avail_packages:
@@ -779,14 +828,15 @@ def do_system_installpackage(self, args):
                 jobs[system_id].append(system.get('package').get('id'))
     else:
         # XXX: Satellite 5.3 compatibility
-        for system_id in system_ids:
-            logging.debug('Getting available packages for %s' %
-                          self.get_system_name(system_id))
+        logging.debug('Getting available packages for %i system(s)' % len(system_ids))
 
-            avail_packages = \
-                self.client.system.listLatestInstallablePackages(self.session,
-                                                                 system_id)
+        installable = _call_systems(
+            self,
+            lambda client, system_id: client.system.listLatestInstallablePackages(self.session,
+                                                                                  system_id),
+            system_ids)[0]
 
+        for _system, system_id, avail_packages in installable:
             for package in avail_packages:
                 if package.get('name') in packages_to_install:
                     if system_id not in jobs:
@@ -828,21 +878,17 @@ def do_system_installpackage(self, args):
     if not self.user_confirm(_('Install these packages [y/N]:')):
         return 1
 
-    scheduled = 0
-    for system_id in jobs:
-        try:
-            self.client.system.schedulePackageInstall(self.session,
-                                                      system_id,
-                                                      jobs[system_id],
-                                                      options.start_time)
+    scheduled, failed = _call_systems(
+        self,
+        lambda client, system_id: client.system.schedulePackageInstall(self.session,
+                                                                       system_id,
+                                                                       jobs[system_id],
+                                                                       options.start_time),
+        [(self.get_system_name(system_id), system_id) for system_id in jobs])
 
-            scheduled += 1
-        except xmlrpclib.Fault:
-            logging.error(_N('Failed to schedule %s') % self.get_system_name(system_id))
+    logging.info(_N('Scheduled %i system(s)') % len(scheduled))
 
-    logging.info(_N('Scheduled %i system(s)') % scheduled)
-
-    return 0
+    return 1 if failed else 0
 
 ####################
 
@@ -951,26 +997,22 @@ def do_system_removepackage(self, args):
     if not self.user_confirm(_('Remove these packages [y/N]:')):
         return 1
 
-    scheduled = 0
-    for system in jobs:
-        system_id = self.get_system_id(system)
-        if not system_id:
-            continue
-
-        try:
-            action_id = self.client.system.schedulePackageRemove(self.session,
-                                                                 system_id,
-                                                                 jobs[system],
-                                                                 options.start_time)
+    system_ids = _system_ids(self, jobs)
+    system_packages = dict((system_id, jobs[system]) for (system, system_id) in system_ids)
+    scheduled, failed = _call_systems(
+        self,
+        lambda client, system_id: client.system.schedulePackageRemove(self.session,
+                                                                      system_id,
+                                                                      system_packages[system_id],
+                                                                      options.start_time),
+        system_ids)
 
-            logging.info(_N('Action ID: %i') % action_id)
-            scheduled += 1
-        except xmlrpclib.Fault:
-            logging.error(_N('Failed to schedule %s') % system)
+    for _system, _system_id, action_id in scheduled:
+        logging.info(_N('Action ID: %i') % action_id)
 
-    logging.info(_N('Scheduled %i system(s)') % scheduled)
+    logging.info(_N('Scheduled %i system(s)') % len(scheduled))
 
-    return 0
+    return 1 if failed else 0
 
 ####################
 
@@ -1042,27 +1084,27 @@ def do_system_upgradepackage(self, args):
         logging.warning(_N('No systems selected'))
         return 1
 
+    def get_upgrades(client, system_id):
+        # minions get a full package update, so None is returned for them
+        details = client.system.getDetails(self.session, system_id)
+        if self.check_api_version('25.0') and \
+           details.get('base_entitlement', '') == 'salt_entitled':
+            return None
+
+        return client.system.listLatestUpgradablePackages(self.session,
+                                                          system_id)
+
     # make a dictionary of each system and the package IDs to install
     jobs = {}
     minions = {}
-    for system in sorted(systems):
-        system_id = self.get_system_id(system)
-        if not system_id:
-            continue
-        details = self.client.system.getDetails(self.session, system_id)
-        if self.check_api_version('25.0') and \
-           details.get('base_entitlement', '') == 'salt_entitled':
+    for system, system_id, packages in _map_systems(self, get_upgrades, sorted(systems)):
+        if packages is None:
             minions[system] = system_id
+        elif packages:
+            package_ids = [p.get('to_package_id') for p in packages]
+            jobs[system] = package_ids
         else:
-            packages = \
-                self.client.system.listLatestUpgradablePackages(self.session,
-                                                                system_id)
-
-            if packages:
-                package_ids = [p.get('to_package_id') for p in packages]
-                jobs[system] = package_ids
-            else:
-                logging.warning(_N('No upgrades available for %s') % system)
+            logging.warning(_N('No upgrades available for %s') % system)
 
     if not jobs and not minions:
         return 1
@@ -1106,19 +1148,16 @@ def do_system_upgradepackage(self, args):
     if not self.user_confirm(_('Upgrade these systems/packages [y/N]:')):
         return 1
 
-    scheduled = 0
-    for system in jobs:
-        system_id = self.get_system_id(system)
-
-        try:
-            self.client.system.schedulePackageInstall(self.session,
-                                                      system_id,
-                                                      jobs[system],
-                                                      options.start_time)
-
-            scheduled += 1
-        except xmlrpclib.Fault:
-            logging.error(_N('Failed to schedule %s') % system)
+    system_ids = _system_ids(self, jobs)
+    system_packages = dict((system_id, jobs[system]) for (system, system_id) in system_ids)
+    results, failed = _call_systems(
+        self,
+        lambda client, system_id: client.system.schedulePackageInstall(self.session,
+                                                                       system_id,
+                                                                       system_packages[system_id],
+                                                                       options.start_time),
+        system_ids)
+    scheduled = len(results)
 
     if minions:
         try:
@@ -1128,12 +1167,13 @@ def do_system_upgradepackage(self, args):
                                                      options.start_time)
             scheduled += len(sids)
         except xmlrpclib.Fault:
-             logging.error(_N('Failed to schedule %s') % system)
+            logging.error(_N('Failed to schedule %s') % ', '.join(sorted(minions)))
+            failed += len(minions)
 
 
     logging.info(_N('Scheduled %i system(s)') % scheduled)
 
-    return 0
+    return 1 if failed else 0
 
 ####################
 
@@ -1170,15 +1210,11 @@ def do_system_listupgrades(self, args):
         logging.warning(_N('No systems selected'))
         return 1
 
-    for system in sorted(systems):
-        system_id = self.get_system_id(system)
-        if not system_id:
-            continue
-
-        packages = \
-            self.client.system.listLatestUpgradablePackages(self.session,
-                                                            system_id)
+    upgrades = _map_systems(
+        self, lambda client, system_id: client.system.listLatestUpgradablePackages(self.session, system_id),
+        sorted(systems))
 
+    for system, _system_id, packages in upgrades:
         if not packages:
             logging.warning(_N('No upgrades available for %s') % system)
             continue
@@ -1240,14 +1276,11 @@ def do_system_listinstalledpackages(self, args):
         logging.warning(_N('No systems selected'))
         return 1
 
-    for system in sorted(systems):
-        system_id = self.get_system_id(system)
-        if not system_id:
-            continue
-
-        packages = self.client.system.listPackages(self.session,
-                                                   system_id)
+    installed = _map_systems(
+        self, lambda client, system_id: client.system.listPackages(self.session, system_id),
+        sorted(systems))
 
+    for system, _system_id, packages in installed:
         if add_separator:
             print(self.SEPARATOR)
         add_separator = True
@@ -1295,11 +1328,13 @@ def do_system_listconfigchannels(self, args):
         logging.warning(_N('No systems selected'))
         return 1
 
-    for system in sorted(systems):
-        system_id = self.get_system_id(system)
-        if not system_id:
-            continue
+    def list_channels(client, system_id):
+        try:
+            return client.system.config.listChannels(self.session, system_id)
+        except xmlrpclib.Fault:
+            return None
 
+    for system, _system_id, channels in _map_systems(self, list_channels, sorted(systems)):
         if add_separator:
             print(self.SEPARATOR)
         add_separator = True
@@ -1307,10 +1342,7 @@ def do_system_listconfigchannels(self, args):
         if len(systems) > 1:
             print(_('System: %s') % system)
 
-        try:
-            channels = self.client.system.config.listChannels(self.session,
-                                                              system_id)
-        except xmlrpclib.Fault:
+        if channels is None:
             logging.warning(_N('%s does not support configuration channels') %
                             system)
             continue
@@ -1394,11 +1426,20 @@ def do_system_listconfigfiles(self, args):
         logging.warning(_N('No systems selected'))
         return 1
 
-    for system in sorted(systems):
-        system_id = self.get_system_id(system)
-        if not system_id:
-            continue
+    def list_files(client, system_id):
+        try:
+            # Pass 0 for system-sandbox files
+            # Pass 1 for locally managed or centrally managed
+            files = client.system.config.listFiles(self.session,
+                                                   system_id, 0)
+            files += client.system.config.listFiles(self.session,
+                                                    system_id, 1)
+        except xmlrpclib.Fault:
+            return None
 
+        return files
+
+    for system, _system_id, files in _map_systems(self, list_files, sorted(systems)):
         if add_separator:
             print(self.SEPARATOR)
         add_separator = True
@@ -1406,14 +1447,7 @@ def do_system_listconfigfiles(self, args):
         if len(systems) > 1:
             print(_('System: %s') % system)
 
-        try:
-            # Pass 0 for system-sandbox files
-            # Pass 1 for locally managed or centrally managed
-            files = self.client.system.config.listFiles(self.session,
-                                                        system_id, 0)
-            files += self.client.system.config.listFiles(self.session,
-                                                         system_id, 1)
-        except xmlrpclib.Fault:
+        if files is None:
             logging.warning(_N('%s does not support configuration channels') %
                             system)
             continue
@@ -1956,14 +1990,13 @@ def do_system_lock(self, args):
         logging.warning(_N('No systems selected'))
         return 1
 
-    for system in sorted(systems):
-        system_id = self.get_system_id(system)
-        if not system_id:
-            continue
-
-        self.client.system.setLockStatus(self.session, system_id, True)
+    failed = _apply_to_systems(self,
+                               lambda client, system_id: client.system.setLockStatus(self.session,
+                                                                                     system_id,
+                                                                                     True),
+                               sorted(systems))
 
-    return 0
+    return 1 if failed else 0
 
 ####################
 
@@ -1998,14 +2031,13 @@ def do_system_unlock(self, args):
         logging.warning(_N('No systems selected'))
         return 1
 
-    for system in sorted(systems):
-        system_id = self.get_system_id(system)
-        if not system_id:
-            continue
-
-        self.client.system.setLockStatus(self.session, system_id, False)
+    failed = _apply_to_systems(self,
+                               lambda client, system_id: client.system.setLockStatus(self.session,
+                                                                                     system_id,
+                                                                                     False),
+                               sorted(systems))
 
-    return 0
+    return 1 if failed else 0
 
 ####################
 
@@ -2089,7 +2121,11 @@ def do_system_listcustomvalues(self, args):
 
     add_separator = False
 
-    for system in systems:
+    custom_values = _map_systems(
+        self, lambda client, system_id: client.system.getCustomValues(self.session, system_id),
+        systems)
+
+    for system, _system_id, values in custom_values:
         if add_separator:
             print(self.SEPARATOR)
         add_separator = True
@@ -2098,13 +2134,6 @@ def do_system_listcustomvalues(self, args):
             print(_('System: %s') % system)
             print('')
 
-        system_id = self.get_system_id(system)
-        if not system_id:
-            continue
-
-        values = self.client.system.getCustomValues(self.session,
-                                                    system_id)
-
         for v in values:
             print('%s = %s' % (v, values[v]))
 
@@ -2155,16 +2184,13 @@ def do_system_addcustomvalue(self, args):
         logging.warning(_N('No systems selected'))
         return 1
 
-    for system in systems:
-        system_id = self.get_system_id(system)
-        if not system_id:
-            continue
-
-        self.client.system.setCustomValues(self.session,
-                                           system_id,
-                                           {key: value})
+    failed = _apply_to_systems(self,
+                               lambda client, system_id: client.system.setCustomValues(self.session,
+                                                                                       system_id,
+                                                                                       {key: value}),
+                               systems)
 
-    return 0
+    return 1 if failed else 0
 
 ####################
 
@@ -2243,16 +2269,13 @@ def do_system_removecustomvalues(self, args):
     if not self.user_confirm(_('Delete these values [y/N]:')):
         return 1
 
-    for system in systems:
-        system_id = self.get_system_id(system)
-        if not system_id:
-            continue
-
-        self.client.system.deleteCustomValues(self.session,
-                                              system_id,
-                                              keys)
+    failed = _apply_to_systems(self,
+                               lambda client, system_id: client.system.deleteCustomValues(self.session,
+                                                                                          system_id,
+                                                                                          keys),
+                               systems)
 
-    return 0
+    return 1 if failed else 0
 
 ####################
 
@@ -2307,17 +2330,14 @@ def do_system_addnote(self, args):
             logging.error(_N('A body is required'))
             return 1
 
-    for system in systems:
-        system_id = self.get_system_id(system)
-        if not system_id:
-            continue
-
-        self.client.system.addNote(self.session,
-                                   system_id,
-                                   options.subject,
-                                   options.body)
+    failed = _apply_to_systems(self,
+                               lambda client, system_id: client.system.addNote(self.session,
+                                                                               system_id,
+                                                                               options.subject,
+                                                                               options.body),
+                               systems)
 
-    return 0
+    return 1 if failed else 0
 
 ####################
 
@@ -2359,25 +2379,26 @@ def do_system_deletenotes(self, args):
         logging.warning(_N('No notes to delete'))
         return None
 
-    for system in systems:
-        system_id = self.get_system_id(system)
-        if not system_id:
-            continue
+    if '.*' not in note_ids:
+        valid_ids = []
+        for note_id in note_ids:
+            try:
+                valid_ids.append(int(note_id))
+            except ValueError:
+                logging.warning(_N('%s is not a valid note ID') % note_id)
+        note_ids = valid_ids
 
+    def delete_notes(client, system_id):
         if '.*' in note_ids:
-            self.client.system.deleteNotes(self.session, system_id)
+            client.system.deleteNotes(self.session, system_id)
         else:
             for note_id in note_ids:
-                try:
-                    note_id = int(note_id)
-                except ValueError:
-                    logging.warning(_N('%s is not a valid note ID') % note_id)
-                    continue
-
                 # deleteNote does not throw an exception
-                self.client.system.deleteNote(self.session, system_id, note_id)
+                client.system.deleteNote(self.session, system_id, note_id)
 
-    return 0
+    failed = _apply_to_systems(self, delete_notes, systems)
+
+    return 1 if failed else 0
 
 ####################
 
@@ -2414,7 +2435,11 @@ def do_system_listnotes(self, args):
 
     add_separator = False
 
-    for system in sorted(systems):
+    system_notes = _map_systems(
+        self, lambda client, system_id: client.system.listNotes(self.session, system_id),
+        sorted(systems))
+
+    for system, _system_id, notes in system_notes:
         if add_separator:
             print(self.SEPARATOR)
         add_separator = True
@@ -2423,12 +2448,6 @@ def do_system_listnotes(self, args):
             print(_('System: %s') % system)
             print('')
 
-        system_id = self.get_system_id(system)
-        if not system_id:
-            continue
-
-        notes = self.client.system.listNotes(self.session, system_id)
-
         for n in notes:
             print('%d. %s (%s)' % (n['id'], n['subject'], n['creator']))
             print(n['note'])
@@ -2472,7 +2491,11 @@ def do_system_listfqdns(self, args):
 
     add_separator = False
 
-    for system in sorted(systems):
+    system_fqdns = _map_systems(
+        self, lambda client, system_id: client.system.listFqdns(self.session, system_id),
+        sorted(systems))
+
+    for system, _system_id, fqdns in system_fqdns:
         if add_separator:
             print(self.SEPARATOR)
         add_separator = True
@@ -2481,12 +2504,6 @@ def do_system_listfqdns(self, args):
             print(_('System: %s') % system)
             print('')
 
-        system_id = self.get_system_id(system)
-        if not system_id:
-            continue
-
-        fqdns = self.client.system.listFqdns(self.session, system_id)
-
         for f in fqdns:
             print(f)
 
@@ -2533,14 +2550,11 @@ def do_system_setbasechannel(self, args):
 
     add_separator = False
 
-    for system in systems:
-        system_id = self.get_system_id(system)
-        if not system_id:
-            continue
-
-        old = self.client.system.getSubscribedBaseChannel(self.session,
-                                                          system_id)
+    base_channels = _map_systems(
+        self, lambda client, system_id: client.system.getSubscribedBaseChannel(self.session, system_id),
+        systems)
 
+    for system, _system_id, old in base_channels:
         if add_separator:
             print(self.SEPARATOR)
         add_separator = True
@@ -2552,16 +2566,13 @@ def do_system_setbasechannel(self, args):
     if not self.user_confirm():
         return 1
 
-    for system in systems:
-        system_id = self.get_system_id(system)
-        if not system_id:
-            continue
-
-        self.client.system.setBaseChannel(self.session,
-                                          system_id,
-                                          new_channel)
+    failed = _call_systems(self,
+                           lambda client, system_id: client.system.setBaseChannel(self.session,
+                                                                                  system_id,
+                                                                                  new_channel),
+                           [(system, system_id) for (system, system_id, _old) in base_channels])[1]
 
-    return 0
+    return 1 if failed else 0
 
 ####################
 
@@ -2620,16 +2631,17 @@ def do_system_schedulechangechannels(self, args):
 
     add_separator = False
 
-    for system in systems:
-        system_id = self.get_system_id(system)
-        if not system_id:
-            continue
+    def get_channels(client, system_id):
+        oldBase = client.system.getSubscribedBaseChannel(self.session,
+                                                         system_id)
 
-        oldBase = self.client.system.getSubscribedBaseChannel(self.session,
-                                                              system_id)
+        oldKids = client.system.listSubscribedChildChannels(self.session,
+                                                            system_id)
+        return oldBase, oldKids
 
-        oldKids = self.client.system.listSubscribedChildChannels(self.session,
-                                                                 system_id)
+    channels = _map_systems(self, get_channels, systems)
+
+    for system, _system_id, (oldBase, oldKids) in channels:
         if add_separator:
             print(self.SEPARATOR)
         add_separator = True
@@ -2643,19 +2655,19 @@ def do_system_schedulechangechannels(self, args):
     if not self.user_confirm():
         return 1
 
-    for system in systems:
-        system_id = self.get_system_id(system)
-        if not system_id:
-            continue
+    scheduled, failed = _call_systems(
+        self,
+        lambda client, system_id: client.system.scheduleChangeChannels(self.session,
+                                                                       system_id,
+                                                                       baseChannel,
+                                                                       childChannels,
+                                                                       options.start_time),
+        [(system, system_id) for (system, system_id, _channels) in channels])
 
-        actionId = self.client.system.scheduleChangeChannels(self.session,
-                                                             system_id,
-                                                             baseChannel,
-                                                             childChannels,
-                                                             options.start_time)
+    for _system, _system_id, actionId in scheduled:
         print(_('Scheduled action id: %s') % actionId)
 
-    return 0
+    return 1 if failed else 0
 
 ####################
 
@@ -2691,11 +2703,11 @@ def do_system_listbasechannel(self, args):
         logging.warning(_N('No systems selected'))
         return 1
 
-    for system in sorted(systems):
-        system_id = self.get_system_id(system)
-        if not system_id:
-            continue
+    base_channels = _map_systems(
+        self, lambda client, system_id: client.system.getSubscribedBaseChannel(self.session, system_id),
+        sorted(systems))
 
+    for system, _system_id, channel in base_channels:
         if add_separator:
             print(self.SEPARATOR)
         add_separator = True
@@ -2703,10 +2715,6 @@ def do_system_listbasechannel(self, args):
         if len(systems) > 1:
             print(_('System: %s') % system)
 
-        channel = \
-            self.client.system.getSubscribedBaseChannel(self.session,
-                                                        system_id)
-
         print(channel.get('label'))
 
     return 0
@@ -2746,11 +2754,11 @@ def do_system_listchildchannels(self, args):
         logging.warning(_N('No systems selected'))
         return 1
 
-    for system in sorted(systems):
-        system_id = self.get_system_id(system)
-        if not system_id:
-            continue
+    child_channels = _map_systems(
+        self, lambda client, system_id: client.system.listSubscribedChildChannels(self.session, system_id),
+        sorted(systems))
 
+    for system, _system_id, channels in child_channels:
         if add_separator:
             print(self.SEPARATOR)
         add_separator = True
@@ -2758,10 +2766,6 @@ def do_system_listchildchannels(self, args):
         if len(systems) > 1:
             print(_('System: %s') % system)
 
-        channels = \
-            self.client.system.listSubscribedChildChannels(self.session,
-                                                           system_id)
-
         print('\n'.join(sorted([c.get('label') for c in channels])))
 
     return 0
@@ -2787,8 +2791,7 @@ def complete_system_addchildchannels(self, text, line, beg, end):
     return None
 
 def do_system_addchildchannels(self, args):
-    self.manipulate_child_channels(args)
-    return 0
+    return self.manipulate_child_channels(args) or 0
 
 ####################
 
@@ -2981,8 +2984,7 @@ def complete_system_removechildchannels(self, text, line, beg, end):
     return None
 
 def do_system_removechildchannels(self, args):
-    self.manipulate_child_channels(args, True)
-    return 0
+    return self.manipulate_child_channels(args, True) or 0
 
 ####################
 
@@ -3019,24 +3021,61 @@ def do_system_details(self, args, short=False):
         logging.warning(_N('No systems selected'))
         return 1
 
-    for system in sorted(systems):
-        system_id = self.get_system_id(system)
-        if not system_id:
-            continue
+    with_uuid = self.check_api_version('10.16')
 
-        last_checkin = \
-            self.client.system.getName(self.session,
-                                       system_id).get('last_checkin')
+    def get_details(client, system_id):
+        info = {}
+        info['last_checkin'] = \
+            client.system.getName(self.session,
+                                  system_id).get('last_checkin')
 
-        details = self.client.system.getDetails(self.session, system_id)
+        info['details'] = client.system.getDetails(self.session, system_id)
 
-        if self.check_api_version('10.16'):
-            uuid = self.client.system.getUuid(self.session, system_id)
+        if with_uuid:
+            info['uuid'] = client.system.getUuid(self.session, system_id)
         else:
-            uuid = None
+            info['uuid'] = None
 
-        registered = self.client.system.getRegistrationDate(self.session,
-                                                            system_id)
+        info['registered'] = client.system.getRegistrationDate(self.session,
+                                                               system_id)
+
+        # only fetch basic information if requested
+        if short:
+            return info
+
+        info['network'] = client.system.getNetwork(self.session, system_id)
+
+        info['entitlements'] = client.system.getEntitlements(self.session,
+                                                             system_id)
+
+        info['base_channel'] = \
+            client.system.getSubscribedBaseChannel(self.session,
+                                                   system_id)
+
+        info['child_channels'] = \
+            client.system.listSubscribedChildChannels(self.session,
+                                                      system_id)
+
+        info['groups'] = client.system.listGroups(self.session,
+                                                  system_id)
+
+        info['kernel'] = client.system.getRunningKernel(self.session,
+                                                        system_id)
+
+        info['keys'] = client.system.listActivationKeys(self.session,
+                                                        system_id)
+
+        try:
+            info['config_channels'] = \
+                client.system.config.listChannels(self.session, system_id)
+        except xmlrpclib.Fault as exc:
+            info['config_channels'] = exc
+
+        return info
+
+    for _system, system_id, info in _map_systems(self, get_details, sorted(systems)):
+        details = info['details']
+        uuid = info['uuid']
 
         if add_separator:
             print(self.SEPARATOR)
@@ -3049,8 +3088,8 @@ def do_system_details(self, args, short=False):
             print(_('UUID:          %s') % uuid)
 
         print(_('Locked:        %s') % details.get('lock_status'))
-        print(_('Registered:    %s') % registered)
-        print(_('Last Checkin:  %s') % last_checkin)
+        print(_('Registered:    %s') % info['registered'])
+        print(_('Last Checkin:  %s') % info['last_checkin'])
         print(_('OSA Status:    %s') % details.get('osa_status'))
         print(_('Last Boot:     %s') % details.get('last_boot'))
         if 'contact_method' in details:
@@ -3060,39 +3099,23 @@ def do_system_details(self, args, short=False):
         if short:
             continue
 
-        network = self.client.system.getNetwork(self.session, system_id)
-
-        entitlements = self.client.system.getEntitlements(self.session,
-                                                          system_id)
-
-        base_channel = \
-            self.client.system.getSubscribedBaseChannel(self.session,
-                                                        system_id)
-
-        child_channels = \
-            self.client.system.listSubscribedChildChannels(self.session,
-                                                           system_id)
-
-        groups = self.client.system.listGroups(self.session,
-                                               system_id)
-
-        kernel = self.client.system.getRunningKernel(self.session,
-                                                     system_id)
-
-        keys = self.client.system.listActivationKeys(self.session,
-                                                     system_id)
+        network = info['network']
+        entitlements = info['entitlements']
+        base_channel = info['base_channel']
+        child_channels = info['child_channels']
+        groups = info['groups']
+        kernel = info['kernel']
+        keys = info['keys']
 
         ranked_config_channels = []
 
-        try:
-            config_channels = \
-                self.client.system.config.listChannels(self.session, system_id)
-        except xmlrpclib.Fault as exc:
+        config_channels = info['config_channels']
+        if isinstance(config_channels, xmlrpclib.Fault):
             # 10003 - unsupported operation
-            if exc.faultCode == 10003:
-                logging.debug(exc.faultString)
+            if config_channels.faultCode == 10003:
+                logging.debug(config_channels.faultString)
             else:
-                logging.warning(exc.faultString)
+                logging.warning(config_channels.faultString)
         else:
             for channel in config_channels:
                 ranked_config_channels.append(channel.get('label'))
@@ -3172,11 +3195,11 @@ def do_system_listerrata(self, args):
         logging.warning(_N('No systems selected'))
         return 1
 
-    for system in sorted(systems):
-        system_id = self.get_system_id(system)
-        if not system_id:
-            continue
+    relevant_errata = _map_systems(
+        self, lambda client, system_id: client.system.getRelevantErrata(self.session, system_id),
+        sorted(systems))
 
+    for system, _system_id, errata in relevant_errata:
         if add_separator:
             print(self.SEPARATOR)
         add_separator = True
@@ -3185,9 +3208,6 @@ def do_system_listerrata(self, args):
             print(_('System: %s') % system)
             print('')
 
-        errata = self.client.system.getRelevantErrata(self.session,
-                                                      system_id)
-
         print_errata_list(errata)
 
     return 0
@@ -3297,11 +3317,11 @@ def do_system_listevents(self, args):
 
     add_separator = False
 
-    for system in sorted(systems):
-        system_id = self.get_system_id(system)
-        if not system_id:
-            continue
+    system_events = _map_systems(
+        self, lambda client, system_id: client.system.getEventHistory(self.session, system_id),
+        sorted(systems))
 
+    for system, _system_id, events in system_events:
         if add_separator:
             print(self.SEPARATOR)
         add_separator = True
@@ -3309,8 +3329,6 @@ def do_system_listevents(self, args):
         if len(systems) > 1:
             print(_('System: %s') % system)
 
-        events = self.client.system.getEventHistory(self.session, system_id)
-
         for e in events:
             print('')
             print(_('Summary:   %s') % e.get('summary'))
@@ -3389,11 +3407,14 @@ def do_system_listeventhistory(self, args):
 
     add_separator = False
 
-    for system in sorted(systems):
-        system_id = self.get_system_id(system)
-        if not system_id:
-            continue
+    def get_events(client, system_id):
+        if options.limit:
+            return client.system.getEventHistory(self.session, system_id,
+                                                 options.start_time, options.offset, options.limit)
 
+        return client.system.getEventHistory(self.session, system_id, options.start_time)
+
+    for system, _system_id, events in _map_systems(self, get_events, sorted(systems)):
         if add_separator:
             print(self.SEPARATOR)
         add_separator = True
@@ -3401,12 +3422,6 @@ def do_system_listeventhistory(self, args):
         if len(systems) > 1:
             print(_('System: %s') % system)
 
-        if options.limit:
-            events = self.client.system.getEventHistory(self.session, system_id,
-                                                        options.start_time, options.offset, options.limit)
-        else:
-            events = self.client.system.getEventHistory(self.session, system_id, options.start_time)
-
         for e in events:
             print('')
             print(_('Id:           %s') % e.get('id'))
@@ -3472,11 +3487,13 @@ def do_system_eventdetails(self, args):
 
     add_separator = False
 
-    for system in sorted(systems):
-        system_id = self.get_system_id(system)
-        if not system_id:
-            continue
+    def get_details(client, system_id):
+        try:
+            return client.system.getEventDetails(self.session, system_id, event_id)
+        except xmlrpclib.Fault:
+            return None
 
+    for system, system_id, detail in _map_systems(self, get_details, sorted(systems)):
         if add_separator:
             print(self.SEPARATOR)
         add_separator = True
@@ -3486,9 +3503,7 @@ def do_system_eventdetails(self, args):
 
         print('')
 
-        try:
-            detail = self.client.system.getEventDetails(self.session, system_id, event_id)
-        except xmlrpclib.Fault:
+        if detail is None:
             print(_('No event %s found in the history of system %s' % (event_id, system_id)))
             continue
 
@@ -3560,11 +3575,11 @@ def do_system_listentitlements(self, args):
         logging.warning(_N('No systems selected'))
         return 1
 
-    for system in sorted(systems):
-        system_id = self.get_system_id(system)
-        if not system_id:
-            continue
+    system_entitlements = _map_systems(
+        self, lambda client, system_id: client.system.getEntitlements(self.session, system_id),
+        sorted(systems))
 
+    for system, _system_id, entitlements in system_entitlements:
         if add_separator:
             print(self.SEPARATOR)
         add_separator = True
@@ -3572,9 +3587,6 @@ def do_system_listentitlements(self, args):
         if len(systems) > 1:
             print(_('System: %s') % system)
 
-        entitlements = self.client.system.getEntitlements(self.session,
-                                                          system_id)
-
         print('\n'.join(sorted(entitlements)))
 
     return 0
@@ -3624,16 +3636,13 @@ def do_system_addentitlements(self, args):
         logging.warning(_N('No systems selected'))
         return 1
 
-    for system in systems:
-        system_id = self.get_system_id(system)
-        if not system_id:
-            continue
-
-        self.client.system.addEntitlements(self.session,
-                                           system_id,
-                                           [entitlement])
+    failed = _apply_to_systems(self,
+                               lambda client, system_id: client.system.addEntitlements(self.session,
+                                                                                       system_id,
+                                                                                       [entitlement]),
+                               systems)
 
-    return 0
+    return 1 if failed else 0
 
 ####################
 
@@ -3680,16 +3689,13 @@ def do_system_removeentitlement(self, args):
         logging.warning(_N('No systems selected'))
         return 1
 
-    for system in systems:
-        system_id = self.get_system_id(system)
-        if not system_id:
-            continue
-
-        self.client.system.removeEntitlements(self.session,
-                                              system_id,
-                                              [entitlement])
+    failed = _apply_to_systems(self,
+                               lambda client, system_id: client.system.removeEntitlements(self.session,
+                                                                                          system_id,
+                                                                                          [entitlement]),
+                               systems)
 
-    return 0
+    return 1 if failed else 0
 
 ####################
 
@@ -3860,15 +3866,13 @@ def do_system_comparepackageprofile(self, args):
 
     add_separator = False
 
-    for system in systems:
-        system_id = self.get_system_id(system)
-        if not system_id:
-            continue
-
-        results = self.client.system.comparePackageProfile(self.session,
-                                                           system_id,
-                                                           profile)
+    comparisons = _map_systems(
+        self, lambda client, system_id: client.system.comparePackageProfile(self.session,
+                                                                            system_id,
+                                                                            profile),
+        systems)
 
+    for system, _system_id, results in comparisons:
         if add_separator:
             print(self.SEPARATOR)
         add_separator = True
@@ -4134,14 +4138,14 @@ def do_system_comparewithchannel(self, args):
         logging.warning(_N('No systems selected'))
         return 1
 
-    channel_latest = {}
-    for system in sorted(systems):
-        system_id = self.get_system_id(system)
-        if not system_id:
-            continue
+    # the installed packages are fetched up front, the channels are then
+    # compared serially as their packages are shared between the systems
+    installed = _map_systems(
+        self, lambda client, system_id: client.system.listPackages(self.session, system_id),
+        sorted(systems))
 
-        instpkgs = self.client.system.listPackages(self.session,
-                                                   system_id)
+    channel_latest = {}
+    for system, system_id, instpkgs in installed:
         logging.debug("Got %d packages installed in system %s" %
                       (len(instpkgs), system))
         # We need to filter to get only the latest installed packages,
@@ -4277,16 +4281,13 @@ def do_system_schedulehardwarerefresh(self, args):
         logging.warning(_N('No systems selected'))
         return 1
 
-    for system in systems:
-        system_id = self.get_system_id(system)
-        if not system_id:
-            continue
+    failed = _apply_to_systems(self,
+                               lambda client, system_id: client.system.scheduleHardwareRefresh(self.session,
+                                                                                               system_id,
+                                                                                               options.start_time),
+                               systems)
 
-        self.client.system.scheduleHardwareRefresh(self.session,
-                                                   system_id,
-                                                   options.start_time)
-
-    return 0
+    return 1 if failed else 0
 
 ####################
 
@@ -4339,16 +4340,13 @@ def do_system_schedulepackagerefresh(self, args):
         logging.warning(_N('No systems selected'))
         return 1
 
-    for system in systems:
-        system_id = self.get_system_id(system)
-        if not system_id:
-            continue
-
-        self.client.system.schedulePackageRefresh(self.session,
-                                                  system_id,
-                                                  options.start_time)
+    failed = _apply_to_systems(self,
+                               lambda client, system_id: client.system.schedulePackageRefresh(self.session,
+                                                                                              system_id,
+                                                                                              options.start_time),
+                               systems)
 
-    return 0
+    return 1 if failed else 0
 
 ####################
 
@@ -4389,13 +4387,12 @@ def do_system_show_packageversion(self, args):
 
     print(_("Package\tVersion\tRelease\tEpoch\tArch\tSystem"))
     print("==============================================")
-    for system in sorted(systems):
-        system_id = self.get_system_id(system)
-        if not system_id:
-            continue
+    installed = _map_systems(
+        self, lambda client, system_id: client.system.listPackages(self.session, system_id),
+        sorted(systems))
 
-        instpkgs = self.client.system.listPackages(self.session, system_id)
-        searchpkg = args[1]
+    searchpkg = args[1]
+    for system, _system_id, instpkgs in installed:
         for pkg in instpkgs:
             if pkg.get('name') == searchpkg:
                 print("%s\t%s\t%s\t%s\t%s\t%s" % (pkg.get('name'), pkg.get('version'), pkg.get('release'),
@@ -4445,14 +4442,13 @@ def do_system_setcontactmethod(self, args):
         logging.warning(_N('No systems selected'))
         return 1
 
-    for system in sorted(systems):
-        system_id = self.get_system_id(system)
-        if not system_id:
-            continue
-
-        self.client.system.setDetails(self.session, system_id, details)
+    failed = _apply_to_systems(self,
+                               lambda client, system_id: client.system.setDetails(self.session,
+                                                                                  system_id,
+                                                                                  details),
+                               sorted(systems))
 
-    return 0
+    return 1 if failed else 0
 
 ####################
 
@@ -4552,14 +4548,20 @@ def do_system_listmigrationtargets(self, args):
         print(_('No systems found'))
         return
 
+    system_ids = []
     for system in sorted(systems):
         system_id = self.get_system_id(system)
         if not system_id:
             print(_('WARN: Cannot find system ') + str(system))
             continue
+        system_ids.append((system, system_id))
 
+    targets = _call_systems(
+        self, lambda client, system_id: client.system.listMigrationTargets(self.session, system_id),
+        system_ids)[0]
+
+    for system, _system_id, tgts in targets:
         print(_('System ') + str(system))
-        tgts = self.client.system.listMigrationTargets(self.session, system_id)
 
         if not tgts:
             print(_('  No migration targets'))
@@ -4652,22 +4654,32 @@ def do_system_scheduleproductmigration(self, args):
     if options.child_channels:
         child_channels = [cnl.strip() for cnl in options.child_channels.split(',')]
 
+    system_ids = []
     for system in sorted(systems):
         system_id = self.get_system_id(system)
         if not system_id:
             logging.warning(_N('Cannot find system ') + str(system) + _('. Skipping it.'))
             continue
-
+        system_ids.append((system, system_id))
+
+    scheduled, failed = _call_systems(
+        self,
+        lambda client, system_id: client.system.scheduleProductMigration(self.session,
+                                                                         system_id, migration_target,
+                                                                         base_channel_label, child_channels,
+                                                                         options.dry_run,
+                                                                         options.allow_vendor_change,
+                                                                         options.remove_products_without_successor,
+                                                                         options.start_time),
+        system_ids)
+
+    for system, _system_id, result in scheduled:
         print(_('Scheduling Product migration for system ') + str(system))
         print(_('Migration target ') + str(migration_target))
-        try:
-            result = self.client.system.scheduleProductMigration(self.session,
-                                                            system_id, migration_target, base_channel_label,
-                                                            child_channels, options.dry_run, options.allow_vendor_change,
-                                                            options.remove_products_without_successor, options.start_time)
-            print(_('Scheduled action ID: ') + str(result))
-        except xmlrpclib.Fault as detail:
-            logging.error(_N('Failed to schedule %s') % detail)
+        print(_('Scheduled action ID: ') + str(result))
+
+    if failed:
+        return 1
 
     return
 
@@ -4800,16 +4812,15 @@ def do_system_needrebootafterupdate(self, args, short=False):
         logging.warning(_N('No systems selected'))
         return 1
 
-    for system in sorted(systems):
-        system_id = self.get_system_id(system)
-        system_needs_reboot = False
-        erratas = self.client.system.getRelevantErrata(self.session, system_id)
+    def needs_reboot(client, system_id):
+        erratas = client.system.getRelevantErrata(self.session, system_id)
         for errata in erratas:
-            errata_details = self.client.errata.getDetails(self.session, errata['advisory_name'])
+            errata_details = client.errata.getDetails(self.session, errata['advisory_name'])
             if errata_details['reboot_suggested']:
-                system_needs_reboot = True
-                break
+                return True
+        return False
 
+    for system, _system_id, system_needs_reboot in _map_systems(self, needs_reboot, sorted(systems)):
         if system_needs_reboot:
             if self.options.quiet:
                 print("{}: 1".format(system))
@@ -56,6 +56,7 @@ def shell():
     base = MagicMock()
     base.session = hashlib.sha256(str(time.time()).encode("utf-8")).hexdigest()
     base.client = MagicMock()
+    base.threads = 1
     base.client.activationkey = MagicMock()
     base.do_activationkey_list = MagicMock(return_value="do_activation_list")
     base.SEPARATOR = "-" * 10
@@ -0,0 +1,92 @@
+# coding: utf-8
+"""
+Test spacecmd.executor
+"""
+from unittest.mock import MagicMock, patch
+from helpers import shell
+import spacecmd.executor
+from xmlrpc import client as xmlrpclib
+import threading
+import time
+
+
+class TestSCExecutor:
+    """
+    Test suite for the concurrent executor.
+    """
+    def test_execute_keeps_order_and_collects_errors(self):
+        """
+        Test results are in the order of the items and exceptions are collected.
+
+        :return:
+        """
+        def func(client, item):
+            time.sleep(0.01 * (5 - item))
+            if item == 2:
+                raise xmlrpclib.Fault(faultCode=42, faultString="No such system")
+            return item * 10
+
+        results = spacecmd.executor.execute(MagicMock, func, range(5), 4)
+
+        assert [r.item for r in results] == [0, 1, 2, 3, 4]
+        assert [r.value for r in results] == [0, 10, None, 30, 40]
+        assert results[2].error.faultCode == 42
+        assert spacecmd.executor.format_error(results[2].error) == "No such system"
+
+    def test_execute_connects_once_per_thread(self):
+        """
+        Test every thread has its own client.
+
+        :return:
+        """
+        clients = []
+
+        def connect():
+            clients.append(threading.current_thread().name)
+            return MagicMock()
+
+        results = spacecmd.executor.execute(connect, lambda client, item: client, range(20), 3)
+
+        assert 1 <= len(clients) <= 3
+        assert len(set(clients)) == len(clients)
+        assert len(set(id(r.value) for r in results)) == len(clients)
+
+    def test_map_concurrently_serial(self, shell):
+        """
+        Test a single thread uses the client of the shell.
+
+        :return:
+        """
+        results = spacecmd.executor.map_concurrently(shell, lambda client, item: client, [1, 2])
+
+        assert [r.value for r in results] == [shell.client, shell.client]
+
+    def test_map_concurrently_in_flight(self, shell):
+        """
+        Test the calls are made over several connections at the same time.
+
+        :return:
+        """
+        lock = threading.Lock()
+        in_flight = [0, 0]
+        # every call waits until as many calls as threads are in flight
+        barrier = threading.Barrier(4, timeout=10)
+
+        def func(client, item):
+            with lock:
+                in_flight[0] += 1
+                in_flight[1] = max(in_flight[1], in_flight[0])
+            barrier.wait()
+            with lock:
+                in_flight[0] -= 1
+            return item
+
+        shell.server_url = "https://example.com/rpc/api"
+        shell.threads = 4
+        with patch("spacecmd.executor.xmlrpclib.Server") as server:
+            results = spacecmd.executor.map_concurrently(shell, func, range(8))
+
+        server.assert_called_with("https://example.com/rpc/api")
+        assert [r.error for r in results] == [None] * 8
+        assert [r.value for r in results] == list(range(8))
+        assert in_flight[1] == 4
@@ -5,6 +5,7 @@ Test spacecmd.misc
 from unittest.mock import MagicMock, patch, mock_open
 from helpers import shell, assert_expect, assert_list_args_expect, assert_args_expect
 import spacecmd.misc
+from spacecmd.channelcache import ChannelCache
 from xmlrpc import client as xmlrpclib
 import datetime
 
@@ -852,6 +853,8 @@ class TestSCMisc:
         :return:
         """
         shell.ERRATA_CACHE_TTL = 86400
+        shell.threads = 1
+        shell.channel_cache = ChannelCache(":memory:")
         shell.all_errata = {}
         shell.options.quiet = False
         shell.errata_cache_expire = datetime.datetime(2099, 1, 1)
@@ -954,6 +957,8 @@ class TestSCMisc:
         shell.all_packages_by_id = {}
         shell.package_cache_expire = tst
         shell.PACKAGE_CACHE_TTL = 8000
+        shell.threads = 1
+        shell.channel_cache = ChannelCache(":memory:")
         shell.client.channel.listSoftwareChannels = MagicMock(return_value=[])
 
         with patch("spacecmd.misc.build_package_names", pkgbuild) as pkgb, \
@@ -986,6 +991,8 @@ class TestSCMisc:
         shell.all_packages_by_id = {}
         shell.package_cache_expire = tst
         shell.PACKAGE_CACHE_TTL = 8000
+        shell.threads = 1
+        shell.channel_cache = ChannelCache(":memory:")
         shell.client.channel.listSoftwareChannels = MagicMock(return_value=[])
 
         with patch("spacecmd.misc.build_package_names", pkgbuild) as pkgb, \
@@ -1017,6 +1024,8 @@ class TestSCMisc:
         shell.all_packages_by_id = {}
         shell.package_cache_expire = tst
         shell.PACKAGE_CACHE_TTL = 8000
+        shell.threads = 1
+        shell.channel_cache = ChannelCache(":memory:")
         shell.client.channel.software.listAllPackages = MagicMock(
             side_effect=[
                 [
@@ -1068,6 +1077,8 @@ class TestSCMisc:
         shell.all_packages_by_id = {}
         shell.package_cache_expire = tst
         shell.PACKAGE_CACHE_TTL = 8000
+        shell.threads = 1
+        shell.channel_cache = ChannelCache(":memory:")
         shell.client.channel.software.listAllPackages = MagicMock(
             side_effect=[
                 [
@@ -1098,7 +1109,8 @@ class TestSCMisc:
         assert shell.package_cache_expire is not None
 
         assert_args_expect(logger.debug.call_args_list,
-                           [(('No access to %s', 'locked_channel',), {}),
+                           [(('No access to %s (%s): %s', 'locked_channel', 13,
+                              'Interrupt configuration interference error'), {}),
                             (('Non-unique package id "69" is detected. '
                               'Taking "vim-1-2" instead of "gedit-1-2"',), {})])
 
@@ -1116,29 +1128,109 @@ class TestSCMisc:
         :param shell:
         :return:
         """
-        savecache = MagicMock()
-
-        shell.all_packages = {"emacs-41-1": [42]}
-        shell.all_packages_short = {"emacs": ""}
-        shell.all_packages_by_id = {42: "emacs-41-1"}
-
-        shell.packages_short_cache_file = "/tmp/psc.f"
-        shell.packages_long_cache_file = "/tmp/plc.f"
-        shell.packages_by_id_cache_file = "/tmp/bic.f"
-
+        shell.channel_cache = ChannelCache(":memory:")
         tst = datetime.datetime(2019, 1, 1, 0, 0)
         shell.package_cache_expire = tst
 
-        with patch("spacecmd.misc.save_cache", savecache) as savc:
-            spacecmd.misc.save_package_caches(shell)
+        spacecmd.misc.save_package_caches(shell)
 
         assert shell.package_cache_expire == tst
-        assert_args_expect(savecache.call_args_list,
-                           [
-                               (('/tmp/psc.f', {'emacs': ''}, tst), {}),
-                               (('/tmp/plc.f', {'emacs-41-1': [42]}, tst), {}),
-                               (('/tmp/bic.f', {42: 'emacs-41-1'}, tst), {}),
-                           ])
+        assert shell.channel_cache.get_expire("packages") == tst
+
+    def test_generate_package_cache_refreshes_modified_channels(self, shell):
+        """
+        Test generate package cache fetches only the channels modified since they were cached.
+
+        :param shell:
+        :return:
+        """
+        shell.options.quiet = True
+        shell.package_cache_expire = datetime.datetime(2000, 1, 1, 0, 0)
+        shell.PACKAGE_CACHE_TTL = 8000
+        shell.threads = 1
+        shell.channel_cache = ChannelCache(":memory:")
+        shell.client.channel.listSoftwareChannels = MagicMock(
+            return_value=[{"label": "base_channel"}, {"label": "child_channel"}])
+        shell.client.channel.software.getDetails = MagicMock(
+            side_effect=lambda session, label: {"last_modified": "20230101T00:00:00"})
+        shell.client.channel.software.listAllPackages = MagicMock(side_effect=[
+            [{"name": "emacs", "version": 42, "release": 3, "id": 42}],
+            [{"name": "vim", "version": 1, "release": 2, "id": 69}],
+            [{"name": "emacs", "version": 43, "release": 1, "id": 43}],
+        ])
+
+        spacecmd.misc.generate_package_cache(shell)
+        assert shell.client.channel.software.listAllPackages.call_count == 2
+        assert shell.all_packages == {"emacs-42-3": [42], "vim-1-2": [69]}
+
+        shell.client.channel.software.getDetails = MagicMock(
+            side_effect=lambda session, label: {
+                "last_modified": "20230102T00:00:00" if label == "base_channel" else "20230101T00:00:00"})
+        shell.package_cache_expire = datetime.datetime(2000, 1, 1, 0, 0)
+        spacecmd.misc.generate_package_cache(shell, force=False)
+
+        assert shell.client.channel.software.listAllPackages.call_count == 3
+        assert shell.client.channel.software.listAllPackages.call_args[0] == (shell.session, "base_channel")
+        assert shell.all_packages == {"emacs-43-1": [43], "vim-1-2": [69]}
+        assert shell.all_packages_by_id == {43: "emacs-43-1", 69: "vim-1-2"}
+        assert shell.all_packages_short == {"emacs": "", "vim": ""}
+
+    def test_generate_package_cache_loads_from_disk(self, shell, tmpdir):
+        """
+        Test generate package cache reads the cached packages from disk when not expired.
+
+        :param shell:
+        :return:
+        """
+        cache = ChannelCache(str(tmpdir.join("channels.db")))
+        cache.store("packages", "base_channel", "20230101T00:00:00", [(42, "emacs", "emacs-42-3")])
+        cache.close()
+
+        shell.channel_cache = ChannelCache(str(tmpdir.join("channels.db")))
+        shell.package_cache_expire = datetime.datetime(2099, 1, 1)
+        shell.package_cache_loaded = False
+
+        spacecmd.misc.generate_package_cache(shell)
+
+        assert not shell.client.channel.listSoftwareChannels.called
+        assert shell.package_cache_loaded
+        assert shell.all_packages == {"emacs-42-3": [42]}
+        assert shell.all_packages_by_id == {42: "emacs-42-3"}
+
+    def test_generate_errata_cache_concurrent(self, shell):
+        """
+        Test generate errata cache fetches the channels over a pool of connections.
+
+        :param shell:
+        :return:
+        """
+        shell.options.quiet = True
+        shell.ERRATA_CACHE_TTL = 86400
+        shell.threads = 4
+        shell.channel_cache = ChannelCache(":memory:")
+        shell.server_url = "https://example.com/rpc/api"
+        shell.client.channel.listSoftwareChannels = MagicMock(
+            return_value=[{"label": "channel-%s" % i} for i in range(10)])
+
+        def list_errata(session, label):
+            if label == "channel-3":
+                raise xmlrpclib.Fault(faultCode=42, faultString="No access")
+            return [{"id": int(label[8:]), "advisory_name": "cve-%s" % label[8:]}]
+
+        connection = MagicMock()
+        connection.channel.software.getDetails.return_value = {"last_modified": "20230101T00:00:00"}
+        connection.channel.software.listErrata.side_effect = list_errata
+        server = MagicMock(return_value=connection)
+        with patch("spacecmd.misc.xmlrpclib.Server", server):
+            spacecmd.misc.generate_errata_cache(shell, force=True)
+
+        assert 1 <= server.call_count <= 4
+        server.assert_called_with("https://example.com/rpc/api")
+        assert not shell.client.channel.software.listErrata.called
+        assert sorted(shell.all_errata) == sorted("cve-%s" % i for i in range(10) if i != 3)
+        assert shell.all_errata["cve-5"]["id"] == 5
+        assert sorted(shell.channel_cache.get_last_modified("errata")) == \
+            sorted("channel-%s" % i for i in range(10) if i != 3)
 
     def test_user_confirm_bool_positive(self, shell):
         """
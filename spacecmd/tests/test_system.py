@@ -6,6 +6,7 @@ from datetime import datetime
 from unittest.mock import MagicMock, patch, mock_open
 from helpers import shell, assert_expect, assert_list_args_expect, assert_args_expect
 import spacecmd.system
+from xmlrpc import client as xmlrpclib
 
 
 class TestSystem:
@@ -676,3 +677,55 @@ class TestSystem:
         assert shell.client.system.bootstrapWithPrivateSshKey.called
         assert_args_expect(shell.client.system.bootstrapWithPrivateSshKey.call_args_list,
                            [((shell.session, 'uyuni.example.com', 22, 'admin', 'private_ssh_key', 'key_secret', '1-akey', '1-re-key', 1000010042, True), {})])
+
+    def test_do_system_listentitlements_collects_errors(self, shell):
+        """
+        Test system_listentitlements reports failed systems and prints the others in order.
+        """
+        shell.expand_systems = MagicMock(return_value=["web", "db", "broken"])
+        shell.get_system_id = MagicMock(side_effect=lambda name: {"web": 1, "db": 2, "broken": 3}[name])
+
+        def get_entitlements(session, system_id):
+            if system_id == 3:
+                raise xmlrpclib.Fault(faultCode=-210, faultString="No such system")
+            return ["salt_entitled"] if system_id == 1 else ["container_build_host", "salt_entitled"]
+
+        shell.client.system.getEntitlements = MagicMock(side_effect=get_entitlements)
+        m_logger = MagicMock()
+        m_print = MagicMock()
+
+        with patch("spacecmd.system.logging", m_logger), patch("spacecmd.system.print", m_print):
+            assert spacecmd.system.do_system_listentitlements(shell, "web db broken") == 0
+
+        assert_list_args_expect(m_logger.error.call_args_list, ["%s: %s"])
+        assert m_logger.error.call_args[0][1:] == ("broken", "No such system")
+        assert_list_args_expect(m_print.call_args_list,
+                                ["System: db", "container_build_host\nsalt_entitled",
+                                 shell.SEPARATOR, "System: web", "salt_entitled"])
+
+    def test_do_system_lock_reports_failed_systems(self, shell):
+        """
+        Test system_lock locks the other systems and returns non-zero when a call failed.
+        """
+        shell.expand_systems = MagicMock(return_value=["web", "db", "broken"])
+        shell.get_system_id = MagicMock(side_effect=lambda name: {"web": 1, "db": 2, "broken": 3}[name])
+
+        def set_lock_status(session, system_id, lock):
+            if system_id == 3:
+                raise xmlrpclib.Fault(faultCode=-210, faultString="No such system")
+
+        shell.client.system.setLockStatus = MagicMock(side_effect=set_lock_status)
+        m_logger = MagicMock()
+
+        with patch("spacecmd.system.logging", m_logger):
+            assert spacecmd.system.do_system_lock(shell, "web db broken") == 1
+
+        assert m_logger.error.call_args[0][1:] == ("broken", "No such system")
+        assert_args_expect(shell.client.system.setLockStatus.call_args_list,
+                           [((shell.session, 3, True), {}),
+                            ((shell.session, 2, True), {}),
+                            ((shell.session, 1, True), {})])
+
+        shell.expand_systems = MagicMock(return_value=["web", "db"])
+        shell.client.system.setLockStatus = MagicMock()
+        assert spacecmd.system.do_system_lock(shell, "web db") == 0
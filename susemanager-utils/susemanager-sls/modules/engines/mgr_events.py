@@ -6,7 +6,9 @@ LISTEN/NOTIFY mechanism to alert SUSE Manager of newly available events.
 
 mgr_events.py tries to keep the I/O low in high load scenarios. Therefore
 events are INSERTed once they come in, but not necessarily COMMITted
-immediately.
+immediately. While no commit is possible, the events are buffered in memory
+and INSERTed together with a multi-row statement once a commit is possible
+again, or once flush_size events are waiting.
 
 The algorithm is an implementation of token bucket:
  - a COMMIT costs one token
@@ -43,6 +45,7 @@ Full configuration example
       - mgr_events:
           commit_interval: 1
           commit_burst: 100
+          flush_size: 1000
           postgres_db:
               dbname: susemanger
               user: spacewalk
@@ -62,9 +65,11 @@ import logging
 import time
 import fnmatch
 import hashlib
+import re
 
 try:
     import psycopg2
+    import psycopg2.extras
     HAS_PSYCOPG2 = True
 except ImportError:
     HAS_PSYCOPG2 = False
@@ -79,6 +84,27 @@ log = logging.getLogger(__name__)
 
 DEFAULT_COMMIT_INTERVAL = 1
 DEFAULT_COMMIT_BURST = 100
+DEFAULT_FLUSH_SIZE = 1000
+
+EVENT_TAGS = [
+    "salt/minion/*/start",
+    "salt/job/*/ret/*",
+    "salt/beacon/*",
+    "salt/engines/libvirt_events/*/domain/lifecycle",
+    "salt/engines/libvirt_events/*/pool/lifecycle",
+    "salt/engines/libvirt_events/*/network/lifecycle",
+    "salt/engines/libvirt_events/*/pool/refresh",
+    "salt/batch/*/start",
+    "suse/manager/image_deployed",
+    "suse/manager/image_synced",
+    "suse/manager/pxe_update",
+    "suse/systemid/generate",
+]
+EVENT_TAGS_RE = re.compile("|".join(fnmatch.translate(tag) for tag in EVENT_TAGS))
+JOB_RETURN_TAG_RE = re.compile(fnmatch.translate("salt/job/*/ret/*"))
+
+INSERT_EVENT_QUERY = 'INSERT INTO suseSaltEvent (minion_id, data, queue) VALUES (%s, %s, %s);'
+INSERT_EVENTS_QUERY = 'INSERT INTO suseSaltEvent (minion_id, data, queue) VALUES %s;'
 
 def __virtual__():
     return HAS_PSYCOPG2
@@ -89,11 +115,21 @@ class Responder:
         self.config = config
         self.config.setdefault('commit_interval', DEFAULT_COMMIT_INTERVAL)
         self.config.setdefault('commit_burst', DEFAULT_COMMIT_BURST)
+        self.config.setdefault('flush_size', DEFAULT_FLUSH_SIZE)
         self.config.setdefault('postgres_db', {})
         self.config['postgres_db'].setdefault('host', 'localhost')
         self.config['postgres_db'].setdefault('notify_channel', 'suseSaltEvent')
         self.counters = [0 for i in range(config['events']['thread_pool_size'] + 1)]
         self.tokens = config['commit_burst']
+        self.buffer = []
+        self.metrics = {
+            'started': time.monotonic(),
+            'events': 0,
+            'inserted': 0,
+            'flushes': 0,
+            'flush_time': 0.0,
+            'max_flush_time': 0.0,
+        }
         self.event_bus = event_bus
         self._connect_to_database()
         self.event_bus.io_loop.call_later(config['commit_interval'], self.add_token)
@@ -117,56 +153,113 @@ class Responder:
 
     def _insert(self, tag, data):
         self.db_keepalive()
-        if any([
-            fnmatch.fnmatch(tag, "salt/minion/*/start"),
-            fnmatch.fnmatch(tag, "salt/job/*/ret/*"),
-            fnmatch.fnmatch(tag, "salt/beacon/*"),
-            fnmatch.fnmatch(tag, "salt/engines/libvirt_events/*/domain/lifecycle"),
-            fnmatch.fnmatch(tag, "salt/engines/libvirt_events/*/pool/lifecycle"),
-            fnmatch.fnmatch(tag, "salt/engines/libvirt_events/*/network/lifecycle"),
-            fnmatch.fnmatch(tag, "salt/engines/libvirt_events/*/pool/refresh"),
-            fnmatch.fnmatch(tag, "salt/batch/*/start"),
-            fnmatch.fnmatch(tag, "suse/manager/image_deployed"),
-            fnmatch.fnmatch(tag, "suse/manager/image_synced"),
-            fnmatch.fnmatch(tag, "suse/manager/pxe_update"),
-            fnmatch.fnmatch(tag, "suse/systemid/generate")
-        ]) and not self._is_salt_mine_event(tag, data) and not self._is_presence_ping(tag, data):
+        if EVENT_TAGS_RE.match(tag) and not self._is_salt_mine_event(tag, data) and not self._is_presence_ping(tag, data):
             queue = 0
             if 'id' in data:
                 hash_sum = hashlib.md5(data.get("id").encode(self.connection.encoding)).hexdigest()[0:8]
                 queue = int(hash_sum, 16) % self.config['events']['thread_pool_size'] + 1
             log.debug("%s: Adding event to queue %d -> %s", __name__, queue, tag)
-            try:
-                self.cursor.execute(
-                    'INSERT INTO suseSaltEvent (minion_id, data, queue) VALUES (%s, %s, %s);',
-                    (data.get("id"), json.dumps({'tag': tag, 'data': data}), queue)
-                )
-                self.counters[queue] += 1
+            self.buffer.append((data.get("id"), json.dumps({'tag': tag, 'data': data}), queue))
+            self.metrics['events'] += 1
+            if self.tokens > 0:
                 self.attempt_commit()
+            elif len(self.buffer) >= self.config['flush_size']:
+                self.flush()
+        else:
+            log.debug("%s: Discarding event -> %s", __name__, tag)
+
+    def flush(self):
+        """
+        INSERT the buffered events, without committing them.
+        """
+        if not self.buffer:
+            return
+        events = self.buffer
+        self.buffer = []
+        start = time.monotonic()
+        try:
+            if len(events) == 1:
+                self.cursor.execute(INSERT_EVENT_QUERY, events[0])
+            else:
+                psycopg2.extras.execute_values(self.cursor, INSERT_EVENTS_QUERY, events,
+                                               page_size=self.config['flush_size'])
+        except Exception as err:
+            log.error("%s: %s", __name__, err)
+            try:
+                self.connection.commit()
+            except Exception as err2:
+                log.error("%s: Error commiting: %s", __name__, err2)
+                self.connection.close()
+            inserted = None if self.connection.closed else self._insert_each(events)
+            if inserted is None:
+                # Insert the events again once reconnected
+                self.buffer = events + self.buffer
+                return
+            if len(inserted) < len(events):
+                log.error("%s: Discarding %d events", __name__, len(events) - len(inserted))
+            events = inserted
+        finally:
+            log.debug("%s: %s", __name__, self.cursor.query)
+        for event in events:
+            self.counters[event[2]] += 1
+        elapsed = time.monotonic() - start
+        self.metrics['inserted'] += len(events)
+        self.metrics['flushes'] += 1
+        self.metrics['flush_time'] += elapsed
+        self.metrics['max_flush_time'] = max(self.metrics['max_flush_time'], elapsed)
+
+    def _insert_each(self, events):
+        """
+        INSERT the events one by one, each in its own savepoint so that only the
+        events refused by the database are lost.
+        Returns the inserted events, or None if the connection was lost.
+        """
+        inserted = []
+        for event in events:
+            try:
+                self.cursor.execute("SAVEPOINT event;")
+                self.cursor.execute(INSERT_EVENT_QUERY, event)
+                self.cursor.execute("RELEASE SAVEPOINT event;")
+                inserted.append(event)
             except Exception as err:
                 log.error("%s: %s", __name__, err)
                 try:
-                    self.connection.commit()
+                    self.cursor.execute("ROLLBACK TO SAVEPOINT event;")
                 except Exception as err2:
-                    log.error("%s: Error commiting: %s", __name__, err2)
+                    log.error("%s: Error rolling back: %s", __name__, err2)
                     self.connection.close()
-            finally:
-                log.debug("%s: %s", __name__, self.cursor.query)
-        else:
-            log.debug("%s: Discarding event -> %s", __name__, tag)
+                    return None
+        return inserted
+
+    def get_metrics(self):
+        """
+        Return the event throughput, the buffer depth and the flush latencies.
+        """
+        uptime = time.monotonic() - self.metrics['started']
+        flushes = self.metrics['flushes']
+        return {
+            'events': self.metrics['events'],
+            'inserted': self.metrics['inserted'],
+            'events_per_second': self.metrics['inserted'] / uptime if uptime > 0 else 0.0,
+            'buffer_depth': len(self.buffer),
+            'flushes': flushes,
+            'avg_flush_latency': self.metrics['flush_time'] / flushes if flushes else 0.0,
+            'max_flush_latency': self.metrics['max_flush_time'],
+        }
 
     def trace_log(self):
         log.trace("%s: queues sizes -> %s", __name__, self.counters)
         log.trace("%s: tokens -> %s", __name__, self.tokens)
+        log.trace("%s: metrics -> %s", __name__, self.get_metrics())
 
     def _is_salt_mine_event(self, tag, data):
-        return fnmatch.fnmatch(tag, "salt/job/*/ret/*") and self._is_salt_mine_update(data)
+        return JOB_RETURN_TAG_RE.match(tag) and self._is_salt_mine_update(data)
 
     def _is_salt_mine_update(self, data):
         return data.get("fun") == "mine.update"
 
     def _is_presence_ping(self, tag, data):
-        return fnmatch.fnmatch(tag, "salt/job/*/ret/*") and self._is_test_ping(data) and self._is_batch_mode(data)
+        return JOB_RETURN_TAG_RE.match(tag) and self._is_test_ping(data) and self._is_batch_mode(data)
 
     def _is_test_ping(self, data):
         return data.get("fun") == "test.ping"
@@ -200,6 +293,8 @@ class Responder:
         Committing to the database.
         """
         self.db_keepalive()
+        if self.tokens > 0:
+            self.flush()
         if self.tokens > 0 and sum(self.counters) > 0:
             log.debug("%s: commit", __name__)
             self.cursor.execute(
@@ -9,13 +9,19 @@ Retrieve SUSE Manager pillar data for a minion_id.
     ext_pillar:
       - suma_minion: True
 
+The global, organization and group pillars are cached on the master and refreshed
+on change notifications from the database, or at the latest after
+``suma_minion_cache_ttl`` seconds (default: 300).
+
 '''
 
 # Import python libs
 from __future__ import absolute_import
 from enum import Enum
+import copy
 import os
 import logging
+import time
 import yaml
 import salt.utils.dictupdate
 import salt.utils.stringutils
@@ -58,6 +64,12 @@ MANAGER_STATIC_PILLAR = [
 ]
 
 formulas_metadata_cache = dict()
+formulas_layout_cache = dict()
+
+# Channel notified by the suseSaltPillar triggers on pillar changes
+PILLAR_CACHE_CHANNEL = 'suse_salt_pillar'
+# Maximum age of the cached pillars in seconds, in case notifications are lost
+DEFAULT_PILLAR_CACHE_TTL = 300
 
 # Fomula group subtypes
 class EditGroupSubtype(Enum):
@@ -153,6 +165,72 @@ def _get_cursor(func):
                 cnx.close()
 
 
+class PillarCache:
+    '''
+    Global, organization and group pillars shared by all the minions.
+
+    The cached entries are dropped when the suseSaltPillar triggers notify about a change
+    of their target, or all at once when they get older than the TTL.
+    '''
+
+    def __init__(self, ttl=DEFAULT_PILLAR_CACHE_TTL):
+        self.ttl = ttl
+        self.cnx = None
+        self.clear()
+
+    def clear(self):
+        self.global_pillar = None
+        self.org_pillars = {}
+        self.group_pillars = {}
+        self.created = time.monotonic()
+
+    def sync(self, cnx):
+        '''
+        Drop the outdated entries, listening for pillar changes on new connections.
+        '''
+        if cnx is not self.cnx:
+            # Changes may have been missed while not listening
+            self.clear()
+            cursor = cnx.cursor()
+            cursor.execute('LISTEN {0};'.format(PILLAR_CACHE_CHANNEL))
+            cnx.commit()
+            self.cnx = cnx
+        elif time.monotonic() - self.created > self.ttl:
+            log.debug('Expiring the pillar cache')
+            self.clear()
+        cnx.poll()
+        while cnx.notifies:
+            self.invalidate(cnx.notifies.pop(0).payload)
+
+    def invalidate(self, target):
+        '''
+        Drop the cached pillars of a target notified as 'global', 'org:<id>', 'group:<id>' or 'server:<id>'
+        '''
+        kind, _, target_id = target.partition(':')
+        if kind == 'server':
+            return
+        log.debug('Invalidating the cached pillars of %s', target)
+        if kind == 'global':
+            self.global_pillar = None
+        elif kind == 'org':
+            self.org_pillars.pop(int(target_id), None)
+        elif kind == 'group':
+            self.group_pillars.pop(int(target_id), None)
+        else:
+            self.clear()
+
+
+def _get_pillar_cache():
+    '''
+    Get the pillar cache from the context, there is none for Salt SSH as the connection is not kept.
+    '''
+    if _is_salt_ssh(__opts__):
+        return None
+    if "suma_minion_cache" not in __context__:
+        __context__["suma_minion_cache"] = PillarCache(__opts__.get("suma_minion_cache_ttl", DEFAULT_PILLAR_CACHE_TTL))
+    return __context__["suma_minion_cache"]
+
+
 def ext_pillar(minion_id, pillar, *args):
     '''
     Find SUMA-related pillars for the registered minions and return the data.
@@ -171,10 +249,18 @@ def ext_pillar(minion_id, pillar, *args):
         nonlocal ret
         nonlocal group_formulas
         nonlocal system_formulas
-        ret = load_global_pillars(cursor, ret)
-        ret = load_org_pillars(minion_id, cursor, ret)
-        group_formulas, ret = load_group_pillars(minion_id, cursor, ret)
+        cache = _get_pillar_cache()
+        if cache is None:
+            ret = load_global_pillars(cursor, ret)
+            ret = load_org_pillars(minion_id, cursor, ret)
+            group_formulas, ret = load_group_pillars(minion_id, cursor, ret)
+        else:
+            cache.sync(cursor.connection)
+            group_formulas, ret = load_cached_pillars(minion_id, cursor, cache, ret)
         system_formulas, ret = load_system_pillars(minion_id, cursor, ret)
+        if cache is not None:
+            # Notifications are only delivered outside of a transaction
+            cursor.connection.commit()
 
     _get_cursor(_load_db_pillar)
 
@@ -263,6 +349,67 @@ def load_group_pillars(minion_id, cursor, pillar):
     return (group_formulas, pillar)
 
 
+def load_cached_pillars(minion_id, cursor, cache, pillar):
+    '''
+    Merge the global, org and group pillars of a minion from the cache, loading the missing ones
+    from the database, and extract the group formulas
+    '''
+    if cache.global_pillar is None:
+        cache.global_pillar = load_global_pillars(cursor, {})
+    pillar = salt.utils.dictupdate.merge(pillar, copy.deepcopy(cache.global_pillar), strategy='recurse')
+
+    cursor.execute('''
+            SELECT s.org_id,
+                   ARRAY(SELECT g.server_group_id
+                         FROM rhnServerGroupMembers AS g
+                         WHERE g.server_id = s.id
+                         ORDER BY g.server_group_id)
+            FROM suseminioninfo AS m,
+                 rhnServer AS s
+            WHERE m.minion_id = %s
+              AND s.id = m.server_id;''', (minion_id,))
+    row = cursor.fetchone()
+    if row is None:
+        return ({}, pillar)
+    org_id = int(row[0])
+    group_ids = [int(group_id) for group_id in row[1]]
+
+    if org_id not in cache.org_pillars:
+        cursor.execute('''
+                SELECT p.pillar
+                FROM susesaltpillar AS p
+                WHERE p.org_id = %s;''', (org_id,))
+        org_pillar = {}
+        for org_row in cursor.fetchall():
+            org_pillar = salt.utils.dictupdate.merge(org_pillar, org_row[0], strategy='recurse')
+        cache.org_pillars[org_id] = org_pillar
+    pillar = salt.utils.dictupdate.merge(pillar, copy.deepcopy(cache.org_pillars[org_id]), strategy='recurse')
+
+    missing_group_ids = [group_id for group_id in group_ids if group_id not in cache.group_pillars]
+    if missing_group_ids:
+        loaded = dict((group_id, ({}, {})) for group_id in missing_group_ids)
+        cursor.execute('''
+                SELECT p.group_id, p.category, p.pillar
+                FROM susesaltpillar AS p
+                WHERE p.group_id = ANY(%s::numeric[]);''', (missing_group_ids,))
+        for group_row in cursor.fetchall():
+            formulas, group_pillar = loaded[int(group_row[0])]
+            if group_row[1].startswith(FORMULA_PREFIX):
+                formulas[group_row[1][len(FORMULA_PREFIX):]] = group_row[2]
+            else:
+                loaded[int(group_row[0])] = (formulas,
+                        salt.utils.dictupdate.merge(group_pillar, group_row[2], strategy='recurse'))
+        cache.group_pillars.update(loaded)
+
+    group_formulas = {}
+    for group_id in group_ids:
+        formulas, group_pillar = cache.group_pillars[group_id]
+        group_formulas.update(copy.deepcopy(formulas))
+        pillar = salt.utils.dictupdate.merge(pillar, copy.deepcopy(group_pillar), strategy='recurse')
+
+    return (group_formulas, pillar)
+
+
 def load_system_pillars(minion_id, cursor, pillar):
     '''
     Load the system pillars from the DB and extract the formulas from it
@@ -343,25 +490,46 @@ def load_formula_pillar(system_data, group_data, formula_name, formula_metadata
     '''
     Load the data from a specific formula for a minion in a specific group, merge and return it.
     '''
-    layout_filename = os.path.join(MANAGER_FORMULAS_METADATA_STANDALONE_PATH, formula_name, "form.yml")
-    if not os.path.isfile(layout_filename):
-        layout_filename = os.path.join(MANAGER_FORMULAS_METADATA_MANAGER_PATH, formula_name, "form.yml")
-        if not os.path.isfile(layout_filename):
-            layout_filename = os.path.join(CUSTOM_FORMULAS_METADATA_PATH, formula_name, "form.yml")
-            if not os.path.isfile(layout_filename):
-                log.error('Error loading data for formula "{formula}": No form.yml found'.format(formula=formula_name))
-                return {}
-
-    try:
-        layout = yaml.load(open(layout_filename).read(), Loader=yaml.FullLoader)
-    except Exception as error:
-        log.error('Error loading form.yml of formula "{formula}": {message}'.format(formula=formula_name, message=str(error)))
+    layout = load_formula_layout(formula_name)
+    if layout is None:
         return {}
 
     merged_data = merge_formula_data(layout, group_data, system_data)
     merged_data = adjust_empty_values(layout, merged_data)
 
-    return merged_data
+    # The defaults are shared with the cached layout
+    return copy.deepcopy(merged_data)
+
+
+def load_formula_layout(formula_name):
+    '''
+    Load the form.yml layout of a formula, parsing it again only if the file was modified.
+    '''
+    layout_paths_ordered = [
+        os.path.join(MANAGER_FORMULAS_METADATA_STANDALONE_PATH, formula_name, "form.yml"),
+        os.path.join(MANAGER_FORMULAS_METADATA_MANAGER_PATH, formula_name, "form.yml"),
+        os.path.join(CUSTOM_FORMULAS_METADATA_PATH, formula_name, "form.yml")
+    ]
+
+    # Take the first layout file that exist
+    for layout_filename in layout_paths_ordered:
+        try:
+            mtime = os.stat(layout_filename).st_mtime_ns
+        except OSError:
+            continue
+        cached = formulas_layout_cache.get(layout_filename)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        try:
+            layout = yaml.load(open(layout_filename).read(), Loader=yaml.FullLoader)
+        except Exception as error:
+            log.error('Error loading form.yml of formula "{formula}": {message}'.format(formula=formula_name, message=str(error)))
+            return None
+        formulas_layout_cache[layout_filename] = (mtime, layout)
+        return layout
+
+    log.error('Error loading data for formula "{formula}": No form.yml found'.format(formula=formula_name))
+    return None
 
 
 def merge_formula_data(layout, group_data, system_data, scope="system"):
@@ -1,8 +1,12 @@
+import fnmatch
+import json
 import logging
+import os
 import pytest
 import psycopg2
 import shlex
 import subprocess
+import mgr_events
 from mgr_events import Responder, DEFAULT_COMMIT_BURST
 from unittest.mock import MagicMock, patch, call
 from sqlalchemy import create_engine
@@ -187,12 +191,120 @@ def test_commit_avoidance_without_tokens(responder):
             mock_connection.encoding = 'utf-8'
             responder.tokens = 0
             responder._insert('salt/minion/1/start', {'id': 'testminion', 'value': 1})
-            assert responder.counters == [0, 0, 1, 0]
+            assert responder.counters == [0, 0, 0, 0]
+            assert responder.buffer == [('testminion', '{"tag": "salt/minion/1/start", "data": {"id": "testminion", "value": 1}}', 2)]
             assert responder.tokens == 0
             assert responder.connection.commit.call_count == 0
+            assert responder.cursor.execute.mock_calls == []
+
+            responder.flush()
+            assert responder.counters == [0, 0, 1, 0]
+            assert responder.buffer == []
             assert responder.cursor.execute.mock_calls == [call('INSERT INTO suseSaltEvent (minion_id, data, queue) VALUES (%s, %s, %s);', ('testminion', '{"tag": "salt/minion/1/start", "data": {"id": "testminion", "value": 1}}', 2))]
 
 
+def test_buffered_events_inserted_with_one_statement(responder):
+    responder.tokens = 0
+    responder.config['flush_size'] = 3
+    with patch.object(responder, 'connection') as mock_connection, \
+            patch('mgr_events.psycopg2.extras.execute_values') as mock_execute_values:
+        mock_connection.closed = False
+        mock_connection.encoding = 'utf-8'
+        for i in range(3):
+            responder._insert('salt/minion/{}/start'.format(i), {'id': 'minion{}'.format(i)})
+        mock_execute_values.assert_called_once()
+        assert mock_execute_values.call_args[0][1] == 'INSERT INTO suseSaltEvent (minion_id, data, queue) VALUES %s;'
+        assert [row[0] for row in mock_execute_values.call_args[0][2]] == ['minion0', 'minion1', 'minion2']
+        assert sum(responder.counters) == 3
+        assert responder.connection.commit.call_count == 0
+
+        responder.add_token()
+        assert responder.connection.commit.call_count == 1
+        assert responder.counters == [0, 0, 0, 0]
+        assert responder.get_metrics()['inserted'] == 3
+        assert responder.get_metrics()['buffer_depth'] == 0
+
+
+def test_buffered_events_kept_on_lost_connection(responder):
+    responder.tokens = 0
+    responder.buffer = [('minion1', '{}', 1), ('minion2', '{}', 2)]
+    with patch.object(responder, 'connection') as mock_connection, \
+            patch('mgr_events.psycopg2.extras.execute_values', side_effect=psycopg2.OperationalError):
+        mock_connection.commit.side_effect = psycopg2.InterfaceError
+        responder.flush()
+        mock_connection.close.assert_called_once()
+    assert len(responder.buffer) == 2
+    assert responder.counters == [0, 0, 0, 0]
+
+
+def test_buffered_events_inserted_without_bad_event(responder):
+    responder.tokens = 0
+    bad_event = ('minion2', '{"invalid": "\u0000"}', 2)
+    responder.buffer = [('minion1', '{}', 1), bad_event, ('minion3', '{}', 3)]
+    inserted = []
+
+    def execute(query, params=None):
+        if params == bad_event:
+            raise psycopg2.DataError
+        if query == mgr_events.INSERT_EVENT_QUERY:
+            inserted.append(params)
+    with patch.object(responder, 'connection') as mock_connection, \
+            patch.object(responder, 'cursor') as mock_cursor, \
+            patch('mgr_events.psycopg2.extras.execute_values', side_effect=psycopg2.DataError):
+        mock_connection.closed = False
+        mock_cursor.execute.side_effect = execute
+        responder.flush()
+        mock_cursor.execute.assert_any_call("ROLLBACK TO SAVEPOINT event;")
+    assert inserted == [('minion1', '{}', 1), ('minion3', '{}', 3)]
+    assert responder.buffer == []
+    assert responder.counters == [0, 1, 0, 1]
+
+
+@pytest.mark.parametrize("tag", [
+    'salt/minion/minion1/start',
+    'salt/minion/minion1/stop',
+    'salt/job/123/ret/minion1',
+    'salt/job/123/new',
+    'salt/beacon/minion1/pkgset/',
+    'salt/engines/libvirt_events/minion1/pool/refresh',
+    'salt/engines/libvirt_events/minion1/pool/undefined',
+    'suse/manager/pxe_update',
+    'suse/manager/pxe_update/other',
+])
+def test_event_tags_matcher(tag):
+    expected = any(fnmatch.fnmatch(tag, pattern) for pattern in mgr_events.EVENT_TAGS)
+    assert bool(mgr_events.EVENT_TAGS_RE.match(tag)) == expected
+
+
+def test_replay_recorded_events():
+    '''
+    Replay a recorded event stream through a responder with a mocked database:
+    the accepted events are inserted in a few batched statements
+    '''
+    with open(os.path.join(os.path.dirname(__file__), 'data', 'events.json')) as events_file:
+        events = json.load(events_file)
+    repeat = 2000
+    with patch('mgr_events.psycopg2') as mock_psycopg2:
+        mock_psycopg2.connect.return_value.closed = False
+        mock_psycopg2.connect.return_value.encoding = 'utf-8'
+        responder = Responder(MagicMock(), {
+            'postgres_db': {'dbname': 'tests', 'user': 'postgres', 'password': ''},
+            'events': {'thread_pool_size': 8}
+        })
+        for _ in range(repeat):
+            for tag, data in events:
+                responder._insert(tag, data)
+        responder.add_token()
+        inserted = sum(len(c[1][2]) for c in mock_psycopg2.extras.execute_values.mock_calls)
+        inserted += len([c for c in responder.cursor.execute.mock_calls if 'INSERT' in c[1][0]])
+
+    metrics = responder.get_metrics()
+    # 6 of the recorded events are stored, the others are discarded
+    assert metrics['events'] == inserted == metrics['inserted'] == 6 * repeat
+    assert metrics['buffer_depth'] == 0
+    assert metrics['flushes'] < DEFAULT_COMMIT_BURST + 6 * repeat / mgr_events.DEFAULT_FLUSH_SIZE + 2
+
+
 def test_postgres_connect(db_connection, responder):
     disposable_connection = new_connection()
     disposable_connection.close()
@@ -182,3 +182,102 @@ def test_using_context_in__get_cursor():
             "dbname": "test_db",
             "port": 1234,
         }
+
+
+def test_pillar_cache_invalidation():
+    '''
+    Test the pillar cache drops the notified entries
+    '''
+    cache = suma_minion.PillarCache()
+    cnx = MagicMock()
+    cnx.notifies = []
+    cache.sync(cnx)
+    cnx.cursor.return_value.execute.assert_called_once_with('LISTEN suse_salt_pillar;')
+
+    cache.global_pillar = {"global": True}
+    cache.org_pillars = {1: {"org": 1}, 2: {"org": 2}}
+    cache.group_pillars = {9: ({}, {"group": 9})}
+    cnx.notifies = [MagicMock(payload="org:2"), MagicMock(payload="server:1000010000")]
+    cache.sync(cnx)
+    assert cache.org_pillars == {1: {"org": 1}}
+    assert cache.global_pillar == {"global": True}
+    assert cnx.cursor.call_count == 1
+
+    cnx.notifies = [MagicMock(payload="group:9"), MagicMock(payload="global")]
+    cache.sync(cnx)
+    assert cache.group_pillars == {}
+    assert cache.global_pillar is None
+
+    # A new connection may have missed notifications
+    cache.global_pillar = {"global": True}
+    new_cnx = MagicMock()
+    new_cnx.notifies = []
+    cache.sync(new_cnx)
+    assert cache.global_pillar is None
+
+    cache.global_pillar = {"global": True}
+    cache.created -= cache.ttl + 1
+    cache.sync(new_cnx)
+    assert cache.global_pillar is None
+
+
+def test_load_cached_pillars():
+    '''
+    Test the global, org and group pillars are only loaded once
+    '''
+    cache = suma_minion.PillarCache()
+    queries = []
+
+    def execute(query, args=None):
+        queries.append(query)
+        if "p.server_id is NULL" in query:
+            cursor.fetchall.return_value = [({"formula_order": TEST_FORMULA_ORDER},)]
+        elif "rhnServerGroupMembers" in query:
+            cursor.fetchone.return_value = (1, [9, 10]) if args[0] == "minion1" else (1, [9])
+        elif "p.org_id = %s" in query:
+            cursor.fetchall.return_value = [({"org": {"name": "org1"}},)]
+        elif "p.group_id = ANY" in query:
+            cursor.fetchall.return_value = [
+                    row for row in [(9, "formula-locale", {"tz": "UTC"}), (9, "group", {"group": {"a": 1}}),
+                                    (10, "group", {"group": {"b": 2}})]
+                    if row[0] in args[0]]
+
+    cursor = MagicMock()
+    cursor.execute.side_effect = execute
+    formulas, pillar = suma_minion.load_cached_pillars("minion1", cursor, cache, {})
+    assert formulas == {"locale": {"tz": "UTC"}}
+    assert pillar == {"formula_order": TEST_FORMULA_ORDER, "org": {"name": "org1"}, "group": {"a": 1, "b": 2}}
+    assert len(queries) == 4
+
+    queries.clear()
+    formulas, pillar = suma_minion.load_cached_pillars("minion2", cursor, cache, {})
+    assert formulas == {"locale": {"tz": "UTC"}}
+    assert pillar["group"] == {"a": 1}
+    assert len(queries) == 1
+
+    # The cached data is not shared with the returned pillar
+    pillar["group"]["a"] = 2
+    formulas["locale"]["tz"] = "CET"
+    assert cache.group_pillars[9] == ({"locale": {"tz": "UTC"}}, {"group": {"a": 1}})
+
+
+def test_load_formula_layout_cached(tmp_path):
+    '''
+    Test the formula layout is parsed again only when modified
+    '''
+    formula_dir = tmp_path / "locale"
+    formula_dir.mkdir()
+    layout_file = formula_dir / "form.yml"
+    layout_file.write_text("tz:\n  $default: UTC\n")
+
+    with patch("suma_minion.MANAGER_FORMULAS_METADATA_STANDALONE_PATH", str(tmp_path)), \
+            patch("suma_minion.yaml.load", wraps=suma_minion.yaml.load) as yaml_load:
+        assert suma_minion.load_formula_pillar({}, {}, "locale") == {"tz": "UTC"}
+        assert suma_minion.load_formula_pillar({}, {"tz": "CET"}, "locale") == {"tz": "CET"}
+        assert yaml_load.call_count == 1
+
+        layout_file.write_text("tz:\n  $default: CET\n")
+        stat = layout_file.stat()
+        os.utime(layout_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000000000))
+        assert suma_minion.load_formula_pillar({}, {}, "locale") == {"tz": "CET"}
+        assert yaml_load.call_count == 2